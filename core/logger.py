@@ -28,7 +28,10 @@ Originally distributed under MIT/X11 license. See documentation/MITLicense.txt f
 import logging
 import logging.handlers
 import os
+import queue
 import sys
+import threading
+import time
 import traceback
 import functools
 from qtpy import QtCore
@@ -78,8 +81,10 @@ class QtLogFormatter(logging.Formatter):
 class QtLogHandler(QtCore.QObject, logging.Handler):
     """Log handler for displaying log records in a QT gui.
 
-      For each log record the Qt signal sigLoggedMessage is emitted
-      with a dictionary as parameter. The keys of this dictionary are:
+      The log records are collected and the Qt signal sigLoggedMessages is
+      emitted with a list of dictionaries at most every min_interval seconds,
+      so a flood of messages does not block the GUI. The keys of the
+      dictionaries are:
         - name: logger name
         - message: the message
         - timestamp: the creation time of the log record
@@ -91,31 +96,214 @@ class QtLogHandler(QtCore.QObject, logging.Handler):
 
       @param object parent: parent of QObject, defaults to None
       @param int level: log level, defaults to NOTSET
+      @param float min_interval: minimal time between two signals in seconds
     """
 
-    sigLoggedMessage = QtCore.Signal(object)
-    """signal emitted for each log record"""
+    sigLoggedMessages = QtCore.Signal(object)
+    """signal emitted with a list of log entries"""
 
-    def __init__(self, parent=None, level=0):
+    def __init__(self, parent=None, level=0, min_interval=0.1):
         QtCore.QObject.__init__(self, parent)
         logging.Handler.__init__(self, level)
         self.setFormatter(QtLogFormatter())
+        self.min_interval = min_interval
+        self._pending = list()
+        self._last_emit = 0
 
     def emit(self, record):
         """Emit function of handler.
 
-          Formats the log record and emits :sigLoggedMessage:
+          Formats the log record and emits :sigLoggedMessages: if the last
+          batch is older than min_interval.
 
           @param object record: :logging.LogRecord:
         """
-        record = self.format(record)
-        if record:
-            self.sigLoggedMessage.emit(record)
+        entry = self.format(record)
+        if entry:
+            self._pending.append(entry)
+            if time.monotonic() - self._last_emit >= self.min_interval:
+                self.flush()
+
+    def flush(self):
+        """Emit :sigLoggedMessages: with all pending log entries.
+        """
+        self.acquire()
+        try:
+            entries = self._pending
+            self._pending = list()
+            self._last_emit = time.monotonic()
+        finally:
+            self.release()
+        if entries:
+            self.sigLoggedMessages.emit(entries)
+
+
+class AsyncLogHandler(logging.Handler):
+    """Log handler passing the log records to other handlers in a background
+    thread.
+
+      Logging only puts the record into a queue, so writing files or updating
+      the GUI never blocks the logging thread. Identical consecutive messages
+      (same logger, level and message) are folded: only the first one is
+      passed on and a summary record with the number of repetitions follows
+      when a different message arrives, after repeat_timeout seconds without
+      repetition or at least every repeat_timeout seconds.
+
+      @param list handlers: handlers the log records are passed to
+      @param int level: log level, defaults to NOTSET
+      @param float repeat_timeout: timeout for the summary of repeated
+                                   messages in seconds
+      @param float flush_interval: the handlers are flushed if no record
+                                   arrived within this time in seconds
+    """
+
+    def __init__(self, handlers=(), level=0, repeat_timeout=5, flush_interval=0.1):
+        super().__init__(level)
+        self.handlers = tuple(handlers)
+        self.repeat_timeout = repeat_timeout
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._last_key = None
+        self._repeated_record = None
+        self._repeat_count = 0
+        self._repeat_start = 0
+        self._thread = threading.Thread(target=self._run, name='logging', daemon=True)
+        self._thread.start()
+
+    def addHandler(self, handler):
+        """Add a handler the log records are passed to.
+
+          @param object handler: :logging.Handler:
+        """
+        if handler not in self.handlers:
+            self.handlers = self.handlers + (handler, )
+
+    def removeHandler(self, handler):
+        """Remove a handler the log records are passed to.
+
+          @param object handler: :logging.Handler:
+        """
+        self.handlers = tuple(h for h in self.handlers if h is not handler)
+
+    def emit(self, record):
+        """Put the log record into the queue.
+
+          The message is merged with its arguments right away, since the
+          arguments might change before the record is handled.
+
+          @param object record: :logging.LogRecord:
+        """
+        try:
+            record.msg = record.getMessage()
+            record.args = None
+            self._queue.put_nowait(record)
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        """Handle all queued log records and stop the background thread.
+        """
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        super().close()
+
+    def _run(self):
+        while True:
+            try:
+                record = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                if (self._repeat_count > 0
+                        and time.time() - self._repeated_record.created > self.repeat_timeout):
+                    self._handle_repeats()
+                self._flush_handlers()
+                continue
+            if record is None:
+                self._handle_repeats()
+                self._flush_handlers()
+                break
+
+            key = (record.name, record.levelno, record.msg) if record.exc_info is None else None
+            if key is not None and key == self._last_key:
+                self._repeated_record = record
+                self._repeat_count += 1
+                if record.created - self._repeat_start > self.repeat_timeout:
+                    self._handle_repeats()
+                continue
+            self._handle_repeats()
+            self._last_key = key
+            self._repeat_start = record.created
+            self._handle(record)
+
+    def _handle_repeats(self):
+        if self._repeat_count > 0:
+            record = logging.makeLogRecord(self._repeated_record.__dict__)
+            record.msg = '{0} [repeated {1:d} times]'.format(record.msg, self._repeat_count)
+            self._repeat_count = 0
+            self._repeat_start = record.created
+            self._handle(record)
+
+    def _handle(self, record):
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                try:
+                    handler.handle(record)
+                except Exception:
+                    handler.handleError(record)
+
+    def _flush_handlers(self):
+        for handler in self.handlers:
+            try:
+                handler.flush()
+            except Exception:
+                pass
+
+
+# the handler passing the log records to all other handlers, set up by initialize_logger
+_async_log_handler = None
+
+
+def add_log_handler(handler):
+    """Add a handler to the logging of Qudi.
+
+      The handler is called from the logging thread if the logging is set up
+      by initialize_logger and directly by the root logger otherwise.
+
+      @param object handler: :logging.Handler:
+    """
+    if _async_log_handler is not None:
+        _async_log_handler.addHandler(handler)
+    else:
+        logging.getLogger().addHandler(handler)
+
+
+def remove_log_handler(handler):
+    """Remove a handler added with add_log_handler.
+
+      @param object handler: :logging.Handler:
+    """
+    if _async_log_handler is not None:
+        _async_log_handler.removeHandler(handler)
+    logging.getLogger().removeHandler(handler)
+
+
+def get_log_handlers():
+    """Returns all handlers of the logging of Qudi.
+
+      @return list: :logging.Handler: instances
+    """
+    handlers = list(logging.getLogger().handlers)
+    if _async_log_handler is not None:
+        handlers.extend(_async_log_handler.handlers)
+    return handlers
 
 
 def initialize_logger(path=''):
     """sets up the logger including a console, file and qt handler
+
+      All handlers are called from a background thread, see AsyncLogHandler.
     """
+    global _async_log_handler
     # initialize logger
     logging.basicConfig(format="%(message)s", level=logging.INFO)
     logging.addLevelName(logging.CRITICAL, 'critical')
@@ -128,7 +316,8 @@ def initialize_logger(path=''):
     logger = logging.getLogger()
     logger.setLevel(logging.INFO)
     # set level of stream handler which logs to stderr
-    logger.handlers[0].setLevel(logging.WARNING)
+    stream_handler = logger.handlers[0]
+    stream_handler.setLevel(logging.WARNING)
 
     # add file logger
     logfile_path = os.path.join(path, 'qudi.log')
@@ -139,12 +328,16 @@ def initialize_logger(path=''):
         datefmt="%Y-%m-%d %H:%M:%S"))
     rotating_file_handler.doRollover()
     rotating_file_handler.setLevel(logging.DEBUG)
-    logger.addHandler(rotating_file_handler)
 
     # add Qt log handler
     qt_log_handler = QtLogHandler()
     qt_log_handler.setLevel(logging.DEBUG)
-    logging.getLogger().addHandler(qt_log_handler)
+
+    # pass all records through the logging thread
+    logger.removeHandler(stream_handler)
+    _async_log_handler = AsyncLogHandler(
+        [stream_handler, rotating_file_handler, qt_log_handler])
+    logger.addHandler(_async_log_handler)
 
     for logger_name in ['core', 'gui', 'logic', 'hardware']:
             logging.getLogger(logger_name).setLevel(logging.DEBUG)
@@ -32,6 +32,7 @@ import re
 import time
 import importlib
 
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from qtpy import QtCore
 from . import config
 
@@ -47,6 +48,7 @@ except ImportError:
     RemoteObjectManager = None
 from .module import BaseMixin
 from .connector import Connector
+from .process import create_process_module
 
 
 class Manager(QtCore.QObject):
@@ -105,6 +107,13 @@ class Manager(QtCore.QObject):
         self.alreadyQuit = False
         self.remote_server = False
 
+        # timing of the module loading and activation, see logStartupProfile
+        self.startup_profile = OrderedDict()
+        self._startupTime = time.perf_counter()
+        self._startupRunning = False
+        # python modules imported or reloaded during startup, they need no reload
+        self._freshImports = set()
+
         try:
             # Initialize parent class QObject
             super().__init__(**kwargs)
@@ -210,6 +219,7 @@ class Manager(QtCore.QObject):
         except:
             logger.exception('Error while configuring Manager:')
         finally:
+            self._freshImports.clear()
             if (len(self.tree['loaded']['logic']) == 0
                     and len(self.tree['loaded']['gui']) == 0):
                 logger.critical('No modules loaded during startup.')
@@ -551,6 +561,47 @@ class Manager(QtCore.QObject):
         # print('refcnt:', sys.getrefcount(mod))
         return mod
 
+    def _importModuleOnce(self, baseName, module):
+        """Import a python module for loading a Qudi module from it, reload it if it was
+           imported before.
+
+          @param string baseName: the module base package (hardware, logic, or gui)
+          @param string module: the python module name inside the base package
+
+          @return object: the loaded python module
+
+          Even if the import is successful an error might occur during
+          instantiation. E.g. in an abc metaclass, methods might be missing in
+          a derived interface file. Reloading the namespace will prevent the
+          need to restart Qudi, if a module instantiation was not successful
+          upon load. A module imported or reloaded before during the current
+          startup is up to date already, so it is not executed a second time.
+        """
+        path = '{0}.{1}'.format(baseName, module)
+        with self.lock:
+            fresh = path not in sys.modules or path in self._freshImports
+        mod = self.importModule(baseName, module)
+        if not fresh:
+            importlib.reload(mod)  # keep the namespace of module up to date
+        with self.lock:
+            self._freshImports.add(path)
+        return mod
+
+    @staticmethod
+    def _splitModuleClass(defined_module):
+        """Python module and class name of a module definition.
+
+          @param dict defined_module: module configuration containing module.Class
+
+          @return tuple(str, str): module name inside the base package and class name
+        """
+        # class_name is the last part of the config entry
+        class_name = re.split('\.', defined_module['module.Class'])[-1]
+        # module_name is the whole line without this last part (and
+        # with the trailing dot removed also)
+        module_name = re.sub('.' + class_name + '$', '', defined_module['module.Class'])
+        return module_name, class_name
+
     def configureModule(self, moduleObject, baseName, className, instanceName,
                         configuration=None):
         """Instantiate an object from the class that makes up a Qudi module
@@ -596,7 +647,14 @@ class Manager(QtCore.QObject):
                 instanceName, baseName, className))
 
         # Create object from class
-        instance = modclass(manager=self, name=instanceName, config=configuration)
+        if configuration.get('separate_process', False):
+            if baseName != 'hardware':
+                raise Exception('Only hardware modules can run in a separate process, not {0}.{1}.'
+                                ''.format(baseName, instanceName))
+            instance = create_process_module(
+                modclass, manager=self, name=instanceName, config=configuration)
+        else:
+            instance = modclass(manager=self, name=instanceName, config=configuration)
 
         with self.lock:
             self.tree['loaded'][baseName][instanceName] = instance
@@ -784,28 +842,21 @@ class Manager(QtCore.QObject):
                     return -1
             else:
                 try:
-                    # class_name is the last part of the config entry
-                    class_name = re.split('\.', defined_module['module.Class'])[-1]
-                    # module_name is the whole line without this last part (and
-                    # with the trailing dot removed also)
-                    module_name = re.sub(
-                        '.' + class_name + '$',
-                        '',
-                        defined_module['module.Class'])
-
-                    modObj = self.importModule(base, module_name)
-
-                    # Ensure that the namespace of a module is reloaded before 
-                    # instantiation. That will not harm anything.
-                    # Even if the import is successful an error might occur 
-                    # during instantiation. E.g. in an abc metaclass, 
-                    # methods might be missing in a derived interface file.
-                    # Reloading the namespace will prevent the need to restart 
-                    # Qudi, if a module instantiation was not successful upon 
-                    # load.
-                    importlib.reload(modObj)  # keep the namespace of module up to date
-
-                    self.configureModule(modObj, base, class_name, key, defined_module)
+                    module_name, class_name = self._splitModuleClass(defined_module)
+
+                    start = time.perf_counter()
+                    modObj = self._importModuleOnce(base, module_name)
+                    self._recordStartupTime(base, key, 'import', start)
+
+                    start = time.perf_counter()
+                    try:
+                        self.configureModule(modObj, base, class_name, key, defined_module)
+                    except:
+                        # reload the python module when loading it the next time
+                        with self.lock:
+                            self._freshImports.discard('{0}.{1}'.format(base, module_name))
+                        raise
+                    self._recordStartupTime(base, key, 'configure', start)
                     if 'remoteaccess' in defined_module and defined_module['remoteaccess']:
                         if self.rm is None:
                             logger.error('Remote module sharing functionality disabled. Rpyc not'
@@ -958,6 +1009,7 @@ class Manager(QtCore.QObject):
         if module.module_state() != 'deactivated':
             logger.error('{0} module {1} not deactivated'.format(base, name))
             return
+        start = time.perf_counter()
         try:
             module.setStatusVariables(self.loadStatusVariables(base, name))
             # start main loop for qt objects
@@ -977,6 +1029,7 @@ class Manager(QtCore.QObject):
         except:
             logger.exception(
                 '{0} module {1}: error during activation:'.format(base, name))
+        self._recordStartupTime(base, name, 'activate', start)
         QtCore.QCoreApplication.instance().processEvents()
 
     @QtCore.Slot(str, str)
@@ -1259,16 +1312,276 @@ class Manager(QtCore.QObject):
     def startAllConfiguredModules(self):
         """Connect all Qudi modules from the currently loaded configuration and
             activate them.
+
+            With the global config option parallel_startup, the modules are
+            started as soon as their own dependencies are active instead of one
+            after another, see _startModulesParallel.
         """
         deps = self.getAllRecursiveModuleDependencies(self.tree['defined'])
         sorteddeps = toposort(deps)
+        self.startup_profile = OrderedDict()
+        self._startupTime = time.perf_counter()
+        self._startupRunning = True
 
-        for module in sorteddeps:
-            base = self.findBase(module)
-            if self.startModule(base, module) < 0:
-                break
-
+        try:
+            if self.tree['global'].get('parallel_startup', False):
+                self._startModulesParallel(sorteddeps, deps)
+            else:
+                for module in sorteddeps:
+                    base = self.findBase(module)
+                    if self.startModule(base, module) < 0:
+                        break
+        finally:
+            self._startupRunning = False
+            with self.lock:
+                self._freshImports.clear()
         logger.info('Start all modules finished.')
+        self.logStartupProfile()
+
+    def _startModulesParallel(self, modules, deps):
+        """ Load, connect and activate modules as soon as their dependencies are active.
+
+          @param list modules: unique module names in topological order
+          @param dict deps: module dependencies as for the toposort function
+
+            The python modules which are not loaded yet are imported in a
+            background thread in the order of the modules, ahead of their
+            instantiation. Threaded modules and hardware modules are activated
+            concurrently in their own threads, driven by a pool of global
+            startup_workers (default 4) threads, so independent branches of the
+            dependency tree start in parallel. Non-threaded hardware modules
+            are moved back to the main thread after their activation. Other
+            non-threaded modules, GUI modules, remote modules, modules in a
+            separate process and modules configured with activate_in_main_thread
+            are activated in the main thread, each as soon as its dependencies
+            are ready. Hardware modules which create QObjects without parent in
+            on_activate (e.g. timers) need activate_in_main_thread, since these
+            objects would stay bound to the temporary thread.
+            If a module fails, the modules depending on it are not started.
+        """
+        workers = max(1, int(self.tree['global'].get('startup_workers', 4)))
+        pending = OrderedDict((module, set(deps.get(module, []))) for module in modules)
+        done = set()
+        failed = set()
+        activations = dict()
+
+        with ThreadPoolExecutor(max_workers=1) as import_pool, \
+                ThreadPoolExecutor(max_workers=workers) as activation_pool:
+            # modules which are already loaded must not be imported (i.e. reloaded) again
+            imports = {module: import_pool.submit(self._preimportModule, self.findBase(module),
+                                                  module)
+                       for module in modules
+                       if not self.isModuleLoaded(self.findBase(module), module)}
+            while pending or activations:
+                for module, module_deps in list(pending.items()):
+                    base = self.findBase(module)
+                    if module_deps & failed:
+                        logger.warning('Not starting {0} module {1}, its dependencies {2} '
+                                       'failed.'.format(base, module,
+                                                        sorted(module_deps & failed)))
+                        pending.pop(module)
+                        failed.add(module)
+                        continue
+                    if not (module_deps <= done
+                            and (module not in imports or imports[module].done())):
+                        continue
+                    pending.pop(module)
+                    if self._loadConnectModule(base, module) < 0:
+                        failed.add(module)
+                        continue
+                    if self._canActivateInWorker(base, module):
+                        self._prepareWorkerActivation(base, module)
+                        future = activation_pool.submit(self._activateModuleInWorker, base,
+                                                        module)
+                        activations[future] = (base, module)
+                        continue
+                    if self.tree['loaded'][base][module].module_state() == 'deactivated':
+                        self.activateModule(base, module)
+                    elif base == 'gui':
+                        self.tree['loaded'][base][module].show()
+                    if self.isModuleActive(base, module):
+                        done.add(module)
+                    else:
+                        failed.add(module)
+                    self.sigModulesChanged.emit()
+
+                waiting = list(activations) + [imports[m] for m in pending
+                                               if m in imports and not imports[m].done()]
+                if not waiting:
+                    if pending and not any(module_deps <= done | failed
+                                           for module_deps in pending.values()):
+                        logger.error('Cannot start modules {0}, their dependencies are not '
+                                     'being started.'.format(list(pending)))
+                        break
+                    continue
+                finished, _ = wait(waiting, timeout=0.05, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    if future not in activations:
+                        continue
+                    base, module = activations.pop(future)
+                    self._finishWorkerActivation(base, module, future)
+                    if self.isModuleActive(base, module):
+                        done.add(module)
+                    else:
+                        failed.add(module)
+                    self.sigModulesChanged.emit()
+                # keep the GUI alive while hardware is activated in the background
+                QtCore.QCoreApplication.instance().processEvents()
+
+    def _preimportModule(self, base, key):
+        """ Import the python module of a Qudi module in a background thread.
+
+          @param str base: Module category
+          @param str key: Unique module name
+        """
+        defined_module = self.tree['defined'][base][key]
+        if 'module.Class' not in defined_module or 'remote' in defined_module:
+            return
+        start = time.perf_counter()
+        try:
+            self._importModuleOnce(base, self._splitModuleClass(defined_module)[0])
+        except:
+            # the error is reported again when the module is loaded
+            logger.debug('Import of {0} module {1} failed in the background.'.format(base, key))
+        self._recordStartupTime(base, key, 'import', start)
+
+    def _loadConnectModule(self, base, key):
+        """ Load and connect a module for the parallel startup if it is not loaded yet.
+
+          @param str base: Module category
+          @param str key: Unique module name
+
+          @return int: 0 on success, -1 on error
+        """
+        if self.isModuleLoaded(base, key):
+            return 0
+        success = self.loadConfigureModule(base, key)
+        if success < 0:
+            logger.warning('Not starting {0} module {1} after loading failure.'.format(base, key))
+            return -1
+        elif success > 0:
+            logger.warning('Nonfatal loading error, going on.')
+        start = time.perf_counter()
+        success = self.connectModule(base, key)
+        self._recordStartupTime(base, key, 'connect', start)
+        if success < 0:
+            logger.warning('Not starting {0} module {1} after connection failure.'
+                           ''.format(base, key))
+            return -1
+        return 0
+
+    def _canActivateInWorker(self, base, key):
+        """ Whether a module may be activated concurrently in its own thread.
+
+          @param str base: Module category
+          @param str key: Unique module name
+
+          @return bool: module can be activated outside of the main thread
+        """
+        defined_module = self.tree['defined'][base][key]
+        return (base != 'gui'
+                and (self.tree['loaded'][base][key].is_module_threaded or base == 'hardware')
+                and 'remote' not in defined_module
+                and not defined_module.get('separate_process', False)
+                and not defined_module.get('activate_in_main_thread', False)
+                and self.tree['loaded'][base][key].module_state() == 'deactivated')
+
+    def _prepareWorkerActivation(self, base, key):
+        """ Load the status variables of a module and move it to its own thread.
+
+          @param str base: Module category
+          @param str key: Unique module name
+        """
+        module = self.tree['loaded'][base][key]
+        module.setStatusVariables(self.loadStatusVariables(base, key))
+        modthread = self.tm.newThread('mod-{0}-{1}'.format(base, key))
+        module.moveToThread(modthread)
+        modthread.start()
+
+    def _activateModuleInWorker(self, base, key):
+        """ Activate a module prepared by _prepareWorkerActivation, runs in a worker thread.
+
+          @param str base: Module category
+          @param str key: Unique module name
+
+          @return tuple(bool, float, float): activation success, start and stop time
+        """
+        start = time.perf_counter()
+        success = QtCore.QMetaObject.invokeMethod(
+            self.tree['loaded'][base][key].module_state,
+            'trigger',
+            QtCore.Qt.BlockingQueuedConnection,
+            QtCore.Q_RETURN_ARG(bool),
+            QtCore.Q_ARG(str, 'activate'))
+        return success, start, time.perf_counter()
+
+    def _finishWorkerActivation(self, base, key, future):
+        """ Record the result of the activation of a module in its thread and move a
+            non-threaded module back to the main thread.
+
+          @param str base: Module category
+          @param str key: Unique module name
+          @param Future future: future of _activateModuleInWorker
+        """
+        try:
+            success, start, stop = future.result()
+            logger.debug('Activation success: {}'.format(success))
+            self._recordStartupTime(base, key, 'activate', start, stop)
+        except:
+            logger.exception('{0} module {1}: error during activation:'.format(base, key))
+        module = self.tree['loaded'][base][key]
+        if not module.is_module_threaded:
+            try:
+                QtCore.QMetaObject.invokeMethod(
+                    module,
+                    'moveToThread',
+                    QtCore.Qt.BlockingQueuedConnection,
+                    QtCore.Q_ARG(QtCore.QThread, self.tm.thread))
+            except:
+                logger.exception('{0} module {1}: error while moving it back to the main '
+                                 'thread:'.format(base, key))
+            self.tm.quitThread('mod-{0}-{1}'.format(base, key))
+            self.tm.joinThread('mod-{0}-{1}'.format(base, key))
+
+    def _recordStartupTime(self, base, key, phase, start, stop=None):
+        """ Add the duration of a loading phase of a module to the startup profile.
+
+          @param str base: Module category
+          @param str key: Unique module name
+          @param str phase: import, configure, connect or activate
+          @param float start: time.perf_counter() at the start of the phase
+          @param float stop: time.perf_counter() at the end of the phase, default is now
+
+            Only the loading during startAllConfiguredModules is recorded.
+        """
+        if not self._startupRunning:
+            return
+        if stop is None:
+            stop = time.perf_counter()
+        with self.lock:
+            entry = self.startup_profile.setdefault(
+                '{0}.{1}'.format(base, key),
+                OrderedDict([('import', 0.), ('configure', 0.), ('connect', 0.),
+                             ('activate', 0.), ('start', start - self._startupTime),
+                             ('ready', 0.)]))
+            entry[phase] += stop - start
+            entry['start'] = min(entry['start'], start - self._startupTime)
+            entry['ready'] = max(entry['ready'], stop - self._startupTime)
+
+    def logStartupProfile(self):
+        """ Log the time every module spent in importing, configuration, connection and
+            activation, in the order in which the modules became ready.
+        """
+        if not self.startup_profile:
+            return
+        with self.lock:
+            profile = sorted(self.startup_profile.items(), key=lambda item: item[1]['ready'])
+        lines = ['{0:<40}{1:>10}{2:>10}{3:>10}{4:>10}{5:>10}{6:>10}'.format(
+            'module', 'import', 'configure', 'connect', 'activate', 'start', 'ready')]
+        for name, entry in profile:
+            lines.append('{0:<40}{1:>10.3f}{2:>10.3f}{3:>10.3f}{4:>10.3f}{5:>10.3f}{6:>10.3f}'
+                         ''.format(name, *entry.values()))
+        logger.info('Module startup profile in s:\n{0}'.format('\n'.join(lines)))
 
     def getStatusDir(self):
         """ Get the directory where the app state is saved, create it if necessary.
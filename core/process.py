@@ -0,0 +1,431 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the classes to run a Qudi hardware module in a separate worker process.
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import importlib
+import logging
+import logging.handlers
+import multiprocessing
+import pickle
+import traceback
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+
+from .interface import InterfaceMethod
+from .util.mutex import Mutex
+
+logger = logging.getLogger(__name__)
+
+# Smaller arrays are pickled together with the message
+SHARED_ARRAY_MIN_BYTES = 65536
+DEFAULT_SHARED_BUFFER_SIZE = 64 * 2 ** 20
+
+# Placeholder for an array which was copied into the shared buffer
+SharedArray = namedtuple('SharedArray', 'offset shape dtype')
+
+
+class SharedBuffer:
+    """ Memory shared between the Qudi process and a worker process to transfer numpy arrays.
+
+    Only one call is in flight at a time, so the buffer is filled from the start for every message.
+    The receiving side copies the arrays out of the buffer before the buffer is used again.
+    """
+
+    def __init__(self, size=DEFAULT_SHARED_BUFFER_SIZE, raw=None):
+        """
+        @param int size: size of the buffer in bytes
+        @param raw: optional, existing multiprocessing RawArray to attach to
+        """
+        if raw is None:
+            raw = multiprocessing.get_context('spawn').RawArray('B', int(size))
+        self.raw = raw
+        self._view = np.frombuffer(raw, dtype=np.uint8)
+        self._offset = 0
+
+    def reset(self):
+        """ Start filling the buffer from the beginning again. """
+        self._offset = 0
+
+    def pack(self, obj):
+        """ Copy the large numpy arrays in obj into the buffer and replace them by placeholders.
+
+        @param obj: object to send, arrays are also found inside tuples, lists and dicts
+
+        @return: object with SharedArray placeholders
+        """
+        if isinstance(obj, np.ndarray):
+            if obj.dtype.hasobject or obj.nbytes < SHARED_ARRAY_MIN_BYTES:
+                return obj
+            # keep the arrays aligned to cache lines
+            offset = -(-self._offset // 64) * 64
+            if offset + obj.nbytes > self._view.size:
+                return obj
+            target = np.ndarray(obj.shape, dtype=obj.dtype, buffer=self._view, offset=offset)
+            target[...] = obj
+            self._offset = offset + obj.nbytes
+            return SharedArray(offset, obj.shape, obj.dtype)
+        if type(obj) in (tuple, list):
+            return type(obj)(self.pack(item) for item in obj)
+        if type(obj) in (dict, OrderedDict):
+            return type(obj)((key, self.pack(value)) for key, value in obj.items())
+        return obj
+
+    def unpack(self, obj):
+        """ Replace the SharedArray placeholders in obj by copies of the arrays in the buffer.
+
+        @param obj: received object
+
+        @return: object with numpy arrays
+        """
+        if isinstance(obj, SharedArray):
+            return np.ndarray(obj.shape, dtype=obj.dtype, buffer=self._view,
+                              offset=obj.offset).copy()
+        if type(obj) in (tuple, list):
+            return type(obj)(self.unpack(item) for item in obj)
+        if type(obj) in (dict, OrderedDict):
+            return type(obj)((key, self.unpack(value)) for key, value in obj.items())
+        return obj
+
+
+class ProcessModuleState:
+    """ Stands in for the module state machine of a module running in a worker process.
+
+    The state is reported by the worker process with every reply, so asking for it never waits for
+    a running call.
+    """
+    _allowed_sources = {'activate': ('deactivated', ),
+                        'deactivate': ('idle', 'running', 'locked')}
+
+    def __init__(self, module):
+        self._module = module
+        self.current = 'deactivated'
+
+    def __call__(self):
+        """ Returns the current state. """
+        return self.current
+
+    def can(self, event):
+        """ Whether the event is possible in the current state. """
+        return self.current in self._allowed_sources.get(event, ())
+
+    def activate(self):
+        """ Activate the module in the worker process, which is started if necessary.
+
+        @return bool: activation success
+        """
+        return self._module._activate()
+
+    def deactivate(self):
+        """ Deactivate the module and stop the worker process.
+
+        @return bool: deactivation success
+        """
+        return self._module._deactivate()
+
+
+class ProcessInterfaceMethod:
+    """ Forwards calls of an overloaded interface method to the worker process. """
+
+    def __init__(self, module, name):
+        self._module = module
+        self._name = name
+
+    def __call__(self, *args, **kwargs):
+        return self._module._call(self._name, None, args, kwargs)
+
+    def __getitem__(self, interface):
+        def call(*args, **kwargs):
+            return self._module._call(self._name, interface, args, kwargs)
+        return call
+
+
+class ProcessModule:
+    """ Proxy of a hardware module which is instantiated and running in a separate worker process.
+
+    Long calls into C libraries and Python heavy data processing of the module then neither hold
+    the GIL of the Qudi process nor block other modules. Method calls and attribute requests are
+    forwarded over a pipe, one at a time. Large numpy arrays in the arguments and results are
+    transferred through a SharedBuffer instead of being pickled. The log messages of the worker
+    are handled by the logging of the Qudi process.
+
+    The module can only be used through its methods, i.e. Qt signals of the module, connectors and
+    GUI modules are not available. Enable it in the configuration of a hardware module with
+
+        separate_process: True
+        shared_buffer_size: 67108864  # optional, in bytes
+
+    Use create_process_module to get a proxy which passes the interface checks of the connectors.
+    """
+
+    def __init__(self, module_class, manager, name, config=None):
+        """
+        @param type module_class: class of the hardware module
+        @param Manager manager: the manager object
+        @param str name: unique name of the module
+        @param dict config: configuration of the module
+        """
+        if config is None:
+            config = OrderedDict()
+        self._module_class = module_class
+        self._manager = manager
+        self._name = name
+        self._configuration = config
+        self._statusVariables = OrderedDict()
+        self.connectors = OrderedDict()
+        self.module_state = ProcessModuleState(self)
+
+        self._lock = Mutex()
+        self._context = multiprocessing.get_context('spawn')
+        self._buffer = SharedBuffer(config.get('shared_buffer_size', DEFAULT_SHARED_BUFFER_SIZE))
+        self._process = None
+        self._connection = None
+        self._log_listener = None
+        self._start_worker()
+
+    @property
+    def log(self):
+        """ Returns a logger object. """
+        return logging.getLogger('{0}.{1}'.format(self._module_class.__module__,
+                                                  self._module_class.__name__))
+
+    @property
+    def is_module_threaded(self):
+        """ The module is activated in the worker process, not in a thread of Qudi. """
+        return False
+
+    @property
+    def is_worker_alive(self):
+        """ Whether the worker process is running. """
+        return self._process is not None and self._process.is_alive()
+
+    def getStatusVariables(self):
+        """ Return the status variables of the last deactivation. """
+        return self._statusVariables
+
+    def setStatusVariables(self, variableDict):
+        """ Set the status variables which are passed on with the next activation. """
+        self._statusVariables = variableDict
+
+    def getConfiguration(self):
+        """ Return the configuration dictionary for this module. """
+        return self._configuration
+
+    def __getattr__(self, name):
+        # only called for attributes which are not found in the proxy itself
+        if name.startswith('_'):
+            raise AttributeError(name)
+        class_attr = getattr(self._module_class, name, None)
+        if isinstance(class_attr, InterfaceMethod):
+            return ProcessInterfaceMethod(self, name)
+        if callable(class_attr) and not isinstance(class_attr, type):
+            def call(*args, **kwargs):
+                return self._call(name, None, args, kwargs)
+            call.__name__ = name
+            call.__doc__ = class_attr.__doc__
+            return call
+        return self._request('getattr', name)
+
+    def _start_worker(self):
+        log_queue = self._context.Queue()
+        self._log_listener = logging.handlers.QueueListener(log_queue, _LogForwardHandler())
+        self._log_listener.start()
+        self._connection, worker_connection = self._context.Pipe()
+        self._process = self._context.Process(
+            target=run_module_process,
+            args=(worker_connection, self._buffer.raw, log_queue, self._module_class.__module__,
+                  self._module_class.__name__, self._name, self._configuration),
+            name='qudi-{0}'.format(self._name),
+            daemon=True)
+        self._process.start()
+        worker_connection.close()
+        # wait for the instantiation of the module in the worker process
+        try:
+            with self._lock:
+                self._receive()
+        except:
+            self._stop_worker()
+            raise
+
+    def _stop_worker(self):
+        if self.is_worker_alive:
+            try:
+                self._request('stop')
+            except Exception:
+                logger.exception('Error while stopping the worker process of {0}.'
+                                 ''.format(self._name))
+            self._process.join(10)
+            if self._process.is_alive():
+                self._process.terminate()
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+        if self._log_listener is not None:
+            self._log_listener.stop()
+            self._log_listener = None
+        self._process = None
+        self.module_state.current = 'deactivated'
+
+    def _activate(self):
+        if not self.is_worker_alive:
+            self._start_worker()
+        return self._request('activate', self._statusVariables)
+
+    def _deactivate(self):
+        try:
+            success, status_variables = self._request('deactivate')
+            self._statusVariables = status_variables
+        finally:
+            self._stop_worker()
+        return success
+
+    def _call(self, name, interface, args, kwargs):
+        with self._lock:
+            self._buffer.reset()
+            self._send(('call', name, interface, self._buffer.pack(args),
+                        self._buffer.pack(kwargs)))
+            return self._receive()
+
+    def _request(self, command, *args):
+        with self._lock:
+            self._send((command, ) + args)
+            return self._receive()
+
+    def _send(self, message):
+        if not self.is_worker_alive:
+            raise RuntimeError('Worker process of module {0} is not running.'.format(self._name))
+        self._connection.send(message)
+
+    def _receive(self):
+        try:
+            status, state, payload = self._connection.recv()
+        except (EOFError, OSError):
+            self.module_state.current = 'deactivated'
+            raise RuntimeError('Worker process of module {0} terminated.'.format(self._name))
+        self.module_state.current = state
+        if status == 'error':
+            exception, formatted_traceback = payload
+            self.log.debug('Error in worker process:\n{0}'.format(formatted_traceback))
+            raise exception
+        return self._buffer.unpack(payload)
+
+
+def create_process_module(module_class, manager, name, config=None):
+    """ Create a proxy of a hardware module running in a worker process.
+
+    @param type module_class: class of the hardware module
+    @param Manager manager: the manager object
+    @param str name: unique name of the module
+    @param dict config: configuration of the module
+
+    @return ProcessModule: proxy of the module
+
+    The class of the proxy carries the names of the module class and of its bases, so the proxy
+    can be connected to connectors which expect one of its interfaces.
+    """
+    bases = [type(cls.__name__, (), {'__module__': cls.__module__})
+             for cls in module_class.mro()[1:]
+             if cls.__module__.split('.')[0] in ('hardware', 'interface', 'logic')]
+    proxy_class = type(module_class.__name__, (ProcessModule, ) + tuple(bases),
+                       {'__module__': module_class.__module__})
+    return proxy_class(module_class, manager=manager, name=name, config=config)
+
+
+class _LogForwardHandler(logging.Handler):
+    """ Passes the log records of the worker process to the loggers of the Qudi process. """
+
+    def emit(self, record):
+        logging.getLogger(record.name).handle(record)
+
+
+def _picklable_exception(exception):
+    try:
+        pickle.dumps(exception)
+        return exception
+    except Exception:
+        return RuntimeError('{0}: {1}'.format(type(exception).__name__, exception))
+
+
+def run_module_process(connection, raw_buffer, log_queue, module_name, class_name, name, config):
+    """ Main function of the worker process. Instantiates the module and serves the requests.
+
+    @param Connection connection: pipe to the Qudi process
+    @param raw_buffer: RawArray of the SharedBuffer
+    @param Queue log_queue: queue for the log records
+    @param str module_name: name of the python module containing the module class
+    @param str class_name: name of the module class
+    @param str name: unique name of the module
+    @param dict config: configuration of the module
+    """
+    root_logger = logging.getLogger()
+    root_logger.handlers = [logging.handlers.QueueHandler(log_queue)]
+    root_logger.setLevel(logging.DEBUG)
+
+    from qtpy import QtCore
+    app = QtCore.QCoreApplication.instance()
+    if app is None:
+        app = QtCore.QCoreApplication([])
+
+    buffer = SharedBuffer(raw=raw_buffer)
+    try:
+        module_class = getattr(importlib.import_module(module_name), class_name)
+        instance = module_class(manager=None, name=name, config=config)
+    except Exception as e:
+        connection.send(('error', 'deactivated', (_picklable_exception(e), traceback.format_exc())))
+        return
+    connection.send(('ok', instance.module_state(), None))
+
+    while True:
+        # keep timers and queued signals within the module working while idle
+        if not connection.poll(0.01):
+            app.processEvents()
+            continue
+        try:
+            request = connection.recv()
+        except (EOFError, OSError):
+            break
+        command = request[0]
+        try:
+            if command == 'call':
+                method_name, interface, args, kwargs = request[1:]
+                args = buffer.unpack(args)
+                kwargs = buffer.unpack(kwargs)
+                method = getattr(instance, method_name)
+                if interface is not None:
+                    method = method[interface]
+                result = method(*args, **kwargs)
+            elif command == 'getattr':
+                result = getattr(instance, request[1])
+            elif command == 'activate':
+                instance._statusVariables = request[1]
+                result = instance.module_state.activate()
+            elif command == 'deactivate':
+                success = instance.module_state.deactivate()
+                result = (success, instance._statusVariables)
+            elif command == 'stop':
+                connection.send(('ok', instance.module_state(), None))
+                break
+            else:
+                raise ValueError('Unknown request "{0}".'.format(command))
+            buffer.reset()
+            connection.send(('ok', instance.module_state(), buffer.pack(result)))
+        except Exception as e:
+            connection.send(('error', instance.module_state(),
+                             (_picklable_exception(e), traceback.format_exc())))
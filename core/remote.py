@@ -27,6 +27,7 @@ from qtpy.QtCore import QObject
 from urllib.parse import urlparse
 import ssl
 from .util.models import DictTableModel, ListTableModel
+from .util.network import ArraySender
 import rpyc
 from rpyc.utils.server import ThreadedServer
 from rpyc.utils.authenticators import SSLAuthenticator
@@ -65,12 +66,14 @@ class RemoteObjectManager(QObject):
                 """ code that runs when a connection is created
                     (to init the service, if needed)
                 """
+                self._array_sender = ArraySender()
                 logger.info('Client connected!')
 
             def on_disconnect(self, conn):
                 """ code that runs when the connection has already closed
                     (to finalize the service, if needed)
                 """
+                self._array_sender.close()
                 logger.info('Client disconnected!')
 
             def exposed_getModule(self, name):
@@ -95,6 +98,23 @@ class RemoteObjectManager(QObject):
                         logger.error('Client requested a module that is not '
                                 'shared.')
                         return None
+
+            def exposed_get_array(self, array, key=None, version=None, compression=False,
+                                  delta=False, client_host=None):
+                """ Return a numpy array of a shared module as binary message.
+
+                  @param numpy.ndarray array: array (returned by a shared module) to transfer
+                  @param str key: optional, name of the array for delta updates and shared memory
+                  @param int version: version of this key the client already has
+                  @param bool compression: compress the message
+                  @param bool delta: send only the changed elements if possible
+                  @param str client_host: host name of the client
+
+                  @return bytes: binary message, see core.util.network.decode_array
+                """
+                return self._array_sender.encode(array, key=key, version=version,
+                                                 compression=compression, delta=delta,
+                                                 client_host=client_host)
         return RemoteModuleService
 
     def createServer(self, hostname, port, certfile=None, keyfile=None):
@@ -19,14 +19,230 @@ Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
 top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
 """
 
+import os
+import socket
+import struct
+import tempfile
+import weakref
+import zlib
+
+import numpy as np
 import rpyc.core.netref
 import rpyc.utils.classic
 
 
 def netobtain(obj):
-    """
+    """ Return a local copy of obj if it is a rpyc remote object, else obj itself.
+
+    Arrays are pickled as a whole, use netobtain_array for large numpy arrays.
     """
     if isinstance(obj, rpyc.core.netref.BaseNetref):
         return rpyc.utils.classic.obtain(obj)
     else:
         return obj
+
+
+# Binary array messages: header, dtype string, shape and the payload, which is either the raw
+# array buffer, the changed elements (indices and values) or the path of a shared memory file.
+ARRAY_MAGIC = b'QARR'
+ARRAY_FULL = 0
+ARRAY_DELTA = 1
+ARRAY_SHARED = 2
+_array_header = struct.Struct('<4sBBBBQ')  # magic, kind, compressed, ndim, dtype length, version
+
+
+def encode_array(array, compression=False, version=0):
+    """ Encode a numpy array into a compact binary message.
+
+    @param numpy.ndarray array: array to encode, must not contain python objects
+    @param bool compression: compress the array buffer with zlib
+    @param int version: version number of the array, used for delta updates
+
+    @return bytes: binary message
+    """
+    array = np.ascontiguousarray(array)
+    payload = array.tobytes() if compression else memoryview(array).cast('B')
+    return _encode_message(ARRAY_FULL, array.dtype, array.shape, payload, compression, version)
+
+
+def encode_array_delta(array, previous, compression=False, version=0, max_ratio=0.5):
+    """ Encode only the elements of an array which changed since a previous version.
+
+    @param numpy.ndarray array: array to encode
+    @param numpy.ndarray previous: previous version of the array known to the receiver
+    @param bool compression: compress the changed elements with zlib
+    @param int version: version number of the new array
+    @param float max_ratio: maximal size of the delta message relative to the full array
+
+    @return bytes: binary message, None if a delta update is not possible or not worth it
+
+    Accumulating histograms change only in a small fraction of their bins between two updates,
+    so sending the changed bins is much cheaper than sending the whole histogram.
+    """
+    array = np.ascontiguousarray(array)
+    if previous is None or previous.shape != array.shape or previous.dtype != array.dtype:
+        return None
+    changed = np.flatnonzero(array.ravel() != previous.ravel())
+    if changed.size * (8 + array.itemsize) > max_ratio * array.nbytes:
+        return None
+    payload = changed.astype('<i8').tobytes() + array.ravel()[changed].tobytes()
+    return _encode_message(ARRAY_DELTA, array.dtype, array.shape, payload, compression, version)
+
+
+def decode_array(message, previous=None):
+    """ Decode a binary message of encode_array, encode_array_delta or ArraySender.
+
+    @param bytes message: binary message
+    @param numpy.ndarray previous: previous version of the array, needed for delta messages
+
+    @return tuple(numpy.ndarray, int): writeable array and its version number
+    """
+    message = memoryview(message)
+    magic, kind, compressed, ndim, dtype_length, version = _array_header.unpack_from(message)
+    if magic != ARRAY_MAGIC:
+        raise ValueError('Not an encoded array.')
+    offset = _array_header.size
+    dtype = np.dtype(bytes(message[offset:offset + dtype_length]).decode())
+    offset += dtype_length
+    shape = struct.unpack_from('<{0:d}Q'.format(ndim), message, offset)
+    offset += 8 * ndim
+    payload = message[offset:]
+    if compressed:
+        payload = zlib.decompress(payload)
+
+    if kind == ARRAY_FULL:
+        array = np.frombuffer(payload, dtype=dtype).reshape(shape).copy()
+    elif kind == ARRAY_DELTA:
+        if previous is None or previous.shape != shape or previous.dtype != dtype:
+            raise ValueError('Delta update of an array requires the previous version.')
+        count = len(payload) // (8 + dtype.itemsize)
+        changed = np.frombuffer(payload, dtype='<i8', count=count)
+        array = previous.copy()
+        array.ravel()[changed] = np.frombuffer(payload, dtype=dtype, offset=8 * count)
+    elif kind == ARRAY_SHARED:
+        path = bytes(payload).decode()
+        array = np.array(np.memmap(path, dtype=dtype, mode='r', shape=shape))
+    else:
+        raise ValueError('Unknown array message kind {0}.'.format(kind))
+    return array, version
+
+
+def _encode_message(kind, dtype, shape, payload, compression, version):
+    dtype_str = dtype.str.encode()
+    if compression:
+        payload = zlib.compress(payload, 1)
+    return b''.join((
+        _array_header.pack(ARRAY_MAGIC, kind, bool(compression), len(shape), len(dtype_str),
+                           version),
+        dtype_str,
+        struct.pack('<{0:d}Q'.format(len(shape)), *shape),
+        payload))
+
+
+class ArraySender:
+    """ Encodes arrays for one client connection, i.e. the sending side of netobtain_array.
+
+    For every key the last sent version of an array is kept to send delta updates. If the client
+    runs on the same host, the arrays are passed through a memory mapped file in shared memory
+    (/dev/shm if available) instead of the socket.
+    """
+
+    def __init__(self):
+        self._sent = dict()
+        self._shared = dict()
+        self._shared_dir = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+    def encode(self, array, key=None, version=None, compression=False, delta=False,
+               client_host=None):
+        """ Encode an array for the client.
+
+        @param numpy.ndarray array: array to send
+        @param str key: optional, name of the array, required for delta updates and shared memory
+        @param int version: version of this key the client already has
+        @param bool compression: compress the message with zlib
+        @param bool delta: send only the changed elements if possible
+        @param str client_host: host name of the client, shared memory is used for this host
+
+        @return bytes: binary message
+        """
+        array = np.asarray(array)
+        if key is None:
+            return encode_array(array, compression=compression)
+
+        last_version, previous = self._sent.get(key, (0, None))
+        new_version = last_version + 1
+        if array.size and client_host is not None and client_host == socket.gethostname():
+            shared = self._shared.get(key)
+            if shared is None or shared.shape != array.shape or shared.dtype != array.dtype:
+                self._close_shared(key)
+                fd, path = tempfile.mkstemp(prefix='qudi_', suffix='.bin', dir=self._shared_dir)
+                os.close(fd)
+                shared = np.memmap(path, dtype=array.dtype, mode='w+', shape=array.shape)
+                self._shared[key] = shared
+            shared[...] = array
+            self._sent[key] = (new_version, None)
+            return _encode_message(ARRAY_SHARED, array.dtype, array.shape,
+                                   shared.filename.encode(), False, new_version)
+
+        message = None
+        if delta and version is not None and version == last_version:
+            message = encode_array_delta(array, previous, compression=compression,
+                                         version=new_version)
+        if message is None:
+            message = encode_array(array, compression=compression, version=new_version)
+        self._sent[key] = (new_version, array.copy() if delta else None)
+        return message
+
+    def close(self):
+        """ Forget the sent arrays and remove the shared memory files. """
+        for key in list(self._shared):
+            self._close_shared(key)
+        self._sent.clear()
+
+    def _close_shared(self, key):
+        shared = self._shared.pop(key, None)
+        if shared is not None:
+            path = shared.filename
+            del shared
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+# last received version of every key for every connection, for delta updates
+_received_arrays = weakref.WeakKeyDictionary()
+
+
+def netobtain_array(obj, key=None, compression=False, delta=False):
+    """ Return a local copy of a numpy array which may be a rpyc remote object.
+
+    @param obj: numpy array or rpyc reference to a remote numpy array
+    @param str key: optional, name of the array. Required for delta updates and for the transfer
+                    via shared memory if the remote module runs on the same host.
+    @param bool compression: compress the array for the transfer
+    @param bool delta: only transfer the changed elements since the last transfer of this key
+
+    @return numpy.ndarray: local array
+
+    The array is transferred as a binary message instead of being pickled. Falls back to
+    netobtain if the remote module server does not support the binary transfer.
+    """
+    if not isinstance(obj, rpyc.core.netref.BaseNetref):
+        return obj
+    connection = object.__getattribute__(obj, '____conn__')
+    if isinstance(connection, weakref.ref):
+        connection = connection()
+    try:
+        get_array = connection.root.get_array
+    except AttributeError:
+        return netobtain(obj)
+
+    received = _received_arrays.setdefault(connection, dict())
+    version, previous = received.get(key, (None, None))
+    message = get_array(obj, key, version, compression, delta, socket.gethostname())
+    array, version = decode_array(message, previous)
+    if key is not None:
+        # keep a private copy as base of the next delta, the caller may modify the returned array
+        received[key] = (version, array.copy() if delta else None)
+    return array
@@ -109,9 +109,14 @@ class CameraGUI(GUIBase):
         self._mw.start_image_Action.setChecked(self._logic.enabled)
         self._mw.start_image_Action.triggered.connect(self.start_image_clicked)
 
+        self._mw.record_video_Action.setEnabled(True)
+        self._mw.record_video_Action.setChecked(self._logic.recording)
+        self._mw.record_video_Action.triggered.connect(self.record_video_clicked)
+
         self._logic.sigUpdateDisplay.connect(self.update_data)
         self._logic.sigAcquisitionFinished.connect(self.acquisition_finished)
         self._logic.sigVideoFinished.connect(self.enable_start_image_action)
+        self._logic.sigRecordingFinished.connect(self.recording_finished)
 
         # starting the physical measurement
         self.sigVideoStart.connect(self._logic.start_loop)
@@ -216,6 +221,27 @@ class CameraGUI(GUIBase):
 
     def enable_start_image_action(self):
         self._mw.start_image_Action.setEnabled(True)
+        self._mw.start_video_Action.setText('Start Video')
+        self._mw.start_video_Action.setChecked(False)
+
+    def record_video_clicked(self):
+        """ Start or stop the background recording of the video stream. """
+        if self._logic.recording:
+            self._logic.stop_recording()
+        else:
+            self._mw.start_image_Action.setDisabled(True)
+            self._mw.start_video_Action.setText('Stop Video')
+            self._mw.start_video_Action.setChecked(True)
+            self._logic.start_recording()
+
+    def recording_finished(self):
+        self._mw.record_video_Action.setChecked(False)
+        statistics = self._logic.get_acquisition_statistics()
+        self._mw.statusBar().showMessage(
+            'Recorded {0:d} frames, {1:d} dropped during acquisition, {2:d} dropped by recorder.'
+            ''.format(statistics['recorded_frames'],
+                      statistics['dropped_frames'],
+                      statistics['dropped_recording_frames']))
 
     def update_data(self):
         """
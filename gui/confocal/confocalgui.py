@@ -30,7 +30,7 @@ from core.configoption import ConfigOption
 from core.statusvariable import StatusVar
 from qtwidgets.scan_plotwidget import ScanImageItem
 from gui.guibase import GUIBase
-from gui.guiutils import ColorBar
+from gui.guiutils import ColorBar, UpdateRateLimiter, RunningPercentile
 from gui.colordefs import ColorScaleInferno
 from gui.colordefs import QudiPalettePale as palette
 from gui.fitsettings import FitParametersWidget
@@ -124,6 +124,9 @@ class ConfocalGui(GUIBase):
     image_z_padding = ConfigOption('image_z_padding', 0.02)
 
     default_meter_prefix = ConfigOption('default_meter_prefix', None)  # assume the unit prefix of position spinbox
+    max_image_update_rate = ConfigOption('max_image_update_rate', 20)  # in Hz
+    # larger images are displayed with every n-th line and pixel only
+    max_image_display_size = ConfigOption('max_image_display_size', 2048)
 
     # status var
     adjust_cursor_roi = StatusVar(default=True)
@@ -178,8 +181,10 @@ class ConfocalGui(GUIBase):
         self.opt_channel = 0
 
         # Get the image for the display from the logic
-        raw_data_xy = self._scanning_logic.xy_image[:, :, 3 + self.xy_channel]
-        raw_data_depth = self._scanning_logic.depth_image[:, :, 3 + self.depth_channel]
+        raw_data_xy = self._scanning_logic.xy_image.view(
+            self.xy_channel, self.max_image_display_size)
+        raw_data_depth = self._scanning_logic.depth_image.view(
+            self.depth_channel, self.max_image_display_size)
 
         # Set initial position for the crosshair, default is the middle of the
         # screen:
@@ -191,6 +196,17 @@ class ConfocalGui(GUIBase):
         self.xy_image = ScanImageItem(image=raw_data_xy, axisOrder='row-major')
         self.depth_image = ScanImageItem(image=raw_data_depth, axisOrder='row-major')
 
+        # Running histograms of the displayed images for the percentile colour scaling. Only the
+        # image lines reported by the logic since the last refresh are added to the histograms.
+        self._xy_percentile = RunningPercentile()
+        self._depth_percentile = RunningPercentile()
+        self._percentile_sources = {'xy': None, 'depth': None}
+        self._dirty_lines = {'xy': list(), 'depth': list()}
+        self._update_percentile('xy', self._xy_percentile, self._scanning_logic.xy_image,
+                                self.xy_channel)
+        self._update_percentile('depth', self._depth_percentile,
+                                self._scanning_logic.depth_image, self.depth_channel)
+
         # Hide tilt correction window
         self._mw.tilt_correction_dockWidget.hide()
 
@@ -486,11 +502,17 @@ class ConfocalGui(GUIBase):
         self._mw.depth_cb_high_percentile_DoubleSpinBox.valueChanged.connect(self.shortcut_to_depth_cb_centiles)
 
         # Connect the emitted signal of an image change from the logic with
-        # a refresh of the GUI picture:
-        self._scanning_logic.signal_xy_image_updated.connect(self.refresh_xy_image)
+        # a refresh of the GUI picture. Image updates are coalesced to a maximum frame rate.
+        self._xy_image_limiter = UpdateRateLimiter(self.refresh_xy_image,
+                                                   max_rate=self.max_image_update_rate)
+        self._depth_image_limiter = UpdateRateLimiter(self.refresh_depth_image,
+                                                      max_rate=self.max_image_update_rate)
+        self._scanning_logic.sigImageLinesUpdated.connect(self._mark_dirty_lines)
+        self._scanning_logic.signal_xy_image_updated.connect(self._xy_image_limiter.request_update)
         self._scanning_logic.signal_xy_image_updated.connect(self.refresh_scan_line)
         self._scanning_logic.signal_depth_image_updated.connect(self.refresh_scan_line)
-        self._scanning_logic.signal_depth_image_updated.connect(self.refresh_depth_image)
+        self._scanning_logic.signal_depth_image_updated.connect(
+            self._depth_image_limiter.request_update)
         self._optimizer_logic.sigImageUpdated.connect(self.refresh_refocus_image)
         self._scanning_logic.sigImageXYInitialized.connect(self.adjust_xy_window)
         self._scanning_logic.sigImageDepthInitialized.connect(self.adjust_depth_window)
@@ -648,6 +670,13 @@ class ConfocalGui(GUIBase):
 
         @return int: error code (0:OK, -1:error)
         """
+        self._scanning_logic.sigImageLinesUpdated.disconnect(self._mark_dirty_lines)
+        self._scanning_logic.signal_xy_image_updated.disconnect(
+            self._xy_image_limiter.request_update)
+        self._scanning_logic.signal_depth_image_updated.disconnect(
+            self._depth_image_limiter.request_update)
+        self._xy_image_limiter.flush()
+        self._depth_image_limiter.flush()
         self._mw.close()
         return 0
 
@@ -705,21 +734,19 @@ class ConfocalGui(GUIBase):
         """ Determines the cb_min and cb_max values for the xy scan image
         """
         # If "Manual" is checked, or the image data is empty (all zeros), then take manual cb range.
-        if self._mw.xy_cb_manual_RadioButton.isChecked() or np.count_nonzero(self.xy_image.image) < 1:
+        if self._mw.xy_cb_manual_RadioButton.isChecked() or self._xy_percentile.count < 1:
             cb_min = self._mw.xy_cb_min_DoubleSpinBox.value()
             cb_max = self._mw.xy_cb_max_DoubleSpinBox.value()
 
         # Otherwise, calculate cb range from percentiles.
         else:
-            # Exclude any zeros (which are typically due to unfinished scan)
-            xy_image_nonzero = self.xy_image.image[np.nonzero(self.xy_image.image)]
-
-            # Read centile range
+            # The running histogram excludes any zeros (which are typically due to unfinished
+            # scan) and is updated in refresh_xy_image for the changed lines only.
             low_centile = self._mw.xy_cb_low_percentile_DoubleSpinBox.value()
             high_centile = self._mw.xy_cb_high_percentile_DoubleSpinBox.value()
 
-            cb_min = np.percentile(xy_image_nonzero, low_centile)
-            cb_max = np.percentile(xy_image_nonzero, high_centile)
+            cb_min = self._xy_percentile.percentile(low_centile)
+            cb_max = self._xy_percentile.percentile(high_centile)
 
         cb_range = [cb_min, cb_max]
 
@@ -729,21 +756,19 @@ class ConfocalGui(GUIBase):
         """ Determines the cb_min and cb_max values for the xy scan image
         """
         # If "Manual" is checked, or the image data is empty (all zeros), then take manual cb range.
-        if self._mw.depth_cb_manual_RadioButton.isChecked() or np.count_nonzero(self.depth_image.image) < 1:
+        if self._mw.depth_cb_manual_RadioButton.isChecked() or self._depth_percentile.count < 1:
             cb_min = self._mw.depth_cb_min_DoubleSpinBox.value()
             cb_max = self._mw.depth_cb_max_DoubleSpinBox.value()
 
         # Otherwise, calculate cb range from percentiles.
         else:
-            # Exclude any zeros (which are typically due to unfinished scan)
-            depth_image_nonzero = self.depth_image.image[np.nonzero(self.depth_image.image)]
-
-            # Read centile range
+            # The running histogram excludes any zeros (which are typically due to unfinished
+            # scan) and is updated in refresh_depth_image for the changed lines only.
             low_centile = self._mw.depth_cb_low_percentile_DoubleSpinBox.value()
             high_centile = self._mw.depth_cb_high_percentile_DoubleSpinBox.value()
 
-            cb_min = np.percentile(depth_image_nonzero, low_centile)
-            cb_max = np.percentile(depth_image_nonzero, high_centile)
+            cb_min = self._depth_percentile.percentile(low_centile)
+            cb_max = self._depth_percentile.percentile(high_centile)
 
         cb_range = [cb_min, cb_max]
         return cb_range
@@ -1380,7 +1405,8 @@ class ConfocalGui(GUIBase):
         """
         self.xy_image.getViewBox().updateAutoRange()
 
-        xy_image_data = self._scanning_logic.xy_image[:, :, 3 + self.xy_channel]
+        xy_image_data = self._update_percentile(
+            'xy', self._xy_percentile, self._scanning_logic.xy_image, self.xy_channel)
 
         cb_range = self.get_xy_cb_range()
 
@@ -1401,7 +1427,8 @@ class ConfocalGui(GUIBase):
 
         self.depth_image.getViewBox().enableAutoRange()
 
-        depth_image_data = self._scanning_logic.depth_image[:, :, 3 + self.depth_channel]
+        depth_image_data = self._update_percentile(
+            'depth', self._depth_percentile, self._scanning_logic.depth_image, self.depth_channel)
         cb_range = self.get_depth_cb_range()
 
         # Now update image with new color scale, and update colorbar
@@ -1412,6 +1439,47 @@ class ConfocalGui(GUIBase):
         if self._scanning_logic.module_state() != 'locked':
             self.enable_scan_actions()
 
+    def _mark_dirty_lines(self, plane, first_line, stop_line):
+        """ Remember the image lines changed by the logic until the next image refresh.
+
+        @param str plane: 'xy' or 'depth'
+        @param int first_line: first changed line of the image
+        @param int stop_line: line after the last changed line
+        """
+        self._dirty_lines[plane].append((first_line, stop_line))
+
+    def _update_percentile(self, plane, percentile, image, channel):
+        """ Get the displayed view of an image and update its running percentile.
+
+        Only the view lines covering the image lines reported as changed since the last refresh are
+        added to the histogram. A new image (i.e. a new scan) or channel rebuilds the histogram and
+        its range from scratch.
+
+        @param str plane: 'xy' or 'depth'
+        @param RunningPercentile percentile: running percentile of the displayed image
+        @param ConfocalImage image: image of the logic
+        @param int channel: displayed count channel
+
+        @return numpy.ndarray: downsampled view of the image for display
+        """
+        view = image.view(channel, self.max_image_display_size)
+        dirty_lines, self._dirty_lines[plane] = self._dirty_lines[plane], list()
+        source = self._percentile_sources[plane]
+        if source is None or source[0] is not image or source[1] != channel:
+            self._percentile_sources[plane] = (image, channel)
+            percentile.reset()
+            rows = None
+        else:
+            # the view contains every line_step-th line of the image
+            line_step = 1
+            if self.max_image_display_size is not None:
+                line_step = max(1, -(-len(image) // int(self.max_image_display_size)))
+            rows = [np.arange(-(-first // line_step), -(-stop // line_step))
+                    for first, stop in dirty_lines]
+            rows = np.concatenate(rows) if rows else np.empty(0, dtype='int64')
+        percentile.update(view, rows)
+        return view
+
     def refresh_refocus_image(self):
         """Refreshes the xy image, the crosshair and the colorbar. """
         ##########
@@ -20,7 +20,9 @@ Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
 top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
 """
 
+import numpy as np
 import pyqtgraph as pg
+from qtpy import QtCore
 
 
 class ColorBar(pg.GraphicsObject):
@@ -107,3 +109,155 @@ class ColorBar(pg.GraphicsObject):
         """
         return pg.QtCore.QRectF(self.pic.boundingRect())
 
+
+
+class UpdateRateLimiter(QtCore.QObject):
+    """ Coalesce update requests so that a (costly) refresh slot is called at a bounded rate.
+
+    The first request is served immediately. All further requests arriving within the minimum
+    update interval are merged into a single call at the end of the interval, so the last state
+    is always displayed.
+
+    @param callable callback: the refresh method to call
+    @param float max_rate: maximum number of calls per second
+    """
+
+    def __init__(self, callback, max_rate=20, parent=None):
+        super().__init__(parent)
+        self._callback = callback
+        self._pending = False
+        self._timer = QtCore.QTimer()
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._timeout)
+        self.max_rate = max_rate
+
+    @property
+    def max_rate(self):
+        return 1000 / self._timer.interval()
+
+    @max_rate.setter
+    def max_rate(self, rate):
+        self._timer.setInterval(max(1, int(round(1000 / rate))))
+
+    @QtCore.Slot()
+    def request_update(self):
+        """ Request a call of the callback. Can be connected directly to signals. """
+        if self._timer.isActive():
+            self._pending = True
+            return
+        self._pending = False
+        self._timer.start()
+        self._callback()
+
+    @QtCore.Slot()
+    def flush(self):
+        """ Serve a pending request immediately. """
+        self._timer.stop()
+        if self._pending:
+            self._pending = False
+            self._callback()
+
+    @QtCore.Slot()
+    def _timeout(self):
+        if self._pending:
+            self._pending = False
+            self._timer.start()
+            self._callback()
+
+
+class RunningPercentile:
+    """ Histogram based percentile estimate for images that change only row by row.
+
+    Instead of sorting the whole image for each update, a histogram of all nonzero pixel values is
+    kept. Only rows that changed since the last update are removed from and added to the histogram.
+    If the caller knows these rows (e.g. the lines scanned since the last update), only they are
+    looked at. The histogram range grows with the data, in which case the histogram is rebuilt
+    once. Call reset when a new image is started to fit the range to the new data again.
+    The returned percentiles are exact to within one histogram bin width.
+
+    @param int bins: number of histogram bins
+    """
+
+    def __init__(self, bins=4096):
+        self._bins = int(bins)
+        self._image = None
+        self._histogram = np.zeros(self._bins, dtype='int64')
+        self._range = (0., 1.)
+
+    @property
+    def count(self):
+        """ Number of nonzero values in the histogram. """
+        return int(self._histogram.sum())
+
+    def reset(self):
+        """ Forget the cached image and the histogram range. The next update rebuilds both. """
+        self._image = None
+        self._histogram = np.zeros(self._bins, dtype='int64')
+        self._range = (0., 1.)
+
+    def update(self, image, rows=None):
+        """ Update the histogram with the changed rows of image.
+
+        @param numpy.ndarray image: 2D image array
+        @param rows: optional, indices of the rows changed since the last update. If None, the
+                     whole image is compared to the cached one.
+        """
+        image = np.asarray(image)
+        if self._image is None or self._image.shape != image.shape:
+            self._rebuild(image)
+            return
+
+        if rows is None:
+            dirty_rows = np.flatnonzero(np.any(self._image != image, axis=1))
+        else:
+            dirty_rows = np.unique(np.asarray(rows, dtype='int64'))
+            dirty_rows = dirty_rows[(dirty_rows >= 0) & (dirty_rows < image.shape[0])]
+        if dirty_rows.size == 0:
+            return
+        new_values = image[dirty_rows]
+        new_nonzero = new_values[new_values != 0]
+        if new_nonzero.size > 0 and (new_nonzero.min() < self._range[0]
+                                     or new_nonzero.max() > self._range[1]):
+            self._rebuild(image)
+            return
+        old_values = self._image[dirty_rows]
+        self._histogram -= self._bin_count(old_values[old_values != 0])
+        self._histogram += self._bin_count(new_nonzero)
+        self._image[dirty_rows] = new_values
+
+    def percentile(self, q):
+        """ Estimate the q-th percentile of the nonzero values.
+
+        @param float q: percentile in the range 0..100
+
+        @return float: estimated percentile (0 if no nonzero values are present)
+        """
+        total = self._histogram.sum()
+        if total == 0:
+            return 0.
+        cumulative = np.cumsum(self._histogram)
+        target = np.clip(q, 0, 100) / 100 * total
+        index = int(np.searchsorted(cumulative, target))
+        index = min(index, self._bins - 1)
+        # linear interpolation within the bin
+        previous = cumulative[index - 1] if index > 0 else 0
+        fraction = (target - previous) / max(self._histogram[index], 1)
+        bin_width = (self._range[1] - self._range[0]) / self._bins
+        return self._range[0] + (index + np.clip(fraction, 0, 1)) * bin_width
+
+    def _rebuild(self, image):
+        self._image = np.array(image, copy=True)
+        nonzero = self._image[self._image != 0]
+        if nonzero.size == 0:
+            self._range = (0., 1.)
+        else:
+            low, high = float(nonzero.min()), float(nonzero.max())
+            # leave headroom so that a growing signal does not cause a rebuild every update
+            span = max(high - low, abs(high) * 1e-6, 1e-12)
+            self._range = (low, high + 0.5 * span)
+        self._histogram = self._bin_count(nonzero)
+
+    def _bin_count(self, values):
+        scale = self._bins / (self._range[1] - self._range[0])
+        indices = np.clip(((values - self._range[0]) * scale).astype('int64'), 0, self._bins - 1)
+        return np.bincount(indices, minlength=self._bins)
@@ -373,25 +373,41 @@ class LogWidget(QtWidgets.QWidget):
 
           @param dict entry: log entry in dict format
         """
+        self.addEntries([entry])
+
+    def addEntries(self, entries):
+        """Add several log entries to the log view at once.
+
+          @param list entries: log entries in dict format
+
+        The rows are inserted with a single model update and the view is
+        scrolled only once per batch.
+        """
         # All incoming messages begin here
         # for thread-safetyness:
         isGuiThread = QtCore.QThread.currentThread(
         ) == QtCore.QCoreApplication.instance().thread()
         if not isGuiThread:
-            self.sigAddEntry.emit(entry)
+            for entry in entries:
+                self.sigAddEntry.emit(entry)
+            return
+        logEntries = list()
+        for entry in entries[-self.logLength:]:
+            text = entry['message']
+            if entry.get('exception') is not None:
+                if 'reasons' in entry['exception']:
+                    text += '\n' + entry['exception']['reasons']
+                if 'message' in entry['exception']:
+                    text += '\n' + entry['exception']['message']
+                for line in entry['exception']['traceback']:
+                    text += '\n' + str(line)
+            logEntries.append([entry['name'], entry['timestamp'], entry['level'], text])
+        if not logEntries:
             return
-        if self.model.rowCount() > self.logLength:
-            self.model.removeRows(0, self.model.rowCount() - self.logLength)
-        text = entry['message']
-        if entry.get('exception') is not None:
-            if 'reasons' in entry['exception']:
-                text += '\n' + entry['exception']['reasons']
-            if 'message' in entry['exception']:
-                text += '\n' + entry['exception']['message']
-            for line in entry['exception']['traceback']:
-                text += '\n' + str(line)
-        logEntry = [entry['name'], entry['timestamp'], entry['level'], text]
-        self.model.addRow(self.model.rowCount(), logEntry)
+        excess = self.model.rowCount() + len(logEntries) - self.logLength
+        if excess > 0:
+            self.model.removeRows(0, min(excess, self.model.rowCount()))
+        self.model.addRows(self.model.rowCount(), logEntries)
         self.output.scrollToBottom()
 
     def displayEntry(self, entry):
@@ -143,9 +143,9 @@ class ManagerGui(GUIBase):
         self._manager.sigShutdownAcknowledge.connect(self.promptForShutdown)
         # Log widget
         self._mw.logwidget.setManager(self._manager)
-        for loghandler in logging.getLogger().handlers:
+        for loghandler in core.logger.get_log_handlers():
             if isinstance(loghandler, core.logger.QtLogHandler):
-                loghandler.sigLoggedMessage.connect(self.handleLogEntry)
+                loghandler.sigLoggedMessages.connect(self.handleLogEntries)
         # Module widgets
         self.sigStartModule.connect(self._manager.startModule)
         self.sigReloadModule.connect(self._manager.restartModuleRecursive)
@@ -266,9 +266,18 @@ class ManagerGui(GUIBase):
 
             @param dict entry: Log entry
         """
-        self._mw.logwidget.addEntry(entry)
-        if entry['level'] == 'error' or entry['level'] == 'critical':
-            self.errorDialog.show(entry)
+        self.handleLogEntries([entry])
+
+    def handleLogEntries(self, entries):
+        """ Forward a batch of log entries to log widget and show an error
+            popup for error messages.
+
+            @param list entries: Log entries
+        """
+        self._mw.logwidget.addEntries(entries)
+        for entry in entries:
+            if entry['level'] == 'error' or entry['level'] == 'critical':
+                self.errorDialog.show(entry)
 
     def startIPython(self):
         """ Create an IPython kernel manager and kernel.
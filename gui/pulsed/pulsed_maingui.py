@@ -32,6 +32,7 @@ from core.util.helpers import natural_sort
 from gui.colordefs import QudiPalettePale as palette
 from gui.fitsettings import FitSettingsDialog
 from gui.guibase import GUIBase
+from gui.guiutils import UpdateRateLimiter
 from qtpy import QtCore, QtWidgets, uic
 from qtwidgets.scientific_spinbox import ScienDSpinBox, ScienSpinBox
 from enum import Enum
@@ -2364,7 +2365,7 @@ class PulsedMeasurementGui(GUIBase):
             self.measuring_error_image2.setData(x=measurement_error[0], y=measurement_error[2])
 
         # dealing with the laser plot
-        self.update_laser_data()
+        self._laser_update_limiter.request_update()
         return
 
     @QtCore.Slot()
@@ -2792,6 +2793,11 @@ class PulsedMeasurementGui(GUIBase):
     #                      Extraction tab related methods                     #
     ###########################################################################
     def _activate_extraction_ui(self):
+        # Summing thousands of laser pulses is costly, so the laser plot refresh is rate limited
+        # and the sum is cached for as long as the logic holds the same data array.
+        self._summed_laser_cache = (None, None)
+        self._laser_update_limiter = UpdateRateLimiter(self.update_laser_data, max_rate=5)
+
         # Configure the lasertrace plot display:
         self.sig_start_line = pg.InfiniteLine(pos=0,
                                               pen={'color': palette.c3, 'width': 1},
@@ -2860,6 +2866,8 @@ class PulsedMeasurementGui(GUIBase):
     def _deactivate_extraction_ui(self):
         self._show_laser_index = self._pe.laserpulses_ComboBox.currentIndex()
         self._show_raw_data = self._pe.laserpulses_display_raw_CheckBox.isChecked()
+        self._laser_update_limiter.flush()
+        self._summed_laser_cache = (None, None)
         return
 
     @QtCore.Slot()
@@ -3091,14 +3099,14 @@ class PulsedMeasurementGui(GUIBase):
         if show_raw:
             if is_gated:
                 if laser_index == 0:
-                    y_data = np.sum(self.pulsedmasterlogic().raw_data, axis=0)
+                    y_data = self._sum_laser_traces(self.pulsedmasterlogic().raw_data)
                 else:
                     y_data = self.pulsedmasterlogic().raw_data[laser_index - 1]
             else:
                 y_data = self.pulsedmasterlogic().raw_data
         else:
             if laser_index == 0:
-                y_data = np.sum(self.pulsedmasterlogic().laser_data, axis=0)
+                y_data = self._sum_laser_traces(self.pulsedmasterlogic().laser_data)
             else:
                 y_data = self.pulsedmasterlogic().laser_data[laser_index - 1]
 
@@ -3110,4 +3118,20 @@ class PulsedMeasurementGui(GUIBase):
         self.lasertrace_image.setData(x=x_data, y=y_data)
         return
 
+    def _sum_laser_traces(self, laser_traces):
+        """ Sum over all laser pulses of the given 2D array.
+
+        The result is cached for as long as the logic provides the very same array object, i.e.
+        until new data has been acquired.
+
+        @param numpy.ndarray laser_traces: 2D array of laser traces
+
+        @return numpy.ndarray: summed laser trace
+        """
+        cached_traces, summed_trace = self._summed_laser_cache
+        if cached_traces is not laser_traces:
+            summed_trace = np.sum(laser_traces, axis=0)
+            self._summed_laser_cache = (laser_traces, summed_trace)
+        return summed_trace
+
 
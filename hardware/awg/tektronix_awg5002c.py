@@ -22,7 +22,6 @@ top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi
 
 from core.util.modules import get_home_dir
 import time
-from ftplib import FTP
 from socket import socket, AF_INET, SOCK_STREAM
 import os
 from collections import OrderedDict
@@ -32,6 +31,7 @@ import re
 from core.module import Base
 from core.configoption import ConfigOption
 from interface.pulser_interface import PulserInterface, PulserConstraints, SequenceOption
+from .tektronix_transport import FtpSessionPool
 
 
 class AWG5002C(Base, PulserInterface):
@@ -52,6 +52,7 @@ class AWG5002C(Base, PulserInterface):
         # ftp_login: 'anonymous' # optional, the username for ftp login
         # ftp_passwd: 'anonymous@' # optional, the password for ftp login
         # default_sample_rate: 600.0e6 # optional, the default sampling rate
+        # ftp_sessions: 2 # optional, number of FTP sessions for parallel file transfer
     """
 
     # config options
@@ -63,6 +64,7 @@ class AWG5002C(Base, PulserInterface):
     user = ConfigOption('ftp_login', 'anonymous', missing='warn')
     passwd = ConfigOption('ftp_passwd', 'anonymous@', missing='warn')
     default_sample_rate = ConfigOption('default_sample_rate', missing='warn')
+    _ftp_sessions = ConfigOption('ftp_sessions', 2, missing='nothing')
 
     def __init__(self, config, **kwargs):
         super().__init__(config=config, **kwargs)
@@ -91,8 +93,9 @@ class AWG5002C(Base, PulserInterface):
         #   https://docs.python.org/3/library/socket.html#socket.socket.recv
         self.input_buffer = int(4096)   # buffer length for received text
 
-        # the ftp connection will be established during runtime if needed and
-        # closed directly afterwards. This makes the connection stable.
+        # the ftp sessions will be established during runtime if needed and
+        # kept open for later transfers. Sessions closed by the AWG are replaced.
+        self._ftp_pool = None
 
         if 'default_sample_rate' in config.keys():
             self._sample_rate = self.set_sample_rate(config['default_sample_rate'])
@@ -104,6 +107,12 @@ class AWG5002C(Base, PulserInterface):
 
         # settings for remote access on the AWG PC
         self.asset_directory = '\\waves'
+        self._ftp_pool = FtpSessionPool(self.ip_address,
+                                        user=self.user,
+                                        passwd=self.passwd,
+                                        working_dir=self.asset_directory,
+                                        max_sessions=self._ftp_sessions,
+                                        timeout=self._timeout)
 
         if 'tmp_work_dir' in config.keys():
             self._tmp_work_dir = config['tmp_work_dir']
@@ -133,6 +142,8 @@ class AWG5002C(Base, PulserInterface):
         """ Deinitialisation performed during deactivation of the module.
         """
         self.connected = False
+        if self._ftp_pool is not None:
+            self._ftp_pool.close()
         self.soc.shutdown(0)  # tell the connection that the host will not listen
                               # any more to messages from it.
         self.soc.close()
@@ -306,9 +317,10 @@ class AWG5002C(Base, PulserInterface):
             if (asset_name + '.seq') in filename:
                 upload_names.append(filename)
 
-        # upload files
-        for name in upload_names:
-            self._send_file(name)
+        # upload files, the files of the different channels in parallel
+        self._ftp_pool.upload_files(
+            [os.path.join(self.host_waveform_directory, name) for name in upload_names],
+            replace=False)
         return 0
 
     def _send_file(self, filename):
@@ -325,11 +337,7 @@ class AWG5002C(Base, PulserInterface):
 
         filepath = os.path.join(self.host_waveform_directory, filename)
 
-        with FTP(self.ip_address) as ftp:
-            ftp.login()  # login as default user anonymous, passwd anonymous@
-            ftp.cwd(self.asset_directory)
-            with open(filepath, 'rb') as uploaded_file:
-                ftp.storbinary('STOR '+filename, uploaded_file)
+        self._ftp_pool.upload(filepath, replace=False)
 
     def load_asset(self, asset_name, load_dict=None):
         """ Loads a sequence or waveform to the specified channel of the pulsing
@@ -964,11 +972,7 @@ class AWG5002C(Base, PulserInterface):
                     files_to_delete.append(filename)
 
         # delete files
-        with FTP(self.ip_address) as ftp:
-            ftp.login() # login as default user anonymous, passwd anonymous@
-            ftp.cwd(self.asset_directory)
-            for filename in files_to_delete:
-                ftp.delete(filename)
+        self._ftp_pool.delete(files_to_delete, missing_ok=False)
 
         # clear the AWG if the deleted asset is the currently loaded asset
         # if self.current_loaded_asset == asset_name:
@@ -987,9 +991,7 @@ class AWG5002C(Base, PulserInterface):
         """
 
         # check whether the desired directory exists:
-        with FTP(self.ip_address) as ftp:
-            ftp.login()  # login as default user anonymous, passwd anonymous@
-
+        with self._ftp_pool.session() as ftp:
             try:
                 ftp.cwd(dir_path)
             except:
@@ -998,6 +1000,7 @@ class AWG5002C(Base, PulserInterface):
                 ftp.mkd(dir_path)
 
         self.asset_directory = dir_path
+        self._ftp_pool.working_dir = dir_path
         return 0
 
     def get_asset_dir_on_device(self):
@@ -1213,33 +1216,10 @@ class AWG5002C(Base, PulserInterface):
         @return: list, The full filenames of all assets saved on the device.
         """
         filename_list = []
-        with FTP(self.ip_address) as ftp:
-            ftp.login()  # login as default user anonymous, passwd anonymous@
-            ftp.cwd(self.asset_directory)
-            # get only the files from the dir and skip possible directories
-            log =[]
-            file_list = []
-            ftp.retrlines('LIST', callback=log.append)
-            for line in log:
-                if '<DIR>' not in line:
-                    # that is how a potential line is looking like:
-                    #   '05-10-16  05:22PM                  292 SSR aom adjusted.seq'
-                    # One can see that the first part consists of the date
-                    # information. Remove those information and separate then
-                    # the first number, which indicates the size of the file,
-                    # from the following. That is necessary if the filename has
-                    # whitespaces in the name:
-                    size_filename = line[18:].lstrip()
-
-                    # split after the first appearing whitespace and take the
-                    # rest as filename, remove for safety all trailing
-                    # whitespaces:
-                    actual_filename = size_filename.split(' ', 1)[1].lstrip()
-                    file_list.append(actual_filename)
-            for filename in file_list:
-                if filename.endswith('.wfm') or filename.endswith('.seq'):
-                    if filename not in filename_list:
-                        filename_list.append(filename)
+        for filename in self._ftp_pool.list_files():
+            if filename.endswith('.wfm') or filename.endswith('.seq'):
+                if filename not in filename_list:
+                    filename_list.append(filename)
 
         return filename_list
 
@@ -22,12 +22,14 @@ top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi
 
 
 import os
+import shutil
+import tempfile
 import time
 import visa
 import numpy as np
 
 from collections import OrderedDict
-from ftplib import FTP
+from concurrent.futures import ThreadPoolExecutor
 from lxml import etree as ET
 
 from core.module import Base
@@ -35,6 +37,7 @@ from core.configoption import ConfigOption
 from core.util.modules import get_home_dir
 from core.util.helpers import natural_sort
 from interface.pulser_interface import PulserInterface, PulserConstraints, SequenceOption
+from .tektronix_transport import FtpSessionPool, DeviceStateCache, wait_for_opc
 
 
 class AWG70K(Base, PulserInterface):
@@ -52,6 +55,8 @@ class AWG70K(Base, PulserInterface):
         # ftp_root_dir: 'C:\\inetpub\\ftproot' # optional, root directory on AWG device
         # ftp_login: 'anonymous' # optional, the username for ftp login
         # ftp_passwd: 'anonymous@' # optional, the password for ftp login
+        # ftp_sessions: 4 # optional, number of FTP sessions for parallel file transfer
+        # marker_buffer_size: 268435456 # optional, bytes of marker data buffered in memory
 
     """
 
@@ -65,6 +70,11 @@ class AWG70K(Base, PulserInterface):
     _ftp_dir = ConfigOption(name='ftp_root_dir', default='C:\\inetpub\\ftproot', missing='warn')
     _username = ConfigOption(name='ftp_login', default='anonymous', missing='warn')
     _password = ConfigOption(name='ftp_passwd', default='anonymous@', missing='warn')
+    _ftp_sessions = ConfigOption(name='ftp_sessions', default=4, missing='nothing')
+    # Marker bytes of chunkwise written waveforms are kept in memory up to this size (in bytes)
+    # until all analog samples are sent. Only larger marker data is spooled to a temporary file.
+    _marker_buffer_size = ConfigOption(name='marker_buffer_size', default=268435456,
+                                       missing='nothing')
 
     # translation dict from qudi trigger descriptor to device command
     __event_triggers = {'OFF': 'OFF', 'A': 'ATR', 'B': 'BTR', 'INT': 'INT'}
@@ -79,6 +89,13 @@ class AWG70K(Base, PulserInterface):
         self.awg_model = ''  # String describing the model
 
         self.ftp_working_dir = 'waves'  # subfolder of FTP root dir on AWG disk to work in
+        self._ftp_pool = None  # persistent FTP sessions to the AWG
+        # WFMX files currently streamed to the AWG. Keys are the file names, values are tuples
+        # (FtpUploadStream, marker byte buffer or None)
+        self._wfmx_uploads = dict()
+        # Cached device state (active channels, waveform/sequence names, sample rate).
+        # Every command changing this state invalidates the respective entry.
+        self._state = DeviceStateCache()
 
         self.__max_seq_steps = 0
         self.__max_seq_repetitions = 0
@@ -105,10 +122,16 @@ class AWG70K(Base, PulserInterface):
             # set timeout by default to 30 sec
             self.awg.timeout = self._visa_timeout * 1000
 
-        # try connecting to AWG using FTP protocol
-        with FTP(self._ip_address) as ftp:
-            ftp.login(user=self._username, passwd=self._password)
-            ftp.cwd(self.ftp_working_dir)
+        # try connecting to AWG using FTP protocol. The session is kept open for later transfers.
+        self._ftp_pool = FtpSessionPool(self._ip_address,
+                                        user=self._username,
+                                        passwd=self._password,
+                                        working_dir=self.ftp_working_dir,
+                                        max_sessions=self._ftp_sessions,
+                                        timeout=self._visa_timeout)
+        with self._ftp_pool.session():
+            pass
+        self._state.invalidate()
 
         if self.awg is not None:
             self.awg_model = self.query('*IDN?').split(',')[1]
@@ -132,6 +155,11 @@ class AWG70K(Base, PulserInterface):
             self.awg.close()
         except:
             self.log.debug('Closing AWG connection using pyvisa failed.')
+        for filename in list(self._wfmx_uploads):
+            self._abort_wfmx_upload(filename)
+        if self._ftp_pool is not None:
+            self._ftp_pool.close()
+        self._state.invalidate()
         self.log.info('Closed connection to AWG')
         return
 
@@ -344,7 +372,7 @@ class AWG70K(Base, PulserInterface):
             self.log.error('No analog samples passed to write_waveform method in awg70k.')
             return -1, waveforms
 
-        min_samples = int(self.query('WLIS:WAV:LMIN?'))
+        min_samples = self.__min_waveform_length
         if total_number_of_samples < min_samples:
             self.log.error('Unable to write waveform.\nNumber of samples to write ({0:d}) is '
                            'smaller than the allowed minimum waveform length ({1:d}).'
@@ -364,7 +392,10 @@ class AWG70K(Base, PulserInterface):
                                      set(analog_samples.keys()).union(set(digital_samples.keys()))))
             return -1, waveforms
 
-        # Write waveforms. One for each analog channel.
+        number_of_samples = len(analog_samples[active_analog[0]])
+
+        # Prepare the samples of each analog channel and its markers
+        channel_samples = list()
         for a_ch in active_analog:
             # Get the integer analog channel number
             a_ch_num = int(a_ch.split('ch')[-1])
@@ -387,47 +418,64 @@ class AWG70K(Base, PulserInterface):
 
             # Create waveform name string
             wfm_name = '{0}_ch{1:d}'.format(name, a_ch_num)
+            channel_samples.append((wfm_name, analog_samples[a_ch], mrk_bytes))
+            # Append created waveform name to waveform list
+            waveforms.append(wfm_name)
 
-            # Check if waveform already exists and delete if necessary.
-            if wfm_name in self.get_waveform_names():
-                self.delete_waveform(wfm_name)
+        # Delete waveforms by the same name from the workspace before their files are replaced
+        if is_first_chunk:
+            self.delete_waveform(waveforms)
+
+        # The upload of each file occupies an FTP session until its last chunk is written.
+        if self._ftp_pool.max_sessions < len(channel_samples):
+            self.log.warning('Streaming {0:d} channels needs more FTP sessions than configured '
+                             '(ftp_sessions: {1:d}). Increasing the number of sessions to {0:d}.'
+                             ''.format(len(channel_samples), self._ftp_pool.max_sessions))
+            self._ftp_pool.resize(len(channel_samples))
+        # The VISA resource must not be used by the upload threads, so query the sample rate for
+        # the header of the WFMX files here.
+        sample_rate = self.get_sample_rate() if is_first_chunk else None
+
+        # Stream the chunk into the WFMX files on the AWG, all channels in parallel
+        def write_channel(wfm_name, samples, mrk_bytes):
+            return self._write_wfmx(filename=wfm_name,
+                                    analog_samples=samples,
+                                    marker_bytes=mrk_bytes,
+                                    is_first_chunk=is_first_chunk,
+                                    is_last_chunk=is_last_chunk,
+                                    total_number_of_samples=total_number_of_samples,
+                                    sample_rate=sample_rate)
+
+        start = time.time()
+        if len(channel_samples) > 1:
+            with ThreadPoolExecutor(max_workers=len(channel_samples)) as executor:
+                errors = list(executor.map(lambda args: write_channel(*args), channel_samples))
+        else:
+            errors = [write_channel(*args) for args in channel_samples]
+        self.log.debug('Stream WFMX data: {0}'.format(time.time() - start))
+        if any(err < 0 for err in errors):
+            for wfm_name in waveforms:
+                self._abort_wfmx_upload(wfm_name + '.wfmx')
+            return -1, waveforms
 
-            # Write WFMX file for waveform
-            start = time.time()
-            self._write_wfmx(filename=wfm_name,
-                             analog_samples=analog_samples[a_ch],
-                             marker_bytes=mrk_bytes,
-                             is_first_chunk=is_first_chunk,
-                             is_last_chunk=is_last_chunk,
-                             total_number_of_samples=total_number_of_samples)
-            self.log.debug('Write WFMX file: {0}'.format(time.time() - start))
-
-            # transfer waveform to AWG and load into workspace
-            start = time.time()
-            self._send_file(filename=wfm_name + '.wfmx')
-            self.log.debug('Send WFMX file: {0}'.format(time.time() - start))
+        # The WFMX files are complete only after the last chunk has been written.
+        if not is_last_chunk:
+            return number_of_samples, waveforms
 
-            start = time.time()
+        # load the waveforms into the workspace
+        start = time.time()
+        for wfm_name in waveforms:
             self.write('MMEM:OPEN "{0}"'.format(os.path.join(
                 self._ftp_dir, self.ftp_working_dir, wfm_name + '.wfmx')))
-            # Wait for everything to complete
-            timeout_old = self.awg.timeout
-            # increase this time so that there is no timeout for loading longer sequences
-            # which might take some minutes
-            self.awg.timeout = 5e6
-            # the answer of the *opc-query is received as soon as the loading is finished
-            opc = int(self.query('*OPC?'))
-            # Just to make sure
-            while wfm_name not in self.get_waveform_names():
-                time.sleep(0.25)
-
-            # reset the timeout
-            self.awg.timeout = timeout_old
-            self.log.debug('Load WFMX file into workspace: {0}'.format(time.time() - start))
-
-            # Append created waveform name to waveform list
-            waveforms.append(wfm_name)
-        return total_number_of_samples, waveforms
+        # The answer of the *OPC? query is received as soon as the loading is finished. Loading
+        # long waveforms might take some minutes.
+        wait_for_opc(self.awg, timeout=5000)
+        if not self._wait_for_waveforms(waveforms):
+            self.log.error('Loading of waveforms {0} into the AWG workspace failed.'
+                           ''.format(waveforms))
+            return -1, list()
+        self.log.debug('Load WFMX files into workspace: {0}'.format(time.time() - start))
+        return number_of_samples, waveforms
 
     def write_sequence(self, name, sequence_parameter_list):
         """
@@ -496,8 +544,7 @@ class AWG70K(Base, PulserInterface):
             self.sequence_set_flags(name, step, seq_step.flag_trigger, seq_step.flag_high)
 
         # Wait for everything to complete
-        while int(self.query('*OPC?')) != 1:
-            time.sleep(0.25)
+        wait_for_opc(self.awg)
         return num_steps
 
     def get_waveform_names(self):
@@ -505,6 +552,9 @@ class AWG70K(Base, PulserInterface):
 
         @return list: List of all uploaded waveform name strings in the device workspace.
         """
+        return self._state.get('waveform_names', self._query_waveform_names)
+
+    def _query_waveform_names(self):
         try:
             query_return = self.query('WLIS:LIST?')
         except visa.VisaIOError:
@@ -513,11 +563,31 @@ class AWG70K(Base, PulserInterface):
         waveform_list = natural_sort(query_return.split(',')) if query_return else list()
         return waveform_list
 
+    def _wait_for_waveforms(self, waveform_names, timeout=10):
+        """ Wait until waveforms show up in the workspace of the AWG.
+
+        @param list waveform_names: names of the waveforms to wait for
+        @param float timeout: maximum time to wait in s
+
+        @return bool: True if all waveforms are present in the workspace
+        """
+        stop_time = time.time() + timeout
+        while True:
+            self._state.invalidate('waveform_names')
+            if set(waveform_names).issubset(self.get_waveform_names()):
+                return True
+            if time.time() > stop_time:
+                return False
+            time.sleep(0.25)
+
     def get_sequence_names(self):
         """ Retrieve the names of all uploaded sequence on the device.
 
         @return list: List of all uploaded sequence name strings in the device workspace.
         """
+        return self._state.get('sequence_names', self._query_sequence_names)
+
+    def _query_sequence_names(self):
         sequence_list = list()
 
         if not self._has_sequence_mode():
@@ -548,6 +618,9 @@ class AWG70K(Base, PulserInterface):
             if waveform in avail_waveforms:
                 self.write('WLIS:WAV:DEL "{0}"'.format(waveform))
                 deleted_waveforms.append(waveform)
+        if deleted_waveforms:
+            self._state.update('waveform_names',
+                               lambda names: [n for n in names if n not in deleted_waveforms])
         return deleted_waveforms
 
     def delete_sequence(self, sequence_name):
@@ -567,6 +640,9 @@ class AWG70K(Base, PulserInterface):
             if sequence in avail_sequences:
                 self.write('SLIS:SEQ:DEL "{0}"'.format(sequence))
                 deleted_sequences.append(sequence)
+        if deleted_sequences:
+            self._state.update('sequence_names',
+                               lambda names: [n for n in names if n not in deleted_sequences])
         return deleted_sequences
 
     def load_waveform(self, load_dict):
@@ -712,12 +788,12 @@ class AWG70K(Base, PulserInterface):
         (PulseBlaster, FPGA).
         """
         self.write('WLIS:WAV:DEL ALL')
-        while int(self.query('*OPC?')) != 1:
-            time.sleep(0.25)
+        wait_for_opc(self.awg)
+        self._state.set('waveform_names', list())
         if self._has_sequence_mode():
             self.write('SLIS:SEQ:DEL ALL')
-            while int(self.query('*OPC?')) != 1:
-                time.sleep(0.25)
+            wait_for_opc(self.awg)
+            self._state.set('sequence_names', list())
         return 0
 
     def get_status(self):
@@ -746,9 +822,9 @@ class AWG70K(Base, PulserInterface):
         # self._activate_awg_mode()
 
         self.write('CLOCK:SRATE %.4G' % sample_rate)
-        while int(self.query('*OPC?')) != 1:
-            time.sleep(0.25)
+        wait_for_opc(self.awg)
         time.sleep(1)
+        self._state.invalidate('sample_rate')
         return self.get_sample_rate()
 
     def get_sample_rate(self):
@@ -756,8 +832,7 @@ class AWG70K(Base, PulserInterface):
 
         @return float: The current sample rate of the device (in Hz)
         """
-        return_rate = float(self.query('CLOCK:SRATE?'))
-        return return_rate
+        return self._state.get('sample_rate', lambda: float(self.query('CLOCK:SRATE?')))
 
     def get_analog_level(self, amplitude=None, offset=None):
         """ Retrieve the analog amplitude and offset of the provided channels.
@@ -905,15 +980,13 @@ class AWG70K(Base, PulserInterface):
             for chnl, amp in amplitude.items():
                 ch_num = int(chnl.rsplit('_ch', 1)[1])
                 self.write('SOUR{0:d}:VOLT:AMPL {1}'.format(ch_num, amp))
-                while int(self.query('*OPC?')) != 1:
-                    time.sleep(0.25)
+                wait_for_opc(self.awg)
 
         if offset is not None:
             for chnl, off in offset.items():
                 ch_num = int(chnl.rsplit('_ch', 1)[1])
                 self.write('SOUR{0:d}:VOLT:OFFSET {1}'.format(ch_num, off))
-                while int(self.query('*OPC?')) != 1:
-                    time.sleep(0.25)
+                wait_for_opc(self.awg)
         return self.get_analog_level()
 
     def get_digital_level(self, low=None, high=None):
@@ -1082,9 +1155,16 @@ class AWG70K(Base, PulserInterface):
         If no parameters are passed to this method all channels will be asked
         for their setting.
         """
-        # If you want to check the input use the constraints:
-        # constraints = self.get_constraints()
+        active_ch = self._state.get('active_channels', self._query_active_channels)
 
+        # return either all channel information or just the one asked for.
+        if ch is not None:
+            chnl_to_delete = [chnl for chnl in active_ch if chnl not in ch]
+            for chnl in chnl_to_delete:
+                del active_ch[chnl]
+        return active_ch
+
+    def _query_active_channels(self):
         analog_channels = self._get_all_analog_channels()
 
         active_ch = dict()
@@ -1106,12 +1186,6 @@ class AWG70K(Base, PulserInterface):
             else:
                 active_ch['d_ch{0:d}'.format(ch_num * 2)] = False
                 active_ch['d_ch{0:d}'.format(ch_num * 2 - 1)] = False
-
-        # return either all channel information or just the one asked for.
-        if ch is not None:
-            chnl_to_delete = [chnl for chnl in active_ch if chnl not in ch]
-            for chnl in chnl_to_delete:
-                del active_ch[chnl]
         return active_ch
 
     def set_active_channels(self, ch=None):
@@ -1187,6 +1261,7 @@ class AWG70K(Base, PulserInterface):
             else:
                 self.write('OUTPUT{0:d}:STATE OFF'.format(ach_num))
 
+        self._state.invalidate('active_channels')
         return self.get_active_channels()
 
     def get_interleave(self):
@@ -1223,6 +1298,7 @@ class AWG70K(Base, PulserInterface):
         """
         self.write('*RST')
         self.write('*WAI')
+        self._state.invalidate()
         return 0
 
     def query(self, question):
@@ -1263,6 +1339,7 @@ class AWG70K(Base, PulserInterface):
             self.delete_sequence(name)
         self.write('SLIS:SEQ:NEW "{0}", {1:d}'.format(name, steps))
         self.write('SLIS:SEQ:EVEN:JTIM "{0}", IMM'.format(name))
+        self._state.invalidate('sequence_names')
         return 0
 
     def sequence_set_waveform(self, sequence_name, waveform_name, step, track):
@@ -1500,37 +1577,14 @@ class AWG70K(Base, PulserInterface):
 
         @return list: filenames found in <ftproot>\\waves
         """
-        filename_list = list()
-        with FTP(self._ip_address) as ftp:
-            ftp.login(user=self._username, passwd=self._password)
-            ftp.cwd(self.ftp_working_dir)
-            # get only the files from the dir and skip possible directories
-            log = list()
-            ftp.retrlines('LIST', callback=log.append)
-            for line in log:
-                if '<DIR>' not in line:
-                    # that is how a potential line is looking like:
-                    #   '05-10-16  05:22PM                  292 SSR aom adjusted.seq'
-                    # The first part consists of the date information. Remove this information and
-                    # separate the first number, which indicates the size of the file. This is
-                    # necessary if the filename contains whitespaces.
-                    size_filename = line[18:].lstrip()
-                    # split after the first appearing whitespace and take the rest as filename.
-                    # Remove for safety all trailing and leading whitespaces:
-                    filename = size_filename.split(' ', 1)[1].strip()
-                    filename_list.append(filename)
-        return filename_list
+        return self._ftp_pool.list_files()
 
     def _delete_file(self, filename):
         """
 
         @param str filename:
         """
-        if filename in self._get_filenames_on_device():
-            with FTP(self._ip_address) as ftp:
-                ftp.login(user=self._username, passwd=self._password)
-                ftp.cwd(self.ftp_working_dir)
-                ftp.delete(filename)
+        self._ftp_pool.delete(filename)
         return
 
     def _send_file(self, filename):
@@ -1550,25 +1604,23 @@ class AWG70K(Base, PulserInterface):
                            ''.format(filename, self._tmp_work_dir))
             return -1
 
-        # Delete old file on AWG by the same filename
-        self._delete_file(filename)
-
-        # Transfer file
-        with FTP(self._ip_address) as ftp:
-            ftp.login(user=self._username, passwd=self._password)
-            ftp.cwd(self.ftp_working_dir)
-            with open(filepath, 'rb') as file:
-                ftp.storbinary('STOR ' + filename, file)
+        # Transfer file, an old file on the AWG by the same filename is replaced
+        self._ftp_pool.upload(filepath)
         return 0
 
     def _write_wfmx(self, filename, analog_samples, marker_bytes, is_first_chunk, is_last_chunk,
-                    total_number_of_samples):
+                    total_number_of_samples, sample_rate=None):
         """
-        Appends a sampled chunk of a whole waveform to a wfmx-file. Create the file
-        if it is the first chunk.
+        Streams a sampled chunk of a whole waveform into a wfmx-file on the AWG. The upload of the
+        file is started with the first chunk and finished with the last chunk.
         If both flags (is_first_chunk, is_last_chunk) are set to TRUE it means
         that the whole ensemble is written as a whole in one big chunk.
 
+        A wfmx-file consists of the header, all analog samples and then all marker bytes. The header
+        and the analog samples of each chunk are sent directly. The marker bytes of all chunks but
+        the last one are kept in a buffer until the analog samples are complete. The buffer stays
+        in memory up to marker_buffer_size bytes.
+
         @param name: string, represents the name of the sampled ensemble
         @param analog_samples: dict containing float32 numpy ndarrays, contains the
                                        samples for the analog channels that
@@ -1582,65 +1634,81 @@ class AWG70K(Base, PulserInterface):
                                first write to this file.
         @param is_last_chunk: bool, indicates if the current chunk is the last
                               write to this file.
+        @param sample_rate: float, sample rate written to the header with the first chunk. Pass
+                            it when called from several threads, which must not query the device.
 
-        @return list: the list contains the string names of the created files for the passed
-                      presampled arrays
+        @return int: error code (0:OK, -1:error)
         """
-        # The memory overhead of the tmp file write/read process in bytes. Only used if wfmx file is
-        # written in chunks in order to avoid excessive memory usage.
-        tmp_bytes_overhead = 16777216  # 16 MB
+        # The size of the blocks in bytes in which buffered marker data is sent.
+        marker_block_size = 16777216  # 16 MB
 
         if not filename.endswith('.wfmx'):
             filename += '.wfmx'
-        wfmx_path = os.path.join(self._tmp_work_dir, filename)
-        tmp_path = os.path.join(self._tmp_work_dir, 'digital_tmp.bin')
 
-        # if it is the first chunk, create the .WFMX file with header.
-        if is_first_chunk:
-            # create header
-            header = self._create_xml_header(total_number_of_samples, marker_bytes is not None)
-            # write header
-            with open(wfmx_path, 'wb') as wfmxfile:
-                wfmxfile.write(header.encode('utf8'))
-            # Check if a tmp digital samples file is present and delete it if necessary.
-            if os.path.isfile(tmp_path):
-                os.remove(tmp_path)
-
-        # append analog samples to the .WFMX file.
-        # Write digital samples in temporary file if not the entire samples are passed at once.
-        with open(wfmx_path, 'ab') as wfmxfile:
+        try:
+            # if it is the first chunk, start the upload of the .WFMX file with header.
+            if is_first_chunk:
+                # Discard an unfinished upload of the same file
+                self._abort_wfmx_upload(filename)
+                header = self._create_xml_header(total_number_of_samples, marker_bytes is not None,
+                                                 sample_rate)
+                upload = self._ftp_pool.open_upload(filename)
+                self._wfmx_uploads[filename] = (upload, None)
+                upload.write(header.encode('utf8'))
+            elif filename not in self._wfmx_uploads:
+                self.log.error('Unable to write chunk to "{0}". The upload of the file has not been '
+                               'started with the first chunk.'.format(filename))
+                return -1
+            upload, marker_buffer = self._wfmx_uploads[filename]
+
             # append analog samples in binary format. One sample is 4 bytes (np.float32).
-            wfmxfile.write(analog_samples)
-
-        # Write digital samples to tmp file if chunkwise writing is used and it's not the last chunk
-        if not is_last_chunk and marker_bytes is not None:
-            with open(tmp_path, 'ab') as tmp_file:
-                tmp_file.write(marker_bytes)
-
-        # If this is the last chunk, write digital samples from tmp file to wfmx file (if present)
-        # and also append the currently passed digital samples to wfmx file.
-        # Read from tmp file in chunks of tmp_bytes_overhead in order to avoid too much memory
-        # overhead.
-        if is_last_chunk and marker_bytes is not None:
-            with open(wfmx_path, 'ab') as wfmxfile:
-                # Copy over digital samples from tmp file. Delete tmp file afterwards.
-                if os.path.isfile(tmp_path):
-                    with open(tmp_path, 'rb') as tmp_file:
-                        while True:
-                            tmp = tmp_file.read(tmp_bytes_overhead)
-                            if not tmp:
-                                break
-                            wfmxfile.write(tmp)
-                    os.remove(tmp_path)
-                # Append current digital samples array to wfmx file
-                wfmxfile.write(marker_bytes)
+            upload.write(np.ascontiguousarray(analog_samples, dtype='<f4'))
+
+            # Buffer digital samples if chunkwise writing is used and it's not the last chunk
+            if not is_last_chunk and marker_bytes is not None:
+                if marker_buffer is None:
+                    marker_buffer = tempfile.SpooledTemporaryFile(
+                        max_size=self._marker_buffer_size, dir=self._tmp_work_dir)
+                    self._wfmx_uploads[filename] = (upload, marker_buffer)
+                marker_buffer.write(np.ascontiguousarray(marker_bytes))
+
+            # If this is the last chunk, send the buffered digital samples (if present) and the
+            # currently passed digital samples and finish the upload.
+            if is_last_chunk:
+                if marker_bytes is not None:
+                    if marker_buffer is not None:
+                        marker_buffer.seek(0)
+                        shutil.copyfileobj(marker_buffer, upload, marker_block_size)
+                    upload.write(np.ascontiguousarray(marker_bytes))
+                upload.close()
+                self._abort_wfmx_upload(filename)
+        except Exception:
+            self.log.exception('Streaming of wfmx-file "{0}" to AWG failed.'.format(filename))
+            self._abort_wfmx_upload(filename)
+            return -1
+        return 0
+
+    def _abort_wfmx_upload(self, filename):
+        """
+        Discards the upload of a wfmx-file (if present) and its buffered marker bytes.
+        Does nothing for an upload which has been finished already.
+
+        @param str filename: name of the wfmx-file
+        """
+        upload, marker_buffer = self._wfmx_uploads.pop(filename, (None, None))
+        if upload is not None:
+            upload.abort()
+        if marker_buffer is not None:
+            marker_buffer.close()
         return
 
-    def _create_xml_header(self, number_of_samples, markers_active):
+    def _create_xml_header(self, number_of_samples, markers_active, sample_rate=None):
         """
         This function creates an xml file containing the header for the wfmx-file format using
-        etree.
+        etree. The sample rate is queried from the device if not given.
         """
+        if sample_rate is None:
+            sample_rate = self.get_sample_rate()
         hdr = ET.Element('DataFile', offset='XXXXXXXXX', version='0.1')
         dsc = ET.SubElement(hdr, 'DataSetsCollection', xmlns='http://www.tektronix.com')
         datasets = ET.SubElement(dsc, 'DataSets', version='1', xmlns='http://www.tektronix.com')
@@ -1659,7 +1727,7 @@ class AWG70K(Base, PulserInterface):
         sub_elem.text = '2014-10-28T12:59:52.9004865-07:00'
         prodspec = ET.SubElement(datasets, 'ProductSpecific', name='')
         sub_elem = ET.SubElement(prodspec, 'ReccSamplingRate', units='Hz')
-        sub_elem.text = str(self.get_sample_rate())
+        sub_elem.text = str(sample_rate)
         sub_elem = ET.SubElement(prodspec, 'ReccAmplitude', units='Volts')
         sub_elem.text = '0.5'
         sub_elem = ET.SubElement(prodspec, 'ReccOffset', units='Volts')
@@ -25,14 +25,15 @@ import os
 import time
 import visa
 import numpy as np
-from ftplib import FTP
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 from core.util.modules import get_home_dir
 from core.util.helpers import natural_sort
 from core.module import Base
 from core.configoption import ConfigOption
 from interface.pulser_interface import PulserInterface, PulserConstraints, SequenceOption
+from .tektronix_transport import FtpSessionPool, DeviceStateCache, wait_for_opc
 
 
 class AWG7k(Base, PulserInterface):
@@ -50,6 +51,7 @@ class AWG7k(Base, PulserInterface):
         # ftp_root_dir: 'C:\\inetpub\\ftproot' # optional, root directory on AWG device
         # ftp_login: 'anonymous' # optional, the username for ftp login
         # ftp_passwd: 'anonymous@' # optional, the password for ftp login
+        # ftp_sessions: 2 # optional, number of FTP sessions for parallel file transfer
 
     """
 
@@ -62,6 +64,7 @@ class AWG7k(Base, PulserInterface):
     _ftp_dir = ConfigOption(name='ftp_root_dir', default='C:\\inetpub\\ftproot', missing='warn')
     _username = ConfigOption(name='ftp_login', default='anonymous', missing='warn')
     _password = ConfigOption(name='ftp_passwd', default='anonymous@', missing='warn')
+    _ftp_sessions = ConfigOption(name='ftp_sessions', default=2, missing='nothing')
     _visa_timeout = ConfigOption(name='timeout', default=30, missing='nothing')
 
     def __init__(self, config, **kwargs):
@@ -73,6 +76,12 @@ class AWG7k(Base, PulserInterface):
         self.awg = None  # This variable will hold a reference to the awg visa resource
 
         self.ftp_working_dir = 'waves'  # subfolder of FTP root dir on AWG disk to work in
+        self._ftp_pool = None  # persistent FTP sessions to the AWG
+        # WFM files currently streamed to the AWG. Keys are the file names, values the uploads.
+        self._wfm_uploads = dict()
+        # Cached device state (active channels, waveform names).
+        # Every command changing this state invalidates the respective entry.
+        self._state = DeviceStateCache()
 
         self.installed_options = list()  # will hold the encoded installed options available on awg
         self._internal_ch_state = {
@@ -104,11 +113,16 @@ class AWG7k(Base, PulserInterface):
                 'the connection by using for example "Agilent Connection Expert".'
                 ''.format(self._visa_address))
 
-        # try connecting to AWG using FTP protocol
-        with FTP(self._ip_address) as ftp:
-            ftp.login(user=self._username, passwd=self._password)
-            ftp.cwd(self.ftp_working_dir)
+        # try connecting to AWG using FTP protocol. The session is kept open for later transfers.
+        self._ftp_pool = FtpSessionPool(self._ip_address,
+                                        user=self._username,
+                                        passwd=self._password,
+                                        working_dir=self.ftp_working_dir,
+                                        max_sessions=self._ftp_sessions,
+                                        timeout=self._visa_timeout)
+        with self._ftp_pool.session() as ftp:
             self.log.debug('FTP working dir: {0}'.format(ftp.pwd()))
+        self._state.invalidate()
 
         idn = self.query('*IDN?').split(',')
         self.mfg, self.model, self.ser, self.fw_ver = idn
@@ -137,6 +151,12 @@ class AWG7k(Base, PulserInterface):
             self.awg.close()
         except:
             self.log.debug('Closing AWG connection using pyvisa failed.')
+        for upload in self._wfm_uploads.values():
+            upload.abort()
+        self._wfm_uploads = dict()
+        if self._ftp_pool is not None:
+            self._ftp_pool.close()
+        self._state.invalidate()
         self.log.info('Closed connection to AWG')
         return
 
@@ -445,6 +465,7 @@ class AWG7k(Base, PulserInterface):
         @return int: error code (0:OK, -1:error)
         """
         self.write('WLIS:WAV:DEL ALL')
+        self._state.invalidate('waveform_names')
         if '09' in self.installed_options:
             self.write('SLIS:SUBS:DEL ALL')
         self.write('SEQUENCE:LENGTH 0')
@@ -488,8 +509,7 @@ class AWG7k(Base, PulserInterface):
               further processing.
         """
         self.write('SOUR1:FREQ {0:.4G}MHz\n'.format(sample_rate / 1e6))
-        while int(self.query('*OPC?')) != 1:
-            time.sleep(0.1)
+        wait_for_opc(self.awg)
         # Here we need to wait, because when the sampling rate is changed AWG is busy
         # and therefore the ask in get_sample_rate will return an empty string.
         time.sleep(1)
@@ -622,16 +642,14 @@ class AWG7k(Base, PulserInterface):
             for a_ch in amplitude:
                 ch_num = int(chnl.rsplit('_ch', 1)[1])
                 self.write('SOUR{0:d}:VOLT:AMPL {1}'.format(ch_num, amplitude[a_ch]))
-                while int(self.query('*OPC?')) != 1:
-                    time.sleep(0.1)
+                wait_for_opc(self.awg)
 
         no_offset = '02' in self.installed_options or '06' in self.installed_options
         if offset is not None and not no_offset:
             for a_ch in offset:
                 ch_num = int(chnl.rsplit('_ch', 1)[1])
                 self.write('SOUR{0:d}:VOLT:OFFSET {1}'.format(ch_num, offset[a_ch]))
-                while int(self.query('*OPC?')) != 1:
-                    time.sleep(0.1)
+                wait_for_opc(self.awg)
         return self.get_analog_level()
 
     def get_digital_level(self, low=None, high=None):
@@ -768,9 +786,16 @@ class AWG7k(Base, PulserInterface):
 
         If no parameter (or None) is passed to this method all channel states will be returned.
         """
-        # If you want to check the input use the constraints:
-        # constraints = self.get_constraints()
+        active_ch = self._state.get('active_channels', self._query_active_channels)
+
+        # return either all channel information or just the one asked for.
+        if ch is not None:
+            chnl_to_delete = [chnl for chnl in active_ch if chnl not in ch]
+            for chnl in chnl_to_delete:
+                del active_ch[chnl]
+        return active_ch
 
+    def _query_active_channels(self):
         analog_channels = self._get_all_analog_channels()
 
         active_ch = dict()
@@ -793,12 +818,6 @@ class AWG7k(Base, PulserInterface):
             else:
                 active_ch['d_ch{0:d}'.format(ch_num * 2)] = False
                 active_ch['d_ch{0:d}'.format(ch_num * 2 - 1)] = False
-
-        # return either all channel information or just the one asked for.
-        if ch is not None:
-            chnl_to_delete = [chnl for chnl in active_ch if chnl not in ch]
-            for chnl in chnl_to_delete:
-                del active_ch[chnl]
         return active_ch
 
     def set_active_channels(self, ch=None):
@@ -873,6 +892,7 @@ class AWG7k(Base, PulserInterface):
             else:
                 self.write('OUTPUT{0:d}:STATE OFF'.format(ach_num))
             self._internal_ch_state[a_ch] = new_channels_state[a_ch]
+        self._state.invalidate('active_channels')
         return self.get_active_channels()
 
     def write_waveform(self, name, analog_samples, digital_samples, is_first_chunk, is_last_chunk,
@@ -937,7 +957,10 @@ class AWG7k(Base, PulserInterface):
                                      set(analog_samples.keys()).union(set(digital_samples.keys()))))
             return -1, waveforms
 
-        # Write waveforms. One for each analog channel.
+        number_of_samples = len(analog_samples[active_analog[0]])
+
+        # Prepare the samples of each analog channel and its markers
+        channel_samples = list()
         for a_ch in active_analog:
             # Get the integer analog channel number
             a_ch_num = int(a_ch.rsplit('ch', 1)[1])
@@ -960,36 +983,60 @@ class AWG7k(Base, PulserInterface):
 
             # Create waveform name string
             wfm_name = '{0}_ch{1:d}'.format(name, a_ch_num)
+            channel_samples.append((wfm_name, analog_samples[a_ch], mrk_bytes))
+            # Append created waveform name to waveform list
+            waveforms.append(wfm_name)
 
-            # Write WFM file for waveform
-            start = time.time()
-            self._write_wfm(filename=wfm_name,
-                            analog_samples=analog_samples[a_ch],
-                            marker_bytes=mrk_bytes,
-                            is_first_chunk=is_first_chunk,
-                            is_last_chunk=is_last_chunk,
-                            total_number_of_samples=total_number_of_samples)
-
-            self.log.debug('Write WFM file: {0}'.format(time.time() - start))
+        # The upload of each file occupies an FTP session until its last chunk is written.
+        if self._ftp_pool.max_sessions < len(channel_samples):
+            self.log.warning('Streaming {0:d} channels needs more FTP sessions than configured '
+                             '(ftp_sessions: {1:d}). Increasing the number of sessions to {0:d}.'
+                             ''.format(len(channel_samples), self._ftp_pool.max_sessions))
+            self._ftp_pool.resize(len(channel_samples))
+        # The VISA resource must not be used by the upload threads, so query the sample rate for
+        # the footer of the WFM files here.
+        sample_rate = self.get_sample_rate() if is_last_chunk else None
+
+        # Stream the chunk into the WFM files on the AWG, all channels in parallel
+        def write_channel(wfm_name, samples, mrk_bytes):
+            return self._write_wfm(filename=wfm_name,
+                                   analog_samples=samples,
+                                   marker_bytes=mrk_bytes,
+                                   is_first_chunk=is_first_chunk,
+                                   is_last_chunk=is_last_chunk,
+                                   total_number_of_samples=total_number_of_samples,
+                                   sample_rate=sample_rate)
+
+        start = time.time()
+        if len(channel_samples) > 1:
+            with ThreadPoolExecutor(max_workers=len(channel_samples)) as executor:
+                errors = list(executor.map(lambda args: write_channel(*args), channel_samples))
+        else:
+            errors = [write_channel(*args) for args in channel_samples]
+        self.log.debug('Stream WFM data: {0}'.format(time.time() - start))
+        if any(err < 0 for err in errors):
+            for wfm_name in waveforms:
+                upload = self._wfm_uploads.pop(wfm_name + '.wfm', None)
+                if upload is not None:
+                    upload.abort()
+            return -1, waveforms
 
-            # transfer waveform to AWG and load into workspace
-            start = time.time()
-            self._send_file(filename=wfm_name + '.wfm')
-            self.log.debug('Send WFM file: {0}'.format(time.time() - start))
+        # The WFM files are complete only after the last chunk has been written.
+        if not is_last_chunk:
+            return number_of_samples, waveforms
 
-            start = time.time()
+        # import the waveforms into the workspace
+        start = time.time()
+        for wfm_name in waveforms:
             self.write('MMEM:IMP "{0}","{1}",WFM'.format(wfm_name, wfm_name + '.wfm'))
-            # Wait for everything to complete
-            while int(self.query('*OPC?')) != 1:
-                time.sleep(0.2)
-            # Just to make sure
-            while wfm_name not in self.get_waveform_names():
-                time.sleep(0.2)
-            self.log.debug('Load WFM file into workspace: {0}'.format(time.time() - start))
-
-            # Append created waveform name to waveform list
-            waveforms.append(wfm_name)
-        return total_number_of_samples, waveforms
+        # Wait for everything to complete
+        wait_for_opc(self.awg, timeout=5000)
+        if not self._wait_for_waveforms(waveforms):
+            self.log.error('Import of waveforms {0} into the AWG workspace failed.'
+                           ''.format(waveforms))
+            return -1, list()
+        self.log.debug('Load WFM files into workspace: {0}'.format(time.time() - start))
+        return number_of_samples, waveforms
 
     def write_sequence(self, name, sequence_parameter_list):
         """
@@ -1047,8 +1094,7 @@ class AWG7k(Base, PulserInterface):
             # Set flag states
 
         # Wait for everything to complete
-        while int(self.query('*OPC?')) != 1:
-            time.sleep(0.25)
+        wait_for_opc(self.awg)
 
         self._written_sequences = [name]
         return num_steps
@@ -1058,12 +1104,32 @@ class AWG7k(Base, PulserInterface):
 
         @return list: List of all uploaded waveform name strings in the device workspace.
         """
+        return self._state.get('waveform_names', self._query_waveform_names)
+
+    def _query_waveform_names(self):
         wfm_list_len = int(self.query('WLIS:SIZE?'))
         wfm_list = list()
         for index in range(wfm_list_len):
             wfm_list.append(self.query('WLIS:NAME? {0:d}'.format(index)))
         return natural_sort(wfm_list)
 
+    def _wait_for_waveforms(self, waveform_names, timeout=10):
+        """ Wait until waveforms show up in the workspace of the AWG.
+
+        @param list waveform_names: names of the waveforms to wait for
+        @param float timeout: maximum time to wait in s
+
+        @return bool: True if all waveforms are present in the workspace
+        """
+        stop_time = time.time() + timeout
+        while True:
+            self._state.invalidate('waveform_names')
+            if set(waveform_names).issubset(self.get_waveform_names()):
+                return True
+            if time.time() > stop_time:
+                return False
+            time.sleep(0.2)
+
     def get_sequence_names(self):
         """ Retrieve the names of all uploaded sequence on the device.
 
@@ -1089,6 +1155,9 @@ class AWG7k(Base, PulserInterface):
             if waveform in avail_waveforms:
                 self.write('WLIS:WAV:DEL "{0}"'.format(waveform))
                 deleted_waveforms.append(waveform)
+        if deleted_waveforms:
+            self._state.update('waveform_names',
+                               lambda names: [n for n in names if n not in deleted_waveforms])
         return natural_sort(deleted_waveforms)
 
     def delete_sequence(self, sequence_name):
@@ -1135,8 +1204,7 @@ class AWG7k(Base, PulserInterface):
 
         if self._has_interleave():
             self.write('AWGC:INT:STAT {0:d}'.format(int(state)))
-            while int(self.query('*OPC?')) != 1:
-                time.sleep(0.1)
+            wait_for_opc(self.awg)
         return self.get_interleave()
 
     def write(self, command):
@@ -1170,6 +1238,7 @@ class AWG7k(Base, PulserInterface):
         """
         self.write('*RST')
         self.write('*WAI')
+        self._state.invalidate()
         return 0
 
     def set_lowpass_filter(self, a_ch, cutoff_freq):
@@ -1239,11 +1308,7 @@ class AWG7k(Base, PulserInterface):
 
         @param str filename: The full filename to delete from FTP cwd
         """
-        if filename in self._get_filenames_on_device():
-            with FTP(self._ip_address) as ftp:
-                ftp.login(user=self._username, passwd=self._password)
-                ftp.cwd(self.ftp_working_dir)
-                ftp.delete(filename)
+        self._ftp_pool.delete(filename)
         return
 
     def _send_file(self, filename):
@@ -1263,15 +1328,8 @@ class AWG7k(Base, PulserInterface):
                            ''.format(filename, self._tmp_work_dir))
             return -1
 
-        # Delete old file on AWG by the same filename
-        self._delete_file(filename)
-
-        # Transfer file
-        with FTP(self._ip_address) as ftp:
-            ftp.login(user=self._username, passwd=self._password)
-            ftp.cwd(self.ftp_working_dir)
-            with open(filepath, 'rb') as file:
-                ftp.storbinary('STOR ' + filename, file)
+        # Transfer file, an old file on the AWG by the same filename is replaced
+        self._ftp_pool.upload(filepath)
         return 0
 
     def _get_filenames_on_device(self):
@@ -1279,26 +1337,7 @@ class AWG7k(Base, PulserInterface):
 
         @return list: filenames found in <ftproot>\\waves
         """
-        filename_list = list()
-        with FTP(self._ip_address) as ftp:
-            ftp.login(user=self._username, passwd=self._password)
-            ftp.cwd(self.ftp_working_dir)
-            # get only the files from the dir and skip possible directories
-            log = list()
-            ftp.retrlines('LIST', callback=log.append)
-            for line in log:
-                if '<DIR>' not in line:
-                    # that is how a potential line is looking like:
-                    #   '05-10-16  05:22PM                  292 SSR aom adjusted.seq'
-                    # The first part consists of the date information. Remove this information and
-                    # separate the first number, which indicates the size of the file. This is
-                    # necessary if the filename contains whitespaces.
-                    size_filename = line[18:].lstrip()
-                    # split after the first appearing whitespace and take the rest as filename.
-                    # Remove for safety all trailing and leading whitespaces:
-                    filename = size_filename.split(' ', 1)[1].strip()
-                    filename_list.append(filename)
-        return filename_list
+        return self._ftp_pool.list_files()
 
     def _get_all_channels(self):
         """
@@ -1356,10 +1395,10 @@ class AWG7k(Base, PulserInterface):
         return '06' in self.installed_options
 
     def _write_wfm(self, filename, analog_samples, marker_bytes, is_first_chunk, is_last_chunk,
-                   total_number_of_samples):
+                   total_number_of_samples, sample_rate=None):
         """
-        Appends a sampled chunk of a whole waveform to a wfm-file. Create the file
-        if it is the first chunk.
+        Streams a sampled chunk of a whole waveform into a wfm-file on the AWG. The upload of the
+        file is started with the first chunk and finished with the last chunk.
         If both flags (is_first_chunk, is_last_chunk) are set to TRUE it means
         that the whole ensemble is written as a whole in one big chunk.
 
@@ -1376,8 +1415,12 @@ class AWG7k(Base, PulserInterface):
                                first write to this file.
         @param is_last_chunk: bool, indicates if the current chunk is the last
                               write to this file.
+        @param sample_rate: float, sample rate written to the footer with the last chunk. Pass it
+                            when called from several threads, which must not query the device.
+
+        @return int: error code (0:OK, -1:error)
         """
-        # The memory overhead of the tmp file write/read process in bytes.
+        # The memory overhead of the interleaving buffer in bytes.
         tmp_bytes_overhead = 104857600  # 100 MB
         tmp_samples = tmp_bytes_overhead // 5
         if tmp_samples > len(analog_samples):
@@ -1385,48 +1428,59 @@ class AWG7k(Base, PulserInterface):
 
         if not filename.endswith('.wfm'):
             filename += '.wfm'
-        wfm_path = os.path.join(self._tmp_work_dir, filename)
 
-        # if it is the first chunk, create the WFM file with header.
-        if is_first_chunk:
-            with open(wfm_path, 'wb') as wfm_file:
+        try:
+            # if it is the first chunk, start the upload of the WFM file with header.
+            if is_first_chunk:
+                # Discard an unfinished upload of the same file
+                if filename in self._wfm_uploads:
+                    self._wfm_uploads.pop(filename).abort()
+                self._wfm_uploads[filename] = self._ftp_pool.open_upload(filename)
                 # write the first line, which is the header file, if first chunk is passed:
                 num_bytes = str(int(total_number_of_samples * 5))
                 num_digits = str(len(num_bytes))
                 header = 'MAGIC 1000\r\n#{0}{1}'.format(num_digits, num_bytes)
-                wfm_file.write(header.encode())
+                self._wfm_uploads[filename].write(header.encode())
+            elif filename not in self._wfm_uploads:
+                self.log.error('Unable to write chunk to "{0}". The upload of the file has not been '
+                               'started with the first chunk.'.format(filename))
+                return -1
+            upload = self._wfm_uploads[filename]
 
-        # For the WFM file format unfortunately we need to write the digital sampels together
-        # with the analog samples. Therefore we need a temporary copy of all samples for each
-        # analog channel.
-        write_array = np.zeros(tmp_samples, dtype='float32, uint8')
+            # For the WFM file format unfortunately we need to write the digital sampels together
+            # with the analog samples. Therefore they are interleaved in a preallocated buffer.
+            write_array = np.zeros(tmp_samples, dtype='float32, uint8')
 
-        # Consecutively prepare and write chunks of maximal size tmp_bytes_overhead to file
-        samples_written = 0
-        with open(wfm_path, 'ab') as wfm_file:
+            # Consecutively prepare and send chunks of maximal size tmp_bytes_overhead
+            samples_written = 0
             while samples_written < len(analog_samples):
-                write_end = samples_written + write_array.size
+                write_end = min(samples_written + write_array.size, len(analog_samples))
+                write_view = write_array[:write_end - samples_written]
                 # Prepare tmp write array
-                write_array['f0'] = analog_samples[samples_written:write_end]
+                write_view['f0'] = analog_samples[samples_written:write_end]
                 if marker_bytes is not None:
-                    write_array['f1'] = marker_bytes[samples_written:write_end]
-                # Write to file
-                wfm_file.write(write_array)
+                    write_view['f1'] = marker_bytes[samples_written:write_end]
+                # Send to AWG
+                upload.write(write_view)
                 # Increment write counter
                 samples_written = write_end
-                # Reduce write array size if
-                if 0 < total_number_of_samples - samples_written < write_array.size:
-                    write_array.resize(total_number_of_samples - samples_written)
-
-        del write_array
-
-        # append footer if it's the last chunk to write
-        if is_last_chunk:
-            # the footer encodes the sample rate, which was used for that file:
-            footer = 'CLOCK {0:16.10E}\r\n'.format(self.get_sample_rate())
-            with open(wfm_path, 'ab') as wfm_file:
-                wfm_file.write(footer.encode())
-        return
+
+            del write_array
+
+            # append footer and finish the upload if it's the last chunk to write
+            if is_last_chunk:
+                # the footer encodes the sample rate, which was used for that file:
+                if sample_rate is None:
+                    sample_rate = self.get_sample_rate()
+                footer = 'CLOCK {0:16.10E}\r\n'.format(sample_rate)
+                upload.write(footer.encode())
+                self._wfm_uploads.pop(filename).close()
+        except Exception:
+            self.log.exception('Streaming of wfm-file "{0}" to AWG failed.'.format(filename))
+            if filename in self._wfm_uploads:
+                self._wfm_uploads.pop(filename).abort()
+            return -1
+        return 0
 
     def sequence_set_waveform(self, waveform_name, step, track):
         """
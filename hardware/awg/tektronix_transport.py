@@ -0,0 +1,466 @@
+# -*- coding: utf-8 -*-
+
+"""
+This file contains the transport layer shared by the Tektronix AWG hardware modules.
+
+The AWGs receive waveform files via FTP and are controlled via SCPI commands. Opening a new FTP
+session for every file operation and querying the same device state over and over again costs
+more time than the actual data transfer when uploading many waveforms. This module provides:
+    - FtpSessionPool: persistent, logged-in FTP sessions which are reused and can transfer the
+                      files of several channels in parallel
+    - FtpUploadStream: upload of a file whose content is written piece by piece, e.g. chunk by
+                       chunk while a waveform is sampled, without a local copy of the file
+    - DeviceStateCache: cache for device state queried via SCPI (active channels, waveform list,
+                        constraints), which is invalidated by the commands changing it
+    - wait_for_opc: wait for the completion of all pending operations with a single *OPC? query
+
+The classes do not depend on qudi modules, so they can be used with a local FTP server and a mock
+VISA instrument as well.
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import copy
+import ftplib
+import os
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+
+class FtpSessionPool:
+    """ Pool of persistent FTP sessions to a single host.
+
+    Sessions are logged in and changed to the working directory once and are then reused. A session
+    which was idle longer than keepalive seconds is checked with a NOOP before it is handed out and
+    replaced if the server closed it meanwhile. A session which raised an FTP or socket error is
+    closed instead of being returned to the pool.
+    """
+
+    def __init__(self, host, user='anonymous', passwd='anonymous@', working_dir=None, port=21,
+                 max_sessions=4, timeout=30, keepalive=30, acquire_timeout=60):
+        """
+        @param str host: host name or IP address of the FTP server
+        @param str user: user name for the FTP login
+        @param str passwd: password for the FTP login
+        @param str working_dir: optional, directory to change to after login
+        @param int port: port of the FTP server
+        @param int max_sessions: maximum number of sessions open at the same time
+        @param float timeout: socket timeout of the sessions in s
+        @param float keepalive: idle time in s after which a session is checked before reuse
+        @param float acquire_timeout: maximum time in s to wait for a free session
+        """
+        self.host = host
+        self.user = user
+        self.passwd = passwd
+        self.port = int(port)
+        self.max_sessions = max(1, int(max_sessions))
+        self.timeout = timeout
+        self.keepalive = keepalive
+        self.acquire_timeout = acquire_timeout
+        self._working_dir = working_dir
+
+        self._idle_sessions = list()  # list of tuples (ftp, time of last use)
+        self._num_sessions = 0
+        self._condition = threading.Condition()
+
+    @property
+    def working_dir(self):
+        return self._working_dir
+
+    @working_dir.setter
+    def working_dir(self, working_dir):
+        """ Change the working directory. Idle sessions are closed, sessions in use are closed when
+        they are returned to the pool.
+        """
+        with self._condition:
+            self._working_dir = working_dir
+            self._close_idle_sessions()
+
+    def resize(self, max_sessions):
+        """ Change the maximum number of sessions open at the same time. Waiting callers are woken
+        up if more sessions are allowed, surplus idle sessions are closed if fewer are allowed.
+
+        @param int max_sessions: new maximum number of sessions
+        """
+        with self._condition:
+            self.max_sessions = max(1, int(max_sessions))
+            while self._idle_sessions and self._num_sessions > self.max_sessions:
+                ftp, last_used = self._idle_sessions.pop(0)
+                self._close_session(ftp)
+                self._num_sessions -= 1
+            self._condition.notify_all()
+
+    @property
+    def num_sessions(self):
+        """ Number of currently open sessions. """
+        return self._num_sessions
+
+    def _connect(self):
+        ftp = ftplib.FTP()
+        ftp.connect(self.host, self.port, timeout=self.timeout)
+        try:
+            ftp.login(user=self.user, passwd=self.passwd)
+            if self._working_dir:
+                ftp.cwd(self._working_dir)
+        except:
+            self._close_session(ftp)
+            raise
+        ftp.pool_working_dir = self._working_dir
+        return ftp
+
+    @staticmethod
+    def _close_session(ftp):
+        try:
+            ftp.quit()
+        except ftplib.all_errors:
+            ftp.close()
+
+    def _close_idle_sessions(self):
+        for ftp, last_used in self._idle_sessions:
+            self._close_session(ftp)
+        self._num_sessions -= len(self._idle_sessions)
+        self._idle_sessions = list()
+        self._condition.notify_all()
+
+    def _acquire(self):
+        while True:
+            with self._condition:
+                # Sessions may be held for a long time (e.g. by an FtpUploadStream), so do not wait
+                # forever if all of them are in use.
+                if not self._condition.wait_for(
+                        lambda: self._idle_sessions or self._num_sessions < self.max_sessions,
+                        self.acquire_timeout):
+                    raise TimeoutError(
+                        'No FTP session to {0} available within {1} s, all {2:d} sessions are in '
+                        'use.'.format(self.host, self.acquire_timeout, self.max_sessions))
+                if self._idle_sessions:
+                    ftp, last_used = self._idle_sessions.pop()
+                else:
+                    ftp, last_used = None, None
+                    self._num_sessions += 1
+
+            if ftp is None:
+                try:
+                    return self._connect()
+                except:
+                    self._release(None)
+                    raise
+
+            if time.monotonic() - last_used < self.keepalive:
+                return ftp
+            try:
+                ftp.voidcmd('NOOP')
+                return ftp
+            except ftplib.all_errors:
+                # The server closed the session in the meantime. Try the next one.
+                self._release(ftp, broken=True)
+
+    def _release(self, ftp, broken=False):
+        with self._condition:
+            if ftp is not None:
+                if broken or ftp.pool_working_dir != self._working_dir:
+                    self._close_session(ftp)
+                else:
+                    self._idle_sessions.append((ftp, time.monotonic()))
+                    self._condition.notify()
+                    return
+            self._num_sessions -= 1
+            self._condition.notify()
+
+    @contextmanager
+    def session(self):
+        """ Context manager handing out a logged-in session in the working directory.
+
+        Usage:
+            with pool.session() as ftp:
+                ftp.storbinary('STOR ' + filename, file)
+        """
+        ftp = self._acquire()
+        try:
+            yield ftp
+        except:
+            # The state of the session (e.g. an aborted transfer) is unknown, do not reuse it.
+            self._release(ftp, broken=True)
+            raise
+        else:
+            self._release(ftp)
+
+    def close(self):
+        """ Close all idle sessions. Sessions still in use stay open until they are returned and
+        closed by the next call.
+        """
+        with self._condition:
+            self._close_idle_sessions()
+
+    def list_files(self):
+        """ Names of all files (no directories) in the working directory.
+
+        @return list: file names
+        """
+        with self.session() as ftp:
+            lines = list()
+            ftp.retrlines('LIST', callback=lines.append)
+        return [name for name in (self._parse_list_line(line) for line in lines) if name]
+
+    @staticmethod
+    def _parse_list_line(line):
+        """ Extract the file name from a line of the LIST command. Directories return None.
+
+        The AWGs answer in MS-DOS format, a line looks like this:
+            '05-10-16  05:22PM                  292 SSR aom adjusted.seq'
+        Unix style lines (e.g. of a local test server) are handled as well.
+        """
+        if '<DIR>' in line or line.startswith('d'):
+            return None
+        fields = line.split(None, 8)
+        if line[:1] in '-l' and len(fields) == 9:
+            return fields[8].strip()
+        # The first part consists of the date information. Remove this information and separate
+        # the first number, which indicates the size of the file. This is necessary if the
+        # filename contains whitespaces.
+        size_filename = line[18:].lstrip()
+        if ' ' not in size_filename:
+            return None
+        return size_filename.split(' ', 1)[1].strip()
+
+    def delete(self, filenames, missing_ok=True):
+        """ Delete files in the working directory using a single session.
+
+        @param str|list filenames: file name or list of file names to delete
+        @param bool missing_ok: ignore files not present on the server
+
+        @return list: names of the deleted files
+        """
+        if isinstance(filenames, str):
+            filenames = [filenames]
+        deleted = list()
+        with self.session() as ftp:
+            for filename in filenames:
+                try:
+                    ftp.delete(filename)
+                except ftplib.error_perm:
+                    if not missing_ok:
+                        raise
+                else:
+                    deleted.append(filename)
+        return deleted
+
+    def upload(self, local_path, filename=None, replace=True):
+        """ Upload a local file to the working directory.
+
+        @param str local_path: path of the file to upload
+        @param str filename: optional, name of the file on the server. Default is the local name.
+        @param bool replace: delete a file of the same name on the server before the upload
+
+        @return int: number of bytes transferred
+        """
+        if filename is None:
+            filename = os.path.basename(local_path)
+        with self.session() as ftp:
+            if replace:
+                try:
+                    ftp.delete(filename)
+                except ftplib.error_perm:
+                    pass
+            with open(local_path, 'rb') as file:
+                ftp.storbinary('STOR ' + filename, file, blocksize=1 << 20)
+        return os.path.getsize(local_path)
+
+    def upload_files(self, local_paths, replace=True):
+        """ Upload several files in parallel, one session per file up to max_sessions.
+
+        @param list local_paths: paths of the files to upload, the local names are used on the
+                                 server
+        @param bool replace: delete files of the same name on the server before the upload
+
+        @return int: total number of bytes transferred
+
+        If one of the transfers fails, the exception is raised after all transfers are finished.
+        """
+        local_paths = list(local_paths)
+        if len(local_paths) < 2 or self.max_sessions < 2:
+            return sum(self.upload(path, replace=replace) for path in local_paths)
+        workers = min(len(local_paths), self.max_sessions)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(self.upload, path, None, replace) for path in local_paths]
+        return sum(future.result() for future in futures)
+
+
+    def open_upload(self, filename, replace=True):
+        """ Start the upload of a file to the working directory, which is written piecewise.
+
+        @param str filename: name of the file on the server
+        @param bool replace: delete a file of the same name on the server before the upload
+
+        @return FtpUploadStream: open upload, finish it with close() or discard it with abort()
+        """
+        return FtpUploadStream(self, filename, replace=replace)
+
+
+class FtpUploadStream:
+    """ Upload of a file to an FTP server, which is written piece by piece.
+
+    The data passed to write is sent directly through the data connection of the STOR command, so
+    e.g. sampled waveform chunks go from memory to the device without a temporary file. A session
+    of the pool is occupied until the upload is closed or aborted. Keep the time between two writes
+    below the data connection timeout of the server.
+    """
+
+    def __init__(self, pool, filename, replace=True):
+        """
+        @param FtpSessionPool pool: pool to take the session from. Raises TimeoutError if no
+                                    session becomes available within its acquire_timeout.
+        @param str filename: name of the file on the server
+        @param bool replace: delete a file of the same name on the server before the upload
+        """
+        self.filename = filename
+        self.bytes_written = 0
+        self._pool = pool
+        self._ftp = pool._acquire()
+        try:
+            if replace:
+                try:
+                    self._ftp.delete(filename)
+                except ftplib.error_perm:
+                    pass
+            self._ftp.voidcmd('TYPE I')
+            self._connection = self._ftp.transfercmd('STOR ' + filename)
+        except:
+            pool._release(self._ftp, broken=True)
+            self._ftp = None
+            raise
+
+    @property
+    def is_open(self):
+        return self._ftp is not None
+
+    def write(self, data):
+        """ Send data. Accepts bytes and contiguous numpy arrays (sent as their raw memory).
+
+        @param data: bytes-like object to append to the file
+
+        @return int: number of bytes sent
+        """
+        if self._ftp is None:
+            raise ValueError('Upload of file "{0}" is already closed.'.format(self.filename))
+        data = memoryview(data).cast('B')
+        try:
+            self._connection.sendall(data)
+        except:
+            self.abort()
+            raise
+        self.bytes_written += data.nbytes
+        return data.nbytes
+
+    def close(self):
+        """ Finish the upload and wait for the confirmation of the server. """
+        if self._ftp is None:
+            return
+        ftp, self._ftp = self._ftp, None
+        try:
+            self._connection.close()
+            ftp.voidresp()
+        except:
+            self._pool._release(ftp, broken=True)
+            raise
+        self._pool._release(ftp)
+
+    def abort(self):
+        """ Discard the upload. The incomplete file may remain on the server. """
+        if self._ftp is None:
+            return
+        ftp, self._ftp = self._ftp, None
+        try:
+            self._connection.close()
+        except OSError:
+            pass
+        self._pool._release(ftp, broken=True)
+
+
+class DeviceStateCache:
+    """ Cache for device state queried via SCPI.
+
+    Values are queried on first access and kept until they are invalidated by a command changing
+    the respective state. Mutable values are handed out as copies so callers can not alter the
+    cached state.
+    """
+
+    def __init__(self):
+        self._values = dict()
+        self._lock = threading.RLock()
+
+    def get(self, key, query):
+        """ Return the cached value or call query to get and store it.
+
+        @param str key: name of the cached state
+        @param callable query: function without arguments returning the current value
+
+        @return: the (copied) value
+        """
+        with self._lock:
+            if key not in self._values:
+                self._values[key] = query()
+            return copy.copy(self._values[key])
+
+    def set(self, key, value):
+        """ Store a value known without querying the device, e.g. after setting it. """
+        with self._lock:
+            self._values[key] = copy.copy(value)
+
+    def update(self, key, function):
+        """ Modify a cached value in place if it is present, e.g. add a waveform name to the list.
+
+        @param str key: name of the cached state
+        @param callable function: called with the cached value, returns the new value
+        """
+        with self._lock:
+            if key in self._values:
+                self._values[key] = function(self._values[key])
+
+    def invalidate(self, *keys):
+        """ Discard cached values. Without keys the entire cache is cleared. """
+        with self._lock:
+            if not keys:
+                self._values.clear()
+            for key in keys:
+                self._values.pop(key, None)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._values
+
+
+def wait_for_opc(instrument, timeout=3600):
+    """ Wait for the completion of all pending operations of a SCPI instrument.
+
+    The answer of the *OPC? query is only sent once all pending operations are completed, so a
+    single query with a sufficiently long timeout replaces polling.
+
+    @param instrument: pyvisa resource (or an object providing query and a timeout in ms)
+    @param float timeout: maximum time to wait in s
+
+    @return bool: True if all operations are complete
+    """
+    timeout_old = instrument.timeout
+    instrument.timeout = timeout * 1000
+    try:
+        return int(instrument.query('*OPC?').strip().strip('"')) == 1
+    finally:
+        instrument.timeout = timeout_old
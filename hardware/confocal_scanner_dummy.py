@@ -36,6 +36,9 @@ class ConfocalScannerDummy(Base, ConfocalScannerInterface):
     confocal_scanner_dummy:
         module.Class: 'confocal_scanner_dummy.ConfocalScannerDummy'
         clock_frequency: 100 # in Hz
+        #simulation_mode: False # realistic line timing and Poissonian photon statistics
+        #number_of_emitters: 500 # number of randomly placed emitters within the scan range
+        #emitter_cutoff_sigmas: 5 # emitters further away than this (in sigma) are neglected
         fitlogic: 'fitlogic' # name of the fitlogic module, see default config
 
     """
@@ -46,6 +49,18 @@ class ConfocalScannerDummy(Base, ConfocalScannerInterface):
     # config
     _clock_frequency = ConfigOption('clock_frequency', 100, missing='warn')
     _pixel_clock_channel = ConfigOption('pixel_clock_channel', None, missing='warn')
+    _simulation_mode = ConfigOption('simulation_mode', False)
+    _num_points = ConfigOption('number_of_emitters', 500)
+    _cutoff_sigmas = ConfigOption('emitter_cutoff_sigmas', 5)
+
+    # Parameters of each emitter (lateral 2D gaussian times axial gaussian) together with the
+    # precomputed coefficients of the 2D gaussian exponent.
+    _emitter_dtype = np.dtype([('amplitude', 'f8'), ('x_zero', 'f8'), ('y_zero', 'f8'),
+                               ('sigma_x', 'f8'), ('sigma_y', 'f8'), ('theta', 'f8'),
+                               ('amplitude_z', 'f8'), ('z_zero', 'f8'), ('sigma_z', 'f8'),
+                               ('a', 'f8'), ('b', 'f8'), ('c', 'f8')])
+    # upper limit of array elements evaluated at once while rendering a line
+    _render_block_size = 2 ** 20
 
     def __init__(self, config, **kwargs):
         super().__init__(config=config, **kwargs)
@@ -56,7 +71,12 @@ class ConfocalScannerDummy(Base, ConfocalScannerInterface):
 
         self._position_range = [[0, 100e-6], [0, 100e-6], [0, 100e-6], [0, 1e-6]]
         self._current_position = [0, 0, 0, 0][0:len(self.get_scanner_axes())]
-        self._num_points = 500
+
+        # emitter field and the spatial grid index used to render only nearby emitters
+        self._emitters = np.zeros(0, dtype=self._emitter_dtype)
+        self._cell_size = None
+        self._grid_shape = (0, 0)
+        self._cell_starts = np.zeros(1, dtype=int)
 
     def on_activate(self):
         """ Initialisation performed during activation of the module.
@@ -64,62 +84,23 @@ class ConfocalScannerDummy(Base, ConfocalScannerInterface):
 
         self._fit_logic = self.fitlogic()
 
-        # put randomly distributed NVs in the scanner, first the x,y scan
-        self._points = np.empty([self._num_points, 7])
-        # amplitude
-        self._points[:, 0] = np.random.normal(
-            4e5,
-            1e5,
-            self._num_points)
-        # x_zero
-        self._points[:, 1] = np.random.uniform(
-            self._position_range[0][0],
-            self._position_range[0][1],
-            self._num_points)
-        # y_zero
-        self._points[:, 2] = np.random.uniform(
-            self._position_range[1][0],
-            self._position_range[1][1],
-            self._num_points)
-        # sigma_x
-        self._points[:, 3] = np.random.normal(
-            0.7e-6,
-            0.1e-6,
-            self._num_points)
-        # sigma_y
-        self._points[:, 4] = np.random.normal(
-            0.7e-6,
-            0.1e-6,
-            self._num_points)
-        # theta
-        self._points[:, 5] = 10
-        # offset
-        self._points[:, 6] = 0
-
+        # put randomly distributed NVs in the scanner
+        self._emitters = np.zeros(self._num_points, dtype=self._emitter_dtype)
+        self._emitters['amplitude'] = np.random.normal(4e5, 1e5, self._num_points)
+        self._emitters['x_zero'] = np.random.uniform(self._position_range[0][0],
+                                                     self._position_range[0][1],
+                                                     self._num_points)
+        self._emitters['y_zero'] = np.random.uniform(self._position_range[1][0],
+                                                     self._position_range[1][1],
+                                                     self._num_points)
+        self._emitters['sigma_x'] = np.random.normal(0.7e-6, 0.1e-6, self._num_points)
+        self._emitters['sigma_y'] = np.random.normal(0.7e-6, 0.1e-6, self._num_points)
+        self._emitters['theta'] = 10
         # now also the z-position
-#       gaussian_function(self,x_data=None,amplitude=None, x_zero=None, sigma=None, offset=None):
-
-        self._points_z = np.empty([self._num_points, 4])
-        # amplitude
-        self._points_z[:, 0] = np.random.normal(
-            1,
-            0.05,
-            self._num_points)
-
-        # x_zero
-        self._points_z[:, 1] = np.random.uniform(
-            45e-6,
-            55e-6,
-            self._num_points)
-
-        # sigma
-        self._points_z[:, 2] = np.random.normal(
-            0.5e-6,
-            0.1e-6,
-            self._num_points)
-
-        # offset
-        self._points_z[:, 3] = 0
+        self._emitters['amplitude_z'] = np.random.normal(1, 0.05, self._num_points)
+        self._emitters['z_zero'] = np.random.uniform(45e-6, 55e-6, self._num_points)
+        self._emitters['sigma_z'] = np.random.normal(0.5e-6, 0.1e-6, self._num_points)
+        self._build_emitter_index()
 
     def on_deactivate(self):
         """ Deactivate properly the confocal scanner dummy.
@@ -316,22 +297,29 @@ class ConfocalScannerDummy(Base, ConfocalScannerInterface):
             self.log.error('Given voltage list is no array type.')
             return np.array([[-1.]])
 
+        start_time = time.perf_counter()
         if np.shape(line_path)[1] != self._line_length:
             self._set_up_line(np.shape(line_path)[1])
 
         count_data = np.random.uniform(0, 2e4, self._line_length)
         z_data = line_path[2, :]
 
-        #TODO: Change the gaussian function here to the one from fitlogic and delete the local modules to calculate
-        #the gaussian functions
-        x_data = np.array(line_path[0, :])
-        y_data = np.array(line_path[1, :])
-        for i in range(self._num_points):
-            count_data += self.twoD_gaussian_function((x_data, y_data), *(self._points[i])
-                ) * self.gaussian_function(np.array(z_data), *(self._points_z[i]))
-
-        time.sleep(self._line_length * 1. / self._clock_frequency)
-        time.sleep(self._line_length * 1. / self._clock_frequency)
+        count_data += self._render_emitters(np.asarray(line_path[0, :], dtype=float),
+                                            np.asarray(line_path[1, :], dtype=float),
+                                            np.asarray(z_data, dtype=float))
+
+        if self._simulation_mode:
+            # Photon shot noise for the number of counts collected in one clock period and a
+            # single line duration as given by the pixel clock, including the rendering time.
+            count_data = np.random.poisson(count_data / self._clock_frequency
+                                           ) * self._clock_frequency
+            remaining_time = (self._line_length / self._clock_frequency
+                              - (time.perf_counter() - start_time))
+            if remaining_time > 0:
+                time.sleep(remaining_time)
+        else:
+            time.sleep(self._line_length * 1. / self._clock_frequency)
+            time.sleep(self._line_length * 1. / self._clock_frequency)
 
         # update the scanner position instance variable
         self._current_position = list(line_path[:, -1])
@@ -360,6 +348,109 @@ class ConfocalScannerDummy(Base, ConfocalScannerInterface):
         self.log.debug('ConfocalScannerDummy>close_scanner_clock')
         return 0
 
+    def _build_emitter_index(self):
+        """ Sort the emitters into a uniform lateral grid for fast neighbour lookup.
+
+        The cell size equals the cutoff radius of the broadest emitter, so all emitters
+        contributing to a pixel are found in the pixel cell and its 8 neighbours. The emitters are
+        stored ordered by cell and self._cell_starts holds the start index of each cell
+        (compressed sparse row layout).
+        """
+        emitters = self._emitters
+        theta = emitters['theta']
+        sigma_x_sq = 2 * emitters['sigma_x'] ** 2
+        sigma_y_sq = 2 * emitters['sigma_y'] ** 2
+        emitters['a'] = np.cos(theta) ** 2 / sigma_x_sq + np.sin(theta) ** 2 / sigma_y_sq
+        emitters['b'] = (np.sin(2 * theta) / (2 * sigma_y_sq)
+                         - np.sin(2 * theta) / (2 * sigma_x_sq))
+        emitters['c'] = np.sin(theta) ** 2 / sigma_x_sq + np.cos(theta) ** 2 / sigma_y_sq
+
+        x_range = self._position_range[0]
+        y_range = self._position_range[1]
+        max_sigma = max(np.max(np.abs(emitters['sigma_x']), initial=0),
+                        np.max(np.abs(emitters['sigma_y']), initial=0))
+        self._cell_size = max(self._cutoff_sigmas * max_sigma,
+                              (x_range[1] - x_range[0]) / 1000,
+                              (y_range[1] - y_range[0]) / 1000)
+        self._grid_shape = (int((x_range[1] - x_range[0]) // self._cell_size) + 1,
+                            int((y_range[1] - y_range[0]) // self._cell_size) + 1)
+
+        ix, iy = self._get_cell_coordinates(emitters['x_zero'], emitters['y_zero'])
+        cells = ix * self._grid_shape[1] + iy
+        order = np.argsort(cells, kind='stable')
+        self._emitters = emitters[order]
+        counts = np.bincount(cells, minlength=self._grid_shape[0] * self._grid_shape[1])
+        self._cell_starts = np.concatenate(([0], np.cumsum(counts)))
+        return
+
+    def _get_cell_coordinates(self, x, y):
+        """ Grid cell coordinates for the given lateral positions (clipped to the grid). """
+        ix = np.clip(((x - self._position_range[0][0]) // self._cell_size).astype(int),
+                     0, self._grid_shape[0] - 1)
+        iy = np.clip(((y - self._position_range[1][0]) // self._cell_size).astype(int),
+                     0, self._grid_shape[1] - 1)
+        return ix, iy
+
+    def _get_nearby_emitters(self, x, y):
+        """ Indices of all emitters within the cutoff radius around the given positions.
+
+        @param numpy.ndarray x: x positions of the pixels
+        @param numpy.ndarray y: y positions of the pixels
+
+        @return numpy.ndarray: indices into self._emitters
+        """
+        ix, iy = self._get_cell_coordinates(x, y)
+        # all cells touched by the line together with their 8 neighbours
+        offsets = np.arange(-1, 2)
+        neighbour_x, neighbour_y = np.broadcast_arrays(
+            ix[:, np.newaxis, np.newaxis] + offsets[:, np.newaxis],
+            iy[:, np.newaxis, np.newaxis] + offsets[np.newaxis, :])
+        neighbour_x = neighbour_x.ravel()
+        neighbour_y = neighbour_y.ravel()
+        valid = ((neighbour_x >= 0) & (neighbour_x < self._grid_shape[0])
+                 & (neighbour_y >= 0) & (neighbour_y < self._grid_shape[1]))
+        cells = np.unique(neighbour_x[valid] * self._grid_shape[1] + neighbour_y[valid])
+        starts = self._cell_starts[cells]
+        stops = self._cell_starts[cells + 1]
+        lengths = stops - starts
+        if np.sum(lengths) == 0:
+            return np.zeros(0, dtype=int)
+        # concatenate the index ranges of all cells without a python loop
+        first = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        return first + np.arange(np.sum(lengths))
+
+    def _render_emitters(self, x, y, z):
+        """ Fluorescence of the emitter field along a scan line.
+
+        @param numpy.ndarray x: x positions of the pixels
+        @param numpy.ndarray y: y positions of the pixels
+        @param numpy.ndarray z: z positions of the pixels
+
+        @return numpy.ndarray: count rate for each pixel
+        """
+        counts = np.zeros(x.size)
+        if self._emitters.size == 0:
+            return counts
+        emitters = self._emitters[self._get_nearby_emitters(x, y)]
+        # discard emitters too far away in z along the entire line
+        z_cutoff = self._cutoff_sigmas * np.abs(emitters['sigma_z'])
+        emitters = emitters[(emitters['z_zero'] + z_cutoff >= np.min(z))
+                            & (emitters['z_zero'] - z_cutoff <= np.max(z))]
+        if emitters.size == 0:
+            return counts
+
+        block_length = max(1, self._render_block_size // emitters.size)
+        for start in range(0, x.size, block_length):
+            pixels = slice(start, start + block_length)
+            dx = x[pixels, np.newaxis] - emitters['x_zero']
+            dy = y[pixels, np.newaxis] - emitters['y_zero']
+            dz = z[pixels, np.newaxis] - emitters['z_zero']
+            exponent = (emitters['a'] * dx ** 2 + 2 * emitters['b'] * dx * dy
+                        + emitters['c'] * dy ** 2 + dz ** 2 / (2 * emitters['sigma_z'] ** 2))
+            counts[pixels] = np.exp(-exponent) @ (emitters['amplitude']
+                                                  * emitters['amplitude_z'])
+        return counts
+
 ############################################################################
 #                                                                          #
 #    the following two functions are needed to fluoreschence signal        #
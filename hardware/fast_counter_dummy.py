@@ -25,6 +25,7 @@ import os
 import numpy as np
 
 from core.module import Base
+from core.connector import Connector
 from core.configoption import ConfigOption
 from core.util.modules import get_main_dir
 from interface.fast_counter_interface import FastCounterInterface
@@ -39,12 +40,31 @@ class FastCounterDummy(Base, FastCounterInterface):
         module.Class: 'fast_counter_dummy.FastCounterDummy'
         gated: False
         #load_trace: None # path to the saved dummy trace
+        #simulation_mode: False # generate Poisson traces from the pulser dummy ensemble
+        #sweep_rate: 10000 # simulated sweeps per second
+        #count_rate: 200000 # photon count rate of the bright NV state during laser in counts/s
+        #dark_count_rate: 500 # background count rate in counts/s
+        #nv_contrast: 0.3 # fluorescence contrast between bright and dark state
+        #polarisation_time: 250e-9 # decay time of the spin dependent signal in s
+        #update_interval: 0.5 # minimum time between data trace updates in s
+        #connect:
+        #    pulser: 'pulser_dummy'
 
     """
 
+    # connector
+    pulser = Connector(interface='LaserEdgeInterface', optional=True)
+
     # config option
     _gated = ConfigOption('gated', False, missing='warn')
     trace_path = ConfigOption('load_trace', None)
+    _simulation_mode = ConfigOption('simulation_mode', False)
+    _sweep_rate = ConfigOption('sweep_rate', 1e4)
+    _count_rate = ConfigOption('count_rate', 2e5)
+    _dark_count_rate = ConfigOption('dark_count_rate', 500)
+    _nv_contrast = ConfigOption('nv_contrast', 0.3)
+    _polarisation_time = ConfigOption('polarisation_time', 250e-9)
+    _update_interval = ConfigOption('update_interval', 0.5)
 
     def __init__(self, config, **kwargs):
         super().__init__(config=config, **kwargs)
@@ -67,6 +87,14 @@ class FastCounterDummy(Base, FastCounterInterface):
         self.statusvar = 0
         self._binwidth = 1
         self._gate_length_bins = 8192
+        self._number_of_gates = 0
+
+        # simulation state
+        self._sweep_template = None
+        self._elapsed_sweeps = 0
+        self._elapsed_time = 0.
+        self._last_update = None
+        self._next_update = 0.
         return
 
     def on_deactivate(self):
@@ -136,6 +164,7 @@ class FastCounterDummy(Base, FastCounterInterface):
         self._gate_length_bins = int(np.rint(record_length_s / bin_width_s))
         actual_binwidth = self._binwidth * 1000 / 950e9
         actual_length = self._gate_length_bins * actual_binwidth
+        self._number_of_gates = int(number_of_gates)
         self.statusvar = 1
         return actual_binwidth, actual_length, number_of_gates
 
@@ -153,6 +182,16 @@ class FastCounterDummy(Base, FastCounterInterface):
         return self.statusvar
 
     def start_measure(self):
+        if self._simulation_mode:
+            self._sweep_template = self._create_sweep_template()
+            self._count_data = np.zeros(self._sweep_template.shape, dtype='int64')
+            self._elapsed_sweeps = 0
+            self._elapsed_time = 0.
+            self._last_update = time.perf_counter()
+            self._next_update = self._last_update
+            self.statusvar = 2
+            return 0
+
         time.sleep(1)
         self.statusvar = 2
         try:
@@ -169,14 +208,20 @@ class FastCounterDummy(Base, FastCounterInterface):
 
         Fast counter must be initially in the run state to make it pause.
         """
-        time.sleep(1)
+        if self._simulation_mode:
+            self._accumulate_sweeps()
+        else:
+            time.sleep(1)
         self.statusvar = 3
         return 0
 
     def stop_measure(self):
         """ Stop the fast counter. """
-
-        time.sleep(1)
+        if self._simulation_mode:
+            if self.statusvar == 2:
+                self._accumulate_sweeps()
+        else:
+            time.sleep(1)
         self.statusvar = 1
         return 0
 
@@ -185,7 +230,8 @@ class FastCounterDummy(Base, FastCounterInterface):
 
         If fast counter is in pause state, then fast counter will be continued.
         """
-
+        if self._simulation_mode:
+            self._last_update = time.perf_counter()
         self.statusvar = 2
         return 0
 
@@ -225,6 +271,19 @@ class FastCounterDummy(Base, FastCounterInterface):
         If the hardware does not support these features, the values should be None
         """
 
+        if self._simulation_mode:
+            # Wait for the next update slot instead of a fixed delay in order to deliver data at
+            # the configured rate regardless of the caller's polling interval.
+            wait_time = self._next_update - time.perf_counter()
+            if wait_time > 0:
+                time.sleep(wait_time)
+            self._next_update = time.perf_counter() + self._update_interval
+            if self.statusvar == 2:
+                self._accumulate_sweeps()
+            info_dict = {'elapsed_sweeps': self._elapsed_sweeps,
+                         'elapsed_time': self._elapsed_time}
+            return self._count_data.copy(), info_dict
+
         # include an artificial waiting time
         time.sleep(0.5)
         info_dict = {'elapsed_sweeps': None, 'elapsed_time': None}
@@ -234,3 +293,79 @@ class FastCounterDummy(Base, FastCounterInterface):
         freq = 950.
         time.sleep(0.5)
         return freq
+
+    def _accumulate_sweeps(self):
+        """ Add the photon counts of all sweeps elapsed since the last update to the count data.
+
+        The sum of independent Poisson processes is again Poisson distributed, so all sweeps since
+        the last call are drawn at once with the mean trace scaled by the number of new sweeps.
+        """
+        now = time.perf_counter()
+        new_sweeps = int((now - self._last_update) * self._sweep_rate)
+        if new_sweeps < 1:
+            return
+        self._last_update += new_sweeps / self._sweep_rate
+        self._count_data += np.random.poisson(self._sweep_template * new_sweeps)
+        self._elapsed_sweeps += new_sweeps
+        self._elapsed_time += new_sweeps / self._sweep_rate
+        return
+
+    def _create_sweep_template(self):
+        """ Create the mean number of photons per bin for a single sweep.
+
+        The laser pulse positions are taken from the ensemble currently loaded in the connected
+        pulser (optional connector implementing LaserEdgeInterface, i.e. PulserDummy). Otherwise
+        a single laser pulse in the middle of the record is assumed. In gated mode the number of
+        gates requested in configure() (if given) determines the number of rows. The spin state population of consecutive laser
+        pulses oscillates with full contrast over the course of one sweep.
+
+        @return numpy.ndarray: mean counts per bin, 1D for ungated and 2D for gated counting
+        """
+        binwidth = self.get_binwidth()
+        edges = None
+        if self.pulser.is_connected:
+            edges = self.pulser().get_laser_edges()
+
+        if edges is None or edges['rising'].size == 0:
+            record_bins = self._gate_length_bins
+            rising = np.array([record_bins // 4], dtype='int64')
+            falling = np.array([3 * record_bins // 4], dtype='int64')
+        else:
+            scale = 1 / (edges['sample_rate'] * binwidth)
+            record_bins = int(np.rint(edges['length'] * scale))
+            falling = edges['falling']
+            if falling.size < edges['rising'].size:
+                falling = np.append(falling, edges['length'])
+            rising = np.rint(edges['rising'] * scale).astype('int64')
+            falling = np.rint(falling[:rising.size] * scale).astype('int64')
+
+        number_of_lasers = rising.size
+        bright_population = 0.5 * (1 + np.cos(2 * np.pi * np.arange(number_of_lasers)
+                                              / max(number_of_lasers, 2)))
+        dark_counts_per_bin = self._dark_count_rate * binwidth
+        bright_counts_per_bin = self._count_rate * binwidth
+        if self._gated:
+            gate_bins = self._gate_length_bins
+            if edges is not None and edges['rising'].size > 0:
+                gate_bins = max(gate_bins, int(np.max(falling - rising)))
+            template = np.full((number_of_lasers, gate_bins), dark_counts_per_bin)
+        else:
+            template = np.full(max(record_bins, int(np.max(falling))), dark_counts_per_bin)
+
+        for index in range(number_of_lasers):
+            length = falling[index] - rising[index]
+            if length <= 0:
+                continue
+            time_axis = np.arange(length) * binwidth
+            contrast = self._nv_contrast * (1 - bright_population[index])
+            pulse = bright_counts_per_bin * (
+                    1 - contrast * np.exp(-time_axis / self._polarisation_time))
+            if self._gated:
+                template[index, :length] += pulse[:template.shape[1]]
+            else:
+                template[rising[index]:falling[index]] += pulse
+
+        if self._gated and self._number_of_gates > 0:
+            # Deliver exactly the configured number of gates, repeating the laser pattern if needed
+            template = template[np.arange(self._number_of_gates) % number_of_lasers]
+        return template
@@ -33,6 +33,7 @@ from interface.microwave_interface import MicrowaveInterface
 from interface.microwave_interface import MicrowaveLimits
 from interface.microwave_interface import MicrowaveMode
 from interface.microwave_interface import TriggerEdge
+from .scpi_transport import ScpiTransport
 
 
 class MicrowaveSmbv(Base, MicrowaveInterface):
@@ -71,10 +72,10 @@ class MicrowaveSmbv(Base, MicrowaveInterface):
             self.log.error('Could not connect to the address >>{}<<.'.format(self._address))
             raise
 
+        self._transport = ScpiTransport(self._connection)
         self.model = self._connection.query('*IDN?').split(',')[1]
         self.log.info('MW {} initialised and connected.'.format(self.model))
-        self._command_wait('*CLS')
-        self._command_wait('*RST')
+        self._command_wait('*CLS', '*RST')
         return
 
     def on_deactivate(self):
@@ -82,17 +83,14 @@ class MicrowaveSmbv(Base, MicrowaveInterface):
         self.rm.close()
         return
 
-    def _command_wait(self, command_str):
+    def _command_wait(self, *commands):
         """
-        Writes the command in command_str via ressource manager and waits until the device has finished
-        processing it.
+        Writes the commands via ressource manager in a single transfer and waits until the device
+        has finished processing them.
 
-        @param command_str: The command to be written
+        @param str commands: The commands to be written
         """
-        self._connection.write(command_str)
-        self._connection.write('*WAI')
-        while int(float(self._connection.query('*OPC?'))) != 1:
-            time.sleep(0.2)
+        self._transport.write_wait(*commands)
         return
 
     def get_limits(self):
@@ -138,10 +136,7 @@ class MicrowaveSmbv(Base, MicrowaveInterface):
         if not is_running:
             return 0
 
-        self._connection.write('OUTP:STAT OFF')
-        self._connection.write('*WAI')
-        while int(float(self._connection.query('OUTP:STAT?'))) != 0:
-            time.sleep(0.2)
+        self._command_wait(':OUTP:STAT OFF')
         return 0
 
     def get_status(self):
@@ -200,14 +195,9 @@ class MicrowaveSmbv(Base, MicrowaveInterface):
                 self.off()
 
         if current_mode != 'cw':
-            self._command_wait(':FREQ:MODE CW')
-
-        self._connection.write(':OUTP:STAT ON')
-        self._connection.write('*WAI')
-        dummy, is_running = self.get_status()
-        while not is_running:
-            time.sleep(0.2)
-            dummy, is_running = self.get_status()
+            self._command_wait(':FREQ:MODE CW', ':OUTP:STAT ON')
+        else:
+            self._command_wait(':OUTP:STAT ON')
         return 0
 
     def set_cw(self, frequency=None, power=None):
@@ -226,17 +216,22 @@ class MicrowaveSmbv(Base, MicrowaveInterface):
         if is_running:
             self.off()
 
+        commands = []
         # Activate CW mode
         if mode != 'cw':
-            self._command_wait(':FREQ:MODE CW')
+            commands.append(':FREQ:MODE CW')
 
         # Set CW frequency
         if frequency is not None:
-            self._command_wait(':FREQ {0:f}'.format(frequency))
+            commands.append(':FREQ {0:f}'.format(frequency))
 
-        # Set CW power
+        # Set CW power, the sweep mode uses the same power setting
         if power is not None:
-            self._command_wait(':POW {0:f}'.format(power))
+            commands.append(':POW {0:f}'.format(power))
+            self._transport.invalidate('sweep')
+
+        if commands:
+            self._command_wait(*commands)
 
         # Return actually set values
         mode, dummy = self.get_status()
@@ -292,13 +287,9 @@ class MicrowaveSmbv(Base, MicrowaveInterface):
                 self.off()
 
         if current_mode != 'sweep':
-            self._command_wait(':FREQ:MODE SWEEP')
-
-        self._connection.write(':OUTP:STAT ON')
-        dummy, is_running = self.get_status()
-        while not is_running:
-            time.sleep(0.2)
-            dummy, is_running = self.get_status()
+            self._command_wait(':FREQ:MODE SWEEP', ':OUTP:STAT ON')
+        else:
+            self._command_wait(':OUTP:STAT ON')
         return 0
 
     def set_sweep(self, start=None, stop=None, step=None, power=None):
@@ -316,28 +307,39 @@ class MicrowaveSmbv(Base, MicrowaveInterface):
         if is_running:
             self.off()
 
+        # skip the programming if the sweep is already set up
+        settings = None
+        if None not in (start, stop, step, power):
+            settings = (float(start), float(stop), float(step), float(power))
+            if mode == 'sweep' and self._transport.is_programmed('sweep', settings):
+                return self._transport.get_programmed('sweep') + (mode,)
+
+        commands = []
         if mode != 'sweep':
-            self._command_wait(':FREQ:MODE SWEEP')
+            commands.append(':FREQ:MODE SWEEP')
 
         if (start is not None) and (stop is not None) and (step is not None):
-            self._connection.write(':SWE:MODE STEP')
-            self._connection.write(':SWE:SPAC LIN')
-            self._connection.write('*WAI')
-            self._connection.write(':FREQ:START {0:f}'.format(start - step))
-            self._connection.write(':FREQ:STOP {0:f}'.format(stop))
-            self._connection.write(':SWE:STEP:LIN {0:f}'.format(step))
-            self._connection.write('*WAI')
+            commands.extend([':SWE:MODE STEP',
+                             ':SWE:SPAC LIN',
+                             ':FREQ:START {0:f}'.format(start - step),
+                             ':FREQ:STOP {0:f}'.format(stop),
+                             ':SWE:STEP:LIN {0:f}'.format(step)])
 
         if power is not None:
-            self._connection.write(':POW {0:f}'.format(power))
-            self._connection.write('*WAI')
+            commands.append(':POW {0:f}'.format(power))
 
-        self._command_wait('TRIG:FSW:SOUR EXT')
+        commands.append('TRIG:FSW:SOUR EXT')
+        self._command_wait(*commands)
 
         actual_power = self.get_power()
         freq_list = self.get_frequency()
         mode, dummy = self.get_status()
-        return freq_list[0], freq_list[1], freq_list[2], actual_power, mode
+        actual_values = (freq_list[0], freq_list[1], freq_list[2], actual_power)
+        if settings is None:
+            self._transport.invalidate('sweep')
+        else:
+            self._transport.set_programmed('sweep', settings, actual_values)
+        return actual_values + (mode,)
 
     def reset_sweeppos(self):
         """
@@ -33,6 +33,7 @@ from interface.microwave_interface import MicrowaveInterface
 from interface.microwave_interface import MicrowaveLimits
 from interface.microwave_interface import MicrowaveMode
 from interface.microwave_interface import TriggerEdge
+from .scpi_transport import ScpiTransport
 
 
 class MicrowaveSmiq(Base, MicrowaveInterface):
@@ -82,9 +83,9 @@ class MicrowaveSmiq(Base, MicrowaveInterface):
             raise
 
         self.log.info('MWSMIQ initialised and connected to hardware.')
+        self._transport = ScpiTransport(self._gpib_connection)
         self.model = self._gpib_connection.query('*IDN?').split(',')[1]
-        self._command_wait('*CLS')
-        self._command_wait('*RST')
+        self._command_wait('*CLS', '*RST')
         return
 
     def on_deactivate(self):
@@ -93,17 +94,14 @@ class MicrowaveSmiq(Base, MicrowaveInterface):
         #self.rm.close()
         return
 
-    def _command_wait(self, command_str):
+    def _command_wait(self, *commands):
         """
-        Writes the command in command_str via GPIB and waits until the device has finished
-        processing it.
+        Writes the commands via GPIB in a single transfer and waits until the device has finished
+        processing them.
 
-        @param command_str: The command to be written
+        @param str commands: The commands to be written
         """
-        self._gpib_connection.write(command_str)
-        self._gpib_connection.write('*WAI')
-        while int(float(self._gpib_connection.query('*OPC?'))) != 1:
-            time.sleep(0.2)
+        self._transport.write_wait(*commands)
         return
 
     def get_limits(self):
@@ -170,16 +168,9 @@ class MicrowaveSmiq(Base, MicrowaveInterface):
             return 0
 
         if mode == 'list':
-            self._command_wait(':FREQ:MODE CW')
-
-        self._gpib_connection.write('OUTP:STAT OFF')
-        self._gpib_connection.write('*WAI')
-        while int(float(self._gpib_connection.query('OUTP:STAT?'))) != 0:
-            time.sleep(0.2)
-
-        if mode == 'list':
-            self._command_wait(':LIST:LEARN')
-            self._command_wait(':FREQ:MODE LIST')
+            self._command_wait(':FREQ:MODE CW', ':OUTP:STAT OFF', ':LIST:LEARN', ':FREQ:MODE LIST')
+        else:
+            self._command_wait(':OUTP:STAT OFF')
         return 0
 
     def get_status(self):
@@ -246,14 +237,9 @@ class MicrowaveSmiq(Base, MicrowaveInterface):
                 self.off()
 
         if current_mode != 'cw':
-            self._command_wait(':FREQ:MODE CW')
-
-        self._gpib_connection.write(':OUTP:STAT ON')
-        self._gpib_connection.write('*WAI')
-        dummy, is_running = self.get_status()
-        while not is_running:
-            time.sleep(0.2)
-            dummy, is_running = self.get_status()
+            self._command_wait(':FREQ:MODE CW', ':OUTP:STAT ON')
+        else:
+            self._command_wait(':OUTP:STAT ON')
         return 0
 
     def set_cw(self, frequency=None, power=None):
@@ -272,17 +258,22 @@ class MicrowaveSmiq(Base, MicrowaveInterface):
         if is_running:
             self.off()
 
+        commands = []
         # Activate CW mode
         if mode != 'cw':
-            self._command_wait(':FREQ:MODE CW')
+            commands.append(':FREQ:MODE CW')
 
         # Set CW frequency
         if frequency is not None:
-            self._command_wait(':FREQ {0:f}'.format(frequency))
+            commands.append(':FREQ {0:f}'.format(frequency))
 
-        # Set CW power
+        # Set CW power, the sweep mode uses the same power setting
         if power is not None:
-            self._command_wait(':POW {0:f}'.format(power))
+            commands.append(':POW {0:f}'.format(power))
+            self._transport.invalidate('sweep')
+
+        if commands:
+            self._command_wait(*commands)
 
         # Return actually set values
         mode, dummy = self.get_status()
@@ -306,12 +297,7 @@ class MicrowaveSmiq(Base, MicrowaveInterface):
 
         # This needs to be done due to stupid design of the list mode (sweep is better)
         self.cw_on()
-        self._command_wait(':LIST:LEARN')
-        self._command_wait(':FREQ:MODE LIST')
-        dummy, is_running = self.get_status()
-        while not is_running:
-            time.sleep(0.2)
-            dummy, is_running = self.get_status()
+        self._command_wait(':LIST:LEARN', ':FREQ:MODE LIST')
         return 0
 
     def set_list(self, frequency=None, power=None):
@@ -330,12 +316,20 @@ class MicrowaveSmiq(Base, MicrowaveInterface):
         if is_running:
             self.off()
 
+        # Transferring and learning the list takes long, skip it if the list is already loaded
+        settings = None
+        if frequency is not None and power is not None:
+            settings = (tuple(np.asarray(frequency, dtype=float)), float(power))
+            if mode == 'list' and self._transport.is_programmed('list', settings):
+                actual_freq, actual_power = self._transport.get_programmed('list')
+                return actual_freq, actual_power, mode
+
+        commands = []
         # Cant change list parameters if in list mode
         if mode != 'cw':
-            self.set_cw()
+            commands.append(':FREQ:MODE CW')
 
-        self._gpib_connection.write(":LIST:SEL 'QUDI'")
-        self._gpib_connection.write('*WAI')
+        commands.append(":LIST:SEL 'QUDI'")
 
         # Set list frequencies
         if frequency is not None:
@@ -343,28 +337,29 @@ class MicrowaveSmiq(Base, MicrowaveInterface):
             for f in frequency[:-1]:
                 s += ' {0:f},'.format(f)
             s += ' {0:f}'.format(frequency[-1])
-            self._gpib_connection.write(':LIST:FREQ' + s)
-            self._gpib_connection.write('*WAI')
-            self._gpib_connection.write(':LIST:MODE STEP')
-            self._gpib_connection.write('*WAI')
+            commands.append(':LIST:FREQ' + s)
+            commands.append(':LIST:MODE STEP')
 
         # Set list power
         if power is not None:
-            self._gpib_connection.write(':LIST:POW {0:f}'.format(power))
-            self._gpib_connection.write('*WAI')
+            commands.append(':LIST:POW {0:f}'.format(power))
 
-        self._command_wait(':TRIG1:LIST:SOUR EXT')
+        commands.append(':TRIG1:LIST:SOUR EXT')
 
         # Apply settings in hardware
-        self._command_wait(':LIST:LEARN')
-        # If there are timeout  problems after this command, update the smiq  firmware to > 5.90
+        # If there are timeout  problems after :LIST:LEARN, update the smiq  firmware to > 5.90
         # as there was a problem with excessive wait times after issuing :LIST:LEARN over a
         # GPIB connection in firmware 5.88
-        self._command_wait(':FREQ:MODE LIST')
+        commands.extend([':LIST:LEARN', ':FREQ:MODE LIST'])
+        self._command_wait(*commands)
 
         actual_freq = self.get_frequency()
         actual_power = self.get_power()
         mode, dummy = self.get_status()
+        if settings is None:
+            self._transport.invalidate('list')
+        else:
+            self._transport.set_programmed('list', settings, (actual_freq, actual_power))
         return actual_freq, actual_power, mode
 
     def reset_listpos(self):
@@ -389,13 +384,9 @@ class MicrowaveSmiq(Base, MicrowaveInterface):
                 self.off()
 
         if current_mode != 'sweep':
-            self._command_wait(':FREQ:MODE SWEEP')
-
-        self._gpib_connection.write(':OUTP:STAT ON')
-        dummy, is_running = self.get_status()
-        while not is_running:
-            time.sleep(0.2)
-            dummy, is_running = self.get_status()
+            self._command_wait(':FREQ:MODE SWEEP', ':OUTP:STAT ON')
+        else:
+            self._command_wait(':OUTP:STAT ON')
         return 0
 
     def set_sweep(self, start=None, stop=None, step=None, power=None):
@@ -413,28 +404,38 @@ class MicrowaveSmiq(Base, MicrowaveInterface):
         if is_running:
             self.off()
 
+        settings = None
+        if None not in (start, stop, step, power):
+            settings = (float(start), float(stop), float(step), float(power))
+            if mode == 'sweep' and self._transport.is_programmed('sweep', settings):
+                return self._transport.get_programmed('sweep') + (mode,)
+
+        commands = []
         if mode != 'sweep':
-            self._command_wait(':FREQ:MODE SWEEP')
+            commands.append(':FREQ:MODE SWEEP')
 
         if (start is not None) and (stop is not None) and (step is not None):
-            self._gpib_connection.write(':SWE:MODE STEP')
-            self._gpib_connection.write(':SWE:SPAC LIN')
-            self._gpib_connection.write('*WAI')
-            self._gpib_connection.write(':FREQ:START {0:f}'.format(start - step))
-            self._gpib_connection.write(':FREQ:STOP {0:f}'.format(stop))
-            self._gpib_connection.write(':SWE:STEP:LIN {0:f}'.format(step))
-            self._gpib_connection.write('*WAI')
+            commands.extend([':SWE:MODE STEP',
+                             ':SWE:SPAC LIN',
+                             ':FREQ:START {0:f}'.format(start - step),
+                             ':FREQ:STOP {0:f}'.format(stop),
+                             ':SWE:STEP:LIN {0:f}'.format(step)])
 
         if power is not None:
-            self._gpib_connection.write(':POW {0:f}'.format(power))
-            self._gpib_connection.write('*WAI')
+            commands.append(':POW {0:f}'.format(power))
 
-        self._command_wait(':TRIG1:SWE:SOUR EXT')
+        commands.append(':TRIG1:SWE:SOUR EXT')
+        self._command_wait(*commands)
 
         actual_power = self.get_power()
         freq_list = self.get_frequency()
         mode, dummy = self.get_status()
-        return freq_list[0], freq_list[1], freq_list[2], actual_power, mode
+        actual_values = (freq_list[0], freq_list[1], freq_list[2], actual_power)
+        if settings is None:
+            self._transport.invalidate('sweep')
+        else:
+            self._transport.set_programmed('sweep', settings, actual_values)
+        return actual_values + (mode,)
 
     def reset_sweeppos(self):
         """
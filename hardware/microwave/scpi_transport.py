@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+"""
+This file contains a helper for the SCPI communication with microwave sources.
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+
+class ScpiTransport:
+    """ Batched SCPI communication over an open VISA resource.
+
+    Every bus round trip costs a few ms on GPIB, so several commands are joined into a single
+    program message. Instead of writing '*WAI' and polling '*OPC?' or a status query in a loop,
+    write_wait appends '*OPC?' to the batch and blocks in a single query until the device has
+    processed all commands.
+
+    Furthermore the settings which are expensive to program (e.g. a frequency list) can be
+    remembered with is_programmed/set_programmed, so they are only sent again if they changed.
+    Call invalidate whenever the device state may have changed otherwise (e.g. after '*RST').
+    """
+
+    def __init__(self, connection, opc_timeout=None):
+        """
+        @param connection: open VISA resource (pyvisa MessageBasedResource)
+        @param float opc_timeout: optional, timeout of write_wait in s. Default is the timeout of
+                                  the connection.
+        """
+        self._connection = connection
+        self.opc_timeout = opc_timeout
+        self._programmed = dict()
+
+    @staticmethod
+    def join(commands):
+        """ Join commands into a single program message.
+
+        @param list commands: SCPI commands
+
+        @return str: program message
+
+        Each command is started from the root of the command tree, otherwise the command headers
+        after a ';' would be relative to the previous command.
+        """
+        return ';'.join(command if command.startswith((':', '*')) else ':' + command
+                        for command in commands)
+
+    def write(self, *commands):
+        """ Write all commands with a single bus transfer.
+
+        @param str commands: SCPI commands
+        """
+        if commands:
+            self._connection.write(self.join(commands))
+
+    def query(self, command):
+        """ Query a single command.
+
+        @param str command: SCPI query
+
+        @return str: answer of the device
+        """
+        return self._connection.query(command)
+
+    def write_wait(self, *commands, timeout=None):
+        """ Write all commands with a single bus transfer and wait until they are processed.
+
+        @param str commands: SCPI commands
+        @param float timeout: optional, maximal time to wait in s
+
+        @return bool: True if the device reported that the operation is complete
+        """
+        if timeout is None:
+            timeout = self.opc_timeout
+        old_timeout = self._connection.timeout
+        if timeout is not None:
+            self._connection.timeout = int(timeout * 1000)
+        try:
+            answer = self._connection.query(self.join(list(commands) + ['*OPC?']))
+        finally:
+            if timeout is not None:
+                self._connection.timeout = old_timeout
+        return int(float(answer)) == 1
+
+    def is_programmed(self, key, settings):
+        """ Check whether the device is already programmed with these settings.
+
+        @param str key: name of the settings, e.g. 'list'
+        @param settings: comparable (hashable) representation of the settings
+        """
+        return key in self._programmed and self._programmed[key][0] == settings
+
+    def get_programmed(self, key):
+        """ Return the value stored with set_programmed for the current settings of key. """
+        return self._programmed[key][1]
+
+    def set_programmed(self, key, settings, value=None):
+        """ Remember the settings programmed into the device.
+
+        @param str key: name of the settings, e.g. 'list'
+        @param settings: comparable (hashable) representation of the settings
+        @param value: optional, value to keep for these settings (e.g. the values read back)
+        """
+        self._programmed[key] = (settings, value)
+
+    def invalidate(self, *keys):
+        """ Forget the programmed settings of the keys, of all if no key is given. """
+        if not keys:
+            self._programmed.clear()
+        for key in keys:
+            self._programmed.pop(key, None)
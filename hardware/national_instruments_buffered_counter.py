@@ -0,0 +1,431 @@
+# -*- coding: utf-8 -*-
+
+"""
+This file contains buffered, callback driven readers for NI-DAQmx counter tasks.
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+class BufferedCounterReader:
+    """ Reads continuously running, hardware timed semi-period counter tasks in the background.
+
+    DAQmx calls back every time 2 * samples new values (high and low semi-period of the clock) are
+    in the buffer of the first task. The callback reads all tasks into a preallocated raw buffer,
+    adds up the semi-periods and scales to counts/s in place into one of the result blocks, which
+    are used in turn (ping-pong for the default of 2 blocks). The consumer takes the oldest unread
+    block with read (blocking with timeout) or all unread blocks with read_available
+    (non-blocking). If the consumer is too slow, the oldest unread block is overwritten and counted
+    in lost_blocks.
+
+    The DAQmx backend is passed in, so the reader runs with PyDAQmx as well as with FakeDAQmx.
+    """
+
+    def __init__(self, daq, tasks, samples, clock_frequency, blocks=2, timeout=10):
+        """
+        @param daq: DAQmx backend, i.e. the PyDAQmx module or a FakeDAQmx instance
+        @param list tasks: configured and stopped counter tasks, one per counter channel
+        @param int samples: number of clock periods per block
+        @param float clock_frequency: frequency of the counting clock in Hz
+        @param int blocks: number of result blocks, at least 2
+        @param float timeout: timeout of the DAQmx read in s
+        """
+        self._daq = daq
+        self._tasks = list(tasks)
+        self.samples = int(samples)
+        self.clock_frequency = float(clock_frequency)
+        self.timeout = timeout
+        self.lost_blocks = 0
+        self.error = None
+
+        blocks = max(2, int(blocks))
+        self._raw = np.empty((len(self._tasks), 2 * self.samples), dtype=np.uint32)
+        self._blocks = np.empty((blocks, len(self._tasks), self.samples), dtype=np.float64)
+        self._write_index = 0
+        self._unread = deque()
+        self._condition = threading.Condition()
+        self._n_read = daq.int32()
+        self._callback = None
+        self._running = False
+
+    @property
+    def available_blocks(self):
+        """ Number of blocks which were not read yet. """
+        with self._condition:
+            return len(self._unread)
+
+    def start(self):
+        """ Register the callback and start the counter tasks. """
+        daq = self._daq
+        n_samples = 2 * self.samples
+        for task in self._tasks:
+            # DAQmx buffer for several blocks, so a delayed callback does not overflow it
+            daq.DAQmxCfgImplicitTiming(task, daq.DAQmx_Val_ContSamps,
+                                       max(1000, 4 * len(self._blocks) * n_samples))
+        # keep a reference to the C callback as long as it is registered
+        self._callback = daq.DAQmxEveryNSamplesEventCallbackPtr(self._every_n_samples)
+        daq.DAQmxRegisterEveryNSamplesEvent(
+            self._tasks[0], daq.DAQmx_Val_Acquired_Into_Buffer, n_samples, 0, self._callback,
+            None)
+        self._running = True
+        for task in self._tasks:
+            daq.DAQmxStartTask(task)
+
+    def stop(self):
+        """ Stop the counter tasks and unregister the callback. Waiting readers are woken up. """
+        daq = self._daq
+        self._running = False
+        for task in self._tasks:
+            daq.DAQmxStopTask(task)
+        if self._callback is not None:
+            daq.DAQmxRegisterEveryNSamplesEvent(
+                self._tasks[0], daq.DAQmx_Val_Acquired_Into_Buffer, 2 * self.samples, 0, None,
+                None)
+            self._callback = None
+        with self._condition:
+            self._condition.notify_all()
+
+    def read(self, timeout=None, out=None):
+        """ Return the oldest unread block, wait for it if necessary.
+
+        @param float timeout: maximal time to wait in s, default is the DAQmx read timeout
+        @param numpy.ndarray out: optional, float64 array of shape (channels, samples) to copy into
+
+        @return numpy.ndarray: counts/s with shape (channels, samples), None on timeout or error
+        """
+        if timeout is None:
+            timeout = self.timeout
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while not self._unread and self.error is None and self._running:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+            if not self._unread:
+                return None
+            index = self._unread.popleft()
+            if out is None:
+                return self._blocks[index].copy()
+            out[...] = self._blocks[index]
+            return out
+
+    def read_available(self):
+        """ Return all unread blocks without waiting.
+
+        @return numpy.ndarray: counts/s with shape (channels, unread blocks * samples)
+        """
+        with self._condition:
+            indices = list(self._unread)
+            self._unread.clear()
+            if not indices:
+                return np.empty((len(self._tasks), 0), dtype=np.float64)
+            return np.concatenate(self._blocks[indices], axis=1)
+
+    def _every_n_samples(self, task_handle, event_type, n_samples, callback_data):
+        """ DAQmx callback, runs in a thread of the DAQmx driver. """
+        if not self._running:
+            return 0
+        try:
+            with self._condition:
+                # the consumer is too slow, drop the oldest block
+                if self._write_index in self._unread:
+                    self._unread.remove(self._write_index)
+                    self.lost_blocks += 1
+            for i, task in enumerate(self._tasks):
+                self._daq.DAQmxReadCounterU32(task, 2 * self.samples, self.timeout, self._raw[i],
+                                              2 * self.samples, self._daq.byref(self._n_read),
+                                              None)
+            # add up adjoint semi-periods and normalize to counts per second, all in place
+            block = self._blocks[self._write_index]
+            np.add(self._raw[:, ::2], self._raw[:, 1::2], out=block)
+            block *= self.clock_frequency
+            with self._condition:
+                self._unread.append(self._write_index)
+                self._write_index = (self._write_index + 1) % len(self._blocks)
+                self._condition.notify_all()
+        except Exception as e:
+            # reads fail while the tasks are stopped
+            if self._running:
+                with self._condition:
+                    self.error = e
+                    self._condition.notify_all()
+        return 0
+
+
+class FrameScanReader:
+    """ Streams the counts of a hardware timed frame scan line by line.
+
+    The analog output of the whole frame (lines and flyback) is clocked by the scanner clock, so
+    every clock period is one point of the frame. The semi-period counter tasks measure both halves
+    of every period. DAQmx calls back every time the 2 * line_period values of a line (pixels and
+    flyback) are in the buffer of the first counter task. The callback reads the line from all
+    counter tasks (and the analog input task, if any), keeps the first line_length pixels and
+    passes them in counts/s to line_callback.
+
+    The first semi-period is measured before the first clock edge and is thrown away, like the
+    read offset of 1 does for a single line.
+
+    The DAQmx backend is passed in, so the reader runs with PyDAQmx as well as with FakeDAQmx.
+    """
+
+    def __init__(self, daq, counter_tasks, clock_task, lines, line_period, line_length,
+                 clock_frequency, line_callback, analog_task=None, analog_channels=0,
+                 timeout=10):
+        """
+        @param daq: DAQmx backend, i.e. the PyDAQmx module or a FakeDAQmx instance
+        @param list counter_tasks: configured and stopped semi-period counter tasks
+        @param clock_task: configured and stopped scanner clock task
+        @param int lines: number of lines of the frame
+        @param int line_period: number of points per line including the flyback
+        @param int line_length: number of pixels per line
+        @param float clock_frequency: frequency of the scanner clock in Hz
+        @param callable line_callback: called as line_callback(line_index, counts) with counts/s
+                                       of shape (line_length, channels), [[-1.]] on error
+        @param analog_task: optional, configured and stopped analog input task
+        @param int analog_channels: number of channels of the analog input task
+        @param float timeout: timeout of the DAQmx read in s
+        """
+        self._daq = daq
+        self._counter_tasks = list(counter_tasks)
+        self._clock_task = clock_task
+        self._analog_task = analog_task
+        self.lines = int(lines)
+        self.line_period = int(line_period)
+        self.line_length = int(line_length)
+        self.clock_frequency = float(clock_frequency)
+        self.timeout = timeout
+        self.lines_done = 0
+        self.error = None
+        self._line_callback = line_callback
+
+        n_counters = len(self._counter_tasks)
+        self._raw = np.empty((n_counters, 2 * self.line_period), dtype=np.uint32)
+        self._analog_raw = np.empty((analog_channels, self.line_period), dtype=np.float64)
+        self._counts = np.empty((n_counters + analog_channels, self.line_length),
+                                dtype=np.float64)
+        self._n_read = daq.int32()
+        self._callback = None
+        self._running = False
+
+    @property
+    def finished(self):
+        """ Whether all lines of the frame were passed to the line callback. """
+        return self.lines_done >= self.lines
+
+    def start(self):
+        """ Register the callback and start the counter, analog input and clock tasks.
+
+        The analog output has to be written and started (waiting for the clock) before.
+        """
+        daq = self._daq
+        for task in self._counter_tasks:
+            # the reads follow each other, the first semi-period is skipped explicitly
+            daq.DAQmxSetReadRelativeTo(task, daq.DAQmx_Val_CurrReadPos)
+            daq.DAQmxSetReadOffset(task, 0)
+        # keep a reference to the C callback as long as it is registered
+        self._callback = daq.DAQmxEveryNSamplesEventCallbackPtr(self._every_n_samples)
+        daq.DAQmxRegisterEveryNSamplesEvent(
+            self._counter_tasks[0], daq.DAQmx_Val_Acquired_Into_Buffer, 2 * self.line_period, 0,
+            self._callback, None)
+        self.lines_done = 0
+        self._running = True
+        for task in self._counter_tasks:
+            daq.DAQmxStartTask(task)
+        if self._analog_task is not None:
+            daq.DAQmxStartTask(self._analog_task)
+        daq.DAQmxStartTask(self._clock_task)
+
+    def stop(self):
+        """ Stop the tasks and unregister the callback. """
+        daq = self._daq
+        self._running = False
+        for task in self._counter_tasks:
+            daq.DAQmxStopTask(task)
+        if self._analog_task is not None:
+            daq.DAQmxStopTask(self._analog_task)
+        daq.DAQmxStopTask(self._clock_task)
+        if self._callback is not None:
+            daq.DAQmxRegisterEveryNSamplesEvent(
+                self._counter_tasks[0], daq.DAQmx_Val_Acquired_Into_Buffer,
+                2 * self.line_period, 0, None, None)
+            self._callback = None
+
+    def _every_n_samples(self, task_handle, event_type, n_samples, callback_data):
+        """ DAQmx callback, runs in a thread of the DAQmx driver. """
+        if not self._running or self.finished:
+            return 0
+        daq = self._daq
+        n_counters = len(self._counter_tasks)
+        try:
+            for i, task in enumerate(self._counter_tasks):
+                if self.lines_done == 0:
+                    daq.DAQmxReadCounterU32(task, 1, self.timeout, self._raw[i], 1,
+                                            daq.byref(self._n_read), None)
+                daq.DAQmxReadCounterU32(task, 2 * self.line_period, self.timeout, self._raw[i],
+                                        2 * self.line_period, daq.byref(self._n_read), None)
+            # add up adjoint semi-periods of the pixels and normalize to counts per second
+            pixels = 2 * self.line_length
+            counts = self._counts[:n_counters]
+            np.add(self._raw[:, 0:pixels:2], self._raw[:, 1:pixels:2], out=counts)
+            counts *= self.clock_frequency
+            if self._analog_task is not None:
+                daq.DAQmxReadAnalogF64(self._analog_task, self.line_period, self.timeout,
+                                       daq.DAQmx_Val_GroupByChannel, self._analog_raw,
+                                       self._analog_raw.size, daq.byref(self._n_read), None)
+                self._counts[n_counters:] = self._analog_raw[:, :self.line_length]
+        except Exception as e:
+            # reads fail while the tasks are stopped
+            if self._running:
+                self.error = e
+                self._running = False
+                self._line_callback(self.lines_done, np.array([[-1.]]))
+            return 0
+        line_index = self.lines_done
+        self.lines_done += 1
+        self._line_callback(line_index, self._counts.transpose().copy())
+        return 0
+
+
+class FakeDAQmx:
+    """ Stand-in for the parts of PyDAQmx used by BufferedCounterReader and FrameScanReader, without
+    any NI card.
+
+    Counter tasks return Poisson distributed counts of a constant count rate paced by the wall
+    clock, analog input tasks return zeros at the clock frequency, and registered every-N-samples callbacks are called from a background thread. This
+    allows to exercise and benchmark the counter readout, e.g.
+
+        daq = FakeDAQmx(clock_frequency=1000, count_rate=1e5)
+        reader = BufferedCounterReader(daq, [daq.TaskHandle()], samples=100, clock_frequency=1000)
+        reader.start()
+        counts = reader.read()
+        reader.stop()
+    """
+    DAQmx_Val_ContSamps = 10123
+    DAQmx_Val_Acquired_Into_Buffer = 1
+    DAQmx_Val_CurrReadPos = 10425
+    DAQmx_Val_GroupByChannel = 0
+
+    class int32:
+        def __init__(self, value=0):
+            self.value = value
+
+    class TaskHandle:
+        def __init__(self):
+            self.start_time = None
+            self.read_position = 0
+            self.callback = None
+            self.callback_samples = 0
+            self.thread = None
+
+    def __init__(self, clock_frequency=100, count_rate=1e5, seed=None):
+        """
+        @param float clock_frequency: frequency of the simulated counting clock in Hz
+        @param float count_rate: simulated count rate in counts/s
+        @param int seed: optional, seed of the random numbers
+        """
+        self.clock_frequency = clock_frequency
+        self.count_rate = count_rate
+        self._rng = np.random.RandomState(seed)
+
+    @staticmethod
+    def byref(obj):
+        return obj
+
+    @staticmethod
+    def DAQmxEveryNSamplesEventCallbackPtr(function):
+        return function
+
+    def DAQmxCfgImplicitTiming(self, task, sample_mode, samples_per_channel):
+        return 0
+
+    def DAQmxSetReadRelativeTo(self, task, relative_to):
+        return 0
+
+    def DAQmxSetReadOffset(self, task, offset):
+        return 0
+
+    def DAQmxRegisterEveryNSamplesEvent(self, task, event_type, n_samples, options, callback,
+                                        callback_data):
+        task.callback = callback
+        task.callback_samples = n_samples
+        return 0
+
+    def DAQmxStartTask(self, task):
+        task.start_time = time.monotonic()
+        task.read_position = 0
+        if task.callback is not None:
+            task.thread = threading.Thread(target=self._run_callbacks, args=(task, ), daemon=True)
+            task.thread.start()
+        return 0
+
+    def DAQmxStopTask(self, task):
+        task.start_time = None
+        if task.thread is not None:
+            task.thread.join()
+            task.thread = None
+        return 0
+
+    def DAQmxClearTask(self, task):
+        return self.DAQmxStopTask(task)
+
+    def DAQmxReadCounterU32(self, task, n_samples, timeout, data, array_size, n_read, reserved):
+        # two semi-periods per clock period
+        sample_time = 1 / (2 * self.clock_frequency)
+        self._wait_for_samples(task, n_samples, sample_time, timeout)
+        data[:n_samples] = self._rng.poisson(self.count_rate * sample_time, n_samples)
+        task.read_position += n_samples
+        n_read.value = n_samples
+        return 0
+
+    def DAQmxReadAnalogF64(self, task, n_samples, timeout, fill_mode, data, array_size, n_read,
+                           reserved):
+        self._wait_for_samples(task, n_samples, 1 / self.clock_frequency, timeout)
+        data[...] = 0
+        task.read_position += n_samples
+        n_read.value = n_samples
+        return 0
+
+    @staticmethod
+    def _wait_for_samples(task, n_samples, sample_time, timeout):
+        if task.start_time is None:
+            raise RuntimeError('Task is not running.')
+        ready_time = task.start_time + (task.read_position + n_samples) * sample_time
+        wait = ready_time - time.monotonic()
+        if wait > timeout:
+            raise RuntimeError('Timeout while reading {0} samples.'.format(n_samples))
+        if wait > 0:
+            time.sleep(wait)
+
+    def _run_callbacks(self, task):
+        period = task.callback_samples / (2 * self.clock_frequency)
+        count = 0
+        start_time = task.start_time
+        while task.start_time == start_time and task.callback is not None:
+            count += 1
+            wait = start_time + count * period - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            if task.start_time != start_time or task.callback is None:
+                break
+            task.callback(task, self.DAQmx_Val_Acquired_Into_Buffer, task.callback_samples, None)
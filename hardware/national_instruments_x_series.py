@@ -32,6 +32,7 @@ from interface.slow_counter_interface import SlowCounterConstraints
 from interface.slow_counter_interface import CountingMode
 from interface.odmr_counter_interface import ODMRCounterInterface
 from interface.confocal_scanner_interface import ConfocalScannerInterface
+from .national_instruments_buffered_counter import BufferedCounterReader, FrameScanReader
 
 
 class NationalInstrumentsXSeries(Base, SlowCounterInterface, ConfocalScannerInterface, ODMRCounterInterface):
@@ -87,6 +88,8 @@ class NationalInstrumentsXSeries(Base, SlowCounterInterface, ConfocalScannerInte
         max_counts: 3e7
         read_write_timeout: 10
         counting_edge_rising: True
+        buffered_counting: False # optional, read the counter in a DAQmx callback
+        counter_buffer_blocks: 2 # optional, number of buffered count blocks
 
     """
 
@@ -123,6 +126,8 @@ class NationalInstrumentsXSeries(Base, SlowCounterInterface, ConfocalScannerInte
     # timeout for the Read or/and write process in s
     _RWTimeout = ConfigOption('read_write_timeout', default=10)
     _counting_edge_rising = ConfigOption('counting_edge_rising', default=True)
+    _buffered_counting = ConfigOption('buffered_counting', default=False)
+    _counter_buffer_blocks = ConfigOption('counter_buffer_blocks', default=2)
 
     def on_activate(self):
         """ Starts up the NI Card at activation.
@@ -130,10 +135,15 @@ class NationalInstrumentsXSeries(Base, SlowCounterInterface, ConfocalScannerInte
         # the tasks used on that hardware device:
         self._counter_daq_tasks = list()
         self._counter_analog_daq_task = None
+        self._counter_reader = None
+        self._count_data = None
         self._clock_daq_task = None
         self._scanner_clock_daq_task = None
         self._scanner_ao_task = None
         self._scanner_counter_daq_tasks = list()
+        self._frame_reader = None
+        self._frame_end_position = None
+        self._frame_pixel_clock = False
         self._line_length = None
         self._odmr_length = None
         self._gated_counter_daq_task = None
@@ -523,9 +533,17 @@ class NationalInstrumentsXSeries(Base, SlowCounterInterface, ConfocalScannerInte
             samples = int(self._samples_number)
         else:
             samples = int(samples)
+
+        if self._buffered_counting and len(self._counter_ai_channels) < 1:
+            return self._get_buffered_counter(samples)
+
         try:
-            # count data will be written here in the NumPy array of length samples
-            count_data = np.empty((len(self._counter_daq_tasks), 2 * samples), dtype=np.uint32)
+            # count data will be written here, the array is reused as long as samples is unchanged
+            if self._count_data is None or self._count_data.shape != (len(self._counter_daq_tasks),
+                                                                      2 * samples):
+                self._count_data = np.empty((len(self._counter_daq_tasks), 2 * samples),
+                                            dtype=np.uint32)
+            count_data = self._count_data
 
             # number of samples which were actually read, will be stored here
             n_read_samples = daq.int32()
@@ -571,22 +589,70 @@ class NationalInstrumentsXSeries(Base, SlowCounterInterface, ConfocalScannerInte
             # in case of error return a lot of -1
             return np.ones((len(self.get_counter_channels()), samples), dtype=np.uint32) * -1
 
-        real_data = np.empty((len(self._counter_channels), samples), dtype=np.uint32)
+        all_data = np.empty((len(self.get_counter_channels()), samples), dtype=np.float64)
+        real_data = all_data[:len(self._counter_daq_tasks)]
 
         # add up adjoint pixels to also get the counts from the low time of
-        # the clock:
-        real_data = count_data[:, ::2]
-        real_data += count_data[:, 1::2]
-
-        all_data = np.full((len(self.get_counter_channels()), samples), 222, dtype=np.float64)
-        # normalize to counts per second for counter channels
-        all_data[0:len(real_data)] = np.array(real_data * self._clock_frequency, np.float64)
+        # the clock and normalize to counts per second for counter channels
+        np.add(count_data[:, ::2], count_data[:, 1::2], out=real_data)
+        real_data *= self._clock_frequency
 
         if len(self._counter_ai_channels) > 0:
             all_data[-len(self._counter_ai_channels):] = analog_data
 
         return all_data
 
+    def _get_buffered_counter(self, samples):
+        """ Returns the next block of counts per second read by the DAQmx callback.
+
+        @param int samples: number of samples per block
+
+        @return float [samples]: array with entries as photon counts per second
+
+        The counter tasks are restarted with a BufferedCounterReader at the first call and whenever
+        the number of samples changes.
+        """
+        try:
+            if self._counter_reader is None or self._counter_reader.samples != samples:
+                if self._counter_reader is not None:
+                    self._counter_reader.stop()
+                else:
+                    for task in self._counter_daq_tasks:
+                        daq.DAQmxStopTask(task)
+                self._counter_reader = BufferedCounterReader(
+                    daq, self._counter_daq_tasks, samples, self._clock_frequency,
+                    blocks=self._counter_buffer_blocks, timeout=self._RWTimeout)
+                self._counter_reader.start()
+
+            lost_blocks = self._counter_reader.lost_blocks
+            data = self._counter_reader.read()
+            if self._counter_reader.lost_blocks > lost_blocks:
+                self.log.warning('Counts were not read fast enough, {0:d} blocks of {1:d} samples '
+                                 'have been dropped.'.format(
+                                     self._counter_reader.lost_blocks - lost_blocks, samples))
+            if data is None:
+                raise Exception('No count data within {0} s.'.format(self._RWTimeout)
+                                if self._counter_reader.error is None
+                                else self._counter_reader.error)
+        except:
+            self.log.exception('Getting samples from buffered counter failed.')
+            # in case of error return a lot of -1
+            return np.ones((len(self.get_counter_channels()), samples), dtype=np.uint32) * -1
+        return data
+
+    def get_available_counts(self):
+        """ Returns all counts per second acquired since the last read without waiting.
+
+        @return numpy.ndarray: counts per second with shape (counter channels, samples), the number
+                               of samples is a multiple of the samples of the last get_counter call
+                               (0 if nothing was acquired yet).
+
+        Only available with buffered_counting after the first call of get_counter.
+        """
+        if self._counter_reader is None:
+            return np.empty((len(self._counter_daq_tasks), 0), dtype=np.float64)
+        return self._counter_reader.read_available()
+
     def close_counter(self, scanner=False):
         """ Closes the counter or scanner and cleans up afterwards.
 
@@ -610,6 +676,13 @@ class NationalInstrumentsXSeries(Base, SlowCounterInterface, ConfocalScannerInte
                     error = -1
             self._scanner_counter_daq_tasks = []
         else:
+            if self._counter_reader is not None:
+                try:
+                    self._counter_reader.stop()
+                except:
+                    self.log.exception('Could not stop buffered counter readout.')
+                    error = -1
+                self._counter_reader = None
             for i, task in enumerate(self._counter_daq_tasks):
                 try:
                     # stop the counter task
@@ -1406,11 +1479,134 @@ class NationalInstrumentsXSeries(Base, SlowCounterInterface, ConfocalScannerInte
         # return values is a rate of counts/s
         return all_data.transpose()
 
+    def start_frame_scan(self, frame_path, line_length, line_callback, pixel_clock=False):
+        """ Starts a hardware timed scan of a whole frame and returns immediately.
+
+        @param float[n][k][p] frame_path: positions of k lines with p points each for n axes. The
+                                          first line_length points of every line are the pixels,
+                                          the remaining points are the flyback to the next line.
+        @param int line_length: number of pixels per line
+        @param callable line_callback: called as line_callback(line_index, counts) for every
+                                       completed line with the photon counts per second as
+                                       float[line_length][m] for m channels. On error the counts
+                                       are [[-1.]]. Called from a thread of the DAQmx driver.
+        @param bool pixel_clock: whether we need to output a pixel clock for the frame
+
+        @return int: error code (0:OK, -1:error)
+
+        In contrast to scan_line, the timing is configured and the tasks are started only once per
+        frame. The whole frame is written to the analog output and the counts are read with a
+        DAQmx callback every time a line including its flyback is complete. The pixel clock runs
+        during the flyback as well.
+        """
+        if self._scanner_counter_channels and len(self._scanner_counter_daq_tasks) < 1:
+            self.log.error('Configured counter is not running, cannot scan a frame.')
+            return -1
+
+        if self._scanner_ai_channels and self._scanner_analog_daq_task is None:
+            self.log.error('Configured analog input is not running, cannot scan a frame.')
+            return -1
+
+        if not self._scanner_counter_daq_tasks:
+            self.log.error('Scanning a frame requires at least one counter channel.')
+            return -1
+
+        if self._frame_reader is not None:
+            self.log.error('Another frame scan is still running, stop this one first.')
+            return -1
+
+        frame_path = np.asarray(frame_path, dtype=np.float64)
+        if frame_path.ndim != 3 or not 0 < line_length <= frame_path.shape[2]:
+            self.log.error('Given frame_path has to be of shape (axes, lines, points per line) '
+                           'with at least line_length points per line.')
+            return -1
+        axes, lines, line_period = frame_path.shape
+        path = frame_path.reshape(axes, lines * line_period)
+        try:
+            frame_volts = self._scanner_position_to_volt(path)
+            if np.any(np.isnan(frame_volts)):
+                return -1
+            daq.DAQmxSetSampTimingType(self._scanner_ao_task, daq.DAQmx_Val_SampClk)
+            if self._set_up_line(lines * line_period) < 0:
+                return -1
+            self._write_scanner_ao(voltages=frame_volts, length=self._line_length, start=False)
+
+            # start the timed analog output task, it waits for the scanner clock
+            daq.DAQmxStartTask(self._scanner_ao_task)
+
+            for task in self._scanner_counter_daq_tasks:
+                daq.DAQmxStopTask(task)
+            daq.DAQmxStopTask(self._scanner_clock_daq_task)
+
+            self._frame_pixel_clock = pixel_clock and self._pixel_clock_channel is not None
+            if self._frame_pixel_clock:
+                daq.DAQmxConnectTerms(
+                    self._scanner_clock_channel + 'InternalOutput',
+                    self._pixel_clock_channel,
+                    daq.DAQmx_Val_DoNotInvertPolarity)
+
+            self._frame_end_position = np.array(path[:, -1])
+            self._frame_reader = FrameScanReader(
+                daq,
+                self._scanner_counter_daq_tasks,
+                self._scanner_clock_daq_task,
+                lines,
+                line_period,
+                line_length,
+                self._scanner_clock_frequency,
+                line_callback,
+                analog_task=self._scanner_analog_daq_task if self._scanner_ai_channels else None,
+                analog_channels=len(self._scanner_ai_channels),
+                timeout=self._RWTimeout)
+            self._frame_reader.start()
+        except:
+            self.log.exception('Error while starting the frame scan.')
+            self.stop_frame_scan()
+            return -1
+        return 0
+
+    def stop_frame_scan(self):
+        """ Stops the frame scan started with start_frame_scan and cleans up afterwards.
+
+        @return int: error code (0:OK, -1:error)
+        """
+        retval = 0
+        if self._frame_reader is not None:
+            try:
+                self._frame_reader.stop()
+            except:
+                self.log.exception('Error while stopping the frame scan tasks.')
+                retval = -1
+            if self._frame_reader.error is not None:
+                self.log.error('Frame scan failed after {0:d} lines: {1}'.format(
+                    self._frame_reader.lines_done, self._frame_reader.error))
+                retval = -1
+            # the scanner stops at the end of the frame only if it was finished
+            if self._frame_reader.finished:
+                self._current_position = self._frame_end_position
+            self._frame_reader = None
+
+        if self._stop_analog_output() < 0:
+            retval = -1
+
+        if self._frame_pixel_clock:
+            try:
+                daq.DAQmxDisconnectTerms(
+                    self._scanner_clock_channel + 'InternalOutput',
+                    self._pixel_clock_channel)
+            except:
+                self.log.exception('Error while disconnecting the pixel clock.')
+                retval = -1
+            self._frame_pixel_clock = False
+        return retval
+
     def close_scanner(self):
         """ Closes the scanner and cleans up afterwards.
 
         @return int: error code (0:OK, -1:error)
         """
+        if self._frame_reader is not None:
+            self.stop_frame_scan()
         a = self._stop_analog_output()
 
         b = 0
@@ -21,6 +21,7 @@ top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi
 """
 
 import time
+import numpy as np
 from collections import OrderedDict
 
 from core.module import Base
@@ -28,9 +29,10 @@ from core.statusvariable import StatusVar
 from core.configoption import ConfigOption
 from core.util.helpers import natural_sort
 from interface.pulser_interface import PulserInterface, PulserConstraints, SequenceOption
+from interface.laser_edge_interface import LaserEdgeInterface
 
 
-class PulserDummy(Base, PulserInterface):
+class PulserDummy(Base, PulserInterface, LaserEdgeInterface):
     """ Dummy class for  PulseInterface
 
     Be careful in adjusting the method names in that class, since some of them
@@ -41,11 +43,13 @@ class PulserDummy(Base, PulserInterface):
 
     pulser_dummy:
         module.Class: 'pulser_dummy.PulserDummy'
+        #laser_channel: 'd_ch1' # digital channel driving the laser, used by the simulation
 
     """
 
     activation_config = StatusVar(default=None)
     force_sequence_option = ConfigOption('force_sequence_option', default=False)
+    _laser_channel = ConfigOption('laser_channel', default='d_ch1')
 
     def __init__(self, config, **kwargs):
         super().__init__(config=config, **kwargs)
@@ -72,6 +76,8 @@ class PulserDummy(Base, PulserInterface):
 
         self.waveform_set = set()
         self.sequence_dict = dict()
+        # laser edges (in samples) of every written waveform. Used by simulating dummy hardware.
+        self._laser_edges = dict()
 
         self.current_loaded_assets = dict()
 
@@ -314,6 +320,10 @@ class PulserDummy(Base, PulserInterface):
                 time.sleep(number_of_samples * 8 / 1024 ** 3)
 
         self.waveform_set.update(waveforms)
+        self._record_laser_edges(waveforms,
+                                 digital_samples.get(self._laser_channel),
+                                 number_of_samples,
+                                 is_first_chunk)
 
         self.log.info('Waveforms with nametag "{0}" directly written on dummy pulser.'.format(name))
         return number_of_samples, waveforms
@@ -374,6 +384,7 @@ class PulserDummy(Base, PulserInterface):
         for waveform in waveform_name:
             if waveform in self.waveform_set:
                 self.waveform_set.remove(waveform)
+                self._laser_edges.pop(waveform, None)
                 deleted_waveforms.append(waveform)
 
         return deleted_waveforms
@@ -536,6 +547,7 @@ class PulserDummy(Base, PulserInterface):
         self.current_loaded_assets = dict()
         self.waveform_set = set()
         self.sequence_dict = dict()
+        self._laser_edges = dict()
         return 0
 
     def get_status(self):
@@ -914,3 +926,50 @@ class PulserDummy(Base, PulserInterface):
         self.connected = True
         self.log.info('Dummy reset!')
         return 0
+
+    def get_laser_edges(self):
+        """ Retrieve the laser pulse edges of the currently loaded waveform.
+
+        Allows simulating dummy hardware (e.g. the FastCounterDummy) to produce data matching
+        the currently loaded pulse ensemble. Loaded sequences are not supported.
+
+        @return dict: {'rising': 1D int array, 'falling': 1D int array, 'length': int,
+                       'sample_rate': float} with edge positions in samples, or None if no
+                      laser information is available for the loaded asset.
+        """
+        assets, asset_type = self.get_loaded_assets()
+        if asset_type != 'waveform':
+            return None
+        for waveform in assets.values():
+            edges = self._laser_edges.get(waveform)
+            if edges is not None:
+                return {'rising': np.array(edges['rising'], dtype='int64'),
+                        'falling': np.array(edges['falling'], dtype='int64'),
+                        'length': edges['length'],
+                        'sample_rate': self.sample_rate}
+        return None
+
+    def _record_laser_edges(self, waveforms, laser_samples, number_of_samples, is_first_chunk):
+        """ Store rising and falling edges of the laser channel for the written waveforms.
+
+        @param list waveforms: names of the waveforms written
+        @param numpy.ndarray laser_samples: bool samples of the laser channel (or None)
+        @param int number_of_samples: number of samples in the written chunk
+        @param bool is_first_chunk: Flag indicating if a new waveform has been started
+        """
+        for waveform in waveforms:
+            if is_first_chunk or waveform not in self._laser_edges:
+                self._laser_edges[waveform] = {'rising': list(), 'falling': list(), 'length': 0,
+                                               'state': False}
+            edges = self._laser_edges[waveform]
+            if laser_samples is not None and number_of_samples > 0:
+                samples = np.asarray(laser_samples, dtype=bool)
+                # Prepend the last state of the previous chunk to detect edges on chunk borders
+                transitions = np.diff(samples.astype('int8'),
+                                      prepend=np.int8(edges['state']))
+                offset = edges['length']
+                edges['rising'].extend((np.flatnonzero(transitions > 0) + offset).tolist())
+                edges['falling'].extend((np.flatnonzero(transitions < 0) + offset).tolist())
+                edges['state'] = bool(samples[-1])
+            edges['length'] += number_of_samples
+        return
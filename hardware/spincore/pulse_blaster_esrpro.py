@@ -1819,6 +1819,40 @@ class PulseBlasterESRPRO(Base, SwitchInterface, PulserInterface):
 
         return chunk_length, [self._current_pb_waveform_name]
 
+    def write_digital_events(self, name, digital_events, total_number_of_samples):
+        """ Write a new purely digital waveform, which is given as events instead of samples.
+
+        @param str name: the name of the waveform to be created
+        @param dict digital_events: keys are the generic digital channel names (i.e. 'd_ch1') and
+                                    values are tuples (durations, states) of numpy arrays with the
+                                    length in samples and the state of each event.
+        @param int total_number_of_samples: The number of sample points for the entire waveform
+
+        @return (int, list): number of samples written (-1 indicates failed
+                             process) and list of created waveform names.
+
+        The PulseBlaster is programmed with pulses anyway, so the events are converted directly
+        without the detour over the sample arrays of write_waveform.
+        """
+        if not digital_events or total_number_of_samples <= 0:
+            return self.write_waveform(name, dict(), dict(), True, True, total_number_of_samples)
+
+        chan = list(digital_events)
+        chan.sort()
+        self._current_activation_config = chan
+
+        self._current_pb_waveform_theoretical = self._convert_events_to_pb_sequence(digital_events)
+        self._current_pb_waveform_name = name
+        self._current_pb_waveform = self._correct_sequence_for_delays(
+            self._current_pb_waveform_theoretical)
+        self.write_pulse_form(self._current_pb_waveform)
+        self.log.debug('Waveform written in PulseBlaster with name "{0}" '
+                       'and a total length of {1} sequence '
+                       'entries.'.format(self._current_pb_waveform_name,
+                                          len(self._current_pb_waveform)))
+
+        return total_number_of_samples, [self._current_pb_waveform_name]
+
     def _convert_sample_to_pb_sequence(self, digital_samples):
         """ Helper method to create a pulse blaster sequence.
 
@@ -1842,64 +1876,55 @@ class PulseBlasterESRPRO(Base, SwitchInterface, PulserInterface):
                       channels off for 20us.
         """
 
-        ch_list = list(digital_samples)
-        ch_list.sort()
-        num_ch = len(ch_list)
-
-        # take on of the channel and obtain the channel length
-        num_entries = len(digital_samples[ch_list[0]])
-
-        last_sequence_dict = None
-        pb_sequence_list = list()
-
-        for index in range(num_entries):
+        # run-length-encode the samples of each channel into events
+        digital_events = dict()
+        for ch_name, samples in digital_samples.items():
+            event_starts = np.flatnonzero(np.concatenate(([True], samples[1:] != samples[:-1])))
+            durations = np.diff(np.append(event_starts, len(samples)))
+            digital_events[ch_name] = (durations, samples[event_starts])
 
-            # create at first a temporary array, with the minimal granularity
-            # length. The sampling freq is fixed anyway and cannot be changed.
-            temp_sequence_dict = {'active_channels': [],
-                                  'length': self.GRAN_MIN}
+        return self._convert_events_to_pb_sequence(digital_events)
 
-            for ch_name in ch_list:
+    def _convert_events_to_pb_sequence(self, digital_events):
+        """ Helper method to create a pulse blaster sequence from the events of each channel.
 
-                if digital_samples[ch_name][index]:
-                    temp_sequence_dict['active_channels'].append(int(ch_name.replace('d_ch', ''))-1)
+        @param dict digital_events: keys are the generic digital channel names and values are tuples
+                                    (durations, states) of numpy arrays with the length in samples
+                                    and the state of each event, see write_digital_events.
 
-            # compare it with the last array if present
-
-            # if not present start to count
-            if last_sequence_dict is None:
-                last_sequence_dict = temp_sequence_dict
-
-            else:
+        @return list: a sequence list with dictionaries formated for the generic method
+                      'write_pulse_form', see _convert_sample_to_pb_sequence.
+        """
+        ch_list = list(digital_events)
+        ch_list.sort()
 
-                 # if present and the same channels, accumulate length
-                if temp_sequence_dict['active_channels'] == last_sequence_dict['active_channels']:
-                    last_sequence_dict['length'] += temp_sequence_dict['length']
-
-                # if present and not the same channels, append last array to
-                # sequence array
-                else:
-                    # increase length by 1%, to remove the ambiguity for the
-                    # comparison
-                    if last_sequence_dict['length']*1.01 < self.LEN_MIN:
-                        self.log.warning('Current waveform contains a pulse of '
-                                         'length {0:.2f}ns, which is smaller '
-                                         'than the minimal allowed length of '
-                                         '{1:.2f}ns! Pulse sequence might '
-                                         'most probably look unexpected. '
-                                         'Increase the length of the smallest '
-                                         'pulse!'
-                                         ''.format(last_sequence_dict['length']*1e9,
-                                                   self.LEN_MIN*1e9))
-
-                    pb_sequence_list.append(last_sequence_dict)
-
-                    # and temporary array becomes last array for the next round
-                    last_sequence_dict = temp_sequence_dict
-
-        # do not forget to add the last sequence
-        pb_sequence_list.append(last_sequence_dict)
+        # every event edge of any channel starts a new entry of the sequence
+        event_ends = [np.cumsum(digital_events[ch_name][0]) for ch_name in ch_list]
+        edges = np.unique(np.concatenate([[0]] + event_ends))
+        entry_starts = edges[:-1]
+        entry_lengths = np.diff(edges)
+
+        # state of each channel within each entry
+        entry_states = np.array(
+            [digital_events[ch_name][1][np.searchsorted(ends, entry_starts, side='right')]
+             for ch_name, ends in zip(ch_list, event_ends)], dtype=bool).reshape(len(ch_list), -1)
+        ch_numbers = np.array([int(ch_name.replace('d_ch', '')) - 1 for ch_name in ch_list])
+
+        # increase length by 1%, to remove the ambiguity for the comparison. The last entry might
+        # still be continued by the next chunk.
+        too_short = entry_lengths[:-1] * self.GRAN_MIN * 1.01 < self.LEN_MIN
+        if np.any(too_short):
+            self.log.warning('Current waveform contains {0:d} pulses shorter than the minimal '
+                             'allowed length of {1:.2f}ns (shortest {2:.2f}ns)! Pulse sequence '
+                             'might most probably look unexpected. Increase the length of the '
+                             'smallest pulse!'
+                             ''.format(np.count_nonzero(too_short), self.LEN_MIN*1e9,
+                                       np.min(entry_lengths[:-1]) * self.GRAN_MIN*1e9))
 
+        pb_sequence_list = list()
+        for length, states in zip(entry_lengths, entry_states.T):
+            pb_sequence_list.append({'active_channels': ch_numbers[states].tolist(),
+                                     'length': length * self.GRAN_MIN})
         return pb_sequence_list
 
     def write_sequence(self, name, sequence_parameters):
@@ -673,6 +673,28 @@ class PulseStreamer(Base, PulserInterface):
 
 
     
+    def write_digital_events(self, name, digital_events, total_number_of_samples):
+        """
+        Write a new purely digital waveform, which is given as events instead of sample arrays.
+
+        @param str name: the name of the waveform to be created
+        @param dict digital_events: keys are the generic digital channel names (i.e. 'd_ch1') and
+                                    values are tuples (durations, states) of numpy arrays with the
+                                    length in samples and the state of each event.
+        @param int total_number_of_samples: The number of sample points for the entire waveform
+
+        @return (int, list): Number of samples written (-1 indicates failed process) and list of
+                             created waveform names
+
+        The events already are the pulse patterns of the Pulse Streamer, so no samples are needed.
+        """
+        self.__current_waveform_name = name
+        self.__samples_written = 0
+        self.__current_waveform = {
+            channel_number: [[int(duration), int(state)] for duration, state in zip(*events)]
+            for channel_number, events in digital_events.items()}
+        return total_number_of_samples, [self.__current_waveform_name]
+
     def write_sequence(self, name, sequence_parameters):
         """
         Write a new sequence on the device memory.
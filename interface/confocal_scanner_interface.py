@@ -159,6 +159,36 @@ class ConfocalScannerInterface(metaclass=InterfaceMetaclass):
         """
         pass
 
+    def start_frame_scan(self, frame_path, line_length, line_callback, pixel_clock=False):
+        """ Starts a hardware timed scan of a whole frame and returns immediately.
+
+        Optional: Instead of one scan_line call per scan and return line, the whole raster is
+        output at once and the counts are passed to line_callback as soon as a line is complete.
+        If it is not implemented (-1 is returned), the frame has to be scanned with scan_line.
+
+        @param float[n][k][p] frame_path: positions of k lines with p points each for n axes. The
+                                          first line_length points of every line are the pixels,
+                                          the remaining points are the flyback to the next line.
+        @param int line_length: number of pixels per line
+        @param callable line_callback: called as line_callback(line_index, counts) for every
+                                       completed line with the photon counts per second as
+                                       float[line_length][m] for m channels. On error the counts
+                                       are [[-1.]]. Called from a thread of the hardware.
+        @param bool pixel_clock: whether we need to output a pixel clock for the frame
+
+        @return int: error code (0:OK, -1:error or not supported)
+
+        stop_frame_scan has to be called after the last line or to abort the frame.
+        """
+        return -1
+
+    def stop_frame_scan(self):
+        """ Stops the frame scan started with start_frame_scan and cleans up afterwards.
+
+        @return int: error code (0:OK, -1:error)
+        """
+        return -1
+
     @abstract_interface_method
     def close_scanner(self):
         """ Closes the scanner and cleans up afterwards.
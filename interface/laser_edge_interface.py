@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+
+"""
+Interface file for pulse generators that can report the laser pulses of the loaded waveform.
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+from core.interface import abstract_interface_method
+from core.meta import InterfaceMetaclass
+
+
+class LaserEdgeInterface(metaclass=InterfaceMetaclass):
+    """ Interface for (simulated) pulse generators providing the laser pulse timing of the
+    currently loaded waveform, e.g. to let dummy counting hardware generate matching data.
+    """
+
+    @abstract_interface_method
+    def get_laser_edges(self):
+        """ Retrieve the laser pulse edges of the currently loaded waveform.
+
+        @return dict: {'rising': 1D int array, 'falling': 1D int array, 'length': int,
+                       'sample_rate': float} with edge positions in samples, or None if no
+                      laser information is available for the loaded asset.
+        """
+        pass
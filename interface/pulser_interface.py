@@ -444,6 +444,28 @@ class PulserInterface(metaclass=InterfaceMetaclass):
         """
         pass
 
+    def write_digital_events(self, name, digital_events, total_number_of_samples):
+        """
+        Write a new purely digital waveform, which is given as events instead of sample arrays.
+
+        Optional: Digital pulsers which describe their waveforms as pulses (duration and state)
+        anyway can implement this to avoid the dense sampling of the marker states. If it is not
+        implemented (-1 is returned), the waveform is sampled and written with write_waveform.
+
+        @param str name: the name of the waveform to be created
+        @param dict digital_events: keys are the generic digital channel names (i.e. 'd_ch1') and
+                                    values are tuples (durations, states) of two 1D numpy arrays of
+                                    equal length. durations (int64) contains the length of each
+                                    event in samples, states (bool) the marker state of the event.
+                                    Consecutive events always have different states and the
+                                    durations of each channel add up to total_number_of_samples.
+        @param int total_number_of_samples: The number of sample points for the entire waveform
+
+        @return (int, list): Number of samples written (-1 indicates failed process or no support
+                             of events) and list of created waveform names
+        """
+        return -1, list()
+
     @abstract_interface_method
     def write_sequence(self, name, sequence_parameters):
         """
@@ -21,6 +21,9 @@ top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi
 """
 
 import numpy as np
+import os
+import threading
+import time
 
 from core.connector import Connector
 from core.configoption import ConfigOption
@@ -33,25 +36,299 @@ import matplotlib as mpl
 import datetime
 from collections import OrderedDict
 
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+
+class FrameRingBuffer:
+    """ Preallocated ring buffer holding the most recent camera frames.
+
+    Every frame gets a consecutive frame number. Readers can wait for a specific frame number and
+    will notice if it has already been overwritten by newer frames.
+    """
+
+    def __init__(self, size):
+        self.size = int(size)
+        self._frames = None
+        self._timestamps = np.zeros(self.size)
+        self._frame_count = 0
+        self._condition = threading.Condition()
+
+    @property
+    def frame_count(self):
+        """ Total number of frames written since the last reset. """
+        return self._frame_count
+
+    def reset(self):
+        with self._condition:
+            self._frame_count = 0
+            self._condition.notify_all()
+
+    def put(self, frame, timestamp):
+        """ Copy a frame into the buffer. The memory is (re)allocated only if the frame shape or
+        dtype changes.
+
+        @param numpy.ndarray frame: image data
+        @param float timestamp: acquisition time of the frame
+        """
+        frame = np.asarray(frame)
+        with self._condition:
+            if (self._frames is None or self._frames.shape[1:] != frame.shape
+                    or self._frames.dtype != frame.dtype):
+                self._frames = np.empty((self.size,) + frame.shape, dtype=frame.dtype)
+                self._frame_count = 0
+            index = self._frame_count % self.size
+            self._frames[index] = frame
+            self._timestamps[index] = timestamp
+            self._frame_count += 1
+            self._condition.notify_all()
+
+    def get(self, frame_number):
+        """ Return a copy of a frame.
+
+        @param int frame_number: number of the requested frame
+
+        @return (numpy.ndarray, float): frame and timestamp or (None, None) if the frame is not
+                                        (or no longer) in the buffer
+        """
+        with self._condition:
+            if frame_number >= self._frame_count or frame_number < self._frame_count - self.size:
+                return None, None
+            index = frame_number % self.size
+            return self._frames[index].copy(), self._timestamps[index]
+
+    def wait_for_frame(self, frame_number, timeout=None):
+        """ Block until the frame with the given number has been written.
+
+        @param int frame_number: number of the awaited frame
+        @param float timeout: maximum waiting time in seconds
+
+        @return bool: True if the frame is available (or already overwritten)
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: self._frame_count > frame_number, timeout)
+
+
+class FrameFileWriter:
+    """ Stream camera frames to disk.
+
+    Files ending with ".h5" or ".hdf5" are written as chunked, resizable HDF5 datasets (requires
+    h5py). All other files contain the raw frame data back to back and can be opened memory-mapped
+    with numpy.memmap using dtype and shape from the accompanying "_info.txt" file.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.frames_written = 0
+        self._use_hdf5 = os.path.splitext(file_path)[1].lower() in ('.h5', '.hdf5')
+        if self._use_hdf5 and h5py is None:
+            raise ImportError('Recording to HDF5 file "{0}" requires the h5py package.'
+                              ''.format(file_path))
+        self._file = None
+        self._dataset = None
+        self._frame_shape = None
+        self._dtype = None
+        self._timestamps = list()
+
+    def write(self, frame, timestamp):
+        if self._file is None:
+            self._frame_shape = frame.shape
+            self._dtype = frame.dtype
+            if self._use_hdf5:
+                self._file = h5py.File(self.file_path, 'w')
+                self._dataset = self._file.create_dataset('frames',
+                                                          shape=(0,) + frame.shape,
+                                                          maxshape=(None,) + frame.shape,
+                                                          chunks=(1,) + frame.shape,
+                                                          dtype=frame.dtype)
+            else:
+                self._file = open(self.file_path, 'wb')
+        if frame.shape != self._frame_shape:
+            raise ValueError('Frame shape changed during recording.')
+        if self._use_hdf5:
+            self._dataset.resize(self.frames_written + 1, axis=0)
+            self._dataset[self.frames_written] = frame
+        else:
+            self._file.write(np.ascontiguousarray(frame, dtype=self._dtype).data)
+        self._timestamps.append(timestamp)
+        self.frames_written += 1
+
+    def close(self):
+        if self._file is None:
+            return
+        timestamps = np.array(self._timestamps)
+        if self._use_hdf5:
+            self._file.create_dataset('timestamps', data=timestamps)
+            self._file.close()
+        else:
+            self._file.close()
+            base_path = os.path.splitext(self.file_path)[0]
+            with open(base_path + '_info.txt', 'w') as info_file:
+                info_file.write('dtype: {0}\n'.format(np.dtype(self._dtype).str))
+                info_file.write('shape: {0}\n'.format(
+                    (self.frames_written,) + tuple(self._frame_shape)))
+            np.savetxt(base_path + '_timestamps.txt', timestamps, fmt='%.6f',
+                       header='frame timestamps (s)')
+        self._file = None
+
+
+class CameraAcquisitionWorker(QtCore.QObject):
+    """ Fetches frames from the camera hardware into the ring buffer. Lives in its own thread so
+    that a slow GUI or logic thread does not cause dropped frames.
+    """
+    sigAcquisitionStopped = QtCore.Signal()
+
+    # polling interval and additional time allowed for the readout of single acquisitions in s
+    ready_poll_interval = 0.002
+    readout_timeout = 1.
+
+    def __init__(self, logic):
+        super().__init__()
+        self._logic = logic
+
+    @QtCore.Slot()
+    def run(self):
+        logic = self._logic
+        hardware = logic._hardware
+        live = hardware.support_live_acquisition()
+        next_frame_time = time.perf_counter()
+        last_preview_time = 0.
+        while logic.enabled:
+            period = 1 / logic._fps
+            wait_time = next_frame_time - time.perf_counter()
+            if wait_time > 0:
+                time.sleep(wait_time)
+            if not live:
+                with logic.threadlock:
+                    hardware.start_single_acquisition()
+                # the camera is still exposing, fetching the frame now would fail
+                if not self._wait_for_exposure(hardware):
+                    continue
+            with logic.threadlock:
+                frame = hardware.get_acquired_data()
+            now = time.perf_counter()
+            logic.frame_buffer.put(frame, now)
+            logic._last_image = frame
+
+            # Frames produced by the camera while we were too late to fetch them are lost
+            missed_frames = int((now - next_frame_time) // period)
+            if missed_frames > 0:
+                logic.dropped_frames += missed_frames
+                next_frame_time = now
+            next_frame_time += period
+
+            # decimated preview stream for the GUI
+            if now - last_preview_time >= 1 / logic._preview_rate:
+                last_preview_time = now
+                logic.sigUpdateDisplay.emit()
+        logic.sigUpdateDisplay.emit()
+        self.sigAcquisitionStopped.emit()
+
+    def _wait_for_exposure(self, hardware):
+        """ Wait until a single acquisition of the camera is finished.
+
+        Sleeps for the exposure time and afterwards polls the ready state of the camera.
+
+        @param CameraInterface hardware: the camera
+
+        @return bool: True if the frame is ready, False if the acquisition was stopped or timed out
+        """
+        logic = self._logic
+        exposure = logic._exposure
+        time.sleep(exposure)
+        timeout = time.perf_counter() + exposure + self.readout_timeout
+        while logic.enabled:
+            with logic.threadlock:
+                if hardware.get_ready_state():
+                    return True
+            if time.perf_counter() > timeout:
+                logic.log.warning('Camera did not finish the acquisition in time, frame skipped.')
+                return False
+            time.sleep(self.ready_poll_interval)
+        return False
+
+
+class CameraRecordingWorker(QtCore.QObject):
+    """ Streams frames from the ring buffer to a file in the background. """
+    sigRecordingStopped = QtCore.Signal(str)
+
+    def __init__(self, logic):
+        super().__init__()
+        self._logic = logic
+
+    @QtCore.Slot(str, int)
+    def run(self, file_path, max_frames):
+        logic = self._logic
+        buffer = logic.frame_buffer
+        writer = None
+        frame_number = buffer.frame_count
+        try:
+            writer = FrameFileWriter(file_path)
+            while max_frames <= 0 or writer.frames_written < max_frames:
+                if not buffer.wait_for_frame(frame_number, timeout=0.1):
+                    if logic.recording and logic.enabled:
+                        continue
+                    break
+                frame, timestamp = buffer.get(frame_number)
+                if frame is None:
+                    # overwritten before we could save it, continue with the oldest frame left
+                    oldest = max(buffer.frame_count - buffer.size, frame_number + 1)
+                    logic.dropped_recording_frames += oldest - frame_number
+                    frame_number = oldest
+                    continue
+                writer.write(frame, timestamp)
+                logic.recorded_frames = writer.frames_written
+                frame_number += 1
+                if not logic.recording and frame_number >= buffer.frame_count:
+                    break
+        except:
+            logic.log.exception('Error while recording camera frames.')
+        finally:
+            if writer is not None:
+                try:
+                    writer.close()
+                except:
+                    logic.log.exception('Error while closing the camera recording file.')
+        # always report the end, otherwise the logic stays in the recording state
+        self.sigRecordingStopped.emit(file_path)
+
 
 class CameraLogic(GenericLogic):
     """
     Control a camera.
+
+    Example config for copy-paste:
+
+    camera_logic:
+        module.Class: 'camera_logic.CameraLogic'
+        default_exposure: 20 # maximum frame rate in Hz
+        #ring_buffer_size: 100 # number of frames kept in memory
+        #preview_rate: 20 # maximum GUI update rate in Hz
+        connect:
+            hardware: 'mycamera'
+            savelogic: 'savelogic'
     """
 
     # declare connectors
     hardware = Connector(interface='CameraInterface')
     savelogic = Connector(interface='SaveLogic')
     _max_fps = ConfigOption('default_exposure', 20)
+    _ring_buffer_size = ConfigOption('ring_buffer_size', 100)
+    _preview_rate = ConfigOption('preview_rate', 20)
     _fps = _max_fps
 
     # signals
     sigUpdateDisplay = QtCore.Signal()
     sigAcquisitionFinished = QtCore.Signal()
     sigVideoFinished = QtCore.Signal()
-    timer = None
+    sigRecordingFinished = QtCore.Signal(str)
+    sigStartAcquisitionWorker = QtCore.Signal()
+    sigStartRecordingWorker = QtCore.Signal(str, int)
 
     enabled = False
+    recording = False
 
     _exposure = 1.
     _gain = 1.
@@ -69,34 +346,68 @@ class CameraLogic(GenericLogic):
         self._save_logic = self.savelogic()
 
         self.enabled = False
+        self.recording = False
+        self.dropped_frames = 0
+        self.dropped_recording_frames = 0
+        self.recorded_frames = 0
 
         self.get_exposure()
         self.get_gain()
 
-        self.timer = QtCore.QTimer()
-        self.timer.setSingleShot(True)
-        self.timer.timeout.connect(self.loop)
+        self.frame_buffer = FrameRingBuffer(self._ring_buffer_size)
+
+        # create independent threads for the acquisition and for the recording of frames
+        self._acquisition_thread = QtCore.QThread()
+        self._acquisition_worker = CameraAcquisitionWorker(self)
+        self._acquisition_worker.moveToThread(self._acquisition_thread)
+        self.sigStartAcquisitionWorker.connect(self._acquisition_worker.run,
+                                               QtCore.Qt.QueuedConnection)
+        self._acquisition_worker.sigAcquisitionStopped.connect(self._acquisition_stopped,
+                                                               QtCore.Qt.QueuedConnection)
+        self._acquisition_thread.start()
+
+        self._recording_thread = QtCore.QThread()
+        self._recording_worker = CameraRecordingWorker(self)
+        self._recording_worker.moveToThread(self._recording_thread)
+        self.sigStartRecordingWorker.connect(self._recording_worker.run,
+                                             QtCore.Qt.QueuedConnection)
+        self._recording_worker.sigRecordingStopped.connect(self._recording_stopped,
+                                                           QtCore.Qt.QueuedConnection)
+        self._recording_thread.start()
 
     def on_deactivate(self):
         """ Perform required deactivation. """
-        pass
+        self.recording = False
+        self.enabled = False
+        self.sigStartAcquisitionWorker.disconnect()
+        self.sigStartRecordingWorker.disconnect()
+        self._acquisition_thread.quit()
+        self._recording_thread.quit()
+        self._acquisition_thread.wait()
+        self._recording_thread.wait()
+        with self.threadlock:
+            self._hardware.stop_acquisition()
 
     def set_exposure(self, time):
         """ Set exposure of hardware """
-        self._hardware.set_exposure(time)
+        with self.threadlock:
+            self._hardware.set_exposure(time)
         self.get_exposure()
 
     def get_exposure(self):
         """ Get exposure of hardware """
-        self._exposure = self._hardware.get_exposure()
+        with self.threadlock:
+            self._exposure = self._hardware.get_exposure()
         self._fps = min(1 / self._exposure, self._max_fps)
         return self._exposure
 
     def set_gain(self, gain):
-        self._hardware.set_gain(gain)
+        with self.threadlock:
+            self._hardware.set_gain(gain)
 
     def get_gain(self):
-        gain = self._hardware.get_gain()
+        with self.threadlock:
+            gain = self._hardware.get_gain()
         self._gain = gain
         return gain
 
@@ -104,40 +415,86 @@ class CameraLogic(GenericLogic):
         """
 
         """
-        self._hardware.start_single_acquisition()
-        self._last_image = self._hardware.get_acquired_data()
+        with self.threadlock:
+            self._hardware.start_single_acquisition()
+            self._last_image = self._hardware.get_acquired_data()
         self.sigUpdateDisplay.emit()
         self.sigAcquisitionFinished.emit()
 
     def start_loop(self):
         """ Start the data recording loop.
         """
+        if self.enabled:
+            return
         self.enabled = True
-        self.timer.start(1000*1/self._fps)
+        self.dropped_frames = 0
 
         if self._hardware.support_live_acquisition():
-            self._hardware.start_live_acquisition()
-        else:
-            self._hardware.start_single_acquisition()
+            with self.threadlock:
+                self._hardware.start_live_acquisition()
+        self.sigStartAcquisitionWorker.emit()
 
     def stop_loop(self):
-        """ Stop the data recording loop.
+        """ Stop the data recording loop. The acquisition thread finishes the current frame and
+        sigVideoFinished is emitted afterwards.
         """
-        self.timer.stop()
         self.enabled = False
-        self._hardware.stop_acquisition()
+
+    @QtCore.Slot()
+    def _acquisition_stopped(self):
+        with self.threadlock:
+            self._hardware.stop_acquisition()
         self.sigVideoFinished.emit()
 
+    def start_recording(self, file_path=None, max_frames=0):
+        """ Start streaming the acquired video frames to a file in the background.
+
+        The video loop is started if it is not already running. Frames the recorder could not save
+        before they were overwritten in the ring buffer are counted in dropped_recording_frames.
 
-    def loop(self):
-        """ Execute step in the data recording loop: save one of each control and process values
+        @param str file_path: optional, file to record to. Defaults to a timestamped raw file in the
+                              daily camera data directory. Use a ".h5" extension for HDF5.
+        @param int max_frames: optional, stop recording after this number of frames (0: no limit)
+
+        @return str: path of the recording file
         """
-        self._last_image = self._hardware.get_acquired_data()
-        self.sigUpdateDisplay.emit()
-        if self.enabled:
-            self.timer.start(1000 * 1 / self._fps)
-            if not self._hardware.support_live_acquisition():
-                self._hardware.start_single_acquisition()  # the hardware has to check it's not busy
+        if self.recording:
+            self.log.error('Camera recording already running.')
+            return ''
+        if file_path is None:
+            file_path = os.path.join(
+                self._save_logic.get_path_for_module('Camera'),
+                datetime.datetime.now().strftime('%Y%m%d-%H%M-%S_camera_video.dat'))
+        self.recording = True
+        self.recorded_frames = 0
+        self.dropped_recording_frames = 0
+        # the recorder stops as soon as it sees the video loop disabled
+        if not self.enabled:
+            self.start_loop()
+        self.sigStartRecordingWorker.emit(file_path, int(max_frames))
+        return file_path
+
+    def stop_recording(self):
+        """ Stop the background recording. Frames still in the ring buffer are saved. """
+        self.recording = False
+
+    @QtCore.Slot(str)
+    def _recording_stopped(self, file_path):
+        self.recording = False
+        self.log.info('Recorded {0:d} camera frames to "{1}" ({2:d} frames dropped).'
+                      ''.format(self.recorded_frames, file_path, self.dropped_recording_frames))
+        self.sigRecordingFinished.emit(file_path)
+
+    def get_acquisition_statistics(self):
+        """ Frame counters of the video acquisition and recording.
+
+        @return dict: acquired frames, frames dropped during acquisition, recorded frames and
+                      frames dropped by the recorder
+        """
+        return {'acquired_frames': self.frame_buffer.frame_count,
+                'dropped_frames': self.dropped_frames,
+                'recorded_frames': self.recorded_frames,
+                'dropped_recording_frames': self.dropped_recording_frames}
 
     def get_last_image(self):
         """ Return last acquired image """
@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+
+"""
+This file contains the image container of the confocal xy and depth scans.
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import tempfile
+
+import numpy as np
+
+
+class ConfocalImage:
+    """ Counts of a confocal scan image with analytically described axes.
+
+    Only the counts are stored, with shape (lines, pixels, channels) and a selectable dtype. The
+    pixel axis and the line axis are evenly spaced, the position of the third axis is kept once per
+    line. Images larger than memmap_size are stored in a temporary memory mapped file instead of
+    the RAM. Every line is a contiguous chunk of that file and the pages are only allocated when a
+    line is written, so a huge image costs no memory until it is scanned.
+
+    For compatibility, the image can be indexed like the former dense array of shape
+    (lines, pixels, 3 + channels), whose first three entries of every pixel are the x, y and z
+    position: image[row, :, 0] are the x positions of a line, image[:, :, 3 + n] is a view of the
+    counts of channel n. Only the counts can be assigned this way.
+
+    @param str plane: scanned plane, 'xy', 'xz' or 'yz'. The first axis is along the lines.
+    @param tuple horizontal_axis: (start, stop, number of pixels) of the axis along the lines
+    @param tuple vertical_axis: (start, stop, number of lines) of the axis across the lines
+    @param int channels: number of count channels
+    @param float line_position: initial position of the third axis for every line
+    @param dtype: numpy dtype of the counts. float32 halves the memory, but is exact only up to
+                  2**24 counts.
+    @param float memmap_size: size in bytes above which the counts are memory mapped, None for
+                              keeping every image in RAM
+    @param str memmap_directory: directory of the memory mapped files, default is the temp dir
+    """
+
+    _axis_indices = {'xy': (0, 1, 2), 'xz': (0, 2, 1), 'yz': (1, 2, 0)}
+
+    def __init__(self, plane, horizontal_axis, vertical_axis, channels, line_position=0.,
+                 dtype='float64', memmap_size=None, memmap_directory=None):
+        if plane not in self._axis_indices:
+            raise ValueError('Plane of a confocal image must be "xy", "xz" or "yz", not "{0}".'
+                             ''.format(plane))
+        self.plane = plane
+        self.horizontal_axis = (float(horizontal_axis[0]), float(horizontal_axis[1]),
+                                int(horizontal_axis[2]))
+        self.vertical_axis = (float(vertical_axis[0]), float(vertical_axis[1]),
+                              int(vertical_axis[2]))
+        self.line_position = np.full(self.vertical_axis[2], line_position, dtype='float64')
+        self.memmap_size = memmap_size
+        self.memmap_directory = memmap_directory
+
+        shape = (self.vertical_axis[2], self.horizontal_axis[2], int(channels))
+        self._file = None
+        self._counts = self._allocate(shape, np.dtype(dtype))
+
+    def _allocate(self, shape, dtype):
+        """ Zero initialised counts array, memory mapped if it is too large for the RAM. """
+        nbytes = int(np.prod(shape)) * dtype.itemsize
+        if self.memmap_size is None or nbytes <= self.memmap_size or nbytes == 0:
+            return np.zeros(shape, dtype=dtype)
+        # the file is removed by the OS as soon as it is closed and unmapped
+        self._file = tempfile.TemporaryFile(prefix='qudi_confocal_', suffix='.bin',
+                                            dir=self.memmap_directory)
+        return np.memmap(self._file, dtype=dtype, mode='w+', shape=shape)
+
+    @property
+    def shape(self):
+        """ Shape of the image in the former layout (lines, pixels, 3 + channels). """
+        lines, pixels, channels = self._counts.shape
+        return lines, pixels, 3 + channels
+
+    @property
+    def channels(self):
+        return self._counts.shape[2]
+
+    @property
+    def dtype(self):
+        return self._counts.dtype
+
+    @property
+    def nbytes(self):
+        return self._counts.nbytes
+
+    @property
+    def is_memmapped(self):
+        return isinstance(self._counts, np.memmap)
+
+    @property
+    def horizontal(self):
+        """ Positions of the pixels along a line. """
+        return np.linspace(*self.horizontal_axis)
+
+    @property
+    def vertical(self):
+        """ Positions of the lines. """
+        return np.linspace(*self.vertical_axis)
+
+    def __len__(self):
+        return self._counts.shape[0]
+
+    def counts(self, channel=None):
+        """ View of the counts.
+
+        @param int channel: optional, index of the count channel, all channels if None
+
+        @return numpy.ndarray: counts of shape (lines, pixels) for a channel, else
+                               (lines, pixels, channels)
+        """
+        if channel is None:
+            return np.asarray(self._counts)
+        return np.asarray(self._counts[:, :, channel])
+
+    def view(self, channel, max_shape=None):
+        """ Lazy, downsampled view of the counts of a channel for displaying the image.
+
+        @param int channel: index of the count channel
+        @param int max_shape: maximal number of lines and pixels of the view, None for the full
+                              resolution
+
+        @return numpy.ndarray: every n-th line and pixel of the counts, no data is copied
+        """
+        counts = self.counts(channel)
+        if max_shape is None:
+            return counts
+        line_step = max(1, -(-counts.shape[0] // int(max_shape)))
+        pixel_step = max(1, -(-counts.shape[1] // int(max_shape)))
+        return counts[::line_step, ::pixel_step]
+
+    def set_line_position(self, row, position):
+        """ Set the position of the third axis of a line, e.g. z of an xy image line.
+
+        @param int row: index of the line
+        @param float position: position of the third axis in m
+        """
+        self.line_position[row] = position
+
+    def coordinates(self, rows=slice(None)):
+        """ Positions of the pixels.
+
+        @param rows: index or slice of the lines
+
+        @return tuple(numpy.ndarray): x, y and z positions of the pixels of the lines
+        """
+        return tuple(self[rows, :, axis] for axis in range(3))
+
+    def __getitem__(self, key):
+        rows, pixels, columns = self._split_key(key)
+        if not isinstance(columns, slice) and not np.isscalar(columns):
+            columns = np.asarray(columns)
+        column_indices = np.arange(self.shape[2])[columns]
+
+        # only counts requested, return a view just like the former array did
+        if np.all(column_indices >= 3) and (isinstance(columns, slice)
+                                            or np.isscalar(column_indices)):
+            return np.asarray(
+                self._counts[rows, pixels, self._count_columns(columns, column_indices)])
+
+        row_indices = np.arange(len(self))[rows]
+        pixel_indices = np.arange(self._counts.shape[1])[pixels]
+        if np.ndim(row_indices) == 1 and np.ndim(pixel_indices) == 1:
+            grid_rows, grid_pixels = row_indices[:, np.newaxis], pixel_indices[np.newaxis, :]
+        else:
+            grid_rows, grid_pixels = row_indices, pixel_indices
+        shape = np.broadcast(grid_rows, grid_pixels).shape
+
+        axes = self._axis_indices[self.plane]
+        values = list()
+        for column in np.atleast_1d(column_indices):
+            if column == axes[0]:
+                value = self._positions(self.horizontal_axis, grid_pixels)
+            elif column == axes[1]:
+                value = self._positions(self.vertical_axis, grid_rows)
+            elif column == axes[2]:
+                value = self.line_position[grid_rows]
+            else:
+                value = self._counts[grid_rows, grid_pixels, column - 3]
+            values.append(np.broadcast_to(value, shape).astype('float64'))
+        if np.isscalar(column_indices):
+            return values[0] if shape else values[0][()]
+        return np.stack(values, axis=-1)
+
+    def __setitem__(self, key, value):
+        rows, pixels, columns = self._split_key(key)
+        if not isinstance(columns, slice) and not np.isscalar(columns):
+            columns = np.asarray(columns)
+        column_indices = np.arange(self.shape[2])[columns]
+        if np.any(column_indices < 3):
+            raise IndexError('Only the counts of a confocal image can be assigned, the positions '
+                             'are given by its axes.')
+        self._counts[rows, pixels, self._count_columns(columns, column_indices)] = value
+
+    @staticmethod
+    def _count_columns(columns, column_indices):
+        """ Index of the counts array for an index of the count columns in the former layout. """
+        if isinstance(columns, slice):
+            if column_indices.size == 0:
+                return slice(0, 0)
+            step = columns.step if columns.step is not None else 1
+            stop = column_indices[-1] - 3 + step
+            return slice(column_indices[0] - 3, stop if stop >= 0 else None, step)
+        return column_indices - 3
+
+    def _split_key(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if len(key) > 3:
+            raise IndexError('Too many indices for a confocal image.')
+        return tuple(key) + (slice(None),) * (3 - len(key))
+
+    @staticmethod
+    def _positions(axis, indices):
+        start, stop, num = axis
+        if num < 2:
+            return np.full(np.shape(indices), start)
+        return start + (stop - start) * np.asarray(indices) / (num - 1)
+
+    def copy(self):
+        """ Copy of the image, memory mapped again if the image is too large for the RAM.
+
+        @return ConfocalImage: independent copy
+        """
+        new_image = ConfocalImage(self.plane, self.horizontal_axis, self.vertical_axis,
+                                  self.channels, dtype=self.dtype, memmap_size=self.memmap_size,
+                                  memmap_directory=self.memmap_directory)
+        new_image.line_position[:] = self.line_position
+        # copy chunks of lines to keep the memory usage low for memory mapped images
+        chunk = max(1, 2 ** 22 // max(1, self._counts[0].nbytes))
+        for start in range(0, len(self), chunk):
+            new_image._counts[start:start + chunk] = self._counts[start:start + chunk]
+        return new_image
+
+    def to_dict(self):
+        """ Dictionary of the image for saving it in status variables.
+
+        @return dict: plane, axes, line positions and counts
+        """
+        return {'plane': self.plane,
+                'horizontal_axis': list(self.horizontal_axis),
+                'vertical_axis': list(self.vertical_axis),
+                'line_position': self.line_position.copy(),
+                'counts': self.counts()}
+
+    @classmethod
+    def from_dict(cls, image_dict, dtype=None, memmap_size=None, memmap_directory=None):
+        """ Image from a dictionary of to_dict.
+
+        @param dict image_dict: dictionary created by to_dict
+        @param dtype: numpy dtype of the counts, None for the dtype of the saved counts
+        @param float memmap_size: see ConfocalImage
+        @param str memmap_directory: see ConfocalImage
+
+        @return ConfocalImage: restored image
+        """
+        counts = np.asarray(image_dict['counts'])
+        image = cls(image_dict['plane'], image_dict['horizontal_axis'],
+                    image_dict['vertical_axis'], counts.shape[2],
+                    dtype=counts.dtype if dtype is None else dtype,
+                    memmap_size=memmap_size, memmap_directory=memmap_directory)
+        if counts.shape != image._counts.shape:
+            raise ValueError('Shape of the counts does not match the axes of the image.')
+        image.line_position[:] = image_dict['line_position']
+        image._counts[...] = counts
+        return image
+
+    @classmethod
+    def from_array(cls, array, plane, dtype='float64', memmap_size=None, memmap_directory=None):
+        """ Image from a dense array of shape (lines, pixels, 3 + channels) with the x, y and z
+        position of every pixel, as used before.
+
+        @param numpy.ndarray array: dense image array
+        @param str plane: scanned plane, 'xy', 'xz' or 'yz'
+        @param dtype: numpy dtype of the counts
+        @param float memmap_size: see ConfocalImage
+        @param str memmap_directory: see ConfocalImage
+
+        @return ConfocalImage: image with the counts of the array
+        """
+        horizontal, vertical, fixed = cls._axis_indices[plane]
+        image = cls(plane,
+                    (array[0, 0, horizontal], array[0, -1, horizontal], array.shape[1]),
+                    (array[0, 0, vertical], array[-1, 0, vertical], array.shape[0]),
+                    array.shape[2] - 3,
+                    dtype=dtype,
+                    memmap_size=memmap_size,
+                    memmap_directory=memmap_directory)
+        image.line_position[:] = array[:, 0, fixed]
+        image._counts[...] = array[:, :, 3:]
+        return image
@@ -31,7 +31,10 @@ import matplotlib.pyplot as plt
 from logic.generic_logic import GenericLogic
 from core.util.mutex import Mutex
 from core.connector import Connector
+from core.configoption import ConfigOption
 from core.statusvariable import StatusVar
+from logic.confocal_image import ConfocalImage
+from logic.sparse_confocal_image import ImagePyramid, SparseConfocalImage, rois_from_image
 
 
 class OldConfigFileError(Exception):
@@ -49,6 +52,7 @@ class ConfocalHistoryEntry(QtCore.QObject):
     def __init__(self, confocal):
         """ Make a confocal data setting with default values. """
         super().__init__()
+        self._image_storage = confocal.get_image_storage()
 
         self.depth_scan_dir_is_xz = True
         self.depth_img_is_xz = True
@@ -130,20 +134,21 @@ class ConfocalHistoryEntry(QtCore.QObject):
         confocal._scanning_device.tilt_reference_y = self.tilt_reference_y
         confocal._scanning_device.tiltcorrection = self.tilt_correction
 
+        # the images are shared with the confocal logic, continue_scanner works on a copy
         confocal.initialize_image()
         try:
             if confocal.xy_image.shape == self.xy_image.shape:
-                confocal.xy_image = np.copy(self.xy_image)
+                confocal.xy_image = self.xy_image
         except AttributeError:
-            self.xy_image = np.copy(confocal.xy_image)
+            self.xy_image = confocal.xy_image
 
         confocal._zscan = True
         confocal.initialize_image()
         try:
             if confocal.depth_image.shape == self.depth_image.shape:
-                confocal.depth_image = np.copy(self.depth_image)
+                confocal.depth_image = self.depth_image
         except AttributeError:
-            self.depth_image = np.copy(confocal.depth_image)
+            self.depth_image = confocal.depth_image
         confocal._zscan = False
 
     def snapshot(self, confocal):
@@ -172,8 +177,9 @@ class ConfocalHistoryEntry(QtCore.QObject):
         self.point1 = np.copy(confocal.point1)
         self.point2 = np.copy(confocal.point2)
         self.point3 = np.copy(confocal.point3)
-        self.xy_image = np.copy(confocal.xy_image)
-        self.depth_image = np.copy(confocal.depth_image)
+        # no copy, a new scan creates new images and continue_scanner works on a copy
+        self.xy_image = confocal.xy_image
+        self.depth_image = confocal.depth_image
 
     def serialize(self):
         """ Give out a dictionary that can be saved via the usual means """
@@ -197,8 +203,8 @@ class ConfocalHistoryEntry(QtCore.QObject):
         serialized['tilt_point3'] = list(self.point3)
         serialized['tilt_reference'] = [self.tilt_reference_x, self.tilt_reference_y]
         serialized['tilt_slope'] = [self.tilt_slope_x, self.tilt_slope_y]
-        serialized['xy_image'] = self.xy_image
-        serialized['depth_image'] = self.depth_image
+        serialized['xy_image'] = self.xy_image.to_dict()
+        serialized['depth_image'] = self.depth_image.to_dict()
         return serialized
 
     def deserialize(self, serialized):
@@ -237,15 +243,18 @@ class ConfocalHistoryEntry(QtCore.QObject):
         if 'tilt_point3' in serialized and len(serialized['tilt_point3']) == 3:
             self.point3 = np.array(serialized['tilt_point3'])
         if 'xy_image' in serialized:
-            if isinstance(serialized['xy_image'], np.ndarray):
-                self.xy_image = serialized['xy_image']
-            else:
-                raise OldConfigFileError()
+            self.xy_image = self._deserialize_image(serialized['xy_image'], 'xy')
         if 'depth_image' in serialized:
-            if isinstance(serialized['depth_image'], np.ndarray):
-                self.depth_image = serialized['depth_image'].copy()
-            else:
-                raise OldConfigFileError()
+            self.depth_image = self._deserialize_image(
+                serialized['depth_image'], 'xz' if self.depth_img_is_xz else 'yz')
+
+    def _deserialize_image(self, image, plane):
+        """ Restore a ConfocalImage from its dict or from the dense array of older versions. """
+        if isinstance(image, dict):
+            return ConfocalImage.from_dict(image, **self._image_storage)
+        if isinstance(image, np.ndarray):
+            return ConfocalImage.from_array(image, plane, **self._image_storage)
+        raise OldConfigFileError()
 
 
 class ConfocalLogic(GenericLogic):
@@ -257,6 +266,16 @@ class ConfocalLogic(GenericLogic):
     confocalscanner1 = Connector(interface='ConfocalScannerInterface')
     savelogic = Connector(interface='SaveLogic')
 
+    # config options
+    # scan the whole image with a single hardware timed output if the scanner supports it
+    _frame_scan = ConfigOption('frame_scan', False)
+    # dtype of the image counts ('float32' halves the memory, but rounds counts above 2**24) and
+    # size in MB above which an image is kept in a memory mapped file in image_memmap_directory
+    # (default: temp directory) instead of the RAM
+    _image_dtype = ConfigOption('image_dtype', 'float64')
+    _image_memmap_size = ConfigOption('image_memmap_size', 256)
+    _image_memmap_directory = ConfigOption('image_memmap_directory', None)
+
     # status vars
     _clock_frequency = StatusVar('clock_frequency', 500)
     return_slowness = StatusVar(default=50)
@@ -280,7 +299,11 @@ class ConfocalLogic(GenericLogic):
 
     _signal_save_xy = QtCore.Signal(object, object)
     _signal_save_depth = QtCore.Signal(object, object)
+    _signal_frame_line = QtCore.Signal(int, object)
+    _signal_end_frame_scan = QtCore.Signal()
 
+    # plane ('xy' or 'depth'), first changed line and line after the last changed one
+    sigImageLinesUpdated = QtCore.Signal(str, int, int)
     sigImageXYInitialized = QtCore.Signal()
     sigImageDepthInitialized = QtCore.Signal()
 
@@ -296,6 +319,14 @@ class ConfocalLogic(GenericLogic):
         self._scan_counter = 0
         self._zscan = False
         self.stopRequested = False
+        self._use_frame_scan = False
+        self._frame_scanning = False
+        self._frame_first_line = 0
+        self._tiled_scan_settings = None
+        self._tiled_scan = False
+        self._tile_plan = list()
+        self._tile_scan_position = None
+        self.tiled_image = None
         self.depth_scan_dir_is_xz = True
         self.depth_img_is_xz = True
         self.permanent_scan = False
@@ -346,6 +377,8 @@ class ConfocalLogic(GenericLogic):
 
         self._signal_save_xy.connect(self._save_xy_data, QtCore.Qt.QueuedConnection)
         self._signal_save_depth.connect(self._save_depth_data, QtCore.Qt.QueuedConnection)
+        self._signal_frame_line.connect(self._frame_line_scanned, QtCore.Qt.QueuedConnection)
+        self._signal_end_frame_scan.connect(self._end_frame_scan, QtCore.Qt.QueuedConnection)
 
         self._change_position('activation')
 
@@ -399,6 +432,7 @@ class ConfocalLogic(GenericLogic):
         # TODO: this is dirty, but it works for now
 #        while self.module_state() == 'locked':
 #            time.sleep(0.01)
+        self._tiled_scan_settings = None
         self._scan_counter = 0
         self._zscan = zscan
         if self._zscan:
@@ -409,6 +443,75 @@ class ConfocalLogic(GenericLogic):
         self.signal_start_scanning.emit(tag)
         return 0
 
+    def start_roi_scanning(self, rois, background_step=0, tag='logic'):
+        """Starts an xy scan of regions of interest only
+
+        @param list rois: regions ((x_min, x_max), (y_min, y_max)) in m which are scanned at
+                          full resolution, e.g. from get_rois_from_xy_image or from the POIs
+        @param int background_step: additionally scan every background_step-th line and pixel of
+                                    the whole image first, no background scan if smaller than 2
+
+        @return int: error code (0:OK, -1:error)
+
+        The scanned lines are kept in the tiles of tiled_image (a SparseConfocalImage), xy_image
+        shows them with the background filling the pixels which were not scanned. A ROI scan can
+        not be continued.
+        """
+        if len(rois) < 1 and background_step < 2:
+            self.log.error('No regions of interest to scan.')
+            return -1
+        self._tiled_scan_settings = ('roi', list(rois), int(background_step))
+        self._scan_counter = 0
+        self._zscan = False
+        self._xyscan_continuable = False
+
+        self.signal_start_scanning.emit(tag)
+        return 0
+
+    def start_progressive_scanning(self, coarsest_step=8, threshold=None, tag='logic'):
+        """Starts an xy scan in passes of increasing resolution
+
+        @param int coarsest_step: the first pass scans every coarsest_step-th line and pixel, every
+                                  further pass halves the step down to the full resolution. It is
+                                  rounded down to a power of 2.
+        @param float threshold: optional, count rate (of the first channel) below which regions
+                                are not refined any further
+
+        @return int: error code (0:OK, -1:error)
+
+        The first pass gives a preview of the whole image after a fraction of the scan time, so a
+        bad field of view can be stopped early. The passes are kept in tiled_image (an
+        ImagePyramid), xy_image always shows the finest resolution scanned so far everywhere. A
+        progressive scan can not be continued.
+        """
+        if coarsest_step < 1:
+            self.log.error('The coarsest step of a progressive scan has to be at least 1.')
+            return -1
+        self._tiled_scan_settings = ('progressive', int(coarsest_step), threshold)
+        self._scan_counter = 0
+        self._zscan = False
+        self._xyscan_continuable = False
+
+        self.signal_start_scanning.emit(tag)
+        return 0
+
+    def get_rois_from_xy_image(self, threshold, margin=0, channel=0):
+        """ Regions of interest around the bright areas of the current xy image.
+
+        @param float threshold: count rate above which a pixel belongs to a region
+        @param float margin: added to all sides of the regions in m
+        @param int channel: index of the count channel
+
+        @return list: regions ((x_min, x_max), (y_min, y_max)) in m
+
+        Meant for a coarse pre-scan, which is then followed by start_roi_scanning.
+        """
+        return rois_from_image(self.xy_image.counts(channel),
+                               self.xy_image.horizontal,
+                               self.xy_image.vertical,
+                               threshold,
+                               margin=margin)
+
     def continue_scanning(self,zscan,tag='logic'):
         """Continue scanning
 
@@ -430,6 +533,10 @@ class ConfocalLogic(GenericLogic):
         with self.threadlock:
             if self.module_state() == 'locked':
                 self.stopRequested = True
+            frame_scanning = self._frame_scanning
+        if frame_scanning:
+            # no line loop is running during a frame scan, end the frame in the logic thread
+            self._signal_end_frame_scan.emit()
         self.signal_stop_scanning.emit()
         return 0
 
@@ -497,43 +604,20 @@ class ConfocalLogic(GenericLogic):
             self._image_vert_axis = self._Z
             # update image scan direction from setting
             self.depth_img_is_xz = self.depth_scan_dir_is_xz
+            # the image stores only the counts, the positions are given by its axes
+            channels = len(self.get_scanner_count_channels())
+            vertical_axis = (z1, z2, len(self._image_vert_axis))
             # depth scan is in xz plane
             if self.depth_img_is_xz:
-                #self._image_horz_axis = self._X
-                # creates an image where each pixel will be [x,y,z,counts]
-                self.depth_image = np.zeros((
-                        len(self._image_vert_axis),
-                        len(self._X),
-                        3 + len(self.get_scanner_count_channels())
-                    ))
-
-                self.depth_image[:, :, 0] = np.full(
-                    (len(self._image_vert_axis), len(self._X)), self._XL)
-
-                self.depth_image[:, :, 1] = self._current_y * np.ones(
-                    (len(self._image_vert_axis), len(self._X)))
-
-                z_value_matrix = np.full((len(self._X), len(self._image_vert_axis)), self._Z)
-                self.depth_image[:, :, 2] = z_value_matrix.transpose()
+                self.depth_image = ConfocalImage(
+                    'xz', (x1, x2, len(self._X)), vertical_axis, channels,
+                    line_position=self._current_y, **self.get_image_storage())
 
             # depth scan is yz plane instead of xz plane
             else:
-                #self._image_horz_axis = self._Y
-                # creats an image where each pixel will be [x,y,z,counts]
-                self.depth_image = np.zeros((
-                        len(self._image_vert_axis),
-                        len(self._Y),
-                        3 + len(self.get_scanner_count_channels())
-                    ))
-
-                self.depth_image[:, :, 0] = self._current_x * np.ones(
-                    (len(self._image_vert_axis), len(self._Y)))
-
-                self.depth_image[:, :, 1] = np.full(
-                    (len(self._image_vert_axis), len(self._Y)), self._YL)
-
-                z_value_matrix = np.full((len(self._Y), len(self._image_vert_axis)), self._Z)
-                self.depth_image[:, :, 2] = z_value_matrix.transpose()
+                self.depth_image = ConfocalImage(
+                    'yz', (y1, y2, len(self._Y)), vertical_axis, channels,
+                    line_position=self._current_x, **self.get_image_storage())
 
                 # now we are scanning along the y-axis, so we need a new return line along Y:
                 self._return_YL = np.linspace(self._YL[-1], self._YL[0], self.return_slowness)
@@ -543,23 +627,12 @@ class ConfocalLogic(GenericLogic):
 
         # xy scan is in xy plane
         else:
-            #self._image_horz_axis = self._X
             self._image_vert_axis = self._Y
-            # creats an image where each pixel will be [x,y,z,counts]
-            self.xy_image = np.zeros((
-                    len(self._image_vert_axis),
-                    len(self._X),
-                    3 + len(self.get_scanner_count_channels())
-                ))
-
-            self.xy_image[:, :, 0] = np.full(
-                (len(self._image_vert_axis), len(self._X)), self._XL)
-
-            y_value_matrix = np.full((len(self._X), len(self._image_vert_axis)), self._Y)
-            self.xy_image[:, :, 1] = y_value_matrix.transpose()
-
-            self.xy_image[:, :, 2] = self._current_z * np.ones(
-                (len(self._image_vert_axis), len(self._X)))
+            # the image stores only the counts, the positions are given by its axes
+            self.xy_image = ConfocalImage(
+                'xy', (x1, x2, len(self._X)), (y1, y2, len(self._Y)),
+                len(self.get_scanner_count_channels()),
+                line_position=self._current_z, **self.get_image_storage())
 
             self.sigImageXYInitialized.emit()
         return 0
@@ -577,6 +650,26 @@ class ConfocalLogic(GenericLogic):
             self.module_state.unlock()
             return -1
 
+        self._tiled_scan = self._tiled_scan_settings is not None and not self._zscan
+        if self._tiled_scan:
+            s_ch = len(self.get_scanner_count_channels())
+            if self._tiled_scan_settings[0] == 'roi':
+                rois, background_step = self._tiled_scan_settings[1:]
+                self.tiled_image = SparseConfocalImage(
+                    self._X, self._Y, s_ch, rois, background_step=background_step)
+                self.log.debug('ROI scan of {0:d} of {1:d} pixels in {2:d} tiles.'.format(
+                    self.tiled_image.planned_pixels,
+                    self.xy_image.shape[0] * self.xy_image.shape[1],
+                    len(self.tiled_image.tiles)))
+            else:
+                coarsest_step, threshold = self._tiled_scan_settings[1:]
+                self.tiled_image = ImagePyramid(
+                    self._X, self._Y, s_ch, coarsest_step=coarsest_step, threshold=threshold)
+            self._tile_plan = self.tiled_image.plan_lines((self._current_x, self._current_y))
+            self._tile_scan_position = None
+        elif not self._zscan:
+            self.tiled_image = None
+
         clock_status = self._scanning_device.set_up_scanner_clock(
             clock_frequency=self._clock_frequency)
 
@@ -595,6 +688,7 @@ class ConfocalLogic(GenericLogic):
             self.set_position('scanner')
             return -1
 
+        self._use_frame_scan = self._frame_scan
         self.signal_scan_lines_next.emit()
         return 0
 
@@ -605,6 +699,13 @@ class ConfocalLogic(GenericLogic):
         """
         self.module_state.lock()
         self._scanning_device.module_state.lock()
+        self._tiled_scan = False
+
+        # the image may be shared with the history, which must not change
+        if self._zscan:
+            self.depth_image = self.depth_image.copy()
+        else:
+            self.xy_image = self.xy_image.copy()
 
         clock_status = self._scanning_device.set_up_scanner_clock(
             clock_frequency=self._clock_frequency)
@@ -624,6 +725,7 @@ class ConfocalLogic(GenericLogic):
             self.set_position('scanner')
             return -1
 
+        self._use_frame_scan = self._frame_scan
         self.signal_scan_lines_next.emit()
         return 0
 
@@ -712,6 +814,16 @@ class ConfocalLogic(GenericLogic):
         """
         return self._scanning_device.get_scanner_count_channels()
 
+    def get_image_storage(self):
+        """ Storage of the counts of the xy and depth images.
+
+        @return dict: dtype, memmap_size and memmap_directory arguments of ConfocalImage
+        """
+        memmap_size = self._image_memmap_size
+        return {'dtype': self._image_dtype,
+                'memmap_size': None if memmap_size is None else memmap_size * 2 ** 20,
+                'memmap_directory': self._image_memmap_directory}
+
     def _scan_line(self):
         """scanning an image in either depth or xy
 
@@ -738,6 +850,10 @@ class ConfocalLogic(GenericLogic):
                 self.history_index = len(self.history) - 1
                 return
 
+        if self._tiled_scan:
+            self._scan_tile_line()
+            return
+
         image = self.depth_image if self._zscan else self.xy_image
         n_ch = len(self.get_scanner_axes())
         s_ch = len(self.get_scanner_count_channels())
@@ -762,20 +878,12 @@ class ConfocalLogic(GenericLogic):
                     self.signal_scan_lines_next.emit()
                     return
 
-            # adjust z of line in image to current z before building the line
-            if not self._zscan:
-                z_shape = image[self._scan_counter, :, 2].shape
-                image[self._scan_counter, :, 2] = self._current_z * np.ones(z_shape)
+            # scan the remaining lines at once, they arrive in _frame_line_scanned
+            if self._use_frame_scan and self._start_frame_scan(image, n_ch):
+                return
 
             # make a line in the scan, _scan_counter says which one it is
-            lsx = image[self._scan_counter, :, 0]
-            lsy = image[self._scan_counter, :, 1]
-            lsz = image[self._scan_counter, :, 2]
-            if n_ch <= 3:
-                line = np.vstack([lsx, lsy, lsz][0:n_ch])
-            else:
-                line = np.vstack(
-                    [lsx, lsy, lsz, np.ones(lsx.shape) * self._current_a])
+            line = self._get_scan_line(image, self._scan_counter, n_ch)
 
             # scan the line in the scan
             line_counts = self._scanning_device.scan_line(line, pixel_clock=True)
@@ -785,34 +893,7 @@ class ConfocalLogic(GenericLogic):
                 return
 
             # make a line to go to the starting position of the next scan line
-            if self.depth_img_is_xz or not self._zscan:
-                if n_ch <= 3:
-                    return_line = np.vstack([
-                        self._return_XL,
-                        image[self._scan_counter, 0, 1] * np.ones(self._return_XL.shape),
-                        image[self._scan_counter, 0, 2] * np.ones(self._return_XL.shape)
-                    ][0:n_ch])
-                else:
-                    return_line = np.vstack([
-                            self._return_XL,
-                            image[self._scan_counter, 0, 1] * np.ones(self._return_XL.shape),
-                            image[self._scan_counter, 0, 2] * np.ones(self._return_XL.shape),
-                            np.ones(self._return_XL.shape) * self._current_a
-                        ])
-            else:
-                if n_ch <= 3:
-                    return_line = np.vstack([
-                            image[self._scan_counter, 0, 1] * np.ones(self._return_YL.shape),
-                            self._return_YL,
-                            image[self._scan_counter, 0, 2] * np.ones(self._return_YL.shape)
-                        ][0:n_ch])
-                else:
-                    return_line = np.vstack([
-                            image[self._scan_counter, 0, 1] * np.ones(self._return_YL.shape),
-                            self._return_YL,
-                            image[self._scan_counter, 0, 2] * np.ones(self._return_YL.shape),
-                            np.ones(self._return_YL.shape) * self._current_a
-                        ])
+            return_line = self._get_return_line(image, self._scan_counter, n_ch)
 
             # return the scanner to the start of next line, counts are thrown away
             return_line_counts = self._scanning_device.scan_line(return_line)
@@ -827,9 +908,11 @@ class ConfocalLogic(GenericLogic):
                     self.depth_image[self._scan_counter, :, 3:3 + s_ch] = line_counts
                 else:
                     self.depth_image[self._scan_counter, :, 3:3 + s_ch] = line_counts
+                self.sigImageLinesUpdated.emit('depth', self._scan_counter, self._scan_counter + 1)
                 self.signal_depth_image_updated.emit()
             else:
                 self.xy_image[self._scan_counter, :, 3:3 + s_ch] = line_counts
+                self.sigImageLinesUpdated.emit('xy', self._scan_counter, self._scan_counter + 1)
                 self.signal_xy_image_updated.emit()
 
             # next line in scan
@@ -852,6 +935,205 @@ class ConfocalLogic(GenericLogic):
             self.stop_scanning()
             self.signal_scan_lines_next.emit()
 
+    def _scan_tile_line(self):
+        """ Scans the next line of a ROI or progressive scan, _scan_counter is the index in
+        _tile_plan.
+        """
+        n_ch = len(self.get_scanner_axes())
+        try:
+            tile_index, line, start, stop = self._tile_plan[self._scan_counter]
+            lsx, y = self.tiled_image.line_path(tile_index, line, start, stop)
+            path = [lsx, y * np.ones(lsx.shape), self._current_z * np.ones(lsx.shape)]
+            if n_ch <= 3:
+                line_path = np.vstack(path[0:n_ch])
+            else:
+                line_path = np.vstack(path + [self._current_a * np.ones(lsx.shape)])
+
+            # move from the end of the last line to the start of this one, counts are thrown away
+            if self._tile_scan_position is None:
+                position = [self._current_x, self._current_y, self._current_z, self._current_a]
+                self._tile_scan_position = np.array(position[0:line_path.shape[0]])
+            steps = np.linspace(0, 1, self.return_slowness)
+            move_line = (self._tile_scan_position[:, np.newaxis]
+                         + np.outer(line_path[:, 0] - self._tile_scan_position, steps))
+            move_counts = self._scanning_device.scan_line(move_line)
+            if np.any(move_counts == -1):
+                self.stopRequested = True
+                self.signal_scan_lines_next.emit()
+                return
+
+            line_counts = self._scanning_device.scan_line(line_path, pixel_clock=True)
+            if np.any(line_counts == -1):
+                self.stopRequested = True
+                self.signal_scan_lines_next.emit()
+                return
+            self._tile_scan_position = line_path[:, -1]
+
+            s_ch = len(self.get_scanner_count_channels())
+            self.tiled_image.set_line(tile_index, line, line_counts, start)
+            first_row, stop_row = self.tiled_image.render_line(
+                tile_index, line, self.xy_image.counts(), start, stop)
+            self.sigImageLinesUpdated.emit('xy', first_row, stop_row)
+            self.signal_xy_image_updated.emit()
+
+            self._scan_counter += 1
+            if self._scan_counter >= len(self._tile_plan):
+                # the next lines may depend on the lines scanned so far
+                self._tile_plan.extend(self.tiled_image.next_lines())
+            if self._scan_counter >= len(self._tile_plan):
+                if not self.permanent_scan:
+                    self.stop_scanning()
+                else:
+                    self._scan_counter = 0
+                    self._tile_plan = self.tiled_image.plan_lines(self._tile_scan_position)
+
+            self.signal_scan_lines_next.emit()
+        except:
+            self.log.exception('The scan went wrong, killing the scanner.')
+            self.stop_scanning()
+            self.signal_scan_lines_next.emit()
+
+    def _get_scan_line(self, image, row, n_ch):
+        """ Returns the scanner path of a line of the image.
+
+        @param ConfocalImage image: xy or depth image
+        @param int row: index of the line in the image
+        @param int n_ch: number of scanner axes
+
+        @return numpy.ndarray: positions with shape (n_ch, pixels per line)
+        """
+        # adjust z of line in image to current z before building the line
+        if not self._zscan:
+            image.set_line_position(row, self._current_z)
+
+        lsx, lsy, lsz = image.coordinates(row)
+        if n_ch <= 3:
+            return np.vstack([lsx, lsy, lsz][0:n_ch])
+        return np.vstack([lsx, lsy, lsz, np.ones(lsx.shape) * self._current_a])
+
+    def _get_return_line(self, image, row, n_ch):
+        """ Returns the scanner path from the end of a line of the image back to its start.
+
+        @param ConfocalImage image: xy or depth image
+        @param int row: index of the line in the image
+        @param int n_ch: number of scanner axes
+
+        @return numpy.ndarray: positions with shape (n_ch, return_slowness)
+        """
+        if self.depth_img_is_xz or not self._zscan:
+            if n_ch <= 3:
+                return np.vstack([
+                    self._return_XL,
+                    image[row, 0, 1] * np.ones(self._return_XL.shape),
+                    image[row, 0, 2] * np.ones(self._return_XL.shape)
+                ][0:n_ch])
+            return np.vstack([
+                    self._return_XL,
+                    image[row, 0, 1] * np.ones(self._return_XL.shape),
+                    image[row, 0, 2] * np.ones(self._return_XL.shape),
+                    np.ones(self._return_XL.shape) * self._current_a
+                ])
+        if n_ch <= 3:
+            return np.vstack([
+                    image[row, 0, 1] * np.ones(self._return_YL.shape),
+                    self._return_YL,
+                    image[row, 0, 2] * np.ones(self._return_YL.shape)
+                ][0:n_ch])
+        return np.vstack([
+                image[row, 0, 1] * np.ones(self._return_YL.shape),
+                self._return_YL,
+                image[row, 0, 2] * np.ones(self._return_YL.shape),
+                np.ones(self._return_YL.shape) * self._current_a
+            ])
+
+    def _start_frame_scan(self, image, n_ch):
+        """ Starts a hardware timed scan of the remaining lines of the image.
+
+        @param ConfocalImage image: xy or depth image
+        @param int n_ch: number of scanner axes
+
+        @return bool: whether the frame scan was started
+
+        Every line is followed by its return line, so the scanner hardware can output the whole
+        raster at once instead of starting and stopping its tasks twice per line. If the scanner
+        does not support this, the frame scan is not tried again until the next start of a scan.
+        """
+        frame_path = np.stack(
+            [np.hstack((self._get_scan_line(image, row, n_ch),
+                        self._get_return_line(image, row, n_ch)))
+             for row in range(self._scan_counter, np.size(self._image_vert_axis))],
+            axis=1)
+        self._frame_first_line = self._scan_counter
+        with self.threadlock:
+            self._frame_scanning = True
+        if self._scanning_device.start_frame_scan(
+                frame_path, image.shape[1], self._frame_line_callback, pixel_clock=True) < 0:
+            with self.threadlock:
+                self._frame_scanning = False
+            self._use_frame_scan = False
+            self.log.warning('Scanner does not support scanning a whole frame, scanning the '
+                             'image line by line.')
+            return False
+        return True
+
+    def _frame_line_callback(self, line_index, counts):
+        """ Receives the lines of the frame scan in a thread of the scanner hardware. """
+        self._signal_frame_line.emit(line_index, counts)
+
+    def _frame_line_scanned(self, line_index, counts):
+        """ Puts a line of the frame scan into the image.
+
+        @param int line_index: index of the line in the frame
+        @param numpy.ndarray counts: photon counts per second of the line for every channel
+        """
+        if not self._frame_scanning:
+            # line of a frame scan which is already stopped
+            return
+        if np.any(counts == -1):
+            self.stopRequested = True
+            self._end_frame_scan()
+            return
+
+        try:
+            row = self._frame_first_line + line_index
+            s_ch = len(self.get_scanner_count_channels())
+            if self._zscan:
+                self.depth_image[row, :, 3:3 + s_ch] = counts
+                self.sigImageLinesUpdated.emit('depth', row, row + 1)
+                self.signal_depth_image_updated.emit()
+            else:
+                self.xy_image[row, :, 3:3 + s_ch] = counts
+                self.sigImageLinesUpdated.emit('xy', row, row + 1)
+                self.signal_xy_image_updated.emit()
+            self._scan_counter = row + 1
+
+            if self.stopRequested:
+                self._end_frame_scan()
+            elif self._scan_counter >= np.size(self._image_vert_axis):
+                if not self.permanent_scan:
+                    self.stop_scanning()
+                    if self._zscan:
+                        self._zscan_continuable = False
+                    else:
+                        self._xyscan_continuable = False
+                else:
+                    self._scan_counter = 0
+                self._end_frame_scan()
+        except:
+            self.log.exception('The frame scan went wrong, killing the scanner.')
+            self.stop_scanning()
+            self._end_frame_scan()
+
+    def _end_frame_scan(self):
+        """ Stops the frame scan of the hardware and continues with _scan_line. """
+        with self.threadlock:
+            if not self._frame_scanning:
+                return
+            self._frame_scanning = False
+        if self._scanning_device.stop_frame_scan() < 0:
+            self.stopRequested = True
+        self.signal_scan_lines_next.emit()
+
     def save_xy_data(self, colorscale_range=None, percentile_range=None, block=True):
         """ Save the current confocal xy data to file.
 
@@ -897,8 +1179,10 @@ class ConfocalLogic(GenericLogic):
         parameters['Clock frequency of scanner (Hz)'] = self._clock_frequency
         parameters['Return Slowness (Steps during retrace line)'] = self.return_slowness
 
+        if self.tiled_image is not None:
+            parameters.update(self.tiled_image.get_parameters())
+
         # Prepare a figure to be saved
-        figure_data = self.xy_image[:, :, 3]
         image_extent = [self.image_x_range[0],
                         self.image_x_range[1],
                         self.image_y_range[0],
@@ -906,7 +1190,7 @@ class ConfocalLogic(GenericLogic):
         axes = ['X', 'Y']
         crosshair_pos = [self.get_position()[0], self.get_position()[1]]
 
-        figs = {ch: self.draw_figure(data=self.xy_image[:, :, 3 + n],
+        figs = {ch: self.draw_figure(data=self.xy_image.counts(n),
                                      image_extent=image_extent,
                                      scan_axis=axes,
                                      cbar_range=colorscale_range,
@@ -921,7 +1205,7 @@ class ConfocalLogic(GenericLogic):
             image_data['Confocal pure XY scan image data without axis.\n'
                 'The upper left entry represents the signal at the upper left pixel position.\n'
                 'A pixel-line in the image corresponds to a row '
-                'of entries where the Signal is in counts/s:'] = self.xy_image[:, :, 3 + n]
+                'of entries where the Signal is in counts/s:'] = self.xy_image.counts(n)
 
             filelabel = 'confocal_xy_image_{0}'.format(ch.replace('/', ''))
             self._save_logic.save_data(image_data,
@@ -935,12 +1219,13 @@ class ConfocalLogic(GenericLogic):
 
         # prepare the full raw data in an OrderedDict:
         data = OrderedDict()
-        data['x position (m)'] = self.xy_image[:, :, 0].flatten()
-        data['y position (m)'] = self.xy_image[:, :, 1].flatten()
-        data['z position (m)'] = self.xy_image[:, :, 2].flatten()
+        x, y, z = self.xy_image.coordinates()
+        data['x position (m)'] = x.ravel()
+        data['y position (m)'] = y.ravel()
+        data['z position (m)'] = z.ravel()
 
         for n, ch in enumerate(self.get_scanner_count_channels()):
-            data['count rate {0} (Hz)'.format(ch)] = self.xy_image[:, :, 3 + n].flatten()
+            data['count rate {0} (Hz)'.format(ch)] = self.xy_image.counts(n).ravel()
 
         # Save the raw data to file
         filelabel = 'confocal_xy_data'
@@ -952,6 +1237,17 @@ class ConfocalLogic(GenericLogic):
                                    fmt='%.6e',
                                    delimiter='\t')
 
+        # the image above is filled up with coarser pixels, save the really scanned pixels
+        if self.tiled_image is not None:
+            self._save_logic.save_data(
+                self.tiled_image.to_data(self.get_scanner_count_channels()),
+                filepath=filepath,
+                timestamp=timestamp,
+                parameters=parameters,
+                filelabel='confocal_xy_tile_data',
+                fmt='%.6e',
+                delimiter='\t')
+
         self.log.debug('Confocal Image saved.')
         self.signal_xy_data_saved.emit()
         return
@@ -1015,7 +1311,7 @@ class ConfocalLogic(GenericLogic):
                         self.image_z_range[0],
                         self.image_z_range[1]]
 
-        figs = {ch: self.draw_figure(data=self.depth_image[:, :, 3 + n],
+        figs = {ch: self.draw_figure(data=self.depth_image.counts(n),
                                      image_extent=image_extent,
                                      scan_axis=axes,
                                      cbar_range=colorscale_range,
@@ -1030,7 +1326,7 @@ class ConfocalLogic(GenericLogic):
             image_data['Confocal pure depth scan image data without axis.\n'
                 'The upper left entry represents the signal at the upper left pixel position.\n'
                 'A pixel-line in the image corresponds to a row in '
-                'of entries where the Signal is in counts/s:'] = self.depth_image[:, :, 3 + n]
+                'of entries where the Signal is in counts/s:'] = self.depth_image.counts(n)
 
             filelabel = 'confocal_depth_image_{0}'.format(ch.replace('/', ''))
             self._save_logic.save_data(image_data,
@@ -1044,12 +1340,13 @@ class ConfocalLogic(GenericLogic):
 
         # prepare the full raw data in an OrderedDict:
         data = OrderedDict()
-        data['x position (m)'] = self.depth_image[:, :, 0].flatten()
-        data['y position (m)'] = self.depth_image[:, :, 1].flatten()
-        data['z position (m)'] = self.depth_image[:, :, 2].flatten()
+        x, y, z = self.depth_image.coordinates()
+        data['x position (m)'] = x.ravel()
+        data['y position (m)'] = y.ravel()
+        data['z position (m)'] = z.ravel()
 
         for n, ch in enumerate(self.get_scanner_count_channels()):
-            data['count rate {0} (Hz)'.format(ch)] = self.depth_image[:, :, 3 + n].flatten()
+            data['count rate {0} (Hz)'.format(ch)] = self.depth_image.counts(n).ravel()
 
         # Save the raw data to file
         filelabel = 'confocal_depth_data'
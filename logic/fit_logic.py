@@ -20,13 +20,17 @@ Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
 top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
 """
 
+import functools
 import importlib
 import inspect
 import lmfit
+import multiprocessing
 from qtpy import QtCore
 import numpy as np
 import os
 import sys
+import threading
+import time
 from collections import OrderedDict
 from distutils.version import LooseVersion
 
@@ -37,6 +41,141 @@ from core.config import load, save
 from core.configoption import ConfigOption
 
 
+# set while a make_*_model method constructs a model in the current thread
+_model_construction = threading.local()
+
+
+def _cached_model_method(make_model):
+    """ Wrap a make_*_model method so the lmfit model is only constructed once per set of arguments.
+
+    @param function make_model: make_*_model function imported from logic/fitmethods
+
+    @return function: method returning the cached model and a copy of the cached parameters
+
+    The returned model is shared between all callers and must not be altered. The parameters are
+    a fresh copy of the cached template, so estimators can change them freely.
+    Models requested while another model is constructed are not taken from the cache, since the
+    constructing method may alter them (e.g. by setting parameter hints).
+    """
+    @functools.wraps(make_model)
+    def cached_make_model(self, *args, **kwargs):
+        if getattr(_model_construction, 'active', False):
+            return make_model(self, *args, **kwargs)
+
+        key = (make_model.__name__, args, tuple(sorted(kwargs.items())))
+        try:
+            model, params = self._model_cache[key]
+        except TypeError:
+            # unhashable arguments, do not cache
+            return make_model(self, *args, **kwargs)
+        except KeyError:
+            _model_construction.active = True
+            try:
+                model, params = make_model(self, *args, **kwargs)
+            finally:
+                _model_construction.active = False
+            self._model_cache[key] = (model, params)
+        return model, params.copy()
+    return cached_make_model
+
+
+# FitLogic instance of a batch fit worker process
+_batch_fit_logic = None
+
+
+def _init_batch_fit_worker(config):
+    """ Initializer of the batch fit worker processes, creates the FitLogic used in this process.
+
+    @param dict config: configuration of the FitLogic in the main process
+    """
+    global _batch_fit_logic
+    _batch_fit_logic = FitLogic(manager=None, name='batchfitlogic', config=config)
+
+
+def _batch_fit_worker(task):
+    """ Fit a chunk of traces in a batch fit worker process.
+
+    @param tuple task: arguments of _batch_fit_traces after the fit logic
+
+    @return numpy.ndarray: structured array with the fit results of the chunk
+    """
+    return _batch_fit_traces(_batch_fit_logic, *task)
+
+
+def _batch_fit_traces(fit_logic, x_axis, traces, fit_function, estimator, add_params, warm_start,
+                      warm_start_tolerance, result_dtype):
+    """ Fit traces one after the other, optionally starting from the result of the previous trace.
+
+    @param FitLogic fit_logic: fit logic providing the fit methods
+    @param numpy.ndarray x_axis: 1D x values shared by all traces
+    @param numpy.ndarray traces: 2D array with one trace per row
+    @param str fit_function: name of the 1D fit, e.g. 'lorentzian'
+    @param str estimator: name of the estimator of the fit, e.g. 'dip'
+    @param dict add_params: parameters to substitute, see _substitute_params
+    @param bool warm_start: use the converged parameters of the previous trace as start values
+    @param float warm_start_tolerance: a warm started fit is only accepted if its reduced chi^2 is
+                                       at most this factor larger than the one of the previous trace
+    @param numpy.dtype result_dtype: dtype of the returned array, see FitLogic.batch_fit
+
+    @return numpy.ndarray: structured array with the fit results
+    """
+    fit = fit_logic.fit_list['1d'][fit_function]
+    make_fit = fit['make_fit']
+    estimate = fit[estimator]
+
+    results = np.zeros(len(traces), dtype=result_dtype)
+    for name in result_dtype['value'].names:
+        results['value'][name] = np.nan
+        results['error'][name] = np.nan
+    results['chisqr'] = np.nan
+    results['redchi'] = np.nan
+
+    previous = None
+    for index, trace in enumerate(traces):
+        result = None
+        if warm_start and previous is not None:
+            def warm_estimate(x_axis, data, params, previous_params=previous.params):
+                for name in params:
+                    if name in previous_params and not params[name].expr:
+                        params[name].value = previous_params[name].value
+                return 0, params
+            try:
+                result = make_fit(x_axis=x_axis, data=trace, estimator=warm_estimate,
+                                  add_params=add_params)
+            except Exception:
+                result = None
+            if result is not None and not (result.success and
+                                           result.redchi <= warm_start_tolerance * previous.redchi):
+                cold_result = None
+                try:
+                    cold_result = make_fit(x_axis=x_axis, data=trace, estimator=estimate,
+                                           add_params=add_params)
+                except Exception:
+                    pass
+                if cold_result is not None and cold_result.chisqr < result.chisqr:
+                    result = cold_result
+        if result is None:
+            try:
+                result = make_fit(x_axis=x_axis, data=trace, estimator=estimate,
+                                  add_params=add_params)
+            except Exception as e:
+                fit_logic.log.debug('Fit of trace {0} in batch failed: {1}'.format(index, e))
+                previous = None
+                continue
+
+        for name in result_dtype['value'].names:
+            if name in result.params:
+                results['value'][name][index] = result.params[name].value
+                if result.params[name].stderr is not None:
+                    results['error'][name][index] = result.params[name].stderr
+        results['chisqr'][index] = result.chisqr
+        results['redchi'][index] = result.redchi
+        results['success'][index] = result.success
+        results['nfev'][index] = result.nfev
+        previous = result if result.success else None
+    return results
+
+
 class FitLogic(GenericLogic):
     """
     Documentation to add a new fit model/estimator/function can be found in
@@ -54,11 +193,20 @@ class FitLogic(GenericLogic):
     _additional_methods_import_path = ConfigOption(name='additional_fit_methods_path',
                                                    default=None,
                                                    missing='nothing')
+    # Refine the estimator values with analytic Jacobians before the lmfit fit, where available
+    _analytic_jacobian = ConfigOption(name='analytic_jacobian', default=True, missing='nothing')
+    # Number of processes used for batch fits, 0 means one per CPU core
+    _batch_fit_processes = ConfigOption(name='batch_fit_processes', default=0, missing='nothing')
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         # locking for thread safety
         self.lock = Mutex()
+        # constructed lmfit models and parameter templates by method name and arguments
+        self._model_cache = dict()
+        # process pool for batch fits, created on first use
+        self._batch_fit_pool = None
+        self._batch_fit_pool_size = 0
 
         filenames = []
         # for path in directories:
@@ -108,7 +256,9 @@ class FitLogic(GenericLogic):
                 if callable(ref) and (inspect.ismethod(ref) or inspect.isfunction(ref)):
                     method_str = str(method)
                     try:
-                        # import methods in Fitlogic
+                        # import methods in Fitlogic, models are only constructed once
+                        if method_str.startswith('make_') and method_str.endswith('_model'):
+                            ref = _cached_model_method(ref)
                         setattr(FitLogic, method, ref)
                         # append method to a list of methods to include in the fit_list dictionary
                         if method_str.startswith('make_') and method_str.endswith('_fit'):
@@ -177,7 +327,106 @@ class FitLogic(GenericLogic):
 
     def on_deactivate(self):
         """ """
-        pass
+        if self._batch_fit_pool is not None:
+            self._batch_fit_pool.terminate()
+            self._batch_fit_pool.join()
+            self._batch_fit_pool = None
+
+    def _get_batch_fit_pool(self):
+        """ Get the process pool for batch fits, start it if necessary.
+
+        @return multiprocessing.pool.Pool: pool of batch fit worker processes
+
+        The workers are spawned (not forked) so they do not inherit the Qt state of this process.
+        Each worker creates its own FitLogic once, so the pool is kept until deactivation.
+        """
+        if self._batch_fit_pool is None:
+            num_processes = self._batch_fit_processes
+            if num_processes < 1:
+                num_processes = os.cpu_count()
+            config = {'additional_fit_methods_path': self._additional_methods_import_path,
+                      'analytic_jacobian': self._analytic_jacobian}
+            context = multiprocessing.get_context('spawn')
+            self._batch_fit_pool_size = num_processes
+            self._batch_fit_pool = context.Pool(processes=num_processes,
+                                                initializer=_init_batch_fit_worker,
+                                                initargs=(config,))
+        return self._batch_fit_pool
+
+    def get_batch_fit_dtype(self, fit_function):
+        """ Get the dtype of the structured array returned by batch_fit.
+
+        @param str fit_function: name of the 1D fit, e.g. 'lorentzian'
+
+        @return numpy.dtype: structured dtype with the fields
+                             'value' and 'error' (each with one float field per fit parameter),
+                             'chisqr', 'redchi' (float), 'success' (bool) and 'nfev' (int)
+        """
+        model, params = self.fit_list['1d'][fit_function]['make_model']()
+        param_dtype = [(name, 'float64') for name in params]
+        return np.dtype([('value', param_dtype), ('error', param_dtype), ('chisqr', 'float64'),
+                         ('redchi', 'float64'), ('success', 'bool'), ('nfev', 'int64')])
+
+    def batch_fit(self, x_axis, data, fit_function, estimator='generic', add_params=None,
+                  warm_start=True, warm_start_tolerance=2.0, parallel=True, chunk_size=None):
+        """ Fit many traces sharing the same x axis at once.
+
+        @param numpy.ndarray x_axis: 1D x values shared by all traces
+        @param numpy.ndarray data: traces along the last axis, e.g. shape (rows, columns, len(x_axis))
+                                   for a 2D map of spectra
+        @param str fit_function: name of the 1D fit, e.g. 'lorentzian'
+        @param str estimator: name of the estimator of the fit, e.g. 'dip'
+        @param Parameters or dict add_params: optional, parameters to substitute in every fit
+        @param bool warm_start: start each fit from the converged parameters of the previous trace
+                                (in C order, i.e. along the rows of a map) instead of the estimator.
+                                Falls back to the estimator if the warm started fit is worse.
+        @param float warm_start_tolerance: accepted increase of the reduced chi^2 with respect to
+                                           the previous trace for a warm started fit
+        @param bool parallel: fit in a pool of worker processes
+        @param int chunk_size: optional, number of consecutive traces fitted by one worker task
+
+        @return numpy.ndarray: structured array of shape data.shape[:-1], see get_batch_fit_dtype.
+                               Failed fits have NaN values and success False.
+        """
+        x_axis = np.asarray(x_axis, dtype=float)
+        data = np.asarray(data, dtype=float)
+        if data.shape[-1] != x_axis.size:
+            raise ValueError('Last axis of data ({0}) does not match the length of the x axis '
+                             '({1}).'.format(data.shape[-1], x_axis.size))
+        if fit_function not in self.fit_list['1d']:
+            raise ValueError('Unknown 1D fit function "{0}".'.format(fit_function))
+        if estimator not in self.fit_list['1d'][fit_function]:
+            raise ValueError('Unknown estimator "{0}" for fit function "{1}".'
+                             ''.format(estimator, fit_function))
+
+        # Parameters objects are converted to plain dicts to be passed to the worker processes
+        if isinstance(add_params, lmfit.parameter.Parameters):
+            add_params = OrderedDict(
+                (name, {key: value for key, value in (('value', par.value), ('min', par.min),
+                                                      ('max', par.max), ('vary', par.vary),
+                                                      ('expr', par.expr)) if value is not None})
+                for name, par in add_params.items())
+
+        result_dtype = self.get_batch_fit_dtype(fit_function)
+        traces = data.reshape(-1, x_axis.size)
+        num_traces = traces.shape[0]
+        if num_traces == 0:
+            return np.zeros(data.shape[:-1], dtype=result_dtype)
+
+        if not parallel or num_traces == 1:
+            results = _batch_fit_traces(self, x_axis, traces, fit_function, estimator, add_params,
+                                        warm_start, warm_start_tolerance, result_dtype)
+            return results.reshape(data.shape[:-1])
+
+        pool = self._get_batch_fit_pool()
+        if chunk_size is None:
+            # a few chunks per process for load balancing, but long enough for warm starts
+            chunk_size = max(1, int(np.ceil(num_traces / (4 * self._batch_fit_pool_size))))
+        tasks = [(x_axis, traces[start:start + chunk_size], fit_function, estimator, add_params,
+                  warm_start, warm_start_tolerance, result_dtype)
+                 for start in range(0, num_traces, chunk_size)]
+        results = np.concatenate(pool.map(_batch_fit_worker, tasks))
+        return results.reshape(data.shape[:-1])
 
     def validate_load_fits(self, fits):
         """ Take fit names and estimators from a dict and check if they are valid.
@@ -321,6 +570,12 @@ class FitContainer(QtCore.QObject):
         self.use_settings = None
         self.units = ['independent variable {0}'.format(i+1) for i in range(self.dim)]
         self.units.append('dependent variable')
+        # fit curve of the last fit and duration of the last fit in s
+        self.current_fit_x = np.array([])
+        self.current_fit_y = np.array([])
+        self.last_fit_duration = 0.0
+        # serializes fits from the logic thread and from a live fit worker
+        self._fit_lock = Mutex(recursive=True)
 
     def set_units(self, units):
         """ Set units for this fit.
@@ -354,6 +609,8 @@ class FitContainer(QtCore.QObject):
         """
         self.current_fit_param = lmfit.parameter.Parameters()
         self.current_fit_result = None
+        self.current_fit_x = np.array([])
+        self.current_fit_y = np.array([])
 
     @QtCore.Slot(dict)
     def set_fit_functions(self, fit_functions):
@@ -371,25 +628,26 @@ class FitContainer(QtCore.QObject):
         If the name given is not in the list of fits, the current fit will be 'No Fit'.
         This is a reserved name that will do nothing and should not display a fit line if set.
         """
-        if current_fit not in self.fit_list and current_fit != 'No Fit':
-            self.fit_logic.log.warning('{0} not in {1} fit list!'.format(current_fit, self.name))
-            self.current_fit = 'No Fit'
-        else:
-            self.current_fit = current_fit
-            if current_fit != 'No Fit':
-                use_settings = self.fit_list[self.current_fit]['use_settings']
-                self.use_settings = lmfit.parameter.Parameters()
-                # Update the use parameter dictionary
-                for para in use_settings:
-                    if use_settings[para]:
-                        self.use_settings[para]=self.fit_list[self.current_fit]['parameters'][para]
+        with self._fit_lock:
+            if current_fit not in self.fit_list and current_fit != 'No Fit':
+                self.fit_logic.log.warning('{0} not in {1} fit list!'.format(current_fit, self.name))
+                self.current_fit = 'No Fit'
             else:
-                self.use_settings=None
-        self.clear_result()
-        self.sigCurrentFit.emit(self.current_fit)
+                self.current_fit = current_fit
+                if current_fit != 'No Fit':
+                    use_settings = self.fit_list[self.current_fit]['use_settings']
+                    self.use_settings = lmfit.parameter.Parameters()
+                    # Update the use parameter dictionary
+                    for para in use_settings:
+                        if use_settings[para]:
+                            self.use_settings[para]=self.fit_list[self.current_fit]['parameters'][para]
+                else:
+                    self.use_settings=None
+            self.clear_result()
+            self.sigCurrentFit.emit(self.current_fit)
         return self.current_fit, self.use_settings
 
-    def do_fit(self, x_data, y_data):
+    def do_fit(self, x_data, y_data, start_params=None, time_budget=None):
         """Performs the chosen fit on the measured data.
         @param array x_data: optional, 1D np.array or 1D list with the x values.
                              If None is passed then the module x values are
@@ -398,6 +656,12 @@ class FitContainer(QtCore.QObject):
                              If None is passed then the module y values are
                              taken. If passed, then it should have the same size
                              as x_data.
+        @param lmfit.parameter.Parameters start_params: optional, start the fit from these
+                             parameter values (e.g. a previous result) instead of the values
+                             of the estimator. Parameters configured in use_settings still take
+                             precedence.
+        @param float time_budget: optional, abort the fit after this time in s and return the
+                             parameters reached so far.
 
         @return: tuple (fit_x, fit_y, str_dict, fit_result)
             np.array fit_x: 1D array containing the x values of the fit
@@ -415,50 +679,268 @@ class FitContainer(QtCore.QObject):
                             obtained from this object. If no fit is performed
                             then result is set to None.
         """
-        self.clear_result()
+        with self._fit_lock:
+            self.clear_result()
+            start_time = time.perf_counter()
+
+            fit_x = np.linspace(
+                start=x_data[0],
+                stop=x_data[-1],
+                num=int(len(x_data) * self.fit_granularity_fact))
+
+            # set the keyword arguments, which will be passed to the fit.
+            kwargs = {
+                'x_axis': x_data,
+                'data': y_data,
+                'units': self.units,
+                'add_params': self.use_settings}
+
+            result = None
+
+            if self.current_fit in self.fit_list:
+                estimator = self.fit_list[self.current_fit]['estimator']
+                if start_params is not None:
+                    estimator = self._warm_start_estimator(estimator, start_params)
+                if time_budget is not None:
+                    kwargs['iter_cb'] = self._time_budget_callback(start_time + time_budget)
+                result = self.fit_list[self.current_fit]['make_fit'](estimator=estimator,
+                                                                     **kwargs)
+
+            elif self.current_fit == 'No Fit':
+                fit_y = np.zeros(fit_x.shape)
 
-        fit_x = np.linspace(
-            start=x_data[0],
-            stop=x_data[-1],
-            num=int(len(x_data) * self.fit_granularity_fact))
+            else:
+                self.fit_logic.log.warning(
+                    'The Fit Function "{0}" is not implemented to be used in the ODMR Logic. '
+                    'Correct that! Fit Call will be skipped and Fit Function will be set to '
+                    '"No Fit".'.format(self.current_fit))
 
-        # set the keyword arguments, which will be passed to the fit.
-        kwargs = {
-            'x_axis': x_data,
-            'data': y_data,
-            'units': self.units,
-            'add_params': self.use_settings}
+                self.current_fit = 'No Fit'
 
-        result = None
+            if self.current_fit != 'No Fit':
+                # after the fit was performed, retrieve the fitting function and
+                # evaluate the fitted parameters according to the function:
+                model, params = self.fit_list[self.current_fit]['make_model']()
+                fit_y = model.eval(x=fit_x, params=result.params)
 
-        if self.current_fit in self.fit_list:
-            result = self.fit_list[self.current_fit]['make_fit'](
-                estimator=self.fit_list[self.current_fit]['estimator'],
-                **kwargs)
+            self.last_fit_duration = time.perf_counter() - start_time
 
-        elif self.current_fit == 'No Fit':
-            fit_y = np.zeros(fit_x.shape)
+            if result is not None:
+                self.current_fit_param = result.params
+                self.current_fit_result = result
+                self.current_fit_x = fit_x
+                self.current_fit_y = fit_y
+                self.sigNewFitParameters.emit(self.current_fit, result.params)
+                self.sigNewFitResult.emit(self.current_fit, result)
 
-        else:
-            self.fit_logic.log.warning(
-                'The Fit Function "{0}" is not implemented to be used in the ODMR Logic. '
-                'Correct that! Fit Call will be skipped and Fit Function will be set to '
-                '"No Fit".'.format(self.current_fit))
+        self.sigFitUpdated.emit()
 
-            self.current_fit = 'No Fit'
+        return fit_x, fit_y, result
 
-        if self.current_fit != 'No Fit':
-            # after the fit was performed, retrieve the fitting function and
-            # evaluate the fitted parameters according to the function:
-            model, params = self.fit_list[self.current_fit]['make_model']()
-            fit_y = model.eval(x=fit_x, params=result.params)
+    def do_live_fit(self, x_data, y_data, time_budget=None):
+        """ Refit data of a running measurement, starting from the previous fit result.
 
-        if result is not None:
-            self.current_fit_param = result.params
-            self.current_fit_result = result
-            self.sigNewFitParameters.emit(self.current_fit, result.params)
-            self.sigNewFitResult.emit(self.current_fit, result)
+        @param array x_data: 1D np.array with the x values
+        @param array y_data: 1D np.array with the y values
+        @param float time_budget: optional, maximal time in s spent on the fit
 
-        self.sigFitUpdated.emit()
+        @return: tuple (fit_x, fit_y, fit_result, refitted)
+            np.array fit_x, np.array fit_y, lmfit.model.ModelResult fit_result: see do_fit
+            bool refitted: False if the data changed less than the parameter uncertainties since
+                           the last fit and the previous result was returned
 
-        return fit_x, fit_y, result
+        If there is no previous result of the current fit for data of the same size, the fit is
+        started from the estimator as usual.
+        """
+        with self._fit_lock:
+            previous = self.current_fit_result
+            if (previous is not None and self.current_fit in self.fit_list
+                    and len(getattr(previous, 'data', ())) == len(y_data)):
+                if self._change_within_errors(previous, x_data, y_data):
+                    return self.current_fit_x, self.current_fit_y, previous, False
+                start_params = previous.params
+            else:
+                start_params = None
+            fit_x, fit_y, result = self.do_fit(x_data, y_data, start_params=start_params,
+                                               time_budget=time_budget)
+        return fit_x, fit_y, result, True
+
+    @staticmethod
+    def _warm_start_estimator(estimator, start_params):
+        """ Estimator using the values of start_params, but the bounds of the original estimator.
+
+        @param method estimator: estimator of the fit
+        @param lmfit.parameter.Parameters start_params: parameters to start from
+
+        @return function: estimator with the signature of the fit estimators
+        """
+        def warm_start_estimator(x_axis, data, params):
+            error, params = estimator(x_axis, data, params)
+            for name, param in params.items():
+                if name in start_params and not param.expr and param.vary:
+                    value = start_params[name].value
+                    if param.min is not None:
+                        value = max(value, param.min)
+                    if param.max is not None:
+                        value = min(value, param.max)
+                    param.value = value
+            return error, params
+        return warm_start_estimator
+
+    @staticmethod
+    def _time_budget_callback(deadline):
+        """ Iteration callback for lmfit aborting the fit after the deadline.
+
+        @param float deadline: time.perf_counter() value after which the fit is aborted
+
+        @return function: callback for the iter_cb argument of lmfit
+        """
+        def time_budget_callback(params, iteration, residual, *args, **kwargs):
+            return time.perf_counter() > deadline
+        return time_budget_callback
+
+    @staticmethod
+    def _change_within_errors(result, x_data, y_data):
+        """ Check if the parameters would change less than their uncertainties when fitting data.
+
+        @param lmfit.model.ModelResult result: previous fit result
+        @param array x_data: 1D np.array with the new x values
+        @param array y_data: 1D np.array with the new y values
+
+        @return bool: True if the linearized parameter change is smaller than the standard error
+                      of every varied parameter
+
+        The parameter change is estimated by one Gauss-Newton step from the previous result using
+        its covariance matrix, which costs one model evaluation per varied parameter instead of a
+        complete fit.
+        """
+        if not result.success or result.covar is None or result.redchi <= 0:
+            return False
+        names = result.var_names
+        errors = np.array([result.params[name].stderr for name in names], dtype=float)
+        if errors.size == 0 or not np.all(np.isfinite(errors)) or np.any(errors <= 0):
+            return False
+
+        x_data = np.asarray(x_data, dtype=float)
+        params = result.params.copy()
+        model_data = result.model.eval(params=params, x=x_data)
+        jacobian = np.empty((x_data.size, len(names)))
+        for index, name in enumerate(names):
+            value = params[name].value
+            step = max(abs(value) * 1e-6, errors[index] * 1e-3)
+            params[name].value = value + step
+            jacobian[:, index] = (result.model.eval(params=params, x=x_data) - model_data) / step
+            params[name].value = value
+        residual = np.asarray(y_data, dtype=float) - model_data
+        # the covariance of lmfit is scaled with the reduced chi^2
+        change = result.covar.dot(jacobian.T.dot(residual)) / result.redchi
+        return bool(np.all(np.abs(change) < errors))
+
+    def batch_fit(self, x_data, y_data, **kwargs):
+        """ Perform the chosen fit on many traces sharing the same x values at once.
+
+        @param array x_data: 1D np.array with the x values
+        @param array y_data: np.array with the traces along the last axis
+        @param kwargs: optional arguments of FitLogic.batch_fit, e.g. warm_start or parallel
+
+        @return numpy.ndarray: structured array with the results, see FitLogic.batch_fit.
+                               None if the current fit is 'No Fit'.
+
+        The fit parameters configured for this container are used for every trace. The result of
+        the last single fit of this container is not changed.
+        """
+        if self.current_fit not in self.fit_list:
+            return None
+        if self.dim != 1:
+            self.fit_logic.log.error('Batch fits are only available for 1D fits.')
+            return None
+        fit = self.fit_list[self.current_fit]
+        return self.fit_logic.batch_fit(x_data, y_data,
+                                        fit_function=fit['fit_name'],
+                                        estimator=fit['est_name'],
+                                        add_params=self.use_settings,
+                                        **kwargs)
+
+
+class LiveFitWorker(QtCore.QObject):
+    """ Refits the data of a running measurement with a fit container in a separate thread.
+
+    The measurement passes its current data with request_fit and never waits for the fit. Requests
+    arriving while a fit is running are coalesced, afterwards only the newest data is fitted. Each
+    fit starts from the previous result and is skipped if the data changed less than the parameter
+    uncertainties (see FitContainer.do_live_fit).
+    """
+    # fit x values, fit y values, fit result (lmfit.model.ModelResult)
+    sigFitUpdated = QtCore.Signal(np.ndarray, np.ndarray, object)
+    _sigFitRequested = QtCore.Signal()
+
+    def __init__(self, fit_container, time_budget=None):
+        """ Create a live fit worker and start its thread.
+
+        @param FitContainer fit_container: fit container used for the fits
+        @param float time_budget: optional, maximal time in s spent on a single fit update
+        """
+        super().__init__()
+        self.fit_container = fit_container
+        self.time_budget = time_budget
+        self.fit_count = 0
+        self.skipped_count = 0
+        self._pending_data = None
+        self._lock = Mutex()
+
+        self._thread = QtCore.QThread()
+        self._thread.setObjectName('live_fit_{0}'.format(fit_container.name))
+        self.moveToThread(self._thread)
+        self._sigFitRequested.connect(self._fit_pending_data, QtCore.Qt.QueuedConnection)
+        self._thread.start()
+
+    @property
+    def last_fit_duration(self):
+        """ Duration of the last fit in s. """
+        return self.fit_container.last_fit_duration
+
+    def request_fit(self, x_data, y_data):
+        """ Request a fit of new data. Returns immediately.
+
+        @param array x_data: 1D np.array with the x values
+        @param array y_data: 1D np.array with the y values
+        """
+        with self._lock:
+            request_pending = self._pending_data is not None
+            self._pending_data = (np.array(x_data, dtype=float), np.array(y_data, dtype=float))
+        if not request_pending:
+            self._sigFitRequested.emit()
+
+    def reset(self):
+        """ Discard pending data and the previous result, the next fit starts from the estimator.
+        """
+        with self._lock:
+            self._pending_data = None
+        self.fit_container.clear_result()
+
+    def stop(self):
+        """ Discard pending data and stop the worker thread. """
+        with self._lock:
+            self._pending_data = None
+        self._thread.quit()
+        self._thread.wait()
+
+    @QtCore.Slot()
+    def _fit_pending_data(self):
+        with self._lock:
+            data = self._pending_data
+            self._pending_data = None
+        if data is None or self.fit_container.current_fit == 'No Fit':
+            return
+        try:
+            fit_x, fit_y, result, refitted = self.fit_container.do_live_fit(
+                data[0], data[1], time_budget=self.time_budget)
+        except Exception:
+            self.fit_container.fit_logic.log.exception('Live fit failed.')
+            return
+        if not refitted:
+            self.skipped_count += 1
+            return
+        self.fit_count += 1
+        if result is not None:
+            self.sigFitUpdated.emit(fit_x, fit_y, result)
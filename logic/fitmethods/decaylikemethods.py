@@ -191,12 +191,13 @@ def make_decayexponential_fit(self, x_axis, data, estimator, units=None, add_par
 
     params = self._substitute_params(initial_params=params,
                                      update_params=add_params)
+    params = self._refine_params_analytically('decayexponential', x_axis, data, params)
     try:
         result = exponentialdecay.fit(data, x=x_axis, params=params, **kwargs)
-    except:
-        result = exponentialdecay.fit(data, x=x_axis, params=params, **kwargs)
+    except Exception as e:
         self.log.warning('The exponentialdecay with offset fit did not work. '
-                       'Message: {}'.format(str(result.message)))
+                       'Message: {}'.format(str(e)))
+        raise
 
 
     if units is None:
@@ -0,0 +1,409 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains a fast fit of 2D and 3D gaussians on regular grids, which is
+imported by class FitLogic.
+
+The lmfit 2D gaussian fit builds the model and the flattened meshgrids on every
+call and estimates the Jacobian by finite differences. For the refocus images
+of the optimizer and for many POI images of one confocal scan, the gaussians
+are fitted here by a bounded Levenberg-Marquardt least squares fit with the
+analytic Jacobian on a precomputed pixel grid instead. All images of a batch
+are fitted at once with vectorized numpy operations. The start values are the
+moments of the image above its background.
+
+The returned GaussianFitResult provides success, best_values, params (with
+stderr), chisqr and redchi like the lmfit ModelResult, with the same parameter
+names as make_twoDgaussian_model.
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+from lmfit import Parameters
+
+
+# pixel grids of the fitted image shapes, see _gaussian_fit_grid
+_gaussian_fit_grids = OrderedDict()
+
+
+class GaussianFitResult:
+    """ Result of fast_gaussian_fit with the attributes of the lmfit ModelResult used in qudi.
+
+    @param list names: parameter names
+    @param numpy.ndarray values: best values of the parameters
+    @param numpy.ndarray errors: standard errors of the parameters
+    @param bool success: whether the fit converged
+    @param float chisqr: sum of the squared residuals
+    @param int nfree: number of data points minus number of parameters
+    @param int nfev: number of model evaluations
+    """
+
+    def __init__(self, names, values, errors, success, chisqr, nfree, nfev):
+        self.best_values = OrderedDict(zip(names, (float(value) for value in values)))
+        self.errors = OrderedDict(zip(names, (float(error) for error in errors)))
+        self.success = bool(success)
+        self.chisqr = float(chisqr)
+        self.nfree = int(nfree)
+        self.redchi = self.chisqr / max(self.nfree, 1)
+        self.nfev = int(nfev)
+        self.message = 'Fit converged.' if self.success else 'Fit did not converge.'
+        self._params = None
+
+    @property
+    def params(self):
+        """ lmfit Parameters with value and stderr, created on first access. """
+        if self._params is None:
+            self._params = Parameters()
+            for name, value in self.best_values.items():
+                self._params.add(name, value=value)
+                self._params[name].stderr = self.errors[name]
+        return self._params
+
+
+def _gaussian_fit_grid(self, shape, ratios):
+    """ Pixel grid of an image shape with the given step ratios, cached for the next fits.
+
+    @param tuple shape: image shape, (y, x) or (z, y, x)
+    @param tuple ratios: step of every axis (x, y[, z]) in units of the x step
+
+    @return numpy.ndarray: coordinates (x, y[, z]) of the pixels with shape (pixels, dimensions)
+    """
+    key = (tuple(shape), tuple(ratios))
+    grid = _gaussian_fit_grids.get(key)
+    if grid is None:
+        indices = np.meshgrid(*(np.arange(n) for n in shape), indexing='ij')[::-1]
+        grid = np.stack([index.ravel() * ratio for index, ratio in zip(indices, ratios)], axis=1)
+        _gaussian_fit_grids[key] = grid
+        if len(_gaussian_fit_grids) > 16:
+            _gaussian_fit_grids.popitem(last=False)
+    return grid
+
+
+def _gaussian_values_jacobian(self, grid, params, rotation):
+    """ Gaussians with offset on a grid and their Jacobian.
+
+    @param numpy.ndarray grid: pixel coordinates with shape (pixels, dimensions)
+    @param numpy.ndarray params: parameters with shape (images, parameters) in the order
+                                 amplitude, centers, sigmas, [theta,] offset
+    @param bool rotation: whether the 2D gaussian is rotated by theta as in make_twoDgaussian_model
+
+    @return tuple(numpy.ndarray, numpy.ndarray): values with shape (images, pixels) and the
+                                                 Jacobian with shape (images, pixels, parameters)
+    """
+    dim = grid.shape[1]
+    amplitude = params[:, 0:1]
+    center = params[:, 1:1 + dim]
+    sigma = params[:, 1 + dim:1 + 2 * dim]
+    offset = params[:, -1:]
+    delta = grid[np.newaxis, :, :] - center[:, np.newaxis, :]
+    jacobian = np.empty((params.shape[0], grid.shape[0], params.shape[1]))
+
+    if rotation:
+        u, v = delta[..., 0], delta[..., 1]
+        sigma_x, sigma_y = sigma[:, 0:1], sigma[:, 1:2]
+        theta = params[:, 2 * dim + 1:2 * dim + 2]
+        cos2, sin2 = np.cos(theta) ** 2, np.sin(theta) ** 2
+        sin_2t, cos_2t = np.sin(2 * theta), np.cos(2 * theta)
+        a = cos2 / (2 * sigma_x ** 2) + sin2 / (2 * sigma_y ** 2)
+        b = -sin_2t / (4 * sigma_x ** 2) + sin_2t / (4 * sigma_y ** 2)
+        c = sin2 / (2 * sigma_x ** 2) + cos2 / (2 * sigma_y ** 2)
+        uu, uv, vv = u ** 2, 2 * u * v, v ** 2
+        shape = np.exp(-(a * uu + b * uv + c * vv))
+        scaled = amplitude * shape
+        # derivatives of the exponent by a, b and c for sigma_x, sigma_y and theta
+        inverse_difference = 1 / sigma_y ** 2 - 1 / sigma_x ** 2
+        jacobian[..., 1] = scaled * (2 * a * u + 2 * b * v)
+        jacobian[..., 2] = scaled * (2 * b * u + 2 * c * v)
+        jacobian[..., 3] = scaled * (cos2 * uu - sin_2t / 2 * uv + sin2 * vv) / sigma_x ** 3
+        jacobian[..., 4] = scaled * (sin2 * uu + sin_2t / 2 * uv + cos2 * vv) / sigma_y ** 3
+        jacobian[..., 5] = -scaled * inverse_difference / 2 * (sin_2t * uu + cos_2t * uv
+                                                               - sin_2t * vv)
+    else:
+        normalized = delta / sigma[:, np.newaxis, :]
+        shape = np.exp(-0.5 * np.sum(normalized ** 2, axis=2))
+        scaled = amplitude * shape
+        jacobian[..., 1:1 + dim] = scaled[..., np.newaxis] * normalized / sigma[:, np.newaxis, :]
+        jacobian[..., 1 + dim:1 + 2 * dim] = (scaled[..., np.newaxis] * normalized ** 2
+                                              / sigma[:, np.newaxis, :])
+    jacobian[..., 0] = shape
+    jacobian[..., -1] = 1
+    return scaled + offset, jacobian
+
+
+def _estimate_gaussians_from_moments(self, grid, data, rotation):
+    """ Start values of the gaussians from the moments of the data above the background.
+
+    @param numpy.ndarray grid: pixel coordinates with shape (pixels, dimensions)
+    @param numpy.ndarray data: images with shape (images, pixels)
+    @param bool rotation: whether theta is estimated too
+
+    @return numpy.ndarray: parameters with shape (images, parameters)
+    """
+    offset = np.percentile(data, 10, axis=1)
+    weights = np.clip(data - offset[:, np.newaxis], 0, None)
+    total = weights.sum(axis=1)
+    # flat images get the uniform weights
+    weights[total <= 0] = 1
+    total[total <= 0] = data.shape[1]
+
+    center = weights.dot(grid) / total[:, np.newaxis]
+    variance = np.clip(weights.dot(grid ** 2) / total[:, np.newaxis] - center ** 2, 0, None)
+    amplitude = data.max(axis=1) - offset
+    columns = [amplitude[:, np.newaxis], center]
+    if rotation:
+        covariance = weights.dot(grid[:, 0] * grid[:, 1]) / total - center[:, 0] * center[:, 1]
+        mean = 0.5 * (variance[:, 0] + variance[:, 1])
+        radius = np.sqrt((0.5 * (variance[:, 0] - variance[:, 1])) ** 2 + covariance ** 2)
+        # sigma_x is along the direction -theta, see make_twoDgaussian_model
+        angle = 0.5 * np.arctan2(2 * covariance, variance[:, 0] - variance[:, 1])
+        columns.append(np.sqrt(np.stack((mean + radius, np.clip(mean - radius, 0, None)), 1)))
+        columns.append(np.mod(-angle, np.pi)[:, np.newaxis])
+    else:
+        columns.append(np.sqrt(variance))
+    columns.append(offset[:, np.newaxis])
+    return np.hstack(columns)
+
+
+def _fit_gaussians(self, grid, data, start, lower, upper, rotation, max_iterations=100,
+                   tolerance=1e-10):
+    """ Bounded Levenberg-Marquardt fit of gaussians to many images at once.
+
+    @param numpy.ndarray grid: pixel coordinates with shape (pixels, dimensions)
+    @param numpy.ndarray data: images with shape (images, pixels)
+    @param numpy.ndarray start: start parameters with shape (images, parameters)
+    @param numpy.ndarray lower: lower bounds of the parameters, the same for all images
+    @param numpy.ndarray upper: upper bounds of the parameters, the same for all images
+    @param bool rotation: whether the 2D gaussians are rotated by theta
+    @param int max_iterations: maximal number of iterations
+    @param float tolerance: relative decrease of the squared residuals at convergence
+
+    @return tuple: parameters, their standard errors, sum of squared residuals, success and number
+                   of model evaluations of every image
+
+    The steps are solved in the coordinates scaled by the diagonal of the normal matrix
+    (Marquardt's scaling) and projected onto the bounds. Theta is wrapped into [0, pi).
+    """
+    theta_index = 2 * grid.shape[1] + 1 if rotation else None
+
+    def project(params):
+        if rotation:
+            params[:, theta_index] = np.mod(params[:, theta_index], np.pi)
+        return np.clip(params, lower, upper)
+
+    params = project(start.copy())
+    images, num_params = params.shape
+    values, jacobian = self._gaussian_values_jacobian(grid, params, rotation)
+    residual = data - values
+    cost = np.sum(residual ** 2, axis=1)
+    damping = np.full(images, 1e-3)
+    active = np.isfinite(cost)
+    success = np.zeros(images, dtype=bool)
+    nfev = np.ones(images, dtype=int)
+    diagonal = np.arange(num_params)
+
+    with np.errstate(all='ignore'):
+        for iteration in range(max_iterations):
+            indices = np.flatnonzero(active)
+            if indices.size == 0:
+                break
+            jac = jacobian[indices]
+            normal = np.einsum('ipk,ipl->ikl', jac, jac)
+            gradient = np.einsum('ipk,ip->ik', jac, residual[indices])
+            scale = np.sqrt(normal[:, diagonal, diagonal])
+            scale[~(scale > 0)] = 1
+            scaled_normal = normal / (scale[:, :, np.newaxis] * scale[:, np.newaxis, :])
+            scaled_normal[:, diagonal, diagonal] += damping[indices, np.newaxis]
+            try:
+                step = np.linalg.solve(scaled_normal, (gradient / scale)[..., np.newaxis])
+            except np.linalg.LinAlgError:
+                step = np.matmul(np.linalg.pinv(scaled_normal), (gradient / scale)[..., np.newaxis])
+            new_params = project(params[indices] + step[..., 0] / scale)
+
+            new_values, new_jacobian = self._gaussian_values_jacobian(grid, new_params, rotation)
+            new_residual = data[indices] - new_values
+            new_cost = np.sum(new_residual ** 2, axis=1)
+            nfev[indices] += 1
+
+            better = new_cost < cost[indices]
+            accepted = indices[better]
+            converged = np.zeros(indices.size, dtype=bool)
+            converged[better] = (cost[accepted] - new_cost[better]
+                                 <= tolerance * cost[accepted])
+            params[accepted] = new_params[better]
+            values[accepted] = new_values[better]
+            jacobian[accepted] = new_jacobian[better]
+            residual[accepted] = new_residual[better]
+            cost[accepted] = new_cost[better]
+            damping[accepted] = np.maximum(damping[accepted] / 10, 1e-12)
+            damping[indices[~better]] *= 10
+
+            # no step improves the fit anymore, i.e. the minimum within the bounds is reached
+            converged |= damping[indices] > 1e10
+            success[indices[converged]] = True
+            active[indices[converged]] = False
+
+    # covariance as in lmfit, scaled by the reduced chi square
+    nfree = max(data.shape[1] - num_params, 1)
+    normal = np.einsum('ipk,ipl->ikl', jacobian, jacobian)
+    with np.errstate(all='ignore'):
+        covariance = np.linalg.pinv(normal) * (cost / nfree)[:, np.newaxis, np.newaxis]
+        errors = np.sqrt(np.abs(covariance[:, diagonal, diagonal]))
+    success &= np.all(np.isfinite(params), axis=1)
+    return params, errors, cost, success, nfev
+
+
+def _prepare_gaussian_fit(self, axes, shape):
+    """ Grid, bounds and conversion to physical units of the gaussians on regular axes.
+
+    @param tuple axes: evenly spaced 1D axes (x, y[, z])
+    @param tuple shape: image shape, (y, x) or (z, y, x)
+
+    @return tuple: names, grid, lower and upper bounds in grid units, origin of the grid and the
+                   unit of the grid
+    """
+    axes = [np.asarray(axis, dtype=float) for axis in axes]
+    if len(axes) not in (2, 3):
+        raise ValueError('Gaussian fit needs 2 or 3 axes, not {0}.'.format(len(axes)))
+    if tuple(shape) != tuple(axis.size for axis in reversed(axes)):
+        raise ValueError('Image shape {0} does not match the axes {1}.'.format(
+            tuple(shape), tuple(axis.size for axis in reversed(axes))))
+    if any(axis.size < 2 for axis in axes):
+        raise ValueError('Gaussian fit needs at least 2 points along every axis.')
+
+    dim = len(axes)
+    steps = np.array([(axis[-1] - axis[0]) / (axis.size - 1) for axis in axes])
+    unit = steps[0]
+    if np.any(steps == 0):
+        raise ValueError('Axes of the gaussian fit must not have zero length.')
+    ratios = steps / unit
+    grid = self._gaussian_fit_grid(shape, tuple(ratios))
+    spans = np.abs(ratios) * (np.array([axis.size for axis in axes]) - 1)
+
+    labels = 'xyz'[:dim]
+    names = (['amplitude'] + ['center_' + l for l in labels] + ['sigma_' + l for l in labels]
+             + (['theta'] if dim == 2 else []) + ['offset'])
+    # same bounds as the lmfit estimators: centers within the axes extended by their span,
+    # sigmas between one step and three times the span
+    grid_min, grid_max = grid.min(axis=0), grid.max(axis=0)
+    lower = np.concatenate(([0], grid_min - spans, np.abs(ratios), [0] if dim == 2 else [],
+                            [-np.inf]))
+    upper = np.concatenate(([np.inf], grid_max + spans, 3 * spans, [np.pi] if dim == 2 else [],
+                            [np.inf]))
+    origin = np.array([axis[0] for axis in axes])
+    return names, grid, lower, upper, origin, unit
+
+
+def _gaussian_results(self, names, dim, params, errors, cost, success, nfev, origins, unit,
+                      nfree):
+    """ GaussianFitResults in physical units from the parameters in grid units. """
+    scale = np.ones(params.shape[1])
+    scale[1:1 + 2 * dim] = np.abs(unit)
+    params = params * scale
+    params[:, 1:1 + dim] = params[:, 1:1 + dim] * np.sign(unit) + origins
+    errors = errors * scale
+    return [GaussianFitResult(names, params[i], errors[i], success[i], cost[i], nfree, nfev[i])
+            for i in range(params.shape[0])]
+
+
+def fast_gaussian_fit(self, axes, data, max_iterations=100):
+    """ Fit a 2D or 3D gaussian with offset to an image on a regular grid.
+
+    @param tuple axes: evenly spaced 1D axes (x_axis, y_axis[, z_axis])
+    @param numpy.ndarray data: image of shape (len(y_axis), len(x_axis)) for 2D or
+                               (len(z_axis), len(y_axis), len(x_axis)) for 3D, or flattened
+    @param int max_iterations: maximal number of Levenberg-Marquardt iterations
+
+    @return GaussianFitResult: the parameters and errors are named like in
+                               make_twoDgaussian_model (amplitude, center_x, center_y, sigma_x,
+                               sigma_y, theta, offset). The 3D gaussian is not rotated and has the
+                               parameters amplitude, center_x/y/z, sigma_x/y/z and offset.
+    """
+    shape = tuple(np.asarray(axis).size for axis in reversed(axes))
+    data = np.asarray(data, dtype=float).reshape(shape)
+    return self.batch_gaussian_fit(axes, data[np.newaxis], max_iterations=max_iterations)[0]
+
+
+def batch_gaussian_fit(self, axes, data, origins=None, max_iterations=100):
+    """ Fit 2D or 3D gaussians with offset to many images with the same grid at once.
+
+    @param tuple axes: evenly spaced 1D axes (x_axis, y_axis[, z_axis]) of all images
+    @param numpy.ndarray data: images with shape (images, len(y_axis), len(x_axis)) for 2D or
+                               (images, len(z_axis), len(y_axis), len(x_axis)) for 3D
+    @param numpy.ndarray origins: optional, shift of the axes of every image with shape
+                                  (images, dimensions), e.g. the positions of the POIs
+    @param int max_iterations: maximal number of Levenberg-Marquardt iterations
+
+    @return list(GaussianFitResult): results of the images, see fast_gaussian_fit
+    """
+    data = np.asarray(data, dtype=float)
+    dim = len(axes)
+    names, grid, lower, upper, origin, unit = self._prepare_gaussian_fit(axes, data.shape[1:])
+    images = data.reshape(data.shape[0], -1)
+    if images.shape[0] == 0:
+        return list()
+    origins = origin if origins is None else origin + np.asarray(origins, dtype=float)
+    origins = np.broadcast_to(origins, (images.shape[0], dim))
+
+    rotation = dim == 2
+    start = self._estimate_gaussians_from_moments(grid, images, rotation)
+    params, errors, cost, success, nfev = self._fit_gaussians(
+        grid, images, start, lower, upper, rotation, max_iterations=max_iterations)
+    return self._gaussian_results(names, dim, params, errors, cost, success, nfev, origins, unit,
+                                  images.shape[1] - params.shape[1])
+
+
+def fit_gaussian_spots(self, image, x_axis, y_axis, positions, size, max_iterations=100):
+    """ Fit 2D gaussians to the surroundings of many positions in one image at once.
+
+    @param numpy.ndarray image: image of shape (len(y_axis), len(x_axis)), e.g. a confocal xy scan
+    @param numpy.ndarray x_axis: evenly spaced x axis of the image
+    @param numpy.ndarray y_axis: evenly spaced y axis of the image
+    @param positions: iterable of positions (x, y, ...), e.g. of POIs
+    @param float size: edge length of the fitted square around every position
+    @param int max_iterations: maximal number of Levenberg-Marquardt iterations
+
+    @return list(GaussianFitResult): results for the positions, None for positions whose square
+                                     is not completely inside the image
+    """
+    image = np.asarray(image, dtype=float)
+    x_axis = np.asarray(x_axis, dtype=float)
+    y_axis = np.asarray(y_axis, dtype=float)
+    x_step = (x_axis[-1] - x_axis[0]) / (x_axis.size - 1)
+    y_step = (y_axis[-1] - y_axis[0]) / (y_axis.size - 1)
+    half_x = max(1, int(round(0.5 * size / abs(x_step))))
+    half_y = max(1, int(round(0.5 * size / abs(y_step))))
+
+    corners = list()
+    for position in positions:
+        column = int(round((position[0] - x_axis[0]) / x_step)) - half_x
+        row = int(round((position[1] - y_axis[0]) / y_step)) - half_y
+        inside = (0 <= column and column + 2 * half_x < x_axis.size
+                  and 0 <= row and row + 2 * half_y < y_axis.size)
+        corners.append((row, column) if inside else None)
+
+    valid = [corner for corner in corners if corner is not None]
+    if not valid:
+        return [None] * len(corners)
+    sub_images = np.stack([image[row:row + 2 * half_y + 1, column:column + 2 * half_x + 1]
+                           for row, column in valid])
+    origins = np.array([(column * x_step, row * y_step) for row, column in valid])
+    sub_axes = (x_axis[:2 * half_x + 1], y_axis[:2 * half_y + 1])
+    results = iter(self.batch_gaussian_fit(sub_axes, sub_images, origins=origins,
+                                           max_iterations=max_iterations))
+    return [None if corner is None else next(results) for corner in corners]
@@ -324,11 +324,13 @@ def make_gaussian_fit(self, x_axis, data, estimator, units=None, add_params=None
 
     params = self._substitute_params(initial_params=params,
                                      update_params=add_params)
+    params = self._refine_params_analytically('gaussian', x_axis, data, params)
     try:
         result = mod_final.fit(data, x=x_axis, params=params, **kwargs)
-    except:
+    except Exception as e:
         self.log.warning('The 1D gaussian peak fit did not work. Error '
-                       'message: {0}\n'.format(result.message))
+                       'message: {0}\n'.format(e))
+        raise
 
     if units is None:
             units = ['arb. unit', 'arb. unit']
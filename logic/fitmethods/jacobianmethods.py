@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains analytic Jacobians of the most common fit models, which are
+imported by class FitLogic.
+
+The lmfit fits estimate the Jacobian by finite differences, i.e. every step of
+the optimizer costs one model evaluation per varying parameter. For the
+Lorentzian, Gaussian, sine and exponential decay models with offset the
+derivatives are known in closed form. The estimated start values of these fits
+are therefore refined by scipy's least_squares using the analytic Jacobian
+first, so the subsequent lmfit fit (which still provides the result object,
+the errors and the derived parameters) starts next to the optimum and only
+needs a few iterations.
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+
+import numpy as np
+
+
+############################################################################
+#                                                                          #
+#                   Model functions with analytic Jacobian                 #
+#                                                                          #
+############################################################################
+
+def _lorentzian_jacobian(self, x, amplitude, center, sigma, offset):
+    """ Lorentzian with offset as in make_lorentzian_model and its Jacobian.
+
+    @param numpy.array x: 1D axis values
+    @param float amplitude: amplitude of the lorentzian
+    @param float center: center of the lorentzian
+    @param float sigma: half width at half maximum
+    @param float offset: constant offset
+
+    @return tuple(numpy.array, numpy.array): function values and Jacobian with
+                                             one column per parameter
+    """
+    delta = x - center
+    denominator = delta ** 2 + sigma ** 2
+    shape = sigma ** 2 / denominator
+
+    jacobian = np.empty((x.size, 4))
+    jacobian[:, 0] = shape
+    jacobian[:, 1] = 2 * amplitude * sigma ** 2 * delta / denominator ** 2
+    jacobian[:, 2] = 2 * amplitude * sigma * delta ** 2 / denominator ** 2
+    jacobian[:, 3] = 1
+    return amplitude * shape + offset, jacobian
+
+
+def _gaussian_jacobian(self, x, amplitude, center, sigma, offset):
+    """ Gaussian with offset as in make_gaussian_model and its Jacobian.
+
+    @param numpy.array x: 1D axis values
+    @param float amplitude: amplitude of the gaussian
+    @param float center: center of the gaussian
+    @param float sigma: standard deviation
+    @param float offset: constant offset
+
+    @return tuple(numpy.array, numpy.array): function values and Jacobian with
+                                             one column per parameter
+    """
+    delta = x - center
+    shape = np.exp(-delta ** 2 / (2 * sigma ** 2))
+
+    jacobian = np.empty((x.size, 4))
+    jacobian[:, 0] = shape
+    jacobian[:, 1] = amplitude * shape * delta / sigma ** 2
+    jacobian[:, 2] = amplitude * shape * delta ** 2 / sigma ** 3
+    jacobian[:, 3] = 1
+    return amplitude * shape + offset, jacobian
+
+
+def _sine_jacobian(self, x, amplitude, frequency, phase, offset):
+    """ Sine with offset as in make_sine_model and its Jacobian.
+
+    @param numpy.array x: 1D axis values
+    @param float amplitude: amplitude of the sine
+    @param float frequency: frequency of the sine
+    @param float phase: phase of the sine
+    @param float offset: constant offset
+
+    @return tuple(numpy.array, numpy.array): function values and Jacobian with
+                                             one column per parameter
+    """
+    argument = 2 * np.pi * frequency * x + phase
+    sine = np.sin(argument)
+    cosine = np.cos(argument)
+
+    jacobian = np.empty((x.size, 4))
+    jacobian[:, 0] = sine
+    jacobian[:, 1] = 2 * np.pi * amplitude * x * cosine
+    jacobian[:, 2] = amplitude * cosine
+    jacobian[:, 3] = 1
+    return amplitude * sine + offset, jacobian
+
+
+def _decayexponential_jacobian(self, x, amplitude, lifetime, offset):
+    """ Exponential decay with offset as in make_decayexponential_model and its
+        Jacobian.
+
+    @param numpy.array x: 1D axis values
+    @param float amplitude: amplitude of the decay
+    @param float lifetime: lifetime of the decay
+    @param float offset: constant offset
+
+    @return tuple(numpy.array, numpy.array): function values and Jacobian with
+                                             one column per parameter
+    """
+    decay = np.exp(-x / lifetime)
+
+    jacobian = np.empty((x.size, 3))
+    jacobian[:, 0] = decay
+    jacobian[:, 1] = amplitude * decay * x / lifetime ** 2
+    jacobian[:, 2] = 1
+    return amplitude * decay + offset, jacobian
+
+
+############################################################################
+#                                                                          #
+#                    Refinement of the estimated parameters                #
+#                                                                          #
+############################################################################
+
+def _refine_params_analytically(self, fit_name, x_axis, data, params):
+    """ Refine estimated parameters by a least squares fit with analytic Jacobian.
+
+    @param str fit_name: name of the fit, one of 'lorentzian', 'gaussian',
+                         'sine' or 'decayexponential'
+    @param numpy.array x_axis: 1D axis values
+    @param numpy.array data: 1D data, should have the same dimension as x_axis.
+    @param lmfit.parameter.Parameters params: estimated (and substituted)
+                                              parameters of the fit
+
+    @return lmfit.parameter.Parameters: parameters with refined values
+
+    Fixed parameters and bounds are respected. If one of the model parameters
+    is constrained by an expression or the refinement does not improve the
+    residual, the parameters are returned as they are.
+    """
+    if not getattr(self, '_analytic_jacobian', True):
+        return params
+
+    if fit_name == 'lorentzian':
+        names = ('amplitude', 'center', 'sigma', 'offset')
+        function = self._lorentzian_jacobian
+    elif fit_name == 'gaussian':
+        names = ('amplitude', 'center', 'sigma', 'offset')
+        function = self._gaussian_jacobian
+    elif fit_name == 'sine':
+        names = ('amplitude', 'frequency', 'phase', 'offset')
+        function = self._sine_jacobian
+    elif fit_name == 'decayexponential':
+        # only the single exponential decay has an analytic Jacobian here
+        if 'beta' in params and (params['beta'].vary or params['beta'].value != 1):
+            return params
+        names = ('amplitude', 'lifetime', 'offset')
+        function = self._decayexponential_jacobian
+    else:
+        return params
+
+    if any(name not in params or params[name].expr for name in names):
+        return params
+
+    x_axis = np.asarray(x_axis, dtype=float)
+    data = np.asarray(data, dtype=float)
+    values = np.array([params[name].value for name in names], dtype=float)
+    lower = np.array([-np.inf if params[name].min is None else params[name].min for name in names])
+    upper = np.array([np.inf if params[name].max is None else params[name].max for name in names])
+    vary = np.array([params[name].vary for name in names]) & (lower < upper)
+    if not vary.any() or not np.all(np.isfinite(values)) or x_axis.size <= np.count_nonzero(vary):
+        return params
+
+    def residual(varied_values):
+        full_values = values.copy()
+        full_values[vary] = varied_values
+        return function(x_axis, *full_values)[0] - data
+
+    def jacobian(varied_values):
+        full_values = values.copy()
+        full_values[vary] = varied_values
+        return function(x_axis, *full_values)[1][:, vary]
+
+    # imported here, FitLogic would import a module level function as a fit method
+    from scipy.optimize import least_squares
+
+    start_values = np.clip(values[vary], lower[vary], upper[vary])
+    try:
+        with np.errstate(all='ignore'):
+            start_cost = 0.5 * np.sum(residual(start_values) ** 2)
+            result = least_squares(residual, start_values, jac=jacobian,
+                                   bounds=(lower[vary], upper[vary]), x_scale='jac')
+    except (ValueError, ArithmeticError) as e:
+        self.log.debug('Refinement of the {0} fit parameters failed: {1}'.format(fit_name, e))
+        return params
+
+    if result.status > 0 and np.all(np.isfinite(result.x)) and result.cost < start_cost:
+        for name, value in zip(np.array(names)[vary], result.x):
+            params[name].value = value
+    return params
@@ -305,12 +305,13 @@ def make_lorentzian_fit(self, x_axis, data, estimator, units=None,
 
     params = self._substitute_params(initial_params=params,
                                      update_params=add_params)
+    params = self._refine_params_analytically('lorentzian', x_axis, data, params)
     try:
         result = model.fit(data, x=x_axis, params=params, **kwargs)
-    except:
-        result = model.fit(data, x=x_axis, params=params, **kwargs)
+    except Exception as e:
         self.log.warning('The 1D lorentzian fit did not work. Error '
-                         'message: {0}\n'.format(result.message))
+                         'message: {0}\n'.format(e))
+        raise
 
     # Write the parameters to allow human-readable output to be generated
     result_str_dict = OrderedDict()
@@ -593,12 +593,13 @@ def make_sine_fit(self, x_axis, data, estimator, units=None, add_params=None, **
 
     params = self._substitute_params(initial_params=params,
                                      update_params=add_params)
+    params = self._refine_params_analytically('sine', x_axis, data, params)
     try:
         result = sine.fit(data, x=x_axis, params=params, **kwargs)
-    except:
-        result = sine.fit(data, x=x_axis, params=params, **kwargs)
+    except Exception as e:
         self.log.error('The sine fit did not work.\n'
-                       'Error message: {0}\n'.format(result.message))
+                       'Error message: {0}\n'.format(e))
+        raise
 
     if units is None:
         units = ['arb. unit', 'arb. unit']
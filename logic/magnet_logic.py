@@ -25,9 +25,11 @@ import numpy as np
 import time
 
 from collections import OrderedDict
+from concurrent.futures import CancelledError, TimeoutError
 from core.connector import Connector
 from core.statusvariable import StatusVar
 from logic.generic_logic import GenericLogic
+from logic.motion_watcher import MotionWatcher
 from qtpy import QtCore
 from interface.slow_counter_interface import CountingMode
 
@@ -82,6 +84,9 @@ class MagnetLogic(GenericLogic):
     align_2d_axis1_step = StatusVar('align_2d_axis1_step', 1e-3)
     align_2d_axis1_vel = StatusVar('align_2d_axis1_vel', 10e-6)
     curr_2d_pathway_mode = StatusVar('curr_2d_pathway_mode', 'snake-wise')
+    # settings of the 'adaptive' pathway mode:
+    align_2d_adaptive_coarse_points = StatusVar('align_2d_adaptive_coarse_points', 5)
+    align_2d_adaptive_maximize = StatusVar('align_2d_adaptive_maximize', True)
 
     _checktime = StatusVar('_checktime', 2.5)
     _1D_axis0_data = StatusVar('_1D_axis0_data', default=np.arange(3))
@@ -144,6 +149,7 @@ class MagnetLogic(GenericLogic):
     _sigStepwiseAlignmentNext = QtCore.Signal()
     _sigContinuousAlignmentNext = QtCore.Signal()
     _sigInitializeMeasPos = QtCore.Signal(bool)  # signal to go to the initial measurement position
+    _sigAlignmentReturned = QtCore.Signal()  # magnet is back at the position before the alignment
     sigPosReached = QtCore.Signal()
 
     # signals if new data are writen to the data arrays (during measurement):
@@ -183,6 +189,7 @@ class MagnetLogic(GenericLogic):
         super().__init__(config=config, **kwargs)
 
         self._stop_measure = False
+        self._alignment_meas_prepared = False
 
     def on_activate(self):
         """ Definition and initialisation of the GUI.
@@ -210,13 +217,23 @@ class MagnetLogic(GenericLogic):
         self.sigAbort.connect(self._magnet_device.abort)
         self.sigVelChanged.connect(self._magnet_device.set_velocity)
 
+        # the movements during the alignment are watched in a separate thread,
+        # the position is requested more often when the magnet gets close to
+        # the target:
+        self._motion_watcher = MotionWatcher(self._magnet_device, max_interval=self._checktime,
+                                             is_moving=self._check_is_moving)
+        self._motion_watcher.sigPosChanged.connect(self.sigPosChanged, QtCore.Qt.QueuedConnection)
+
         # signal connect for alignment:
 
         self._sigInitializeMeasPos.connect(self._move_to_curr_pathway_index)
         self._sigStepwiseAlignmentNext.connect(self._stepwise_loop_body,
                                                QtCore.Qt.QueuedConnection)
+        self._sigAlignmentReturned.connect(self._finish_alignment_procedure,
+                                           QtCore.Qt.QueuedConnection)
 
-        self.pathway_modes = ['spiral-in', 'spiral-out', 'snake-wise', 'diagonal-snake-wise']
+        self.pathway_modes = ['spiral-in', 'spiral-out', 'snake-wise', 'diagonal-snake-wise',
+                              'adaptive']
 
         # relative movement settings
 
@@ -286,6 +303,9 @@ class MagnetLogic(GenericLogic):
     def on_deactivate(self):
         """ Deactivate the module properly.
         """
+        self._motion_watcher.sigPosChanged.disconnect()
+        self._motion_watcher.stop()
+
         constraints = self.get_hardware_constraints()
         for axis_label in constraints:
             self._statusVariables[('move_rel_' + axis_label)] = self.move_rel_dict[axis_label]
@@ -482,6 +502,11 @@ class MagnetLogic(GenericLogic):
                            'patharray.'.format(self.current_2d_pathway_mode))
             return [], []
 
+        elif self.curr_2d_pathway_mode == 'adaptive':
+            return self._create_2d_adaptive_pathway(axis0_name, axis0_range, axis0_step,
+                                                    axis1_name, axis1_range, axis1_step,
+                                                    init_pos, axis0_vel, axis1_vel)
+
         elif self.curr_2d_pathway_mode == 'selected-points':
             self.log.error('The pathway creation method "{0}" through the '
                            'matrix is not implemented yet!\nReturn an empty '
@@ -628,6 +653,183 @@ class MagnetLogic(GenericLogic):
 
         return pathway_cont
 
+    def _create_2d_adaptive_pathway(self, axis0_name, axis0_range, axis0_step,
+                                    axis1_name, axis1_range, axis1_step, init_pos,
+                                    axis0_vel=None, axis1_vel=None):
+        """ Create the coarse start of an adaptive pathway through the matrix.
+
+        @params: see _create_2d_pathway
+
+        @return tuple(list, dict): pathway and back_map of the coarse grid
+
+        The matrix is the same as for the snake-wise pathway, i.e. the step
+        sizes are the requested precision of the alignment. At first only a
+        coarse sub-grid with about align_2d_adaptive_coarse_points points per
+        axis is measured snake-wise. Whenever the pathway is finished,
+        _extend_2d_adaptive_pathway appends a finer grid around the optimum
+        found so far, until the optimum is localised to one step.
+        """
+        num_points = (int(axis0_range / axis0_step) + 1, int(axis1_range / axis1_step) + 1)
+        start_pos = (round(init_pos[axis0_name] - axis0_range / 2, 7),
+                     round(init_pos[axis1_name] - axis1_range / 2, 7))
+
+        coarse_steps = max(1, int(self.align_2d_adaptive_coarse_points) - 1)
+        strides = [max(1, (points - 1) // coarse_steps) for points in num_points]
+
+        self._2d_adaptive = {'names': (axis0_name, axis1_name),
+                             'positions': (start_pos[0] + np.arange(num_points[0]) * axis0_step,
+                                           start_pos[1] + np.arange(num_points[1]) * axis1_step),
+                             'steps': (axis0_step, axis1_step),
+                             'vel': (axis0_vel, axis1_vel),
+                             'strides': strides,
+                             'scheduled': np.zeros(num_points, dtype=bool)}
+
+        coarse_indices = []
+        for points, stride in zip(num_points, strides):
+            indices = list(range(0, points, stride))
+            if indices[-1] != points - 1:
+                indices.append(points - 1)
+            coarse_indices.append(indices)
+
+        # snake-wise through the coarse grid, starting at the matrix origin
+        index_list = []
+        for num, axis1_index in enumerate(coarse_indices[1]):
+            axis0_indices = coarse_indices[0] if num % 2 == 0 else coarse_indices[0][::-1]
+            index_list.extend((axis0_index, axis1_index) for axis0_index in axis0_indices)
+
+        pathway = []
+        back_map = dict()
+        self._append_2d_adaptive_points(index_list, pathway, back_map)
+        return pathway, back_map
+
+    def _append_2d_adaptive_points(self, index_list, pathway, back_map):
+        """ Append matrix points to the pathway and the back_map of the
+            adaptive pathway.
+
+        @param list index_list: tuples (axis0_index, axis1_index) in the order
+                                in which they should be measured
+        @param list pathway: the pathway to extend
+        @param dict back_map: the back_map to extend
+        """
+        state = self._2d_adaptive
+        for index in index_list:
+            step_config = dict()
+            back_map_entry = {'index': index}
+            for axis, axis_name in enumerate(state['names']):
+                axis_pos = round(state['positions'][axis][index[axis]], 7)
+                step_config[axis_name] = {'move_abs': axis_pos}
+                if state['vel'][axis] is not None:
+                    step_config[axis_name]['move_vel'] = state['vel'][axis]
+                back_map_entry[axis_name] = axis_pos
+
+            back_map[len(pathway)] = back_map_entry
+            pathway.append(step_config)
+            state['scheduled'][index] = True
+
+    def _extend_2d_adaptive_pathway(self):
+        """ Append the next refinement level to the adaptive pathway.
+
+        @return bool: True if new points were appended, False if the optimum is
+                      localised to the step size of the matrix.
+
+        The strides are halved and all not yet measured points within two
+        strides around the estimated optimum are appended. Their order is
+        chosen nearest neighbour wise, starting from the current magnet
+        position, to keep the travel short. With a stride of one step the
+        window follows the optimum until its whole neighbourhood is measured.
+        """
+        state = self._2d_adaptive
+        old_strides = state['strides']
+        state['strides'] = [max(1, stride // 2) for stride in old_strides]
+
+        center = self._estimate_2d_adaptive_optimum(old_strides)
+
+        new_points = []
+        for axis0_index in range(center[0] - 2 * state['strides'][0],
+                                 center[0] + 2 * state['strides'][0] + 1,
+                                 state['strides'][0]):
+            for axis1_index in range(center[1] - 2 * state['strides'][1],
+                                     center[1] + 2 * state['strides'][1] + 1,
+                                     state['strides'][1]):
+                index = (axis0_index, axis1_index)
+                if (0 <= axis0_index < state['scheduled'].shape[0]
+                        and 0 <= axis1_index < state['scheduled'].shape[1]
+                        and not state['scheduled'][index]):
+                    new_points.append(index)
+
+        if len(new_points) == 0:
+            self._2d_optimum_pos = {axis_name: round(float(state['positions'][axis][center[axis]]), 7)
+                                    for axis, axis_name in enumerate(state['names'])}
+            self.log.info('Adaptive alignment localised the optimum at {0} after '
+                          'measuring {1} of {2} points.'.format(
+                              self._2d_optimum_pos, len(self._pathway),
+                              state['scheduled'].size))
+            return False
+
+        # order the new points nearest neighbour wise in units of the
+        # travelled distance:
+        steps = np.array(state['steps'])
+        last_index = np.array(self._backmap[len(self._pathway) - 1]['index'])
+        remaining = np.array(new_points)
+        index_list = []
+        while len(remaining) > 0:
+            distances = np.sum(((remaining - last_index) * steps) ** 2, axis=1)
+            closest = np.argmin(distances)
+            last_index = remaining[closest]
+            index_list.append(tuple(last_index))
+            remaining = np.delete(remaining, closest, axis=0)
+
+        self._append_2d_adaptive_points(index_list, self._pathway, self._backmap)
+        return True
+
+    def _estimate_2d_adaptive_optimum(self, strides):
+        """ Estimate the matrix index of the optimum of the measured points.
+
+        @param list strides: strides of the last refinement level
+
+        @return tuple(int, int): matrix index of the estimated optimum
+
+        A quadratic surface is fitted to the measured points around the best
+        measured point. If it has an extremum of the right kind within that
+        window, the closest matrix point is returned, otherwise the best
+        measured point itself.
+        """
+        scheduled = self._2d_adaptive['scheduled']
+        data = np.where(scheduled, self._2D_data_matrix, np.nan)
+        if self.align_2d_adaptive_maximize:
+            best = np.unravel_index(np.nanargmax(data), data.shape)
+        else:
+            best = np.unravel_index(np.nanargmin(data), data.shape)
+
+        axis0_index, axis1_index = np.nonzero(scheduled)
+        in_window = ((np.abs(axis0_index - best[0]) <= strides[0])
+                     & (np.abs(axis1_index - best[1]) <= strides[1]))
+        if np.count_nonzero(in_window) < 6:
+            return best
+
+        # fit z = c0 + c1*x + c2*y + c3*x^2 + c4*x*y + c5*y^2 relative to the
+        # best point in units of the strides:
+        x = (axis0_index[in_window] - best[0]) / strides[0]
+        y = (axis1_index[in_window] - best[1]) / strides[1]
+        z = data[axis0_index[in_window], axis1_index[in_window]]
+        design = np.column_stack((np.ones_like(x), x, y, x ** 2, x * y, y ** 2))
+        coeff, _, rank, _ = np.linalg.lstsq(design, z, rcond=None)
+        if rank < design.shape[1]:
+            return best
+
+        hessian = np.array([[2 * coeff[3], coeff[4]], [coeff[4], 2 * coeff[5]]])
+        curvature = -1 if self.align_2d_adaptive_maximize else 1
+        if np.linalg.det(hessian) <= 0 or curvature * hessian[0, 0] <= 0:
+            return best
+
+        vertex = np.linalg.solve(hessian, -coeff[1:3])
+        if np.any(np.abs(vertex) > 1):
+            return best
+
+        center = np.round(np.array(best) + vertex * strides).astype(int)
+        center = np.clip(center, 0, np.array(scheduled.shape) - 1)
+        return tuple(center)
+
     def _prepare_2d_graph(self, axis0_start, axis0_range, axis0_step,
                           axis1_start, axis1_range, axis1_step):
         # set up a matrix where measurement points are save to
@@ -694,7 +896,12 @@ class MagnetLogic(GenericLogic):
 
         # start measurement value
 
-
+        # the adaptive pathway is refined by the stepwise loop body only, the
+        # continuous loop body does not measure anything yet
+        if not stepwise_meas and self.curr_2d_pathway_mode == 'adaptive':
+            self.log.error('The adaptive pathway mode is only available for '
+                           'stepwise measurements. Alignment not started.')
+            return -1
 
         self._start_measurement_time = datetime.datetime.now()
         self._stop_measurement_time = None
@@ -795,26 +1002,43 @@ class MagnetLogic(GenericLogic):
 
         self.log.debug("I'm in _move_to_curr_pathway_index: {0}".format(move_dict_abs))
         # self.set_velocity(move_dict_vel)
-        self._magnet_device.move_abs(move_dict_abs)
         # self.move_rel(move_dict_rel)
-        while self._check_is_moving():
-            time.sleep(self._checktime)
-            self.log.debug("Went into while loop in _move_to_curr_pathway_index")
 
-        # this function will return to this function if position is reached:
-        start_pos = self._saved_pos_before_align
-        end_pos = dict()
-        for axis_name in self._saved_pos_before_align:
-            end_pos[axis_name] = self._backmap[self._pathway_index][axis_name]
+        # the Stepwise alignment loop body self._stepwise_loop_body or the
+        # continuous alignment loop body self._continuous_loop_body is started
+        # as soon as the position is reached:
+        self._move_and_continue(move_dict_abs, stepwise_meas)
+        self._do_measurement_preparation()
+
+    def _move_and_continue(self, move_dict_abs, stepwise_meas=True):
+        """ Move the magnet and run the next alignment loop body as soon as
+            the position is reached.
 
-        self.log.debug("(first movement) magnet moving ? {0}".format(self._check_is_moving()))
+        @param dict move_dict_abs: absolute target position of the magnet
+        @param bool stepwise_meas: whether the stepwise or the continuous loop
+                                   body should be run next
 
+        Returns immediately, so the logic thread can prepare the next
+        measurement while the magnet is moving.
+        """
         if stepwise_meas:
-            # start the Stepwise alignment loop body self._stepwise_loop_body:
-            self._sigStepwiseAlignmentNext.emit()
+            next_signal = self._sigStepwiseAlignmentNext
         else:
-            # start the continuous alignment loop body self._continuous_loop_body:
-            self._sigContinuousAlignmentNext.emit()
+            next_signal = self._sigContinuousAlignmentNext
+
+        def move_done(future):
+            if future.cancelled():
+                self.log.error('Movement of the magnet to {0} was cancelled. Stopping the '
+                               'alignment.'.format(move_dict_abs))
+                self._stop_measure = True
+            elif future.exception() is not None:
+                self.log.error('Movement of the magnet to {0} failed: {1}\nStopping the '
+                               'alignment.'.format(move_dict_abs, future.exception()))
+                self._stop_measure = True
+            # the loop body ends the alignment if it has been stopped
+            next_signal.emit()
+
+        self._motion_watcher.move_abs(move_dict_abs).add_done_callback(move_done)
 
     def _stepwise_loop_body(self):
         """ Go one by one through the created path
@@ -868,33 +1092,26 @@ class MagnetLogic(GenericLogic):
         # increase the index
         self._pathway_index += 1
 
+        # the adaptive pathway is only known up to the current refinement
+        # level, so refine it around the optimum found so far:
+        if self._pathway_index >= len(self._pathway) and self.curr_2d_pathway_mode == 'adaptive':
+            self._extend_2d_adaptive_pathway()
+
         if self._pathway_index < len(self._pathway):
 
-            #
-            self._do_postmeasurement_proc()
             move_dict_vel, \
             move_dict_abs, \
             move_dict_rel = self._move_to_index(self._pathway_index, self._pathway)
 
             # commenting this out for now, because it is kind of useless for us
             # self.set_velocity(move_dict_vel)
-            self._magnet_device.move_abs(move_dict_abs)
 
-            while self._check_is_moving():
-                time.sleep(self._checktime)
-                self.log.debug("Went into while loop in stepwise_loop_body")
-
-            self.log.debug("stepwise_loop_body reports magnet moving ? {0}".format(self._check_is_moving()))
-
-            # this function will return to this function if position is reached:
-            start_pos = dict()
-            end_pos = dict()
-            for axis_name in self._saved_pos_before_align:
-                start_pos[axis_name] = self._backmap[self._pathway_index - 1][axis_name]
-                end_pos[axis_name] = self._backmap[self._pathway_index][axis_name]
-
-            # rerun this loop again
-            self._sigStepwiseAlignmentNext.emit()
+            # rerun this loop again as soon as the position is reached, the
+            # post measurement procedure and the preparation of the next
+            # measurement are done while the magnet is moving:
+            self._move_and_continue(move_dict_abs, stepwise_meas=True)
+            self._do_postmeasurement_proc()
+            self._do_measurement_preparation()
 
         else:
             self._end_alignment_procedure()
@@ -933,11 +1150,14 @@ class MagnetLogic(GenericLogic):
         for axis_name in self._saved_pos_before_align:
             last_pos[axis_name] = self._backmap[self._pathway_index - 1][axis_name]
 
-        self._magnet_device.move_abs(self._saved_pos_before_align)
-
-        while self._check_is_moving():
-            time.sleep(self._checktime)
+        self._alignment_meas_prepared = False
+        future = self._motion_watcher.move_abs(self._saved_pos_before_align)
+        future.add_done_callback(lambda future: self._sigAlignmentReturned.emit())
 
+    def _finish_alignment_procedure(self):
+        """ Called as soon as the magnet is back at the position before the
+            alignment.
+        """
         self.sigMeasurementFinished.emit()
 
         self._pathway_index = 0
@@ -948,54 +1168,32 @@ class MagnetLogic(GenericLogic):
         pass
 
     def _check_position_reached_loop(self, start_pos_dict, end_pos_dict):
-        """ Perform just a while loop, which checks everytime the conditions
+        """ Wait until the magnet has reached the end position.
 
         @param dict start_pos_dict: the position in this dictionary must be
                                     absolute positions!
-        @param dict end_pos_dict:
-        @param float checktime: the checktime in seconds
-
-        @return:
-
-        Whenever the magnet has passed 95% of the way, the method will return.
+        @param dict end_pos_dict: absolute target positions
 
-        Check also whether the difference in position increases again, and if so
-        stop the measurement and raise an error, since either the velocity was
-        too fast or the magnet does not move further.
+        The position is watched by the motion watcher, i.e. every axis has to be
+        within its 'pos_step' constraint or the magnet has to stop moving. The
+        method returns also if the measurement is stopped.
         """
-
-        distance_init = 0.0
-        constraints = self.get_hardware_constraints()
-        minimal_distance = 0.0
-        for axis_label in start_pos_dict:
-            distance_init = (end_pos_dict[axis_label] - start_pos_dict[axis_label]) ** 2
-            minimal_distance = minimal_distance + (constraints[axis_label]['pos_step']) ** 2
-        distance_init = np.sqrt(distance_init)
-        minimal_distance = np.sqrt(minimal_distance)
-
-        # take 97% distance tolerance:
-        distance_tolerance = 0.03 * distance_init
-
-        current_dist = 0.0
-
-        while True:
-            time.sleep(self._checktime)
-
-            curr_pos = self.get_pos(list(end_pos_dict))
-
-            for axis_label in start_pos_dict:
-                current_dist = (end_pos_dict[axis_label] - curr_pos[axis_label]) ** 2
-
-            current_dist = np.sqrt(current_dist)
-
-            self.sigPosChanged.emit(curr_pos)
-
-            if (current_dist <= distance_tolerance) or (current_dist <= minimal_distance) or self._stop_measure:
-                self.sigPosReached.emit()
-
+        future = self._motion_watcher.watch(end_pos_dict)
+        while not self._stop_measure:
+            try:
+                future.result(timeout=self._checktime)
                 break
-
-                # return either pos reached signal of check position
+            except TimeoutError:
+                continue
+            except CancelledError:
+                self.log.warning('Watching the magnet movement to {0} was cancelled.'
+                                 ''.format(end_pos_dict))
+                break
+            except Exception as e:
+                self.log.error('Error while waiting for the magnet to reach {0}: {1}'
+                               ''.format(end_pos_dict, e))
+                break
+        self.sigPosReached.emit()
 
     def _check_is_moving(self):
         """
@@ -1006,7 +1204,7 @@ class MagnetLogic(GenericLogic):
         axes = [i for i in self._magnet_device.get_constraints()]
         state = self._magnet_device.get_status()
 
-        return (state[axes[0]] or state[axes[1]] or state[axes[2]]) is (1 or -1)
+        return any(state[axis] in (1, -1) for axis in axes)
 
     def _set_meas_point(self, meas_val, add_meas_val, pathway_index, back_map):
 
@@ -1504,7 +1702,10 @@ class MagnetLogic(GenericLogic):
         # self.nuclear_2d_idle_time
         # self.nuclear_2d_reps_within_ssr
         # self.nuclear_2d_num_ssr
-        self._load_pulsed_odmr()
+        # the asset may have already been loaded while the magnet was moving
+        if not self._alignment_meas_prepared:
+            self._load_pulsed_odmr()
+        self._alignment_meas_prepared = False
         self._pulser_on()
 
         # self.odmr_2d_low_center_freq
@@ -1747,6 +1948,16 @@ class MagnetLogic(GenericLogic):
 
         return available_ch
 
+    def _do_measurement_preparation(self):
+        """ Prepare the next alignment measurement while the magnet is moving.
+
+        Only preparations which do not depend on the magnet position belong
+        here, e.g. loading of a pulser asset.
+        """
+        if self.curr_alignment_method == '2d_nuclear':
+            self._load_pulsed_odmr()
+            self._alignment_meas_prepared = True
+
     def _do_postmeasurement_proc(self):
 
         # do a selected post measurement procedure,
@@ -1820,7 +2031,10 @@ class MagnetLogic(GenericLogic):
         if self._stop_measurement_time is not None:
             parameters['Measurement stop time'] = self._stop_measurement_time
         parameters['Time at Data save'] = timestamp
-        parameters['Pathway of the magnet alignment'] = 'Snake-wise steps'
+        if self.curr_2d_pathway_mode == 'adaptive':
+            parameters['Pathway of the magnet alignment'] = 'Adaptive coarse to fine steps'
+        else:
+            parameters['Pathway of the magnet alignment'] = 'Snake-wise steps'
 
         for index, entry in enumerate(self._pathway):
             parameters['index_' + str(index)] = entry
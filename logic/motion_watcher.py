@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+
+"""
+This file contains a watcher for the movements of magnet and motor stages.
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import logging
+import time
+from concurrent.futures import Future, TimeoutError
+
+import numpy as np
+from qtpy import QtCore
+
+from core.util.mutex import Mutex
+
+logger = logging.getLogger(__name__)
+
+
+class MotionWatcher(QtCore.QObject):
+    """ Watches the movement of a stage with MagnetInterface or MotorInterface in a separate thread.
+
+    A movement is started with move_abs (or an already started movement is passed to watch), which
+    returns immediately with a concurrent.futures.Future. The caller can prepare the next
+    measurement while the stage is moving and wait on the future (or connect to sigTargetReached)
+    only when the position is really needed.
+
+    The watcher mainly relies on get_pos, since the status numbers of get_status differ between the
+    hardware modules. The target is reached if every axis is within its tolerance, which is by
+    default the 'pos_step' of the axis constraints. The poll interval follows the estimated time of
+    arrival, i.e. the stage is polled rarely while it is far from the target and often close to it.
+    If the position does not change anymore for settle_polls polls after the stage started moving,
+    the movement is considered to be finished anyway and sigMotionStalled is emitted. A stage which
+    does not leave its start position within start_timeout is considered to be stalled as well.
+    If an is_moving function is given (e.g. interpreting get_status of the hardware), it is asked
+    before a movement is declared stalled and the watcher keeps waiting while it returns True.
+    """
+    # current position during the movement
+    sigPosChanged = QtCore.Signal(dict)
+    # final position when the target is reached or the stage stopped elsewhere
+    sigTargetReached = QtCore.Signal(dict)
+    sigMotionStalled = QtCore.Signal(dict)
+    _sigWatchRequested = QtCore.Signal()
+
+    def __init__(self, stage, min_interval=0.02, max_interval=1.0, settle_polls=3, tolerance=None,
+                 start_timeout=5.0, is_moving=None):
+        """ Create a motion watcher and start its thread.
+
+        @param object stage: hardware module with MagnetInterface or MotorInterface
+        @param float min_interval: minimal time between two position requests in s
+        @param float max_interval: maximal time between two position requests in s
+        @param int settle_polls: number of polls without movement after which a moving stage is
+                                 considered to be stopped
+        @param dict tolerance: optional, tolerance of the target position for each axis label. The
+                               'pos_step' constraint is used for the missing axes.
+        @param float start_timeout: time in s after which a stage which did not start moving is
+                                    considered to be stopped
+        @param callable is_moving: optional, function without arguments returning True while the
+                                   hardware reports a movement. Called from the watcher thread.
+        """
+        super().__init__()
+        self._stage = stage
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.settle_polls = settle_polls
+        self.start_timeout = start_timeout
+        self._is_moving = is_moving
+        self.tolerance = dict() if tolerance is None else dict(tolerance)
+        self.poll_count = 0
+        self._watch = None
+        self._lock = Mutex()
+
+        self._thread = QtCore.QThread()
+        self._thread.setObjectName('motion_watcher')
+        self._timer = QtCore.QTimer(self)
+        self._timer.setSingleShot(True)
+        self.moveToThread(self._thread)
+        self._timer.timeout.connect(self._poll, QtCore.Qt.QueuedConnection)
+        self._sigWatchRequested.connect(self._poll, QtCore.Qt.QueuedConnection)
+        self._thread.start()
+
+    @property
+    def is_watching(self):
+        """ Whether a movement is currently watched. """
+        with self._lock:
+            return self._watch is not None
+
+    def move_abs(self, param_dict, timeout=None):
+        """ Move the stage to an absolute position and watch the movement. Returns immediately.
+
+        @param dict param_dict: target position, {'axis_label': <position>}
+        @param float timeout: optional, time in s after which the future fails with a TimeoutError
+
+        @return Future: future with the final position dict as result
+        """
+        self._stage.move_abs(param_dict)
+        return self.watch(param_dict, timeout=timeout)
+
+    def watch(self, target, timeout=None):
+        """ Watch the movement of the stage to a target position. Returns immediately.
+
+        @param dict target: target position, {'axis_label': <position>}
+        @param float timeout: optional, time in s after which the future fails with a TimeoutError
+
+        @return Future: future with the final position dict as result
+
+        A movement which is still watched is cancelled.
+        """
+        constraints = self._stage.get_constraints()
+        tolerance = dict()
+        for axis_label in target:
+            tolerance[axis_label] = self.tolerance.get(axis_label,
+                                                       constraints[axis_label].get('pos_step'))
+            if not tolerance[axis_label] or tolerance[axis_label] <= 0:
+                logger.warning('No position tolerance available for axis "{0}", the target is '
+                               'only considered to be reached when the stage stops.'
+                               ''.format(axis_label))
+                tolerance[axis_label] = np.finfo(float).tiny
+
+        future = Future()
+        watch = {'future': future,
+                 'target': dict(target),
+                 'tolerance': tolerance,
+                 'deadline': None if timeout is None else time.monotonic() + timeout,
+                 'start_pos': None,
+                 'start_time': None,
+                 'moving': False,
+                 'last_pos': None,
+                 'last_time': None,
+                 'still_polls': 0,
+                 'interval': self.min_interval}
+        with self._lock:
+            if self._watch is not None:
+                self._watch['future'].cancel()
+            self._watch = watch
+        self._sigWatchRequested.emit()
+        return future
+
+    def cancel(self):
+        """ Stop watching the current movement. The stage itself is not stopped. """
+        with self._lock:
+            if self._watch is not None:
+                self._watch['future'].cancel()
+            self._watch = None
+
+    def stop(self):
+        """ Stop watching and stop the watcher thread. """
+        self.cancel()
+        self._thread.quit()
+        self._thread.wait()
+
+    def _finish(self, watch, result=None, exception=None):
+        with self._lock:
+            if self._watch is watch:
+                self._watch = None
+        # only a pending future can still be cancelled, claim it before setting the result
+        if not watch['future'].set_running_or_notify_cancel():
+            return False
+        if exception is None:
+            watch['future'].set_result(result)
+        else:
+            watch['future'].set_exception(exception)
+        return True
+
+    @QtCore.Slot()
+    def _poll(self):
+        with self._lock:
+            watch = self._watch
+        if watch is None or watch['future'].cancelled():
+            return
+
+        try:
+            pos = self._stage.get_pos(list(watch['target']))
+        except Exception as e:
+            self._finish(watch, exception=e)
+            return
+        now = time.monotonic()
+        self.poll_count += 1
+        self.sigPosChanged.emit(pos)
+
+        # deviations in units of the tolerance, i.e. comparable for all axes
+        deviation = np.array([(pos[axis] - watch['target'][axis]) / watch['tolerance'][axis]
+                              for axis in watch['target']])
+        if np.all(np.abs(deviation) <= 1):
+            if self._finish(watch, result=pos):
+                self.sigTargetReached.emit(pos)
+            return
+
+        # The stage may start moving some time after the command (e.g. accelerating motors or
+        # ramping magnets), so still polls only count once it has left its start position.
+        if watch['start_pos'] is None:
+            watch['start_pos'] = pos
+            watch['start_time'] = now
+        elif not watch['moving']:
+            watch['moving'] = self._distance(pos, watch['start_pos'], watch) > 1
+
+        speed = 0.0
+        if watch['last_pos'] is not None:
+            moved = self._distance(pos, watch['last_pos'], watch)
+            if moved <= 1:
+                if watch['moving']:
+                    watch['still_polls'] += 1
+            else:
+                watch['moving'] = True
+                watch['still_polls'] = 0
+                speed = moved / (now - watch['last_time'])
+
+        if watch['moving']:
+            stalled = watch['still_polls'] >= self.settle_polls
+        else:
+            stalled = now - watch['start_time'] > self.start_timeout
+        if stalled and self._hardware_is_moving():
+            # the hardware is still busy, e.g. a movement too slow to notice between two polls
+            stalled = False
+            watch['still_polls'] = 0
+            watch['start_time'] = now
+        if stalled:
+            logger.debug('Stage stopped at {0} before reaching {1}.'.format(pos, watch['target']))
+            if self._finish(watch, result=pos):
+                self.sigMotionStalled.emit(pos)
+            return
+
+        if watch['deadline'] is not None and now > watch['deadline']:
+            self._finish(watch, exception=TimeoutError(
+                'Stage did not reach {0} in time, last position {1}.'.format(watch['target'], pos)))
+            return
+
+        if speed > 0:
+            # poll again after half of the estimated time of arrival
+            interval = np.linalg.norm(deviation) / speed / 2
+        else:
+            # not (yet) moving, back off
+            interval = 2 * watch['interval']
+        watch['interval'] = min(max(interval, self.min_interval), self.max_interval)
+        watch['last_pos'] = pos
+        watch['last_time'] = now
+        self._timer.start(int(round(watch['interval'] * 1e3)))
+
+    @staticmethod
+    def _distance(pos, other_pos, watch):
+        """ Distance between two positions of the watched axes in units of their tolerance. """
+        return np.linalg.norm([(pos[axis] - other_pos[axis]) / watch['tolerance'][axis]
+                               for axis in watch['target']])
+
+    def _hardware_is_moving(self):
+        """ Ask the is_moving function, if given. Errors are treated as not moving. """
+        if self._is_moving is None:
+            return False
+        try:
+            return bool(self._is_moving())
+        except Exception:
+            logger.exception('Could not get the movement status of the stage.')
+            return False
@@ -29,6 +29,7 @@ import time
 import datetime
 import matplotlib.pyplot as plt
 
+from logic.fit_logic import LiveFitWorker
 from logic.generic_logic import GenericLogic
 from core.util.mutex import Mutex
 from core.connector import Connector
@@ -66,6 +67,10 @@ class ODMRLogic(GenericLogic):
     lines_to_average = StatusVar('lines_to_average', 0)
     _oversampling = StatusVar('oversampling', default=10)
     _lock_in_active = StatusVar('lock_in_active', default=False)
+    # refit the mean ODMR spectrum after every sweep while the scan is running
+    _live_fit = StatusVar('live_fit', default=False)
+    # maximum time in s spent on a single live fit update
+    _live_fit_time_budget = StatusVar('live_fit_time_budget', default=1.0)
 
     # Internal signals
     sigNextLine = QtCore.Signal()
@@ -133,8 +138,13 @@ class ODMRLogic(GenericLogic):
         self.mw_off()
         self.set_cw_parameters(self.cw_mw_frequency, self.cw_mw_power)
 
+        # Live fitting of the running scan in a separate thread
+        self._live_fit_channel = 0
+        self._live_fitter = LiveFitWorker(self.fc, time_budget=self._live_fit_time_budget)
+
         # Connect signals
         self.sigNextLine.connect(self._scan_odmr_line, QtCore.Qt.QueuedConnection)
+        self._live_fitter.sigFitUpdated.connect(self._live_fit_updated, QtCore.Qt.QueuedConnection)
         return
 
     def on_deactivate(self):
@@ -156,6 +166,8 @@ class ODMRLogic(GenericLogic):
         self._mw_device.off()
         # Disconnect signals
         self.sigNextLine.disconnect()
+        self._live_fitter.sigFitUpdated.disconnect()
+        self._live_fitter.stop()
 
     @fc.constructor
     def sv_set_fits(self, val):
@@ -583,6 +595,7 @@ class ODMRLogic(GenericLogic):
             self._clearOdmrData = False
             self.stopRequested = False
             self.fc.clear_result()
+            self._live_fitter.reset()
 
             self.elapsed_sweeps = 0
             self.elapsed_time = 0.0
@@ -755,6 +768,9 @@ class ODMRLogic(GenericLogic):
             # Fire update signals
             self.sigOdmrElapsedTimeUpdated.emit(self.elapsed_time, self.elapsed_sweeps)
             self.sigOdmrPlotsUpdated.emit(self.odmr_plot_x, self.odmr_plot_y, self.odmr_plot_xy)
+            if self._live_fit and self.fc.current_fit != 'No Fit':
+                self._live_fitter.request_fit(self.odmr_plot_x,
+                                              self.odmr_plot_y[self._live_fit_channel])
             self.sigNextLine.emit()
             return
 
@@ -801,6 +817,57 @@ class ODMRLogic(GenericLogic):
             self.odmr_fit_x, self.odmr_fit_y, result_str_dict, self.fc.current_fit)
         return
 
+    def set_live_fit(self, enabled, channel_index=0, time_budget=None):
+        """
+        Turn the refitting of the mean spectrum during a running scan on or off.
+
+        The current fit of the fit container is used. Each fit starts from the previous result,
+        runs in a separate thread and is skipped if the spectrum changed less than the fit
+        parameter uncertainties.
+
+        @param bool enabled: refit after every sweep of the running scan
+        @param int channel_index: channel of the ODMR counter to fit
+        @param float time_budget: optional, maximum time in s spent on a single fit update
+        """
+        self._live_fit = bool(enabled)
+        self._live_fit_channel = int(channel_index)
+        if time_budget is not None:
+            self._live_fit_time_budget = float(time_budget)
+            self._live_fitter.time_budget = self._live_fit_time_budget
+        return
+
+    @QtCore.Slot(np.ndarray, np.ndarray, object)
+    def _live_fit_updated(self, fit_x, fit_y, result):
+        """ Take over the result of a live fit of the mean spectrum """
+        if not self._live_fit:
+            return
+        self.odmr_fit_x = fit_x
+        self.odmr_fit_y = fit_y
+        self.sigOdmrFitUpdated.emit(fit_x, fit_y, result.result_str_dict, self.fc.current_fit)
+        return
+
+    def do_matrix_fit(self, fit_function=None, channel_index=0, **kwargs):
+        """
+        Execute the currently configured fit on every single sweep of the ODMR matrix at once.
+
+        @param str fit_function: optional, name of the fit to set before fitting
+        @param int channel_index: channel of the ODMR counter to fit
+        @param kwargs: optional arguments of FitLogic.batch_fit, e.g. warm_start or parallel
+
+        @return numpy.ndarray: structured array with one fit result per sweep (newest first),
+                               see FitLogic.batch_fit. None if no fit is set.
+        """
+        if fit_function is not None and isinstance(fit_function, str):
+            if fit_function in self.get_fit_functions():
+                self.fc.set_current_fit(fit_function)
+            else:
+                self.log.warning('Fit function "{0}" not available in ODMRLogic fit container.'
+                                 ''.format(fit_function))
+                return None
+
+        matrix_data = self.odmr_raw_data[:max(1, self.elapsed_sweeps), channel_index, :]
+        return self.fc.batch_fit(self.odmr_plot_x, matrix_data, **kwargs)
+
     def save_odmr_data(self, tag=None, colorscale_range=None, percentile_range=None):
         """ Saves the current ODMR data to a file."""
         timestamp = datetime.datetime.now()
@@ -29,6 +29,42 @@ from core.statusvariable import StatusVar
 from core.util.mutex import Mutex
 
 
+def estimate_gaussian_peak(positions, counts, offset=None, fraction=0.2):
+    """ Closed-form estimate of a Gaussian peak in a line scan.
+
+    The logarithm of a Gaussian is a parabola, so a quadratic least squares fit to the logarithm of
+    the counts above the offset gives centre, width and height without an iterative fit. The
+    points are weighted with their counts, as the shot noise of the logarithm is 1/sqrt(counts).
+
+    @param numpy.ndarray positions: positions of the pixels
+    @param numpy.ndarray counts: counts of the pixels
+    @param float offset: background counts, the minimum of the line if None
+    @param float fraction: only the pixels above this fraction of the peak height are used
+
+    @return tuple(float): centre, sigma and amplitude, None if there is no peak in the line
+    """
+    positions = np.asarray(positions, dtype=float)
+    signal = np.asarray(counts, dtype=float) - (np.min(counts) if offset is None else offset)
+    peak = np.max(signal)
+    used = signal > fraction * peak
+    if peak <= 0 or np.count_nonzero(used) < 3:
+        return None
+
+    # scaled positions keep the fit well conditioned
+    origin = positions[np.argmax(signal)]
+    scale = max(np.ptp(positions), np.finfo(float).tiny)
+    u = (positions[used] - origin) / scale
+    a, b, c = np.polyfit(u, np.log(signal[used]), 2, w=np.sqrt(signal[used]))
+    if a >= 0:
+        return None
+    centre = origin - scale * b / (2 * a)
+    if not positions.min() <= centre <= positions.max():
+        return None
+    sigma = scale * np.sqrt(-1 / (2 * a))
+    amplitude = np.exp(c - b ** 2 / (4 * a))
+    return centre, sigma, amplitude
+
+
 class OptimizerLogic(GenericLogic):
 
     """This is the Logic class for optimizing scanner position on bright features.
@@ -50,10 +86,15 @@ class OptimizerLogic(GenericLogic):
     do_surface_subtraction = StatusVar('surface_subtraction', False)
     surface_subtr_scan_offset = StatusVar('surface_subtraction_offset', 1e-6)
     opt_channel = StatusVar('optimization_channel', 0)
+    # fast tracking: points of each tracking line and the fraction of the signal of the last full
+    # refocus below which the full refocus is done instead
+    tracking_points = StatusVar('tracking_points', 15)
+    tracking_signal_drop = StatusVar('tracking_signal_drop', 0.5)
 
     # "private" signals to keep track of activities here in the optimizer logic
     _sigScanNextXyLine = QtCore.Signal()
     _sigScanZLine = QtCore.Signal()
+    _sigTrackFocus = QtCore.Signal()
     _sigCompletedXyOptimizerScan = QtCore.Signal()
     _sigDoNextOptimizationStep = QtCore.Signal()
     _sigFinishedAllOptimizationSteps = QtCore.Signal()
@@ -79,6 +120,13 @@ class OptimizerLogic(GenericLogic):
         # Keep track of who called the refocus
         self._caller_tag = ''
 
+        # steps of the running optimization, see optimization_sequence
+        self._sequence = list()
+        # position, widths, amplitude and offset of the peak found by the last full refocus
+        self._tracking_reference = None
+        self._xy_peak = None
+        self._refocus_start_time = 0
+
     def on_activate(self):
         """ Initialisation performed during activation of the module.
 
@@ -125,6 +173,7 @@ class OptimizerLogic(GenericLogic):
         # Sets connections between signals and functions
         self._sigScanNextXyLine.connect(self._refocus_xy_line, QtCore.Qt.QueuedConnection)
         self._sigScanZLine.connect(self.do_z_optimization, QtCore.Qt.QueuedConnection)
+        self._sigTrackFocus.connect(self._track_focus, QtCore.Qt.QueuedConnection)
         self._sigCompletedXyOptimizerScan.connect(self._set_optimized_xy_from_fit, QtCore.Qt.QueuedConnection)
 
         self._sigDoNextOptimizationStep.connect(self._do_next_optimization_step, QtCore.Qt.QueuedConnection)
@@ -195,9 +244,45 @@ class OptimizerLogic(GenericLogic):
             @param str caller_tag:
             @param str tag:
         """
-        # checking if refocus corresponding to crosshair or corresponding to initial_pos
+        self.check_optimization_sequence()
+        self._start_optimization(initial_pos, caller_tag, tag, self.optimization_sequence)
 
+    def start_tracking(self, initial_pos=None, caller_tag='unknown', tag='logic'):
+        """ Fast refocus on the emitter found by the last full refocus, e.g. for periodic tracking.
 
+            @param list initial_pos: with the structure [float, float, float]
+            @param str caller_tag:
+            @param str tag:
+
+        Instead of the xy image and the z line, three orthogonal lines through initial_pos are
+        scanned in one go and the position is updated from closed-form Gaussian estimates of the
+        lines. The full refocus is done instead if there was no full refocus near initial_pos
+        before, and after the tracking lines if the peak is lost or its signal dropped below
+        tracking_signal_drop of the last full refocus. sigRefocusFinished is emitted in any case.
+        """
+        self.check_optimization_sequence()
+        self._start_optimization(initial_pos, caller_tag, tag, ['track'])
+
+    def fit_spots(self, image, x_axis, y_axis, positions, size=None):
+        """ Fit 2D gaussians to many spots of one xy scan at once, without scanning again.
+
+            @param numpy.ndarray image: counts of the xy scan with shape (len(y_axis), len(x_axis))
+            @param numpy.ndarray x_axis: evenly spaced x positions of the pixels
+            @param numpy.ndarray y_axis: evenly spaced y positions of the lines
+            @param positions: iterable of the approximate positions (x, y, ...) of the spots
+            @param float size: optional, edge length of the fitted square around every position,
+                               default is the xy size of the refocus
+
+            @return list: fit results with best_values and params like the refocus fit, None for
+                          positions too close to the edge of the image
+        """
+        if size is None:
+            size = self.refocus_XY_size
+        return self._fit_logic.fit_gaussian_spots(image, x_axis, y_axis, positions, size)
+
+    def _start_optimization(self, initial_pos, caller_tag, tag, sequence):
+        """ Starts the optimization steps of sequence around initial_pos. """
+        # checking if refocus corresponding to crosshair or corresponding to initial_pos
         if isinstance(initial_pos, (np.ndarray,)) and initial_pos.size >= 3:
             self._initial_pos_x, self._initial_pos_y, self._initial_pos_z = initial_pos[0:3]
         elif isinstance(initial_pos, (list, tuple)) and len(initial_pos) >= 3:
@@ -223,7 +308,9 @@ class OptimizerLogic(GenericLogic):
         #
         self._xy_scan_line_count = 0
         self._optimization_step = 0
-        self.check_optimization_sequence()
+        self._sequence = list(sequence)
+        self._refocus_start_time = time.perf_counter()
+        self._xy_peak = None
 
         scanner_status = self.start_scanner()
         if scanner_status < 0:
@@ -384,15 +471,20 @@ class OptimizerLogic(GenericLogic):
 
     def _set_optimized_xy_from_fit(self):
         """Fit the completed xy optimizer scan and set the optimized xy position."""
-        fit_x, fit_y = np.meshgrid(self._X_values, self._Y_values)
-        xy_fit_data = self.xy_refocus_image[:, :, 3+self.opt_channel].ravel()
-        axes = np.empty((len(self._X_values) * len(self._Y_values), 2))
-        axes = (fit_x.flatten(), fit_y.flatten())
-        result_2D_gaus = self._fit_logic.make_twoDgaussian_fit(
-            xy_axes=axes,
-            data=xy_fit_data,
-            estimator=self._fit_logic.estimate_twoDgaussian_MLE
-        )
+        result_2D_gaus = self._fit_logic.fast_gaussian_fit(
+            (self._X_values, self._Y_values),
+            self.xy_refocus_image[:, :, 3 + self.opt_channel])
+
+        if not result_2D_gaus.success:
+            # fall back to the slower but more robust lmfit fit
+            fit_x, fit_y = np.meshgrid(self._X_values, self._Y_values)
+            xy_fit_data = self.xy_refocus_image[:, :, 3+self.opt_channel].ravel()
+            axes = (fit_x.flatten(), fit_y.flatten())
+            result_2D_gaus = self._fit_logic.make_twoDgaussian_fit(
+                xy_axes=axes,
+                data=xy_fit_data,
+                estimator=self._fit_logic.estimate_twoDgaussian_MLE
+            )
         # print(result_2D_gaus.fit_report())
 
         if result_2D_gaus.success is False:
@@ -411,6 +503,8 @@ class OptimizerLogic(GenericLogic):
                         self.optim_pos_y = result_2D_gaus.best_values['center_y']
                         self.optim_sigma_x = result_2D_gaus.best_values['sigma_x']
                         self.optim_sigma_y = result_2D_gaus.best_values['sigma_y']
+                        self._xy_peak = (result_2D_gaus.best_values['amplitude'],
+                                         result_2D_gaus.best_values['offset'])
             else:
                 self.optim_pos_x = self._initial_pos_x
                 self.optim_pos_y = self._initial_pos_y
@@ -493,15 +587,24 @@ class OptimizerLogic(GenericLogic):
         """ Finishes up and releases hardware after the optimizer scans."""
         self.kill_scanner()
 
+        # the peak of a full refocus is the reference for the following tracking
+        if self._xy_peak is not None:
+            self._tracking_reference = {
+                'position': np.array([self.optim_pos_x, self.optim_pos_y, self.optim_pos_z]),
+                'amplitude': self._xy_peak[0],
+                'offset': self._xy_peak[1]}
+            self._xy_peak = None
+
         self.log.info(
                 'Optimised from ({0:.3e},{1:.3e},{2:.3e}) to local '
-                'maximum at ({3:.3e},{4:.3e},{5:.3e}).'.format(
+                'maximum at ({3:.3e},{4:.3e},{5:.3e}) in {6:.2f} s.'.format(
                     self._initial_pos_x,
                     self._initial_pos_y,
                     self._initial_pos_z,
                     self.optim_pos_x,
                     self.optim_pos_y,
-                    self.optim_pos_z))
+                    self.optim_pos_z,
+                    time.perf_counter() - self._refocus_start_time))
 
         # Signal that the optimization has finished, and "return" the optimal position along with
         # caller_tag
@@ -574,6 +677,87 @@ class OptimizerLogic(GenericLogic):
             # surface-subtracted line scan data is the difference
             self.z_refocus_line = line_counts - line_bg_counts
 
+    def _track_focus(self):
+        """ Scans the tracking lines through optim_pos and updates the position from them.
+
+        Continues with the full optimization sequence if the peak was not found.
+        """
+        if self.stopRequested:
+            with self.threadlock:
+                self.stopRequested = False
+            self._sequence = self._sequence[:self._optimization_step]
+            self._sigDoNextOptimizationStep.emit()
+            return
+
+        centre = np.array([self.optim_pos_x, self.optim_pos_y, self.optim_pos_z])
+        reference = self._tracking_reference
+        if (reference is None or self.do_surface_subtraction
+                or np.any(np.abs(centre[:2] - reference['position'][:2])
+                          > 0.5 * self.refocus_XY_size)):
+            self.log.debug('No full refocus near the tracked position yet, doing a full refocus.')
+            self._sequence.extend(self.optimization_sequence)
+            self._sigDoNextOptimizationStep.emit()
+            return
+
+        # x, y and z line through the centre
+        points = max(int(self.tracking_points), 5)
+        half_sizes = 0.5 * np.array([self.refocus_XY_size, self.refocus_XY_size,
+                                     self.refocus_Z_size])
+        ranges = np.array([self.x_range, self.y_range, self.z_range], dtype=float)
+        lines = list()
+        for axis in range(3):
+            line = np.repeat(centre[:, np.newaxis], points, axis=1)
+            line[axis] += np.linspace(-1, 1, points) * half_sizes[axis]
+            lines.append(np.clip(line, ranges[:, :1], ranges[:, 1:]))
+
+        # scan all lines at once, connected by moves with return_slowness points
+        steps = np.linspace(0, 1, self.return_slowness + 2)[1:-1]
+        path = [lines[0]]
+        for previous, line in zip(lines[:-1], lines[1:]):
+            path.append(previous[:, -1:] + np.outer(line[:, 0] - previous[:, -1], steps))
+            path.append(line)
+        path = np.hstack(path)
+        n_ch = len(self._scanning_device.get_scanner_axes())
+        if n_ch <= 3:
+            path = path[0:n_ch]
+        else:
+            path = np.vstack((path, np.zeros(path.shape[1])))
+
+        status = self._move_to_start_pos(lines[0][:, 0])
+        counts = self._scanning_device.scan_line(path, pixel_clock=True) if status == 0 else -1
+        if status < 0 or np.any(counts == -1):
+            # finish without the success message and without updating the tracking reference
+            self.log.error('The tracking scan went wrong, killing the scanner.')
+            self._xy_peak = None
+            self.kill_scanner()
+            self.sigRefocusFinished.emit(
+                self._caller_tag,
+                [self.optim_pos_x, self.optim_pos_y, self.optim_pos_z, 0])
+            return
+
+        estimates = list()
+        for axis, line in enumerate(lines):
+            start = axis * (points + len(steps))
+            estimates.append(estimate_gaussian_peak(
+                line[axis],
+                counts[start:start + points, self.opt_channel],
+                offset=reference['offset']))
+
+        # escalate to the full refocus if the emitter is lost or bleached
+        if (any(estimate is None for estimate in estimates)
+                or max(estimate[2] for estimate in estimates)
+                < self.tracking_signal_drop * reference['amplitude']):
+            self.log.info('Lost the peak while tracking, doing a full refocus.')
+            self._sequence.extend(self.optimization_sequence)
+            self._sigDoNextOptimizationStep.emit()
+            return
+
+        self.optim_pos_x, self.optim_pos_y, self.optim_pos_z = [e[0] for e in estimates]
+        self.optim_sigma_x, self.optim_sigma_y, self.optim_sigma_z = [e[1] for e in estimates]
+        reference['position'] = np.array([self.optim_pos_x, self.optim_pos_y, self.optim_pos_z])
+        self.sigImageUpdated.emit()
+        self._sigDoNextOptimizationStep.emit()
+
     def start_scanner(self):
         """Setting up the scanner device.
 
@@ -617,12 +801,12 @@ class OptimizerLogic(GenericLogic):
         """
 
         # At the end fo the sequence, finish the optimization
-        if self._optimization_step == len(self.optimization_sequence):
+        if self._optimization_step >= len(self._sequence):
             self._sigFinishedAllOptimizationSteps.emit()
             return
 
         # Read the next step in the optimization sequence
-        this_step = self.optimization_sequence[self._optimization_step]
+        this_step = self._sequence[self._optimization_step]
 
         # Increment the step counter
         self._optimization_step += 1
@@ -634,6 +818,8 @@ class OptimizerLogic(GenericLogic):
         elif this_step == 'Z':
             self._initialize_z_refocus_image()
             self._sigScanZLine.emit()
+        elif this_step == 'track':
+            self._sigTrackFocus.emit()
 
     def set_position(self, tag, x=None, y=None, z=None, a=None):
         """ Set focus position.
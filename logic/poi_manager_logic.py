@@ -30,6 +30,7 @@ from core.connector import Connector
 from core.statusvariable import StatusVar
 from datetime import datetime
 from logic.generic_logic import GenericLogic
+from logic.sparse_confocal_image import rois_from_positions
 from qtpy import QtCore
 from core.util.mutex import Mutex
 
@@ -821,7 +822,7 @@ class PoiManagerLogic(GenericLogic):
     def set_scan_image(self, emit_change=True):
         """ Get the current xy scan data and set as scan_image of ROI. """
         self._roi.set_scan_image(
-            self.scannerlogic().xy_image[:, :, 3],
+            self.scannerlogic().xy_image.counts(0),
             (tuple(self.scannerlogic().image_x_range), tuple(self.scannerlogic().image_y_range)))
 
         if emit_change:
@@ -829,6 +830,43 @@ class PoiManagerLogic(GenericLogic):
                                      'scan_image_extent': self.roi_scan_image_extent})
         return
 
+    def scan_pois(self, size=None, background_step=0):
+        """ Scan only the surroundings of all POIs instead of the whole xy image.
+
+        @param float size: optional, edge length of the scanned square around each POI in m.
+                           Default is twice the xy size of the optimiser scan.
+        @param int background_step: additionally scan every background_step-th line and pixel of
+                                    the whole image at first, no background scan if smaller than 2
+
+        @return int: error code (0:OK, -1:error)
+        """
+        if not self.poi_names:
+            self.log.error('No POIs defined to scan.')
+            return -1
+        if size is None:
+            size = 2 * self.optimise_xy_size
+        rois = rois_from_positions(list(self.poi_positions.values()), size)
+        return self.scannerlogic().start_roi_scanning(rois, background_step=background_step,
+                                                      tag='poimanager')
+
+    def fit_pois_in_scan(self, size=None, channel=0):
+        """ Fit 2D gaussians to all POIs in the current xy image of the confocal logic at once.
+
+        @param float size: optional, edge length of the fitted square around each POI in m.
+                           Default is the xy size of the optimiser scan.
+        @param int channel: count channel of the xy image
+
+        @return dict: fit result of every POI name, None for POIs too close to the image edge
+        """
+        image = self.scannerlogic().xy_image
+        names = self.poi_names
+        results = self.optimiserlogic().fit_spots(image.counts(channel),
+                                                  image.horizontal,
+                                                  image.vertical,
+                                                  [self.get_poi_position(name) for name in names],
+                                                  size=size)
+        return dict(zip(names, results))
+
     @QtCore.Slot()
     def reset_roi(self):
         self.stop_periodic_refocus()
@@ -946,12 +984,12 @@ class PoiManagerLogic(GenericLogic):
                 remaining_time = self.time_until_refocus
                 self.sigRefocusTimerUpdated.emit(True, self.refocus_period, remaining_time)
                 if remaining_time <= 0 and self.optimiserlogic().module_state() == 'idle':
-                    self.optimise_poi_position(self._periodic_refocus_poi)
+                    self.optimise_poi_position(self._periodic_refocus_poi, tracking=True)
                     self._last_refocus = time.time()
         return
 
     @QtCore.Slot()
-    def optimise_poi_position(self, name=None, update_roi_position=True):
+    def optimise_poi_position(self, name=None, update_roi_position=True, tracking=False):
         """
         Triggers the optimisation procedure for the given poi using the optimiserlogic.
         The difference between old and new position can be used to update the ROI position.
@@ -960,6 +998,8 @@ class PoiManagerLogic(GenericLogic):
 
         @param str name: Name of the POI for which to optimise the position.
         @param bool update_roi_position: Flag indicating if the ROI should be shifted accordingly.
+        @param bool tracking: Use the fast tracking of the optimiserlogic, which falls back to the
+                              full refocus if necessary.
         """
         if name is None:
             if self.active_poi is None:
@@ -975,8 +1015,12 @@ class PoiManagerLogic(GenericLogic):
             tag = 'poimanager_{0}'.format(name)
 
         if self.optimiserlogic().module_state() == 'idle':
-            self.optimiserlogic().start_refocus(initial_pos=self.get_poi_position(name),
-                                                caller_tag=tag)
+            if tracking:
+                self.optimiserlogic().start_tracking(initial_pos=self.get_poi_position(name),
+                                                     caller_tag=tag)
+            else:
+                self.optimiserlogic().start_refocus(initial_pos=self.get_poi_position(name),
+                                                    caller_tag=tag)
             self.sigRefocusStateUpdated.emit(True)
         else:
             self.log.warning('Unable to start POI refocus procedure. '
@@ -31,9 +31,10 @@ from core.connector import Connector
 from core.configoption import ConfigOption
 from core.statusvariable import StatusVar
 from core.util.mutex import Mutex
-from core.util.network import netobtain
+from core.util.network import netobtain_array
 from core.util import units
 from core.util.math import compute_ft
+from logic.fit_logic import LiveFitWorker
 from logic.generic_logic import GenericLogic
 from logic.pulsed.pulse_extractor import PulseExtractor
 from logic.pulsed.pulse_analyzer import PulseAnalyzer
@@ -96,6 +97,10 @@ class PulsedMeasurementLogic(GenericLogic):
     psd = StatusVar(default=False)
     window = StatusVar(default='none')
     base_corr = StatusVar(default=True)
+    # refit the signal data after every analysis while the measurement is running
+    _live_fit = StatusVar(default=False)
+    # maximum time in s spent on a single live fit update
+    _live_fit_time_budget = StatusVar(default=1.0)
 
     # notification signals for master module (i.e. GUI)
     sigMeasurementDataUpdated = QtCore.Signal()
@@ -177,6 +182,8 @@ class PulsedMeasurementLogic(GenericLogic):
         # Recall saved status variables
         if 'fits' in self._statusVariables and isinstance(self._statusVariables.get('fits'), dict):
             self.fc.load_from_dict(self._statusVariables['fits'])
+        self._live_fitter = LiveFitWorker(self.fc, time_budget=self._live_fit_time_budget)
+        self._live_fitter.sigFitUpdated.connect(self._live_fit_updated, QtCore.Qt.QueuedConnection)
 
         # Turn off pulse generator
         self.pulse_generator_off()
@@ -232,6 +239,8 @@ class PulsedMeasurementLogic(GenericLogic):
         self.__analysis_timer.timeout.disconnect()
         self.sigStartTimer.disconnect()
         self.sigStopTimer.disconnect()
+        self._live_fitter.sigFitUpdated.disconnect()
+        self._live_fitter.stop()
         return
 
 
@@ -1046,6 +1055,41 @@ class PulsedMeasurementLogic(GenericLogic):
                                         use_alternative_data)
         return fit_data, self.fc.current_fit_result
 
+    @property
+    def live_fit(self):
+        return self._live_fit
+
+    @property
+    def live_fit_time_budget(self):
+        return self._live_fit_time_budget
+
+    def set_live_fit(self, enabled, time_budget=None):
+        """
+        Turn the refitting of the signal data during a running measurement on or off.
+
+        The current fit of the fit container is used (set e.g. by calling do_fit once). Each fit
+        starts from the previous result, runs in a separate thread and is skipped if the data
+        changed less than the fit parameter uncertainties.
+
+        @param bool enabled: refit after every analysis of the running measurement
+        @param float time_budget: optional, maximum time in s spent on a single fit update
+        """
+        self._live_fit = bool(enabled)
+        if time_budget is not None:
+            self._live_fit_time_budget = float(time_budget)
+            self._live_fitter.time_budget = self._live_fit_time_budget
+        return
+
+    @QtCore.Slot(np.ndarray, np.ndarray, object)
+    def _live_fit_updated(self, x_fit, y_fit, result):
+        """ Take over the result of a live fit of the signal data """
+        if not self._live_fit:
+            return
+        self.signal_fit_data = np.array([x_fit, y_fit])
+        self.fit_result = copy.deepcopy(result)
+        self.sigFitUpdated.emit(self.fc.current_fit, self.signal_fit_data, self.fit_result, False)
+        return
+
     def _apply_invoked_settings(self):
         """
         """
@@ -1175,6 +1219,9 @@ class PulsedMeasurementLogic(GenericLogic):
                 # Compute alternative data array from signal
                 self._compute_alt_data()
 
+                if self._live_fit and self.fc.current_fit != 'No Fit':
+                    self._live_fitter.request_fit(self.signal_data[0], self.signal_data[1])
+
             # emit signals
             self.sigTimerUpdated.emit(self.__elapsed_time, self.__elapsed_sweeps,
                                       self.__timer_interval)
@@ -1217,7 +1264,8 @@ class PulsedMeasurementLogic(GenericLogic):
             fc_data, info_dict = fc_data
         else:
             info_dict = {'elapsed_sweeps': None, 'elapsed_time': None}
-        fc_data = netobtain(fc_data)
+        # accumulating histogram, only transfer the changed bins from a remote fast counter
+        fc_data = netobtain_array(fc_data, key='fast_counter_data', delta=True)
 
         if isinstance(info_dict, dict) and info_dict.get('elapsed_sweeps') is not None:
             elapsed_sweeps = info_dict['elapsed_sweeps']
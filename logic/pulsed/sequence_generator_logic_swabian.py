@@ -1739,6 +1739,22 @@ class SequenceGeneratorLogic(GenericLogic):
                 self.log.warn('Extending waveform {0} by {2} bins. New length {1}.'.format(
                     ensemble.name, ensemble_info['number_of_samples'], extension_samples))
 
+        # Purely digital waveforms are handed over as events (durations and states) if the pulse
+        # generator accepts them. This avoids sampling and run-length-encoding the marker arrays.
+        if not ensemble_info['analog_channels'] and ensemble_info['number_of_samples'] > 0:
+            written_samples, wfm_list = self.pulsegenerator().write_digital_events(
+                name=waveform_name,
+                digital_events=self._compile_digital_events(ensemble, ensemble_info),
+                total_number_of_samples=ensemble_info['number_of_samples'])
+            if written_samples == ensemble_info['number_of_samples']:
+                if ensemble.rotating_frame:
+                    offset_bin += written_samples
+                written_waveforms = self._finish_ensemble_sampling(
+                    ensemble, waveform_name, ensemble_info, wfm_list, start_time)
+                return offset_bin, written_waveforms, ensemble_info
+            self.log.debug('Pulse generator did not accept digital events for PulseBlockEnsemble '
+                           '"{0}". Sampling the waveform instead.'.format(ensemble.name))
+
         # Calculate the byte size per sample.
         # One analog sample per channel is 4 bytes (np.float32) and one digital sample per channel
         # is 1 byte (np.bool).
@@ -1868,6 +1884,16 @@ class SequenceGeneratorLogic(GenericLogic):
                     # Increment element index
                     element_count += 1
 
+        written_waveforms = self._finish_ensemble_sampling(
+            ensemble, waveform_name, ensemble_info, written_waveforms, start_time)
+        return offset_bin, written_waveforms, ensemble_info
+
+    def _finish_ensemble_sampling(self, ensemble, waveform_name, ensemble_info, written_waveforms,
+                                  start_time):
+        """ Store the sampling information in the ensemble, unlock and notify about the new waveforms.
+
+        @return list: naturally sorted names of the written waveforms
+        """
         # Save sampling related parameters to the sampling_information container within the
         # PulseBlockEnsemble.
         # This step is only performed if the resulting waveforms are named by the PulseBlockEnsemble
@@ -1888,7 +1914,46 @@ class SequenceGeneratorLogic(GenericLogic):
             self.module_state.unlock()
         self.sigAvailableWaveformsUpdated.emit(self.sampled_waveforms)
         self.sigSampleEnsembleComplete.emit(ensemble)
-        return offset_bin, natural_sort(written_waveforms), ensemble_info
+        return natural_sort(written_waveforms)
+
+    def _compile_digital_events(self, ensemble, ensemble_info):
+        """ Compile the digital channels of a PulseBlockEnsemble into events without sampling.
+
+        @param PulseBlockEnsemble ensemble: the ensemble to compile (already sanity checked)
+        @param dict ensemble_info: information about the ensemble returned by
+                                   analyze_block_ensemble
+
+        @return dict: keys are the digital channel descriptors and values are tuples
+                      (durations, states) of 1D numpy arrays. durations (int64) contains the length
+                      in bins of each event and states (bool) the channel state during the event.
+                      Consecutive events of a channel always have different states.
+
+        The discretized element lengths of analyze_block_ensemble are merged for consecutive
+        elements with the same channel state, i.e. the cost scales with the number of elements
+        instead of the number of samples.
+        """
+        element_states = {chnl: list() for chnl in ensemble_info['digital_channels']}
+        for block_name, reps in ensemble.block_list:
+            block = self.get_block(block_name)
+            for rep_no in range(reps + 1):
+                for element in block.element_list:
+                    for chnl, states in element_states.items():
+                        states.append(element.digital_high[chnl])
+
+        elements_length_bins = ensemble_info['elements_length_bins']
+        # elements shorter than a bin do not show up in the waveform
+        non_empty = elements_length_bins > 0
+        elements_length_bins = elements_length_bins[non_empty]
+        digital_events = dict()
+        for chnl, states in element_states.items():
+            states = np.array(states, dtype=bool)[non_empty]
+            if states.size == 0:
+                digital_events[chnl] = (np.zeros(0, dtype='int64'), np.zeros(0, dtype=bool))
+                continue
+            event_starts = np.flatnonzero(np.concatenate(([True], states[1:] != states[:-1])))
+            digital_events[chnl] = (np.add.reduceat(elements_length_bins, event_starts),
+                                    states[event_starts])
+        return digital_events
 
     @QtCore.Slot(str)
     def sample_pulse_sequence(self, sequence):
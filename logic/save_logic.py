@@ -31,6 +31,7 @@ import time
 
 from collections import OrderedDict
 from core.configoption import ConfigOption
+from core.logger import add_log_handler, remove_log_handler
 from core.util import units
 from core.util.mutex import Mutex
 from core.util.network import netobtain
@@ -57,8 +58,17 @@ class DailyLogHandler(logging.FileHandler):
         # get current directory
         self._current_directory = savelogic.get_daily_directory()
         self._current_time = time.localtime()
+        self._rollover_at = self._next_midnight(self._current_time)
         super().__init__(self.filename)
 
+    @staticmethod
+    def _next_midnight(current_time):
+        """
+        Returns the timestamp of the start of the day after current_time.
+        """
+        return time.mktime((current_time.tm_year, current_time.tm_mon, current_time.tm_mday + 1,
+                            0, 0, 0, 0, 0, -1))
+
     @property
     def current_directory(self):
         """
@@ -79,17 +89,15 @@ class DailyLogHandler(logging.FileHandler):
 
         @param record struct: a log record
         """
-        # check if we have to rollover to the next day
-        now = time.localtime()
-        if (now.tm_year != self._current_time.tm_year
-                or now.tm_mon != self._current_time.tm_mon
-                or now.tm_mday != self._current_time.tm_mday):
+        # check if we have to rollover to the next day, i.e. a single comparison for most records
+        if record.created >= self._rollover_at:
             # we do
             # close file
             self.flush()
             self.close()
             # remember current time
-            self._current_time = now
+            self._current_time = time.localtime(record.created)
+            self._rollover_at = self._next_midnight(self._current_time)
             # get the new directory, but avoid recursion because
             # get_daily_directory uses the log itself
             level = self.level
@@ -213,14 +221,14 @@ class SaveLogic(GenericLogic):
                 '%(asctime)s %(name)s %(levelname)s: %(message)s',
                 datefmt='%Y-%m-%d %H:%M:%S'))
             self._daily_loghandler.setLevel(logging.DEBUG)
-            logging.getLogger().addHandler(self._daily_loghandler)
+            add_log_handler(self._daily_loghandler)
         else:
             self._daily_loghandler = None
 
     def on_deactivate(self):
         if self._daily_loghandler is not None:
             # removes the log handler logging into the daily directory
-            logging.getLogger().removeHandler(self._daily_loghandler)
+            remove_log_handler(self._daily_loghandler)
 
     @property
     def dailylog(self):
@@ -191,17 +191,16 @@ class SingleShotLogic(GenericLogic):
         @param float smoothing: If pulse detection doesn't work, change this value
         @return numpy array: dimensionality is n_rows x n_laserpulses
         """
-        sum_single_pulses = []
         start_stop_tupel_list = self.find_laser(smoothing=smoothing, n_laserpulses=n_laserpulses)
         if self.data_dict:
-            data = self.data_dict['raw_data']
-            for row in data:
-                laser_pulses = [np.sum(row[jj[0]:jj[1]]) for jj in start_stop_tupel_list]
-                sum_single_pulses.append(laser_pulses)
+            data = np.asarray(self.data_dict['raw_data'])
+            sum_single_pulses = np.column_stack(
+                [np.sum(data[:, start:stop], axis=1) for start, stop in start_stop_tupel_list])
         else:
             self.log.error('Pull data from fastcounting device using get_data function before trying to sum_laserpulse.')
+            sum_single_pulses = np.array([])
 
-        return np.array(sum_single_pulses)
+        return sum_single_pulses
 
 
     def get_normalized_signal(self, smoothing=10.0):
@@ -216,7 +215,8 @@ class SingleShotLogic(GenericLogic):
 
         sum_single_pulses = self.sum_laserpulse()
         if sum_single_pulses.shape[1] == 2:
-            normalized_signal = np.array([(ii[0] - ii[1])/(ii[0] + ii[1]) for ii in sum_single_pulses])
+            normalized_signal = ((sum_single_pulses[:, 0] - sum_single_pulses[:, 1])
+                                 / (sum_single_pulses[:, 0] + sum_single_pulses[:, 1]))
         else:
             self.log.warning('could not perform normalisation. Wrong number of laserpulses.')
 
@@ -236,34 +236,31 @@ class SingleShotLogic(GenericLogic):
         else:
             self.log.error('Pull data from fastcounting device using get_data function '
                            'before trying to calc_all_binnings.')
+            return []
 
         NN = data['n_rows']
         # this is just a guess value, at some point it doesn't make
         # sense anymore to further decrease the number of bins
         max_bin = NN // num_bins
-        count_var = 1
-        bin_list = []
-        temp_list = []
-        signal = self.sum_laserpulse()
-        while count_var <= max_bin:
-            # check if the the first run through loop was done
-            if temp_list:
-                app_arr = np.array(temp_list)
-                bin_list.append(app_arr)
-                temp_list = []
-            jj = 0
-            while jj < NN:
-                sum_ind = np.linspace(jj, jj + count_var - 1, count_var, dtype=np.int)
-                # make sure we don't try to adress not reserved memory
-                jj += count_var
-                if sum_ind[-1] < NN:
-                    # normalize
-                    temp_list.append(np.array([np.sum(signal[sum_ind, 0]), np.sum(signal[sum_ind, 1])]))
-                else:
-                    jj = NN
-            count_var += 1
-
-        return np.array(bin_list)
+        signal = self.sum_laserpulse()[:NN, :2]
+        return self.rebin_signal(signal, range(1, max_bin))
+
+    @staticmethod
+    def rebin_signal(signal, binnings):
+        """
+        Sum up consecutive rows of the signal for several binning factors at once.
+        The cumulative sum is calculated only once, every binning is then just the difference of
+        the cumulative sum taken with the binning factor as stride. Incomplete bins at the end are
+        dropped.
+
+        @param numpy.ndarray signal: data with the readouts along the first axis
+        @param iterable binnings: the binning factors (number of rows added up)
+        @return list: numpy arrays with the binned data, one for each binning factor
+        """
+        signal = np.asarray(signal)
+        cumulative = np.concatenate((np.zeros((1,) + signal.shape[1:], dtype=signal.dtype),
+                                     np.cumsum(signal, axis=0)))
+        return [np.diff(cumulative[::binning], axis=0) for binning in binnings]
 
     def calc_all_binnings_normalized(self, num_bins=100):
         """
@@ -280,7 +277,7 @@ class SingleShotLogic(GenericLogic):
             normalized_binning = (binning[:, 0] - binning[:, 1])/(binning[:, 0] + binning[:, 1])
             normalized_bin_list.append(normalized_binning)
 
-        return np.array(normalized_bin_list)
+        return normalized_bin_list
 
 
     def get_timetrace(self):
@@ -544,6 +541,25 @@ class SingleShotLogic(GenericLogic):
 
         self.trace = np.array([time_axis, data])
         self.sigTraceUpdated.emit()
+
+    def start_streaming_analysis(self, bin_edges):
+        """ Start the streaming analysis of the trace analysis logic. Afterwards new readouts can be
+        passed to add_streaming_readouts while the measurement is running.
+
+        @param numpy.ndarray bin_edges: histogram bin edges, the inner edges are the thresholds
+        """
+        self._traceanalysis_logic.start_streaming_analysis(bin_edges)
+
+    def add_streaming_readouts(self, readouts):
+        """ Update histogram and flip statistics with new readouts from the fast counter.
+
+        @param numpy.ndarray readouts: 1D array of new readouts
+        @return dict: current flip statistics for all thresholds
+        """
+        flip_statistics = self._traceanalysis_logic.add_streaming_readouts(readouts)
+        self.hist_data = self._traceanalysis_logic.hist_data
+        self.sigHistogramUpdated.emit()
+        return flip_statistics
     # # now make time trace ( usually what you get from the gated counter )
     # # with the addition of the normalisation
     # # the fidelity depends on the binning, so it may be smart to calculate
@@ -0,0 +1,456 @@
+# -*- coding: utf-8 -*-
+
+"""
+This file contains tiled confocal xy images for sparse and progressive scans.
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+from scipy import ndimage
+
+
+def merge_rois(rois):
+    """ Merge overlapping rectangular regions of interest.
+
+    @param list rois: regions ((x_min, x_max), (y_min, y_max))
+
+    @return list: regions which do not overlap anymore
+    """
+    merged = [(tuple(sorted(x_range)), tuple(sorted(y_range))) for x_range, y_range in rois]
+    changed = True
+    while changed:
+        changed = False
+        for i in range(len(merged)):
+            for j in range(i + 1, len(merged)):
+                (ax, ay), (bx, by) = merged[i], merged[j]
+                if ax[0] <= bx[1] and bx[0] <= ax[1] and ay[0] <= by[1] and by[0] <= ay[1]:
+                    merged[i] = ((min(ax[0], bx[0]), max(ax[1], bx[1])),
+                                 (min(ay[0], by[0]), max(ay[1], by[1])))
+                    del merged[j]
+                    changed = True
+                    break
+            if changed:
+                break
+    return merged
+
+
+def rois_from_positions(positions, size):
+    """ Square regions of interest around positions, e.g. the POIs of the PoiManagerLogic.
+
+    @param positions: iterable of positions (x, y, ...) in m
+    @param float size: edge length of the regions in m
+
+    @return list: merged regions ((x_min, x_max), (y_min, y_max))
+    """
+    half = size / 2
+    return merge_rois([((pos[0] - half, pos[0] + half), (pos[1] - half, pos[1] + half))
+                       for pos in positions])
+
+
+def rois_from_image(counts, x_axis, y_axis, threshold, margin=0):
+    """ Regions of interest around the connected areas of an image above a threshold.
+
+    @param numpy.ndarray counts: 2D image (lines along y, pixels along x), e.g. of a coarse scan
+    @param numpy.ndarray x_axis: x positions of the pixels in m
+    @param numpy.ndarray y_axis: y positions of the lines in m
+    @param float threshold: count rate above which a pixel belongs to a region
+    @param float margin: added to all sides of the regions in m
+
+    @return list: merged regions ((x_min, x_max), (y_min, y_max))
+    """
+    labels, number = ndimage.label(np.asarray(counts) > threshold)
+    rois = list()
+    for y_slice, x_slice in ndimage.find_objects(labels):
+        rois.append(((x_axis[x_slice.start] - margin, x_axis[x_slice.stop - 1] + margin),
+                     (y_axis[y_slice.start] - margin, y_axis[y_slice.stop - 1] + margin)))
+    return merge_rois(rois)
+
+
+class ScanTile:
+    """ Rectangular part of the pixel grid of a tiled image, scanned line by line.
+
+    The tile consists of every step-th line and pixel within the given index ranges of the grid
+    (the steps of the ranges themselves are applied as well). Every scanned pixel stands for the
+    block x block pixels right and below of it when rendered, by default block is the step.
+    A line can also be scanned in parts, i.e. only between two pixels of the tile.
+    """
+
+    def __init__(self, rows, columns, channels, step=1, block=None):
+        """
+        @param range rows: line indices of the grid, i.e. along y
+        @param range columns: pixel indices of the grid, i.e. along x
+        @param int channels: number of count channels
+        @param int step: distance of the scanned lines and pixels in grid pixels
+        @param int block: optional, edge length of the rendered pixels in grid pixels
+        """
+        self.rows = np.arange(rows.start, rows.stop, rows.step * step)
+        self.columns = np.arange(columns.start, columns.stop, columns.step * step)
+        self.block = step if block is None else block
+        self.counts = np.zeros((len(self.rows), len(self.columns), channels))
+        self.scanned = np.zeros((len(self.rows), len(self.columns)), dtype=bool)
+
+    @property
+    def shape(self):
+        return len(self.rows), len(self.columns)
+
+    def set_line(self, line, counts, start=0):
+        """ Store the counts of a scanned line.
+
+        @param int line: index of the line in the tile
+        @param numpy.ndarray counts: counts with shape (pixels, channels)
+        @param int start: index of the first scanned pixel in the tile
+        """
+        stop = start + len(counts)
+        self.counts[line, start:stop] = counts
+        self.scanned[line, start:stop] = True
+
+    def render_line(self, line, image, start=0, stop=None):
+        """ Put (a part of) a scanned line into a dense image of the whole grid.
+
+        @param int line: index of the line in the tile
+        @param numpy.ndarray image: dense counts with shape (lines, pixels, channels), changed in
+                                    place
+        @param int start: index of the first pixel in the tile
+        @param int stop: index after the last pixel in the tile, default is the end of the line
+
+        @return tuple(int, int): first image line and image line after the last one changed
+        """
+        if stop is None:
+            stop = len(self.columns)
+        row = self.rows[line]
+        pixels = (self.columns[start:stop, np.newaxis] + np.arange(self.block)).ravel()
+        counts = np.repeat(self.counts[line, start:stop], self.block, axis=0)
+        inside = pixels < image.shape[1]
+        image[row:row + self.block, pixels[inside]] = counts[inside]
+        return row, min(row + self.block, image.shape[0])
+
+
+class TiledConfocalImage:
+    """ Confocal xy image on the pixel grid of the full image, which is scanned in tiles.
+
+    Subclasses create the tiles and order their lines with plan_lines (and next_lines, if the plan
+    depends on the lines scanned so far). A planned line is a tuple (tile index, line index, first
+    pixel, pixel after the last). render/render_line put the scanned lines into a dense image for
+    display, later tiles cover earlier ones.
+    """
+
+    def __init__(self, x_axis, y_axis, channels):
+        """
+        @param numpy.ndarray x_axis: x positions of the pixels of the full image in m
+        @param numpy.ndarray y_axis: y positions of the lines of the full image in m
+        @param int channels: number of count channels
+        """
+        self.x_axis = np.asarray(x_axis, dtype=float)
+        self.y_axis = np.asarray(y_axis, dtype=float)
+        self.channels = channels
+        self.tiles = list()
+
+    @property
+    def scanned_pixels(self):
+        """ Number of pixels scanned so far. """
+        return int(sum(np.count_nonzero(tile.scanned) for tile in self.tiles))
+
+    def get_parameters(self):
+        """ Parameters describing the scan, e.g. for saving.
+
+        @return OrderedDict: parameter names and values
+        """
+        return OrderedDict()
+
+    def plan_lines(self, start_position=None):
+        """ Order the lines to scan into a short trajectory.
+
+        @param start_position: optional, (x, y) position of the scanner before the scan
+
+        @return list: tuples (tile index, line index, first pixel, pixel after the last)
+
+        By default all lines of all tiles are scanned in full, tile by tile from top to bottom.
+        """
+        plan = list()
+        for tile_index in range(len(self.tiles)):
+            plan.extend(self._tile_lines(tile_index))
+        return plan
+
+    def _tile_lines(self, tile_index):
+        tile = self.tiles[tile_index]
+        return [(tile_index, line, 0, tile.shape[1]) for line in range(tile.shape[0])]
+
+    def next_lines(self):
+        """ Lines to scan after the planned ones are done.
+
+        @return list: tuples (tile index, line index, first pixel, pixel after the last), empty if
+                      the scan is complete
+        """
+        return list()
+
+    def line_path(self, tile_index, line, start=0, stop=None):
+        """ Positions of (a part of) a line of a tile.
+
+        @param int tile_index: index of the tile
+        @param int line: index of the line in the tile
+        @param int start: index of the first pixel in the tile
+        @param int stop: index after the last pixel in the tile, default is the end of the line
+
+        @return tuple(numpy.ndarray, float): x positions of the pixels and y position of the line
+        """
+        tile = self.tiles[tile_index]
+        return self.x_axis[tile.columns[start:stop]], self.y_axis[tile.rows[line]]
+
+    def set_line(self, tile_index, line, counts, start=0):
+        """ Store the counts of a scanned line.
+
+        @param int tile_index: index of the tile
+        @param int line: index of the line in the tile
+        @param numpy.ndarray counts: counts of the line with shape (pixels, channels)
+        @param int start: index of the first scanned pixel in the tile
+        """
+        self.tiles[tile_index].set_line(line, counts, start)
+
+    def render_line(self, tile_index, line, image, start=0, stop=None):
+        """ Put (a part of) a scanned line of a tile into a dense image.
+
+        @param int tile_index: index of the tile
+        @param int line: index of the line in the tile
+        @param numpy.ndarray image: dense counts with shape (lines, pixels, channels) of the full
+                                    image, changed in place
+        @param int start: index of the first pixel in the tile
+        @param int stop: index after the last pixel in the tile, default is the end of the line
+
+        @return tuple(int, int): first image line and image line after the last one changed
+        """
+        return self.tiles[tile_index].render_line(line, image, start, stop)
+
+    def render(self):
+        """ Dense image of all scanned lines.
+
+        @return numpy.ndarray: counts with shape (lines, pixels, channels) of the full image
+        """
+        image = np.zeros((len(self.y_axis), len(self.x_axis), self.channels))
+        for tile_index, tile in enumerate(self.tiles):
+            for line in np.flatnonzero(np.any(tile.scanned, axis=1)):
+                pixels = np.flatnonzero(tile.scanned[line])
+                self.render_line(tile_index, line, image, pixels[0], pixels[-1] + 1)
+        return image
+
+    def to_data(self, channel_names):
+        """ Positions and counts of all scanned pixels, e.g. for saving.
+
+        @param list channel_names: names of the count channels
+
+        @return OrderedDict: 1D arrays of the tile index, x and y position and the counts
+        """
+        tile_numbers, x, y, counts = list(), list(), list(), list()
+        for tile_index, tile in enumerate(self.tiles):
+            lines, pixels = np.nonzero(tile.scanned)
+            tile_numbers.append(np.full(lines.size, tile_index))
+            x.append(self.x_axis[tile.columns[pixels]])
+            y.append(self.y_axis[tile.rows[lines]])
+            counts.append(tile.counts[lines, pixels])
+        counts = np.concatenate(counts) if counts else np.empty((0, self.channels))
+
+        data = OrderedDict()
+        data['tile'] = np.concatenate(tile_numbers) if tile_numbers else np.empty(0)
+        data['x position (m)'] = np.concatenate(x) if x else np.empty(0)
+        data['y position (m)'] = np.concatenate(y) if y else np.empty(0)
+        for n, ch in enumerate(channel_names):
+            data['count rate {0} (Hz)'.format(ch)] = counts[:, n]
+        return data
+
+
+class SparseConfocalImage(TiledConfocalImage):
+    """ Confocal xy image of which only regions of interest are scanned at full resolution.
+
+    An optional background tile covers the whole image at a coarse resolution (every
+    background_step-th line and pixel), the other tiles cover the regions of interest at full
+    resolution. In the rendered image the background fills the pixels which were not scanned.
+    """
+
+    def __init__(self, x_axis, y_axis, channels, rois, background_step=0):
+        """
+        @param numpy.ndarray x_axis: x positions of the pixels of the full image in m
+        @param numpy.ndarray y_axis: y positions of the lines of the full image in m
+        @param int channels: number of count channels
+        @param list rois: regions of interest ((x_min, x_max), (y_min, y_max)) in m
+        @param int background_step: scan every background_step-th line and pixel of the whole
+                                    image first, no background scan if smaller than 2
+        """
+        super().__init__(x_axis, y_axis, channels)
+        self.rois = merge_rois(rois)
+        self.background_step = background_step if background_step > 1 else 0
+
+        if self.background_step:
+            self.tiles.append(ScanTile(range(len(self.y_axis)), range(len(self.x_axis)),
+                                       channels, step=self.background_step))
+        for (x_min, x_max), (y_min, y_max) in self.rois:
+            columns = np.flatnonzero((self.x_axis >= x_min) & (self.x_axis <= x_max))
+            rows = np.flatnonzero((self.y_axis >= y_min) & (self.y_axis <= y_max))
+            if columns.size and rows.size:
+                self.tiles.append(ScanTile(range(rows[0], rows[-1] + 1),
+                                           range(columns[0], columns[-1] + 1), channels))
+
+    @property
+    def has_background(self):
+        return self.background_step > 0
+
+    @property
+    def planned_pixels(self):
+        """ Number of pixels which are scanned for the whole image. """
+        return sum(tile.shape[0] * tile.shape[1] for tile in self.tiles)
+
+    def get_parameters(self):
+        parameters = OrderedDict()
+        parameters['ROI scan regions (m)'] = self.rois
+        parameters['ROI scan background step (pixels)'] = self.background_step
+        return parameters
+
+    def plan_lines(self, start_position=None):
+        """ Order the lines of all tiles into a short trajectory.
+
+        @param start_position: optional, (x, y) position of the scanner before the scan
+
+        @return list: tuples (tile index, line index, first pixel, pixel after the last)
+
+        The background is scanned first, so the whole image can be judged early. Afterwards the
+        next tile is always the one whose first line starts closest to the end of the last line.
+        The lines of a tile are scanned from top to bottom, every line in positive x direction.
+        """
+        plan = list()
+        if start_position is None:
+            position = np.array([self.x_axis[0], self.y_axis[0]])
+        else:
+            position = np.asarray(start_position[:2], dtype=float)
+        remaining = list(range(len(self.tiles)))
+        if self.has_background:
+            remaining.remove(0)
+            plan.extend(self._tile_lines(0))
+            position = np.array([self.x_axis[-1], self.y_axis[self.tiles[0].rows[-1]]])
+        while remaining:
+            starts = np.array([(self.x_axis[self.tiles[i].columns[0]],
+                                self.y_axis[self.tiles[i].rows[0]]) for i in remaining])
+            index = remaining.pop(int(np.argmin(np.linalg.norm(starts - position, axis=1))))
+            tile = self.tiles[index]
+            plan.extend(self._tile_lines(index))
+            position = np.array([self.x_axis[tile.columns[-1]], self.y_axis[tile.rows[-1]]])
+        return plan
+
+
+class ImagePyramid(TiledConfocalImage):
+    """ Confocal xy image which is scanned in passes of increasing resolution.
+
+    Every level of the pyramid halves the step of the level before, down to a step of 1, i.e. the
+    full resolution. The first, coarsest pass scans every coarsest_step-th line and pixel and gives
+    a preview of the whole image early. The later passes only scan the grid points which are new
+    at their step: the lines in between the lines scanned so far (tile of new lines) and the
+    pixels in between the pixels of the lines scanned so far (tile of in-between pixels). Every
+    pixel is therefore scanned exactly once and the full pyramid takes as long as a plain raster
+    scan. Since the pixels of finer levels are rendered smaller on top of the coarser ones, the
+    rendered image always shows the best resolution available everywhere.
+
+    With a threshold, the lines of a level are only scanned where the image so far is above the
+    threshold in the surroundings (one pixel of the previous level), and lines without such pixels
+    are skipped. Dark regions stay at the resolution of the last level which was scanned there.
+    """
+
+    def __init__(self, x_axis, y_axis, channels, coarsest_step=8, threshold=None, channel=0):
+        """
+        @param numpy.ndarray x_axis: x positions of the pixels of the full image in m
+        @param numpy.ndarray y_axis: y positions of the lines of the full image in m
+        @param int channels: number of count channels
+        @param int coarsest_step: step of the first pass, rounded down to a power of 2
+        @param float threshold: optional, count rate below which regions are not refined
+        @param int channel: index of the count channel compared with the threshold
+        """
+        super().__init__(x_axis, y_axis, channels)
+        self.threshold = threshold
+        self.channel = channel
+        levels = int(np.log2(max(1, coarsest_step)))
+        self.steps = [2 ** level for level in range(levels, -1, -1)]
+        self.level = 0
+
+        height, width = len(self.y_axis), len(self.x_axis)
+        # indices of the tiles of each level
+        self.level_tiles = [[0]]
+        self.tiles.append(ScanTile(range(height), range(width), channels, step=self.steps[0]))
+        for step in self.steps[1:]:
+            coarse_step = 2 * step
+            new_lines = ScanTile(range(step, height, coarse_step), range(0, width, step),
+                                 channels, block=step)
+            in_between = ScanTile(range(0, height, coarse_step), range(step, width, coarse_step),
+                                  channels, block=step)
+            self.level_tiles.append([len(self.tiles), len(self.tiles) + 1])
+            self.tiles.extend([new_lines, in_between])
+
+    def get_parameters(self):
+        parameters = OrderedDict()
+        parameters['Progressive scan steps (pixels)'] = self.steps[:self.level + 1]
+        if self.threshold is not None:
+            parameters['Progressive scan refinement threshold (c/s)'] = self.threshold
+        return parameters
+
+    def plan_lines(self, start_position=None):
+        """ Lines of the coarsest level, all of them over the whole width.
+
+        @param start_position: not used, every level is scanned from top to bottom
+
+        @return list: tuples (tile index, line index, first pixel, pixel after the last)
+        """
+        self.level = 0
+        return self._tile_lines(0)
+
+    def next_lines(self):
+        """ Lines of the next finer level.
+
+        @return list: tuples (tile index, line index, first pixel, pixel after the last), empty if
+                      the full resolution is done
+        """
+        while self.level + 1 < len(self.level_tiles):
+            self.level += 1
+            plan = self._plan_level(self.level)
+            if plan:
+                return plan
+        return list()
+
+    def _plan_level(self, level):
+        """ Lines of the tiles of a level, ordered from top to bottom. """
+        lines = list()
+        for tile_index in self.level_tiles[level]:
+            tile = self.tiles[tile_index]
+            if tile.shape[1] > 0:
+                lines.extend((tile.rows[line], tile_index, line) for line in range(tile.shape[0]))
+        lines.sort()
+
+        if self.threshold is None:
+            return [(tile_index, line, 0, self.tiles[tile_index].shape[1])
+                    for row, tile_index, line in lines]
+
+        # neighbourhood of one pixel of the previous level in the best image so far
+        reach = 2 * self.steps[level]
+        bright = self.render()[:, :, self.channel] >= self.threshold
+        plan = list()
+        for row, tile_index, line in lines:
+            columns = np.flatnonzero(np.any(bright[max(0, row - reach):row + reach + 1], axis=0))
+            if columns.size == 0:
+                continue
+            tile = self.tiles[tile_index]
+            start = np.searchsorted(tile.columns, columns[0] - reach)
+            stop = np.searchsorted(tile.columns, columns[-1] + reach, side='right')
+            if stop > start:
+                plan.append((tile_index, line, start, stop))
+        return plan
@@ -28,6 +28,7 @@ from core.connector import Connector
 from core.statusvariable import StatusVar
 from core.util.mutex import Mutex
 from core.util.network import netobtain
+from logic.fit_logic import LiveFitWorker
 from logic.generic_logic import GenericLogic
 
 
@@ -57,6 +58,10 @@ class SpectrumLogic(GenericLogic):
     _spectrum_background = StatusVar('spectrum_background', np.empty((2, 0)))
     _background_correction = StatusVar('background_correction', False)
     fc = StatusVar('fits', None)
+    # refit the differential spectrum after every loop while it is recorded
+    _live_fit = StatusVar('live_fit', default=False)
+    # maximum time in s spent on a single live fit update
+    _live_fit_time_budget = StatusVar('live_fit_time_budget', default=1.0)
 
     # Internal signals
     sig_specdata_updated = QtCore.Signal()
@@ -93,7 +98,11 @@ class SpectrumLogic(GenericLogic):
         self._odmr_logic = self.odmrlogic()
         self._save_logic = self.savelogic()
 
+        # Live fitting of the differential spectrum in a separate thread
+        self._live_fitter = LiveFitWorker(self.fc, time_budget=self._live_fit_time_budget)
+
         self.sig_next_diff_loop.connect(self._loop_differential_spectrum)
+        self._live_fitter.sigFitUpdated.connect(self._live_fit_updated, QtCore.Qt.QueuedConnection)
         self.sig_specdata_updated.emit()
 
     def on_deactivate(self):
@@ -101,6 +110,8 @@ class SpectrumLogic(GenericLogic):
         """
         if self.module_state() != 'idle' and self.module_state() != 'deactivated':
             pass
+        self._live_fitter.sigFitUpdated.disconnect()
+        self._live_fitter.stop()
 
     @fc.constructor
     def sv_set_fits(self, val):
@@ -202,6 +213,7 @@ class SpectrumLogic(GenericLogic):
         self.diff_spec_data_mod_on = np.array([wavelengths, empty_signal])
         self.diff_spec_data_mod_off = np.array([wavelengths, empty_signal])
         self.repetition_count = 0
+        self._live_fitter.reset()
 
         # Starting the measurement loop
         self._loop_differential_spectrum()
@@ -243,6 +255,8 @@ class SpectrumLogic(GenericLogic):
             1, :] - self.diff_spec_data_mod_off[1, :]
 
         self.sig_specdata_updated.emit()
+        if self._live_fit and self.fc.current_fit != 'No Fit':
+            self._live_fitter.request_fit(*self._get_fit_data())
 
         self.sig_next_diff_loop.emit()
 
@@ -393,14 +407,7 @@ class SpectrumLogic(GenericLogic):
         @param array y_data: intensity data for spectrum.
         """
         if (x_data is None) or (y_data is None):
-            x_data = self.spectrum_data[0]
-            y_data = self.spectrum_data[1]
-            if self.fit_domain.any():
-                start_idx = self._find_nearest_idx(x_data, self.fit_domain[0])
-                stop_idx = self._find_nearest_idx(x_data, self.fit_domain[1])
-
-                x_data = x_data[start_idx:stop_idx]
-                y_data = y_data[start_idx:stop_idx]
+            x_data, y_data = self._get_fit_data()
 
         if fit_function is not None and isinstance(fit_function, str):
             if fit_function in self.get_fit_functions():
@@ -426,6 +433,49 @@ class SpectrumLogic(GenericLogic):
                                               )
         return
 
+    def _get_fit_data(self):
+        """ Get the part of the spectrum data within the fit domain.
+
+        @return tuple(np.array, np.array): wavelength and intensity data to fit
+        """
+        x_data = self.spectrum_data[0]
+        y_data = self.spectrum_data[1]
+        if self.fit_domain.any():
+            start_idx = self._find_nearest_idx(x_data, self.fit_domain[0])
+            stop_idx = self._find_nearest_idx(x_data, self.fit_domain[1])
+
+            x_data = x_data[start_idx:stop_idx]
+            y_data = y_data[start_idx:stop_idx]
+        return x_data, y_data
+
+    def set_live_fit(self, enabled, time_budget=None):
+        """ Turn the refitting of the differential spectrum during its acquisition on or off.
+
+        The current fit of the fit container is used. Each fit starts from the previous result,
+        runs in a separate thread and is skipped if the spectrum changed less than the fit
+        parameter uncertainties.
+
+        @param bool enabled: refit after every loop of the differential spectrum
+        @param float time_budget: optional, maximum time in s spent on a single fit update
+        """
+        self._live_fit = bool(enabled)
+        if time_budget is not None:
+            self._live_fit_time_budget = float(time_budget)
+            self._live_fitter.time_budget = self._live_fit_time_budget
+        return
+
+    @QtCore.Slot(np.ndarray, np.ndarray, object)
+    def _live_fit_updated(self, fit_x, fit_y, result):
+        """ Take over the result of a live fit of the differential spectrum """
+        if not self._live_fit:
+            return
+        self.spectrum_fit = np.array([fit_x, fit_y])
+        self.spectrum_fit_updated_Signal.emit(self.spectrum_fit,
+                                              result.result_str_dict,
+                                              self.fc.current_fit
+                                              )
+        return
+
     def _find_nearest_idx(self, array, value):
         """ Find array index of element nearest to given value
 
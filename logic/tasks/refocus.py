@@ -31,9 +31,9 @@ class Task(InterruptableTask):
         print('Task {0} added!'.format(self.name))
 
     def startTask(self):
-        """ Get position from scanning device and do the refocus """
+        """ Get position from scanning device and do the refocus, tracking if possible """
         pos = self.ref['optimizer']._scanning_device.get_scanner_position()
-        self.ref['optimizer'].start_refocus(pos, 'task')
+        self.ref['optimizer'].start_tracking(pos, 'task')
         # self.ref['optimizer'].start_refocus(caller_tag='task')
 
     def runTaskStep(self):
@@ -21,12 +21,93 @@ from scipy.signal import gaussian
 from scipy.ndimage import filters
 import scipy.integrate as integrate
 from scipy.interpolate import InterpolatedUnivariateSpline
+from scipy.stats import norm
 from collections import OrderedDict
 
 from core.connector import Connector
 from logic.generic_logic import GenericLogic
 
 
+class FlipStatistics:
+    """ Histogram and state flip statistics of a single shot readout trace for many thresholds.
+
+    Every readout value is sorted into one of the bins given by bin_edges. Besides the histogram the
+    2D histogram of all pairs of consecutive readouts is accumulated. Since a threshold placed on a
+    bin edge splits the bins into a low (dark) and a high (bright) set, the number of flips and
+    no-flips for all thresholds follows from cumulative sums of the pair histogram. New readouts
+    can be added at any time, e.g. while a measurement is running.
+
+    @param numpy.ndarray bin_edges: monotonically increasing bin edges. The thresholds analyzed are
+                                    the inner edges. Values outside the outer edges are put into
+                                    the outermost bins.
+    """
+
+    def __init__(self, bin_edges):
+        self.bin_edges = np.asarray(bin_edges, dtype=float)
+        self._num_bins = self.bin_edges.size - 1
+        self.histogram = np.zeros(self._num_bins, dtype='int64')
+        self.pair_histogram = np.zeros((self._num_bins, self._num_bins), dtype='int64')
+        self._last_bin = None
+
+    @property
+    def thresholds(self):
+        return self.bin_edges[1:-1]
+
+    @property
+    def num_readouts(self):
+        return int(self.histogram.sum())
+
+    def add(self, readouts):
+        """ Add readouts, which are consecutive to the ones already added.
+
+        @param numpy.ndarray readouts: 1D array of readout values
+        """
+        readouts = np.asarray(readouts).ravel()
+        if readouts.size == 0:
+            return
+        bins = np.clip(np.searchsorted(self.bin_edges, readouts, side='right') - 1,
+                       0, self._num_bins - 1)
+        self.histogram += np.bincount(bins, minlength=self._num_bins)
+        if self._last_bin is not None:
+            bins = np.concatenate(([self._last_bin], bins))
+        if bins.size > 1:
+            pair_index = bins[:-1] * self._num_bins + bins[1:]
+            self.pair_histogram += np.bincount(
+                pair_index, minlength=self._num_bins ** 2).reshape(self.pair_histogram.shape)
+        self._last_bin = bins[-1]
+
+    def get_flip_statistics(self):
+        """ Flip probabilities for all thresholds.
+
+        A readout is considered bright if it is greater than or equal to the threshold.
+
+        @return dict: numpy arrays with one entry per threshold:
+                      'threshold', 'num_no_flip', 'num_flip', 'flip_prob' (all pairs),
+                      'flip_prob_bright' (bright to dark), 'flip_prob_dark' (dark to bright),
+                      'bright_fraction' (fraction of readouts above threshold)
+        """
+        pairs = self.pair_histogram
+        total = pairs.sum()
+        # number of pairs with first (second) readout in one of the bins below the threshold
+        first_low = np.cumsum(pairs.sum(axis=1))[:-1]
+        second_low = np.cumsum(pairs.sum(axis=0))[:-1]
+        both_low = np.diagonal(np.cumsum(np.cumsum(pairs, axis=0), axis=1))[:-1]
+        low_to_high = first_low - both_low
+        high_to_low = second_low - both_low
+        both_high = total - both_low - low_to_high - high_to_low
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result = OrderedDict()
+            result['threshold'] = self.thresholds
+            result['num_no_flip'] = both_low + both_high
+            result['num_flip'] = low_to_high + high_to_low
+            result['flip_prob'] = result['num_flip'] / total
+            result['flip_prob_bright'] = high_to_low / (both_high + high_to_low)
+            result['flip_prob_dark'] = low_to_high / (both_low + low_to_high)
+            result['bright_fraction'] = 1 - np.cumsum(self.histogram)[:-1] / self.num_readouts
+        return result
+
+
 class TraceAnalysisLogic(GenericLogic):
     """ Perform a gated counting measurement with the hardware.  """
 
@@ -56,6 +137,8 @@ class TraceAnalysisLogic(GenericLogic):
         self.spin_flip_prob = 0
         self.fidelity_left = 0
         self.fidelity_right = 0
+        self.streaming_statistics = None
+        self.flip_statistics = None
 
     def on_activate(self):
         """ Initialisation performed during activation of the module.
@@ -232,36 +315,26 @@ class TraceAnalysisLogic(GenericLogic):
                       float lifetime_dark: the lifetime in the dark state in s
                       float lifetime_bright: lifetime in the bright state in s
         """
-        no_flip = 0.0
+        current_state = trace[:-1]
+        next_state = trace[1:]
 
         if analyze_mode == 'full':
-            for ii in range(len(trace) - 1):
-                if trace[ii] > threshold and trace[ii + 1] > threshold:
-                    no_flip = no_flip + 1
-
-                elif trace[ii] < threshold and trace[ii + 1] < threshold:
-                    no_flip = no_flip + 1
-
+            no_flip = np.count_nonzero(((current_state > threshold) & (next_state > threshold))
+                                       | ((current_state < threshold) & (next_state < threshold)))
             probability = 1.0 - (no_flip / len(trace))
             lost_events = 0.0
 
         if analyze_mode == 'dark':
-            dark_counter = 0.0
-            for ii in range(len(trace) - 1):
-                if trace[ii] < threshold:
-                    dark_counter = dark_counter + 1
-                    if trace[ii + 1] < threshold:
-                        no_flip = no_flip + 1
+            dark = current_state < threshold
+            dark_counter = np.count_nonzero(dark)
+            no_flip = np.count_nonzero(dark & (next_state < threshold))
             probability = 1.0 - (no_flip / dark_counter)
             lost_events = (1.0 - (dark_counter / len(trace))) * 100
 
         if analyze_mode == 'bright':
-            bright_counter = 0.0
-            for ii in range(len(trace) - 1):
-                if trace[ii] > threshold:
-                    bright_counter = bright_counter + 1
-                    if trace[ii + 1] > threshold:
-                        no_flip = no_flip + 1
+            bright = current_state > threshold
+            bright_counter = np.count_nonzero(bright)
+            no_flip = np.count_nonzero(bright & (next_state > threshold))
             probability = 1.0 - (no_flip / bright_counter)
             lost_events = (1.0 - (bright_counter / len(trace))) * 100
 
@@ -284,35 +357,7 @@ class TraceAnalysisLogic(GenericLogic):
         """
         init_threshold = init_threshold if init_threshold is not None else [1, 1]
         ana_threshold = ana_threshold if ana_threshold is not None else [1, 1]
-        no_flip = 0.0
-        flip = 0.0
-
-        # find all indices in the trace-array, where the value is above init_threshold[1]
-        init_high = np.where(trace[:-1] > init_threshold[1])[0]
-        # find all indices in the trace-array, where the value is below init_threshold[0]
-        init_low = np.where(trace[:-1] < init_threshold[0])[0]
-        # find all indices in the trace-array, where the value is above ana_threshold[1]
-        ana_high = np.where(trace > ana_threshold[1])[0]
-        # find all indices in the trace-array, where the value is below ana_threshold[0]
-        ana_low = np.where(trace < ana_threshold[0])[0]
-
-        if analyze_mode == 'bright' or analyze_mode == 'full':
-            # analyze the trace where the data were the nuclear was initalized into one direction
-            for index in init_high:
-                # check if the following data point is in the analysis array
-                if index + 1 in ana_high:
-                    no_flip = no_flip + 1
-                elif index + 1 in ana_low:
-                    flip = flip + 1
-
-        if analyze_mode == 'dark' or analyze_mode == 'full':
-            # repeat the same if the nucleus was initalized into the other array
-            for index in init_low:
-                # check if the following data point is in the analysis array
-                if index + 1 in ana_high:
-                    flip = flip + 1
-                elif index + 1 in ana_low:
-                    no_flip = no_flip + 1
+        flip, no_flip = self._count_flips(trace, init_threshold, ana_threshold, analyze_mode)
 
         # the flip probability is given by the number of flips divided by the total number of analyzed data points
         if (flip + no_flip) == 0:
@@ -346,53 +391,13 @@ class TraceAnalysisLogic(GenericLogic):
             fit_params = fit_result.best_values
 
             # calculate the fidelity for the left and right part from the threshold
-            center1 = fit_params['g0_center']
-            center2 = fit_params['g1_center']
-            std1 = fit_params['g0_sigma']
-            std2 = fit_params['g1_sigma']
-            gaussian1 = lambda x: fit_params['g0_amplitude'] * np.exp(-(x - center1) ** 2 / (2 * std1 ** 2))
-            gaussian2 = lambda x: fit_params['g1_amplitude'] * np.exp(-(x - center2) ** 2 / (2 * std2 ** 2))
-            if center1 > center2:
-                gaussian = gaussian1
-                gaussian1 = gaussian2
-                gaussian2 = gaussian
-            area_left1 = integrate.quad(gaussian1, -np.inf, init_threshold[0])
-            area_left2 = integrate.quad(gaussian2, -np.inf, init_threshold[0])
-            area_right1 = integrate.quad(gaussian1, init_threshold[1], np.inf)
-            area_right2 = integrate.quad(gaussian2, init_threshold[1], np.inf)
-            self.fidelity_left = area_left1[0] / (area_left1[0] + area_left2[0])
-            self.fidelity_right = area_right2[0] / (area_right1[0] + area_right2[0])
+            self.fidelity_left, self.fidelity_right = self.calculate_fidelity(
+                fit_params, init_threshold[0], init_threshold[1])
         except:
             self.log.warning('Not enough data points yet!')
 
         # calculate the flip probability
-        no_flip = 0.0
-        flip = 0.0
-        # find all indices in the trace-array, where the value is above init_threshold[1]
-        init_high = np.where(trace[:-1] > init_threshold[1])[0]
-        # find all indices in the trace-array, where the value is below init_threshold[0]
-        init_low = np.where(trace[:-1] < init_threshold[0])[0]
-        # find all indices in the trace-array, where the value is above ana_threshold[1]
-        ana_high = np.where(trace > ana_threshold[1])[0]
-        # find all indices in the trace-array, where the value is below ana_threshold[0]
-        ana_low = np.where(trace < ana_threshold[0])[0]
-
-        if analyze_mode == 'bright' or analyze_mode == 'full':
-            # analyze the trace where the data were the nuclear was initalized into one direction
-            for index in init_high:
-                # check if the following data point is in the analysis array
-                if index + 1 in ana_high:
-                    no_flip = no_flip + 1
-                elif index + 1 in ana_low:
-                    flip = flip + 1
-        if analyze_mode == 'dark' or analyze_mode == 'full':
-            # repeat the same if the nucleus was initalized into the other array
-            for index in init_low:
-                # check if the following data point is in the analysis array
-                if index + 1 in ana_high:
-                    flip = flip + 1
-                elif index + 1 in ana_low:
-                    no_flip = no_flip + 1
+        flip, no_flip = self._count_flips(trace, init_threshold, ana_threshold, analyze_mode)
 
         # the flip probability is given by the number of flips divided by the total number of analyzed data points
         if (flip + no_flip) == 0:
@@ -411,6 +416,114 @@ class TraceAnalysisLogic(GenericLogic):
 
         return self.spin_flip_prob, lost_events, hist_fit_x, hist_fit_y, fit_result
 
+    def _count_flips(self, trace, init_threshold, ana_threshold, analyze_mode='full'):
+        """ Count the state flips between consecutive readouts of a trace.
+
+        A readout above init_threshold[1] (below init_threshold[0]) initializes the bright (dark)
+        state. The following readout is then assigned bright if above ana_threshold[1] or dark if
+        below ana_threshold[0]. Readouts in between the thresholds are discarded.
+
+        @param numpy.ndarray trace: 1D trace of readouts
+        @param list init_threshold: [lower, upper] thresholds for the initialization readout
+        @param list ana_threshold: [lower, upper] thresholds for the analysis readout
+        @param str analyze_mode: 'bright', 'dark' or 'full'
+
+        @return tuple(int, int): number of flips and number of no-flips
+        """
+        trace = np.asarray(trace)
+        init_high = trace[:-1] > init_threshold[1]
+        init_low = trace[:-1] < init_threshold[0]
+        ana_high = trace[1:] > ana_threshold[1]
+        # a readout above the upper analysis threshold is always counted as bright
+        ana_low = (trace[1:] < ana_threshold[0]) & ~ana_high
+
+        flip = 0
+        no_flip = 0
+        if analyze_mode == 'bright' or analyze_mode == 'full':
+            no_flip += np.count_nonzero(init_high & ana_high)
+            flip += np.count_nonzero(init_high & ana_low)
+        if analyze_mode == 'dark' or analyze_mode == 'full':
+            flip += np.count_nonzero(init_low & ana_high)
+            no_flip += np.count_nonzero(init_low & ana_low)
+        return flip, no_flip
+
+    def calculate_fidelity(self, fit_params, threshold_low, threshold_high=None):
+        """ Readout fidelities of the two states for given thresholds from a double gaussian fit.
+
+        The gaussian areas are evaluated analytically, so arrays of thresholds are handled at once.
+
+        @param dict fit_params: best values of the double gaussian fit (g0_*/g1_* parameters)
+        @param float|numpy.ndarray threshold_low: readouts below are assigned to the dark state
+        @param float|numpy.ndarray threshold_high: optional, readouts above are assigned to the
+                                                   bright state. Defaults to threshold_low.
+
+        @return tuple: fidelity of the dark (left) and bright (right) state assignment
+        """
+        if threshold_high is None:
+            threshold_high = threshold_low
+        gaussians = [(fit_params['g0_amplitude'], fit_params['g0_center'], fit_params['g0_sigma']),
+                     (fit_params['g1_amplitude'], fit_params['g1_center'], fit_params['g1_sigma'])]
+        (amp1, center1, std1), (amp2, center2, std2) = sorted(gaussians, key=lambda g: g[1])
+        # area of a gaussian with amplitude amp is amp * sqrt(2 pi) * std
+        area1 = amp1 * np.sqrt(2 * np.pi) * np.abs(std1)
+        area2 = amp2 * np.sqrt(2 * np.pi) * np.abs(std2)
+        area_left1 = area1 * norm.cdf(threshold_low, center1, np.abs(std1))
+        area_left2 = area2 * norm.cdf(threshold_low, center2, np.abs(std2))
+        area_right1 = area1 * norm.sf(threshold_high, center1, np.abs(std1))
+        area_right2 = area2 * norm.sf(threshold_high, center2, np.abs(std2))
+        fidelity_left = area_left1 / (area_left1 + area_left2)
+        fidelity_right = area_right2 / (area_right1 + area_right2)
+        return fidelity_left, fidelity_right
+
+    def sweep_threshold(self, trace, thresholds=None, num_thresholds=100, fit_params=None):
+        """ Flip probabilities (and fidelities) of a single shot trace for many thresholds at once.
+
+        @param numpy.ndarray trace: 1D trace of readouts
+        @param numpy.ndarray thresholds: optional, thresholds to analyze
+        @param int num_thresholds: number of equidistant thresholds between the minimal and maximal
+                                   value of the trace. Ignored if thresholds are given.
+        @param dict fit_params: optional, double gaussian fit parameters. If given, the readout
+                                fidelities are calculated for each threshold as well.
+
+        @return dict: see FlipStatistics.get_flip_statistics. Contains additionally
+                      'fidelity_left' and 'fidelity_right' if fit_params are given.
+        """
+        trace = np.asarray(trace)
+        if thresholds is None:
+            thresholds = np.linspace(trace.min(), trace.max(), num_thresholds + 2)[1:-1]
+        statistics = FlipStatistics(np.concatenate(([-np.inf], thresholds, [np.inf])))
+        statistics.add(trace)
+        result = statistics.get_flip_statistics()
+        if fit_params is not None:
+            result['fidelity_left'], result['fidelity_right'] = self.calculate_fidelity(
+                fit_params, result['threshold'])
+        return result
+
+    def start_streaming_analysis(self, bin_edges):
+        """ Start accumulating histogram and flip statistics of incoming readouts.
+
+        @param numpy.ndarray bin_edges: bin edges of the histogram. The inner edges are the
+                                        thresholds the flip statistics are calculated for.
+        """
+        self.streaming_statistics = FlipStatistics(bin_edges)
+        self.flip_statistics = None
+
+    def add_streaming_readouts(self, readouts):
+        """ Add new readouts (e.g. fresh from the fast counter) to the streaming analysis and
+        update histogram and flip statistics.
+
+        @param numpy.ndarray readouts: 1D array of new consecutive readouts
+
+        @return dict: current flip statistics, see FlipStatistics.get_flip_statistics
+        """
+        self.streaming_statistics.add(readouts)
+        self.hist_data = np.array([self.streaming_statistics.bin_edges,
+                                   np.append(self.streaming_statistics.histogram, 0)])
+        self.sigHistogramUpdated.emit()
+        self.flip_statistics = self.streaming_statistics.get_flip_statistics()
+        self.sigAnalysisResultsUpdated.emit()
+        return self.flip_statistics
+
     def analyze_flip_prob_postselect(self):
         """ Post select the data trace so that the flip probability is only
             calculated from a jump from below a threshold value to an value
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the model construction and of the fits of FitLogic.
+
+Run from the qudi directory:
+    python tools/fit_benchmark.py
+
+For every make_*_model method of the fit methods in logic/fitmethods the time
+to construct the model from scratch is compared to the time it takes to get it
+from the model cache of FitLogic. For the fits with analytic Jacobian the fit
+time and number of function evaluations with and without refinement are shown.
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import inspect
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.append(os.getcwd())
+
+from logic.fit_logic import FitLogic, _model_construction
+
+
+def time_call(function, repeat=20):
+    """ Best time of a call in ms. """
+    return min(timeit.repeat(function, number=1, repeat=repeat)) * 1e3
+
+
+def build_model(make_model, fitlogic):
+    """ Construct a model from scratch, bypassing the model cache.
+
+    The construction flag is set just like the cache does it, so that models built by nested
+    make_*_model calls are not taken from (and altered in) the cache.
+    """
+    _model_construction.active = True
+    try:
+        return make_model.__wrapped__(fitlogic)
+    finally:
+        _model_construction.active = False
+
+
+def benchmark_models(fitlogic):
+    print('{0:45s} {1:>12s} {2:>12s}'.format('model', 'build [ms]', 'cached [ms]'))
+    for name in sorted(dir(FitLogic)):
+        if not (name.startswith('make_') and name.endswith('_model')):
+            continue
+        make_model = getattr(FitLogic, name)
+        uncached = time_call(lambda: build_model(make_model, fitlogic))
+        cached = time_call(lambda: make_model(fitlogic))
+        print('{0:45s} {1:12.3f} {2:12.3f}'.format(name, uncached, cached))
+
+
+def benchmark_fits(fitlogic, num_points=500):
+    rng = np.random.RandomState(0)
+    x = np.linspace(0, 10, num_points)
+    fits = [
+        ('lorentzian', 'estimate_lorentzian_dip',
+         1 - 0.3 * 0.5 ** 2 / ((x - 4.2) ** 2 + 0.5 ** 2)),
+        ('gaussian', 'estimate_gaussian_peak',
+         0.2 + 2 * np.exp(-(x - 5.5) ** 2 / (2 * 0.8 ** 2))),
+        ('sine', 'estimate_sine',
+         1 + 0.3 * np.sin(2 * np.pi * 0.7 * x + 0.4)),
+        ('decayexponential', 'estimate_decayexponential',
+         0.2 + np.exp(-x / 2.5)),
+    ]
+
+    print('{0:20s} {1:>12s} {2:>8s} {3:>12s} {4:>8s}'.format(
+        'fit', 'lmfit [ms]', 'nfev', 'refined [ms]', 'nfev'))
+    for fit_name, estimator_name, clean_data in fits:
+        data = clean_data + rng.normal(0, 0.02, x.size)
+        make_fit = getattr(fitlogic, 'make_{0}_fit'.format(fit_name))
+        estimator = getattr(fitlogic, estimator_name)
+        results = []
+        for analytic_jacobian in (False, True):
+            fitlogic._analytic_jacobian = analytic_jacobian
+            duration = time_call(lambda: make_fit(x, data, estimator), repeat=10)
+            results.extend([duration, make_fit(x, data, estimator).nfev])
+        print('{0:20s} {1:12.2f} {2:8d} {3:12.2f} {4:8d}'.format(fit_name, *results))
+    fitlogic._analytic_jacobian = True
+
+
+if __name__ == '__main__':
+    fitlogic = FitLogic(manager=None, name='fitlogic')
+    num_methods = sum(1 for name, member in inspect.getmembers(FitLogic)
+                      if inspect.isfunction(member)
+                      and getattr(member, '__module__', '').endswith('methods'))
+    print('{0} methods imported from logic/fitmethods\n'.format(num_methods))
+    benchmark_models(fitlogic)
+    print()
+    benchmark_fits(fitlogic)